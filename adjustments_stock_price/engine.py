@@ -0,0 +1,302 @@
+# adjustments_stock_price/engine.py
+"""
+Vectorised adjusted-price engine.
+
+A symbol's raw series is loaded once into NumPy arrays (prices held as
+paisa in float64, which is exact for every 2 dp price we store). Corporate
+actions are applied in book-close order on array prefixes, and the result
+is written back with one bulk upsert.
+
+The legacy engine ran one UPDATE per adjustment against DECIMAL(14,2)
+columns, so every step was rounded half-up to 2 dp before the next one was
+applied. The prefix loop reproduces that rounding exactly: products are
+computed in float64 and the rare values that land within 1e-6 paisa of a
+.5 tie are recomputed with Decimal.
+"""
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+
+import numpy as np
+from django.db import connection, transaction
+
+from nepse_data.models import StockPrices
+from .models import PriceAdjustments, StockPricesAdj
+from .segments import build_segments, replace_segments, materialize_enabled
+
+# Raw column -> adjusted column
+ADJUSTED_COLUMNS = {
+    'open_price': 'open_price_adj',
+    'high_price': 'high_price_adj',
+    'low_price': 'low_price_adj',
+    'close_price': 'close_price_adj',
+    'average_traded_price': 'average_traded_price_adj',
+}
+
+FACTOR_QUANT = Decimal('0.0000000001')  # adjustment_factor is DECIMAL(18,10)
+TIE_TOLERANCE = 1e-6
+UPSERT_BATCH_SIZE = 1000
+
+ONE = Decimal('1.0')
+WHOLE_PAISA = Decimal('1')
+
+
+def load_price_series(symbol, date_from=None):
+    """Loads a symbol's raw prices (one query) into NumPy arrays sorted by date."""
+    queryset = StockPrices.objects.filter(symbol=symbol)
+    if date_from is not None:
+        queryset = queryset.filter(business_date__gte=date_from)
+    rows = list(
+        queryset
+        .order_by('business_date', 'id')
+        .values_list('id', 'business_date', 'security_id', 'security_name', *ADJUSTED_COLUMNS)
+    )
+    series = {
+        'ids': [row[0] for row in rows],
+        'dates': np.array([row[1] for row in rows], dtype='datetime64[D]'),
+        'raw_dates': [row[1] for row in rows],
+        'security_ids': [row[2] for row in rows],
+        'security_names': [row[3] for row in rows],
+        'raw': {},
+    }
+    for offset, column in enumerate(ADJUSTED_COLUMNS, start=4):
+        series['raw'][column] = [row[offset] for row in rows]
+    return series
+
+
+def _to_paisa(values):
+    """Decimal/None list -> float64 paisa array (NaN for NULL)."""
+    values = np.array([np.nan if v is None else float(v) for v in values], dtype='float64')
+    return np.round(values * 100)
+
+
+def _from_paisa(value):
+    if np.isnan(value):
+        return None
+    return Decimal(int(value)).scaleb(-2)
+
+
+def multiply_round_half_up(paisa, factor):
+    """
+    Returns round_half_up(paisa * factor) like MySQL does when a DECIMAL
+    product is stored in a 2 dp column. NaN (NULL) stays NaN.
+    """
+    product = paisa * float(factor)
+    rounded = np.floor(product + 0.5)
+    fraction = product - np.floor(product)
+    near_tie = np.flatnonzero(np.abs(fraction - 0.5) < TIE_TOLERANCE)
+    if near_tie.size:
+        with localcontext() as ctx:
+            ctx.prec = 60
+            for i in near_tie:
+                exact = (Decimal(int(paisa[i])) * factor).quantize(WHOLE_PAISA, rounding=ROUND_HALF_UP)
+                rounded[i] = float(exact)
+    return rounded
+
+
+def adjustment_factor(adj, last_close_paisa, symbol=''):
+    """
+    Uses Nepali stock market adjustment formulas:
+    - Bonus: Factor = 1 / (1 + R)
+    - Right: Factor = (P + Par*R) / (P * (1 + R))
+    - Cash: Factor = (P - Par*R) / P, floored at 0.01
+
+    P is the adjusted close of the last trading day before the book close
+    date (None/NaN when there is none).
+    """
+    R = adj.adjustment_percent / Decimal('100.0')
+    par_value = adj.par_value or Decimal('100.0')
+    adj_type = str(adj.adjustment_type).strip().lower()
+
+    if adj_type == 'bonus':
+        return ONE / (ONE + R)
+
+    if adj_type not in ('right', 'cash'):
+        print(f"WARNING: Unknown adjustment type '{adj.adjustment_type}' for {symbol}. Factor remains 1.0")
+        return ONE
+
+    if last_close_paisa is None or np.isnan(last_close_paisa):
+        print(f"Skipping {adj_type.upper()} adj for {symbol}: No valid price found before {adj.book_close_date}.")
+        return ONE
+    P = _from_paisa(last_close_paisa)
+    if P <= 0:
+        print(f"Skipping {adj_type.upper()} adj for {symbol}: Invalid price ({P}) before {adj.book_close_date}.")
+        return ONE
+
+    if adj_type == 'right':
+        return (P + (par_value * R)) / (P * (ONE + R))
+
+    new_price = P - (par_value * R)
+    if new_price <= 0:
+        print(f"WARNING: CASH dividend {par_value * R} >= price {P} for {symbol}. Setting factor to 0.01")
+        return Decimal('0.01')
+    return new_price / P
+
+
+def compute_adjusted_series(series, adjustments, symbol=''):
+    """
+    Applies active adjustments (ascending book close date) to the series.
+
+    Returns (adjusted, cumulative_factor, applied) where adjusted maps raw
+    column -> adjusted paisa array, cumulative_factor is the per-row product
+    of every factor whose book close date is after that row, and applied is
+    a list of (adjustment, factor, rows_before_bcd).
+    """
+    dates = series['dates']
+    n = len(dates)
+    adjusted = {column: _to_paisa(values) for column, values in series['raw'].items()}
+    close = adjusted['close_price']
+
+    applied = []
+    # One multiplier per book-close event, placed on the last row before the BCD
+    multipliers = np.ones(n, dtype='float64')
+    for adj in adjustments:
+        idx = int(np.searchsorted(dates, np.datetime64(adj.book_close_date), side='left'))
+        last_close = close[idx - 1] if idx else None
+        factor = adjustment_factor(adj, last_close, symbol)
+        if idx and factor != ONE:
+            for column in adjusted:
+                adjusted[column][:idx] = multiply_round_half_up(adjusted[column][:idx], factor)
+            multipliers[idx - 1] *= float(factor)
+        applied.append((adj, factor, idx))
+
+    # Reverse cumulative product: row i gets every factor placed at or after i
+    cumulative_factor = np.cumprod(multipliers[::-1])[::-1] if n else multipliers
+    return adjusted, cumulative_factor, applied
+
+
+def _upsert_sql(columns):
+    column_list = ', '.join(columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    updates = [col for col in columns if col != 'id']
+    if connection.vendor == 'mysql':
+        return (
+            f"INSERT INTO stock_prices_adj ({column_list}) VALUES ({placeholders}) "
+            f"ON DUPLICATE KEY UPDATE {', '.join(f'{col} = VALUES({col})' for col in updates)}"
+        )
+    return (
+        f"INSERT INTO stock_prices_adj ({column_list}) VALUES ({placeholders}) "
+        f"ON CONFLICT (id) DO UPDATE SET {', '.join(f'{col} = excluded.{col}' for col in updates)}"
+    )
+
+
+UPSERT_COLUMNS = [
+    'id', 'business_date', 'security_id', 'symbol', 'security_name',
+    'open_price', 'high_price', 'low_price', 'close_price',
+    'open_price_adj', 'high_price_adj', 'low_price_adj', 'close_price_adj',
+    'average_traded_price_adj', 'adjustment_factor',
+]
+
+
+def _security_id(value):
+    # Mirrors NULLIF(security_id, '') from the old INSERT ... SELECT
+    value = (value or '').strip() if isinstance(value, str) else value
+    return value if value not in ('', None) else None
+
+
+def write_adjusted_series(symbol, series, adjusted, cumulative_factor, start=0):
+    """
+    Upserts rows [start:] of the adjusted series into stock_prices_adj with
+    batched multi-row INSERT ... ON DUPLICATE KEY UPDATE. stock_prices_adj
+    holds one row per (symbol, business_date), so of several raw rows on a
+    date only the last one (highest id) is written. Returns rows written.
+    """
+    raw = series['raw']
+    dates = series['raw_dates']
+    params = []
+    for i in range(start, len(series['ids'])):
+        if i + 1 < len(dates) and dates[i + 1] == dates[i]:
+            continue
+        params.append((
+            series['ids'][i],
+            series['raw_dates'][i],
+            _security_id(series['security_ids'][i]),
+            symbol,
+            series['security_names'][i],
+            raw['open_price'][i],
+            raw['high_price'][i],
+            raw['low_price'][i],
+            raw['close_price'][i],
+            _from_paisa(adjusted['open_price'][i]),
+            _from_paisa(adjusted['high_price'][i]),
+            _from_paisa(adjusted['low_price'][i]),
+            _from_paisa(adjusted['close_price'][i]),
+            _from_paisa(adjusted['average_traded_price'][i]),
+            Decimal(repr(float(cumulative_factor[i]))).quantize(FACTOR_QUANT, rounding=ROUND_HALF_UP),
+        ))
+
+    sql = _upsert_sql(UPSERT_COLUMNS)
+    with connection.cursor() as cursor:
+        for offset in range(0, len(params), UPSERT_BATCH_SIZE):
+            cursor.executemany(sql, params[offset:offset + UPSERT_BATCH_SIZE])
+    return len(params)
+
+
+def delete_stale_adjusted_rows(symbol):
+    """Removes adjusted rows whose raw stock_prices row no longer exists."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            DELETE FROM stock_prices_adj
+            WHERE symbol = %s
+              AND id NOT IN (SELECT id FROM stock_prices WHERE symbol = %s)
+        """, [symbol, symbol])
+        return cursor.rowcount
+
+
+def active_adjustments(symbol, today=None):
+    """Adjustments whose book close date has passed, oldest first."""
+    today = today or date.today()
+    return list(
+        PriceAdjustments.objects.filter(
+            symbol__script_ticker=symbol, book_close_date__lte=today
+        ).order_by('book_close_date', 'id')
+    )
+
+
+def rebuild_symbol(symbol, today=None):
+    """
+    Recalculates the entire adjusted price history for a symbol: refreshes
+    its factor segments, stores the factor and row count on each applied
+    adjustment and, unless ADJUSTED_PRICES_MATERIALIZE is off, rewrites its
+    stock_prices_adj rows. Returns the number of adjusted rows written.
+    """
+    series = load_price_series(symbol)
+    if not series['ids']:
+        print(f"Warning: No raw price data for {symbol}.")
+    dates = series['raw_dates']
+    duplicate_dates = sorted({day for prev, day in zip(dates, dates[1:]) if prev == day})
+    if duplicate_dates:
+        # Happens when a ticker's security_id changes (the unique key is
+        # (business_date, security_id)). searchsorted keeps same-date rows on
+        # the same side of a book close date; the last row of a date is the
+        # one materialized.
+        print(f"Warning: {symbol} has more than one price row on {len(duplicate_dates)} business dates.")
+
+    adjustments = active_adjustments(symbol, today)
+    adjusted, cumulative_factor, applied = compute_adjusted_series(series, adjustments, symbol)
+
+    # Only factors that actually touched a price row define a segment
+    segments = build_segments(symbol, [
+        (adj.book_close_date, factor) for adj, factor, rows_before in applied if rows_before
+    ])
+
+    with transaction.atomic():
+        replace_segments(symbol, segments)
+        if materialize_enabled():
+            delete_stale_adjusted_rows(symbol)
+            if duplicate_dates:
+                StockPricesAdj.objects.filter(symbol=symbol, business_date__in=duplicate_dates).delete()
+            written = write_adjusted_series(symbol, series, adjusted, cumulative_factor)
+        else:
+            StockPricesAdj.objects.filter(symbol=symbol).delete()
+            written = 0
+
+        for adj, factor, rows_before in applied:
+            adj.records_adjusted = rows_before
+            adj.adjustment_factor = factor
+        if applied:
+            PriceAdjustments.objects.bulk_update(
+                [adj for adj, _, _ in applied], ['records_adjusted', 'adjustment_factor']
+            )
+
+    print(f"Rebuilt {symbol}: {written} rows, {len(segments)} factor segments, {len(applied)} active adjustments.")
+    return written
@@ -0,0 +1,152 @@
+# adjustments_stock_price/incremental.py
+"""
+Change log + incremental refresh of stock_prices_adj.
+
+Writers (price uploads/deletes, adjustment edits, dividend sync) record
+which symbols changed. refresh_dirty_symbols() then only touches those:
+
+- new raw prices that are all on/after the symbol's last active book close
+  date are appended with the current cumulative factor (one small upsert);
+- anything that changes factors (new/edited/deleted adjustments, a book
+  close date that has just passed, raw history deleted or back-filled
+  before a book close) triggers a full rebuild of just that symbol.
+"""
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import engine
+from .models import AdjustmentChangeLog, PriceAdjustments
+from .segments import materialize_enabled
+
+
+# ==================================
+# --- RECORDING CHANGES ---
+# ==================================
+
+def record_price_changes(symbol_dates, change_type='prices'):
+    """
+    Logs raw price changes. symbol_dates is an iterable of (symbol, date);
+    one log row is written per symbol with the min/max date.
+    """
+    ranges = {}
+    for symbol, business_date in symbol_dates:
+        if not symbol:
+            continue
+        low, high = ranges.get(symbol, (business_date, business_date))
+        ranges[symbol] = (min(low, business_date), max(high, business_date))
+
+    AdjustmentChangeLog.objects.bulk_create([
+        AdjustmentChangeLog(symbol=symbol, change_type=change_type, date_from=low, date_to=high)
+        for symbol, (low, high) in ranges.items()
+    ])
+    return len(ranges)
+
+
+def record_adjustment_changes(symbols):
+    """Logs that the corporate actions of these symbols changed (full rebuild needed)."""
+    symbols = sorted({s for s in symbols if s})
+    AdjustmentChangeLog.objects.bulk_create([
+        AdjustmentChangeLog(symbol=symbol, change_type='adjustments')
+        for symbol in symbols
+    ])
+    return len(symbols)
+
+
+# ==================================
+# --- REFRESHING ---
+# ==================================
+
+def _newly_active_symbols(today):
+    """Symbols with an adjustment whose book close date has passed but was never applied."""
+    return set(
+        PriceAdjustments.objects.filter(
+            book_close_date__lte=today, adjustment_factor__isnull=True
+        ).values_list('symbol__script_ticker', flat=True)
+    )
+
+
+def append_new_prices(symbol, date_from, today=None):
+    """
+    Upserts adjusted rows for raw prices on/after date_from without touching
+    older history. Only valid when no active book close date falls after
+    date_from (checked by the caller); returns rows written.
+    """
+    if not materialize_enabled():
+        # New days after the last book close date have factor 1: no segment changes
+        return 0
+    series = engine.load_price_series(symbol, date_from=date_from)
+    if not series['ids']:
+        return 0
+    # Every active adjustment is before date_from, so none applies here and the
+    # cumulative factor of the new rows is 1; keep the general path anyway.
+    later = [
+        adj for adj in engine.active_adjustments(symbol, today)
+        if adj.book_close_date > date_from
+    ]
+    adjusted, cumulative_factor, _ = engine.compute_adjusted_series(series, later, symbol)
+    return engine.write_adjusted_series(symbol, series, adjusted, cumulative_factor)
+
+
+def refresh_dirty_symbols(today=None):
+    """
+    Processes every unprocessed change log row. Returns
+    {'rebuilt': [...], 'appended': {symbol: rows}, 'failed': [...]}.
+    """
+    today = today or date.today()
+
+    # Snapshot the log so rows written while we work are left for the next run
+    last_id = AdjustmentChangeLog.objects.filter(processed_at__isnull=True).aggregate(m=Max('id'))['m']
+    pending = AdjustmentChangeLog.objects.filter(processed_at__isnull=True, id__lte=last_id or 0)
+
+    full_rebuild = set()
+    append_from = {}
+    for symbol, change_type, date_from in pending.values_list('symbol', 'change_type', 'date_from'):
+        if change_type != 'prices' or date_from is None:
+            full_rebuild.add(symbol)
+        else:
+            append_from[symbol] = min(date_from, append_from.get(symbol, date_from))
+
+    full_rebuild |= _newly_active_symbols(today)
+
+    # New prices before an active book close date change that adjustment's
+    # row count (and for right/cash, its reference price) -> full rebuild
+    if append_from:
+        last_bcd = dict(
+            PriceAdjustments.objects.filter(
+                symbol__script_ticker__in=list(append_from), book_close_date__lte=today
+            ).values_list('symbol__script_ticker').annotate(last=Max('book_close_date'))
+        )
+        for symbol, date_from in append_from.items():
+            if last_bcd.get(symbol) and last_bcd[symbol] > date_from:
+                full_rebuild.add(symbol)
+
+    from .tasks import rebuild_adjusted_prices
+
+    summary = {'rebuilt': [], 'appended': {}, 'failed': []}
+    for symbol in sorted(full_rebuild):
+        if rebuild_adjusted_prices(symbol):
+            summary['rebuilt'].append(symbol)
+        else:
+            summary['failed'].append(symbol)
+
+    for symbol, date_from in sorted(append_from.items()):
+        if symbol in full_rebuild:
+            continue
+        try:
+            with transaction.atomic():
+                summary['appended'][symbol] = append_new_prices(symbol, date_from, today)
+        except Exception as e:
+            print(f"!!! --- ERROR appending adjusted prices for {symbol}: {e} --- !!!")
+            summary['failed'].append(symbol)
+
+    # Failed symbols stay unprocessed so the next run retries them
+    pending.exclude(symbol__in=summary['failed']).update(processed_at=timezone.now())
+
+    print(
+        f"Adjusted price refresh: {len(summary['rebuilt'])} rebuilt, "
+        f"{len(summary['appended'])} appended, {len(summary['failed'])} failed."
+    )
+    return summary
@@ -0,0 +1,86 @@
+import time
+from django.core.management.base import BaseCommand
+from adjustments_stock_price.tasks import (
+    do_recalculation_work, plan_recalculation_batches, recalculate_symbol_batch, recalculation_progress,
+)
+from adjustments_stock_price.models import PriceAdjustments
+from nepse_data.models import StockPrices
+
+
+class Command(BaseCommand):
+    help = "Recalculates all adjusted prices, fanned out over Celery workers in symbol batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help="Processes of the 'recalc' Celery worker (its --concurrency); batches are sized so each gets several.",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Symbols per batch task (overrides --workers and settings.RECALC_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--local',
+            action='store_true',
+            help='Run the batches in this process instead of queueing them on Celery.',
+        )
+        parser.add_argument(
+            '--no-wait',
+            action='store_true',
+            help='Queue the job and exit without waiting for it to finish.',
+        )
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        workers = options['workers']
+        batch_size = options['batch_size']
+
+        if options['local']:
+            self._run_local(batch_size, workers)
+        else:
+            task = do_recalculation_work.delay(batch_size=batch_size, workers=workers)
+            self.stdout.write(f"Queued recalculation job {task.id}")
+            if options['no_wait']:
+                return
+            self._wait(task)
+
+        end_time = time.time()
+        self.stdout.write(f"Total time taken: {end_time - start_time:.2f} seconds")
+
+    def _run_local(self, batch_size, workers):
+        all_symbols = set(StockPrices.objects.values_list('symbol', flat=True).distinct())
+        adjusted_symbols = set(PriceAdjustments.objects.values_list('symbol__script_ticker', flat=True).distinct())
+        batches = plan_recalculation_batches(all_symbols, batch_size, workers)
+        self.stdout.write(f"Running {len(batches)} batches for {len(all_symbols)} symbols locally...")
+
+        failures = []
+        for i, batch in enumerate(batches):
+            result = recalculate_symbol_batch(batch, sorted(adjusted_symbols.intersection(batch)))
+            failures.extend(result['failed_symbols'])
+            self.stdout.write(f"  Batch {i + 1}/{len(batches)} done ({len(batch)} symbols)")
+
+        if failures:
+            self.stdout.write(self.style.ERROR(f"Failed symbols: {', '.join(failures)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Successfully recalculated all {len(all_symbols)} symbols."))
+
+    def _wait(self, task):
+        last_message = None
+        while True:
+            info = task.info if isinstance(task.info, dict) else {}
+            if task.successful() and info.get('status') == 'dispatched':
+                info = recalculation_progress(info)
+            if task.ready() and info.get('status') != 'running':
+                break
+            message = info.get('message')
+            if message and message != last_message:
+                self.stdout.write(f"  {message}")
+                last_message = message
+            time.sleep(2)
+
+        if info.get('status') in ('success', 'complete'):
+            self.stdout.write(self.style.SUCCESS(info.get('message', 'Complete.')))
+        else:
+            self.stdout.write(self.style.ERROR(info.get('message', str(task.result))))
@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from adjustments_stock_price.incremental import refresh_dirty_symbols
+
+
+class Command(BaseCommand):
+    help = "Refreshes adjusted prices for the symbols recorded in the change log (new days are appended, changed corporate actions are rebuilt)."
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        summary = refresh_dirty_symbols()
+
+        self.stdout.write(f"Rebuilt: {len(summary['rebuilt'])} symbols")
+        self.stdout.write(f"Appended: {sum(summary['appended'].values())} rows for {len(summary['appended'])} symbols")
+        if summary['failed']:
+            self.stdout.write(self.style.ERROR(f"Failed: {', '.join(summary['failed'])}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("--- Refresh Complete ---"))
+        self.stdout.write(f"Total time taken: {time.time() - start_time:.2f} seconds")
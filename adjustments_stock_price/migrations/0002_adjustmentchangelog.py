@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adjustments_stock_price', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdjustmentChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(db_index=True, max_length=20)),
+                ('change_type', models.CharField(choices=[('prices', 'New Raw Prices'), ('adjustments', 'Corporate Actions'), ('rebuild', 'Full Rebuild')], max_length=20)),
+                ('date_from', models.DateField(blank=True, null=True)),
+                ('date_to', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Adjustment Change Log',
+                'verbose_name_plural': 'Adjustment Change Log',
+                'db_table': 'adjustment_change_log',
+            },
+        ),
+        migrations.AlterField(
+            model_name='priceadjustments',
+            name='adjustment_type',
+            field=models.CharField(choices=[('bonus', 'Bonus Share'), ('right', 'Right Share'), ('cash', 'Cash Dividend')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:40
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def build_segments_from_stored_factors(apps, schema_editor):
+    """
+    Seeds the segments from the factors rebuild_adjusted_prices already
+    stored on price_adjustments, so read-time adjustment works straight away.
+    """
+    from adjustments_stock_price.segments import segment_ranges
+
+    PriceAdjustments = apps.get_model('adjustments_stock_price', 'PriceAdjustments')
+    AdjustmentFactorSegment = apps.get_model('adjustments_stock_price', 'AdjustmentFactorSegment')
+
+    factors = defaultdict(list)
+    applied = PriceAdjustments.objects.filter(
+        adjustment_factor__isnull=False, records_adjusted__gt=0
+    ).values_list('symbol_id', 'book_close_date', 'adjustment_factor')
+    for symbol, book_close_date, factor in applied:
+        factors[symbol].append((book_close_date, factor))
+
+    AdjustmentFactorSegment.objects.bulk_create([
+        AdjustmentFactorSegment(symbol=symbol, valid_from=valid_from, valid_to=valid_to, cumulative_factor=factor)
+        for symbol, symbol_factors in factors.items()
+        for valid_from, valid_to, factor in segment_ranges(symbol_factors)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adjustments_stock_price', '0002_adjustmentchangelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdjustmentFactorSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=20)),
+                ('valid_from', models.DateField()),
+                ('valid_to', models.DateField()),
+                ('cumulative_factor', models.DecimalField(decimal_places=10, max_digits=18)),
+            ],
+            options={
+                'verbose_name': 'Adjustment Factor Segment',
+                'verbose_name_plural': 'Adjustment Factor Segments',
+                'db_table': 'adjustment_factor_segments',
+                'indexes': [models.Index(fields=['symbol', 'valid_from', 'valid_to'], name='adj_segment_range_idx')],
+                'unique_together': {('symbol', 'valid_from')},
+            },
+        ),
+        migrations.RunPython(build_segments_from_stored_factors, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,5 @@
 # adjustments_stock_price/models.py
-from django.db import models
+from django.db import connection, models
 # Import the Companies model from your other app
 from listed_companies.models import Companies
 
@@ -72,4 +72,85 @@ class StockPricesAdj(models.Model):
         verbose_name_plural = 'Adjusted Stock Prices'
 
     def __str__(self):
-        return f"{self.symbol} (Adj) on {self.business_date}"
\ No newline at end of file
+        return f"{self.symbol} (Adj) on {self.business_date}"
+
+class AdjustmentChangeLog(models.Model):
+    """
+    One row per "symbol X needs its adjusted prices refreshed" event.
+    Written by price uploads/deletes and adjustment edits, consumed (and
+    stamped with processed_at) by incremental.refresh_dirty_symbols.
+    """
+    CHANGE_TYPE_CHOICES = (
+        ('prices', 'New Raw Prices'),           # append new days only
+        ('adjustments', 'Corporate Actions'),   # factors changed -> full rebuild
+        ('rebuild', 'Full Rebuild'),            # raw history changed/deleted -> full rebuild
+    )
+
+    symbol = models.CharField(max_length=20, db_index=True)
+    change_type = models.CharField(max_length=20, choices=CHANGE_TYPE_CHOICES)
+    date_from = models.DateField(blank=True, null=True)
+    date_to = models.DateField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    class Meta:
+        db_table = 'adjustment_change_log'
+        verbose_name = 'Adjustment Change Log'
+        verbose_name_plural = 'Adjustment Change Log'
+
+    def __str__(self):
+        return f"{self.symbol} {self.change_type} {self.date_from}..{self.date_to}"
+
+class AdjustmentFactorSegmentManager(models.Manager):
+    """
+    Read-time adjustment: joins raw stock_prices to the factor segments on
+    (symbol, business_date BETWEEN valid_from AND valid_to), so adjusted
+    prices don't need the materialized stock_prices_adj copy.
+    """
+
+    def adjusted_prices(self, symbols, date_from=None, date_to=None):
+        """
+        Returns adjusted OHLCV rows (dicts, ordered by symbol and date) for
+        the given symbols, one per (symbol, date). Days without a segment
+        have a factor of 1.
+        """
+        from .segments import adjusted_prices_sql
+        from nepse_data.utils import dictfetchall
+
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        if not symbols:
+            return []
+        sql, params = adjusted_prices_sql(symbols, date_from, date_to)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = dictfetchall(cursor)
+        # A symbol has two rows on a date when its security_id changed; keep the
+        # newest (rows are ordered by id within a date), like stock_prices_adj
+        newest = {}
+        for row in rows:
+            newest[(row['symbol'], row['business_date'])] = row
+        return list(newest.values())
+
+
+class AdjustmentFactorSegment(models.Model):
+    """
+    One row per date range over which a symbol's cumulative adjustment
+    factor is constant. Maintained by engine.rebuild_symbol; ranges after
+    the last book close date (factor 1) are not stored.
+    """
+    symbol = models.CharField(max_length=20)
+    valid_from = models.DateField()
+    valid_to = models.DateField()
+    cumulative_factor = models.DecimalField(max_digits=18, decimal_places=10)
+
+    objects = AdjustmentFactorSegmentManager()
+
+    class Meta:
+        db_table = 'adjustment_factor_segments'
+        unique_together = (('symbol', 'valid_from'),)
+        indexes = [models.Index(fields=['symbol', 'valid_from', 'valid_to'], name='adj_segment_range_idx')]
+        verbose_name = 'Adjustment Factor Segment'
+        verbose_name_plural = 'Adjustment Factor Segments'
+
+    def __str__(self):
+        return f"{self.symbol} x{self.cumulative_factor} ({self.valid_from}..{self.valid_to})"
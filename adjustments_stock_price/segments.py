@@ -0,0 +1,187 @@
+# adjustments_stock_price/segments.py
+"""
+Cumulative adjustment-factor segments.
+
+Instead of storing a second copy of every price row, a symbol's
+adjustments are reduced to a handful of (valid_from, valid_to,
+cumulative_factor) ranges. Adjusted prices are then computed at read time
+as ROUND(raw * factor, 2) through a range join on stock_prices.
+
+Read-time values round once, where the materialized stock_prices_adj rows
+were rounded after every adjustment, so the two can differ by a paisa or
+two on prices with several corporate actions behind them.
+"""
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import AdjustmentFactorSegment
+
+FACTOR_QUANT = Decimal('0.0000000001')  # cumulative_factor is DECIMAL(18,10)
+SEGMENT_START = date(1900, 1, 1)        # valid_from of a symbol's oldest segment
+
+# Raw column -> adjusted alias, as used by the adjusted price views
+ADJUSTED_PRICE_COLUMNS = {
+    'open_price': 'open_price_adj',
+    'high_price': 'high_price_adj',
+    'low_price': 'low_price_adj',
+    'close_price': 'close_price_adj',
+    'average_traded_price': 'average_traded_price_adj',
+}
+
+
+def materialize_enabled():
+    """Whether stock_prices_adj is still written alongside the segments."""
+    return getattr(settings, 'ADJUSTED_PRICES_MATERIALIZE', True)
+
+
+# ==================================
+# --- BUILDING SEGMENTS ---
+# ==================================
+
+def segment_ranges(factors):
+    """
+    factors is an iterable of (book_close_date, factor) for the adjustments
+    that were applied. A factor multiplies every price before its book
+    close date, so the range ending the day before the n-th book close
+    date carries the product of the n-th and all later factors.
+    Returns [(valid_from, valid_to, cumulative_factor)], oldest first.
+    """
+    by_date = {}
+    ranges = []
+    with localcontext() as ctx:
+        ctx.prec = 40
+        for book_close_date, factor in factors:
+            factor = Decimal(factor)
+            if factor == 1:
+                continue
+            by_date[book_close_date] = by_date.get(book_close_date, Decimal(1)) * factor
+
+        book_close_dates = sorted(by_date)
+        cumulative = Decimal(1)
+        # Walk backwards from the latest book close date
+        for n in range(len(book_close_dates) - 1, -1, -1):
+            cumulative *= by_date[book_close_dates[n]]
+            ranges.append((
+                book_close_dates[n - 1] if n else SEGMENT_START,
+                book_close_dates[n] - timedelta(days=1),
+                cumulative.quantize(FACTOR_QUANT, rounding=ROUND_HALF_UP),
+            ))
+    ranges.reverse()
+    return ranges
+
+
+def build_segments(symbol, factors):
+    """AdjustmentFactorSegment objects for a symbol (see segment_ranges)."""
+    return [
+        AdjustmentFactorSegment(symbol=symbol, valid_from=valid_from, valid_to=valid_to, cumulative_factor=factor)
+        for valid_from, valid_to, factor in segment_ranges(factors)
+    ]
+
+
+def replace_segments(symbol, segments):
+    """Swaps a symbol's segments for a freshly built set. Call inside a transaction."""
+    AdjustmentFactorSegment.objects.filter(symbol=symbol).delete()
+    AdjustmentFactorSegment.objects.bulk_create(segments)
+    invalidate_stamp()
+    return len(segments)
+
+
+# ==================================
+# --- CHANGE STAMP ---
+# ==================================
+
+STAMP_KEY = 'adjustment_segments:stamp'
+
+
+def _stamp_timeout():
+    return getattr(settings, 'SEGMENTS_STAMP_CACHE_TIMEOUT', 3600)
+
+
+def segments_stamp():
+    """
+    A token that changes whenever any symbol's segments are replaced, so
+    readers (the price panel) can tell whether segments moved with one cache
+    read instead of a query. replace_segments drops it once its transaction
+    commits; the cache timeout bounds staleness for writes that bypass it.
+    """
+    try:
+        stamp = cache.get(STAMP_KEY)
+        if stamp is None:
+            cache.add(STAMP_KEY, uuid.uuid4().hex, _stamp_timeout())
+            stamp = cache.get(STAMP_KEY)
+    except Exception as e:
+        print(f"Segment stamp cache unavailable ({e}); reading it from the DB.")
+        stamp = None
+    if stamp is None:
+        # Segments are only ever replaced by delete + insert, so any rebuild moves this
+        stamp = AdjustmentFactorSegment.objects.aggregate(count=Count('id'), last=Max('id'))
+        stamp = f"{stamp['count']}:{stamp['last']}"
+    return stamp
+
+
+def invalidate_stamp():
+    """Drops the cached segments stamp after the current transaction commits."""
+    def _drop():
+        try:
+            cache.delete(STAMP_KEY)
+        except Exception as e:
+            print(f"Could not invalidate the segment stamp cache: {e}")
+
+    transaction.on_commit(_drop)
+
+
+# ==================================
+# --- READ-TIME ADJUSTMENT (RANGE JOIN) ---
+# ==================================
+
+def segment_join(price_alias='p', segment_alias='seg'):
+    """LEFT JOIN fragment attaching each raw price row to its factor segment."""
+    return (
+        f"LEFT JOIN adjustment_factor_segments {segment_alias} "
+        f"ON {segment_alias}.symbol = {price_alias}.symbol "
+        f"AND {price_alias}.business_date BETWEEN {segment_alias}.valid_from AND {segment_alias}.valid_to"
+    )
+
+
+def adjusted_column(column, price_alias='p', segment_alias='seg'):
+    """SQL expression for the adjusted value of a raw price column."""
+    return f"ROUND({price_alias}.{column} * COALESCE({segment_alias}.cumulative_factor, 1), 2)"
+
+
+def adjusted_select(price_alias='p', segment_alias='seg'):
+    """'expr AS open_price_adj, ...' for every adjusted price column."""
+    return ",\n".join(
+        f"{adjusted_column(column, price_alias, segment_alias)} AS {alias}"
+        for column, alias in ADJUSTED_PRICE_COLUMNS.items()
+    )
+
+
+def adjusted_prices_sql(symbols, date_from=None, date_to=None):
+    """Builds the range-join query behind AdjustmentFactorSegment.objects.adjusted_prices."""
+    params = list(symbols)
+    where = [f"p.symbol IN ({', '.join(['%s'] * len(symbols))})"]
+    if date_from:
+        where.append("p.business_date >= %s")
+        params.append(date_from)
+    if date_to:
+        where.append("p.business_date <= %s")
+        params.append(date_to)
+    sql = f"""
+        SELECT
+            p.id, p.symbol, p.business_date,
+            p.open_price, p.high_price, p.low_price, p.close_price,
+            {adjusted_select()},
+            COALESCE(seg.cumulative_factor, 1) AS adjustment_factor,
+            p.total_traded_quantity
+        FROM stock_prices p
+        {segment_join()}
+        WHERE {' AND '.join(where)}
+        ORDER BY p.symbol, p.business_date, p.id
+    """
+    return sql, params
@@ -1,3 +1,127 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+
 from django.test import TestCase
 
-# Create your tests here.
+from listed_companies.models import Companies
+from nepse_data.models import StockPrices
+from .engine import ADJUSTED_COLUMNS, rebuild_symbol
+from .models import PriceAdjustments, StockPricesAdj
+
+START = date(2023, 1, 2)
+CENT = Decimal('0.01')
+
+
+def reference_adjusted(rows, adjustments):
+    """
+    The legacy path in Decimal: adjustments in (book close date, id) order,
+    each one an UPDATE of every row before its book close date, rounded
+    half-up to 2 dp (DECIMAL(14,2)) before the next one is applied.
+    """
+    rows = [dict(row) for row in sorted(rows, key=lambda row: row['business_date'])]
+    for adj in sorted(adjustments, key=lambda adj: (adj.book_close_date, adj.id)):
+        before = [row for row in rows if row['business_date'] < adj.book_close_date]
+        R = adj.adjustment_percent / Decimal('100.0')
+        par_value = adj.par_value or Decimal('100.0')
+        P = before[-1]['close_price'] if before else None
+        if adj.adjustment_type == 'bonus':
+            factor = Decimal('1.0') / (Decimal('1.0') + R)
+        elif P is None or P <= 0:
+            factor = Decimal('1.0')
+        elif adj.adjustment_type == 'right':
+            factor = (P + (par_value * R)) / (P * (Decimal('1.0') + R))
+        else:
+            new_price = P - (par_value * R)
+            factor = new_price / P if new_price > 0 else Decimal('0.01')
+        with localcontext() as ctx:
+            ctx.prec = 60
+            for row in before:
+                for column in ADJUSTED_COLUMNS:
+                    if row[column] is not None:
+                        row[column] = (row[column] * factor).quantize(CENT, rounding=ROUND_HALF_UP)
+    return {row['business_date']: row for row in rows}
+
+
+class AdjustedPriceEngineTests(TestCase):
+
+    def setUp(self):
+        self.company = Companies.objects.create(
+            nepse_code='1', script_ticker='TEST', company_name='Test Co', par_value=Decimal('100.00')
+        )
+
+    def add_prices(self, prices):
+        """prices: one Decimal (or None) per day, used for every price column."""
+        rows = []
+        for i, price in enumerate(prices):
+            rows.append(StockPrices(
+                business_date=START + timedelta(days=i), security_id='1', symbol='TEST', security_name='Test Co',
+                open_price=price, high_price=price, low_price=price, close_price=price,
+                average_traded_price=price, total_traded_quantity=100,
+            ))
+        StockPrices.objects.bulk_create(rows)
+
+    def add_adjustment(self, adjustment_type, days, percent):
+        return PriceAdjustments.objects.create(
+            symbol=self.company, adjustment_type=adjustment_type, book_close_date=START + timedelta(days=days),
+            adjustment_percent=Decimal(percent), par_value=Decimal('100.00'),
+        )
+
+    def assert_matches_reference(self):
+        raw = StockPrices.objects.filter(symbol='TEST').values('business_date', *ADJUSTED_COLUMNS)
+        expected = reference_adjusted(raw, PriceAdjustments.objects.filter(symbol=self.company))
+        stored = StockPricesAdj.objects.filter(symbol='TEST')
+        self.assertEqual(stored.count(), len(expected))
+        for row in stored:
+            for column, adjusted_column in ADJUSTED_COLUMNS.items():
+                self.assertEqual(
+                    getattr(row, adjusted_column), expected[row.business_date][column],
+                    f"{adjusted_column} on {row.business_date}",
+                )
+
+    def random_prices(self, n=200, seed=5):
+        rng = random.Random(seed)
+        price, prices = 500.0, []
+        for _ in range(n):
+            price = max(10.0, price * (1 + rng.gauss(0, 0.02)))
+            prices.append(Decimal(str(round(price, 2))))
+        return prices
+
+    def test_bonus_right_cash_on_different_dates(self):
+        self.add_prices(self.random_prices())
+        self.add_adjustment('bonus', 40, '10')
+        self.add_adjustment('right', 90, '50')
+        self.add_adjustment('cash', 150, '15')
+        rebuild_symbol('TEST')
+        self.assert_matches_reference()
+
+    def test_bonus_right_cash_on_the_same_date(self):
+        self.add_prices(self.random_prices(seed=11))
+        self.add_adjustment('bonus', 120, '12.5')
+        self.add_adjustment('right', 120, '33.33')
+        self.add_adjustment('cash', 120, '7.5')
+        rebuild_symbol('TEST')
+        self.assert_matches_reference()
+
+    def test_half_paisa_tie_rounds_half_up(self):
+        # 100.01 * 0.5 = 50.005 -> 50.01 (a float round() gives 50.0)
+        self.add_prices([Decimal('100.01'), Decimal('100.03'), Decimal('200.00')])
+        self.add_adjustment('bonus', 2, '100')
+        rebuild_symbol('TEST')
+        adjusted = list(StockPricesAdj.objects.filter(symbol='TEST').order_by('business_date')
+                        .values_list('close_price_adj', flat=True))
+        self.assertEqual(adjusted, [Decimal('50.01'), Decimal('50.02'), Decimal('200.00')])
+        self.assert_matches_reference()
+
+    def test_null_prices(self):
+        prices = self.random_prices(60, seed=3)
+        prices[10] = None
+        prices[29] = None  # the close a right share on day 30 would be priced from
+        self.add_prices(prices)
+        self.add_adjustment('bonus', 20, '10')
+        self.add_adjustment('right', 30, '25')
+        self.add_adjustment('cash', 45, '20')
+        rebuild_symbol('TEST')
+        self.assert_matches_reference()
+        right = PriceAdjustments.objects.get(adjustment_type='right')
+        self.assertEqual(right.adjustment_factor, Decimal('1.0'))
@@ -16,7 +16,11 @@ from celery.result import AsyncResult
 
 from .models import PriceAdjustments, StockPricesAdj
 from listed_companies.models import Companies
-from .tasks import do_recalculation_work, rebuild_adjusted_prices 
+from .tasks import (
+    do_recalculation_work, forget_recalculation, rebuild_adjusted_prices, recalculation_progress,
+)
+from .incremental import record_adjustment_changes
+from .segments import segment_join, adjusted_column, adjusted_select
 
 
 def dictfetchall(cursor):
@@ -28,6 +32,12 @@ def dictfetchall(cursor):
     ]
 
 
+def refresh_price_panel():
+    """Re-reads rebuilt symbols into the technical analysis price panel (failures are only reported)."""
+    from technical_analysis.services.price_panel import refresh_panel
+    refresh_panel()
+
+
 def adjustment_tool_view(request):
     """
     Main admin page with date validation.
@@ -70,8 +80,11 @@ def adjustment_tool_view(request):
             else:
                 # Book close date has passed, apply the adjustment
                 if rebuild_adjusted_prices(symbol):
+                    refresh_price_panel()
                     messages.success(request, f"Adjustment for {symbol} added and prices recalculated!")
                 else:
+                    # Leave it in the change log so the next refresh retries
+                    record_adjustment_changes([symbol])
                     messages.error(request, f"Adjustment for {symbol} saved, but recalculation failed.")
 
         except Companies.DoesNotExist:
@@ -119,18 +132,25 @@ def edit_adjustment_view(request, adj_id):
             adjustment.book_close_date = book_close_date
             adjustment.adjustment_percent = adj_percent
             adjustment.par_value = par_value_decimal
+            # Factor/row count are recomputed when the adjustment is (re)applied
+            adjustment.adjustment_factor = None
+            adjustment.records_adjusted = None
             adjustment.save()
 
             # Check if book close date has passed
             if book_close_date > today:
+                # It may have been applied under its old date; undo that on the next refresh
+                record_adjustment_changes([adjustment.symbol.script_ticker])
                 messages.warning(
                     request, 
                     f"Adjustment for {adjustment.symbol.script_ticker} updated but is PENDING (book close date: {book_close_date})"
                 )
             else:
                 if rebuild_adjusted_prices(adjustment.symbol.script_ticker):
+                    refresh_price_panel()
                     messages.success(request, f"Adjustment for {adjustment.symbol.script_ticker} updated and recalculated!")
                 else:
+                    record_adjustment_changes([adjustment.symbol.script_ticker])
                     messages.error(request, f"Adjustment saved, but recalculation failed.")
             
             return redirect('adjustments_stock_price:index')
@@ -147,8 +167,10 @@ def delete_adjustment_view(request, adj_id):
     try:
         adjustment.delete()
         if rebuild_adjusted_prices(symbol):
+            refresh_price_panel()
             messages.success(request, f"Adjustment for {symbol} deleted and prices recalculated.")
         else:
+            record_adjustment_changes([symbol])
             messages.error(request, f"Adjustment deleted, but recalculation failed.")
     except Exception as e:
         messages.error(request, f"Error deleting: {e}")
@@ -157,24 +179,23 @@ def delete_adjustment_view(request, adj_id):
 
 def view_adjustments_view(request, symbol):
     company = get_object_or_404(Companies, script_ticker=symbol)
-    query = """
+    query = f"""
     SELECT
         p.average_traded_price,
-        adj.id, adj.business_date, adj.security_id, adj.symbol, adj.security_name,
-        adj.open_price, adj.high_price, adj.low_price, adj.close_price,
-        adj.open_price_adj, adj.high_price_adj, adj.low_price_adj, adj.close_price_adj,
-        adj.adjustment_factor,
-        COALESCE(adj.average_traded_price_adj, p.average_traded_price) as average_traded_price_adj,
-        MAX(adj.high_price_adj) OVER (
-            ORDER BY adj.business_date ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
+        p.id, p.business_date, p.security_id, p.symbol, p.security_name,
+        p.open_price, p.high_price, p.low_price, p.close_price,
+        {adjusted_select()},
+        COALESCE(seg.cumulative_factor, 1) as adjustment_factor,
+        MAX({adjusted_column('high_price')}) OVER (
+            ORDER BY p.business_date ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
         ) as fifty_two_week_high_adj,
-        MIN(adj.low_price_adj) OVER (
-            ORDER BY adj.business_date ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
+        MIN({adjusted_column('low_price')}) OVER (
+            ORDER BY p.business_date ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
         ) as fifty_two_week_low_adj
-    FROM stock_prices_adj adj
-    JOIN stock_prices p ON adj.id = p.id
-    WHERE adj.symbol = %s
-    ORDER BY adj.business_date DESC
+    FROM stock_prices p
+    {segment_join()}
+    WHERE p.symbol = %s
+    ORDER BY p.business_date DESC
     """
     with connection.cursor() as cursor:
         cursor.execute(query, [symbol])
@@ -241,6 +262,9 @@ def bulk_upload_adjustments_view(request):
             for symbol in symbols_to_rebuild:
                 if not rebuild_adjusted_prices(symbol):
                     rebuild_failures.append(symbol)
+            record_adjustment_changes(rebuild_failures)
+            if len(rebuild_failures) < len(symbols_to_rebuild):
+                refresh_price_panel()
         
         if successful_symbols:
             msg = f"Processed {len(successful_symbols)} adjustments for {len(symbols_to_rebuild)} unique symbols."
@@ -286,6 +310,23 @@ def recalc_status_view(request, job_id):
     
     if status == 'SUCCESS':
         result = task_result.result
+        # The job only dispatches the batches; their progress lives in the batch group
+        if result.get("status") == "dispatched":
+            result = recalculation_progress(result)
+        if result.get("status") == "running":
+            return JsonResponse({
+                "status": "running",
+                "progress": result.get("progress", 0),
+                "total": result.get("total", 0),
+                "message": result.get("message", "Running...")
+            })
+        if result.get("status") == "error":
+            return JsonResponse({
+                "status": "error",
+                "progress": result.get("progress", 0),
+                "total": result.get("total", 0),
+                "message": result.get("message", "An error occurred")
+            })
         # Check if it completed with errors
         if result.get("status") == "completed_with_errors":
             return JsonResponse({
@@ -348,6 +389,9 @@ def clear_job_view(request, job_id):
     """ API endpoint to clear a completed job from memory. """
     try:
         task_result = AsyncResult(job_id)
+        if task_result.successful() and isinstance(task_result.result, dict) \
+                and task_result.result.get("status") == "dispatched":
+            forget_recalculation(task_result.result)
         task_result.forget()
         return JsonResponse({"status": "cleared"})
     except Exception as e:
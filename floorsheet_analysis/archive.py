@@ -0,0 +1,428 @@
+# In: floorsheet_analysis/archive.py
+"""
+Parquet archive for closed months of floorsheet_raw.
+
+Layout under settings.FLOORSHEET_ARCHIVE_DIR:
+
+    month=2024-01/floorsheet.parquet
+    month=2024-02/floorsheet.parquet
+    _manifest.json        {month: {file, rows, dates, archived_at}}
+
+Each file is sorted by (calculation_date, stock_symbol, id) and written in
+row groups of FLOORSHEET_ARCHIVE_ROW_GROUP rows, so the min/max statistics
+let scan() skip row groups on date and symbol; months outside the
+requested range are never opened at all.
+
+The summary tables, broker_stock_daily and the cumulative tables stay in
+MySQL, so the reports don't care where the raw rows live. Raw-row readers
+(get_floorsheet_details, the floorsheet page and its CSV download) read
+both sides; a day that is present in floorsheet_raw again (re-uploaded
+after archiving) is read from MySQL.
+
+pyarrow is only imported when the archive is actually read or written;
+listing archived dates (the floorsheet trading calendar) only reads the
+manifest.
+"""
+import datetime
+import json
+import os
+import tempfile
+from bisect import bisect_left
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+MANIFEST_NAME = '_manifest.json'
+FILE_NAME = 'floorsheet.parquet'
+SORT_ORDER = ['calculation_date', 'stock_symbol', 'id']  # row order inside every file
+
+COLUMNS = [
+    'id', 'contract_no', 'stock_symbol', 'buyer', 'seller',
+    'quantity', 'rate', 'amount', 'calculation_date', 'sector',
+]
+
+
+class ArchiveError(Exception):
+    """Raised when the archive cannot be written or read (missing pyarrow, bad month...)."""
+    pass
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ArchiveError("The floorsheet archive needs pyarrow (pip install pyarrow).")
+    return pyarrow
+
+
+def _schema(pa):
+    return pa.schema([
+        ('id', pa.int64()),
+        ('contract_no', pa.string()),
+        ('stock_symbol', pa.string()),
+        ('buyer', pa.int32()),
+        ('seller', pa.int32()),
+        ('quantity', pa.int64()),
+        ('rate', pa.decimal128(10, 2)),
+        ('amount', pa.decimal128(15, 2)),
+        ('calculation_date', pa.date32()),
+        ('sector', pa.string()),
+    ])
+
+
+def archive_dir():
+    return str(getattr(settings, 'FLOORSHEET_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive', 'floorsheet')))
+
+
+def row_group_size():
+    return getattr(settings, 'FLOORSHEET_ARCHIVE_ROW_GROUP', 100_000)
+
+
+def month_key(day):
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+def month_bounds(month):
+    """'2024-01' -> (date(2024, 1, 1), date(2024, 1, 31))."""
+    try:
+        year, mon = (int(part) for part in month.split('-'))
+        first = datetime.date(year, mon, 1)
+    except ValueError:
+        raise ArchiveError(f"Invalid month '{month}' (expected YYYY-MM).")
+    next_month = datetime.date(year + (mon == 12), mon % 12 + 1, 1)
+    return first, next_month - datetime.timedelta(days=1)
+
+
+# ==================================
+# --- MANIFEST ---
+# ==================================
+
+def _manifest_path():
+    return os.path.join(archive_dir(), MANIFEST_NAME)
+
+
+def load_manifest():
+    """{month: {file, rows, dates, archived_at}}; empty when nothing is archived."""
+    try:
+        with open(_manifest_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_atomic(path, write):
+    """Writes through a temp file in the same directory, then renames over path."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _save_manifest(manifest):
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+    _write_atomic(_manifest_path(), write)
+
+
+def archived_dates():
+    """Every trading date held in the archive, oldest first."""
+    return sorted(
+        datetime.date.fromisoformat(d)
+        for entry in load_manifest().values()
+        for d in entry['dates']
+    )
+
+
+def _months_between(manifest, start_date, end_date):
+    months = []
+    for month in sorted(manifest):
+        first, last = month_bounds(month)
+        if (start_date is None or last >= start_date) and (end_date is None or first <= end_date):
+            months.append(month)
+    return months
+
+
+# ==================================
+# --- WRITING ---
+# ==================================
+
+def _hot_dates(cursor, first, last):
+    cursor.execute(
+        "SELECT DISTINCT calculation_date FROM floorsheet_raw WHERE calculation_date BETWEEN %s AND %s ORDER BY calculation_date",
+        [first, last],
+    )
+    return [row[0] if isinstance(row[0], datetime.date) else datetime.date.fromisoformat(row[0]) for row in cursor.fetchall()]
+
+
+def _batch(pa, schema, rows):
+    columns = list(zip(*rows))
+    arrays = []
+    for i, field in enumerate(schema):
+        values = columns[i]
+        if field.name == 'calculation_date':
+            values = [v if v is None or isinstance(v, datetime.date) else datetime.date.fromisoformat(v) for v in values]
+        elif pa.types.is_decimal(field.type):
+            values = [None if v is None else _decimal(v, field.type.scale) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _decimal(value, scale):
+    return Decimal(str(value)).quantize(Decimal(1).scaleb(-scale))
+
+
+def archive_month(cursor, month, delete=True):
+    """
+    Copies one month of floorsheet_raw into its Parquet file (merging with
+    rows archived earlier for days MySQL no longer has), then - when
+    delete=True - removes those days from floorsheet_raw, one day per
+    statement. Returns {'month', 'rows', 'dates', 'deleted'}.
+    """
+    from nepse_data.exports import stream_query
+
+    pa = _pyarrow()
+    pq = pa.parquet
+    schema = _schema(pa)
+    first, last = month_bounds(month)
+    hot_dates = _hot_dates(cursor, first, last)
+    manifest = load_manifest()
+    if not hot_dates:
+        return {'month': month, 'rows': manifest.get(month, {}).get('rows', 0), 'dates': 0, 'deleted': 0}
+
+    relative = os.path.join(f"month={month}", FILE_NAME)
+    path = os.path.join(archive_dir(), relative)
+
+    # Days archived before and not re-uploaded since are kept as they are
+    kept = schema.empty_table()
+    if month in manifest and os.path.exists(path):
+        kept = pq.read_table(path, schema=schema)
+        kept = kept.filter(pa.compute.invert(pa.compute.is_in(
+            kept['calculation_date'], value_set=pa.array(hot_dates, type=pa.date32())
+        )))
+        kept = sort_table(kept, SORT_ORDER)
+    kept_dates = kept['calculation_date'].to_pylist()
+
+    written = {'rows': 0, 'kept': 0}
+    date_column = COLUMNS.index('calculation_date')
+
+    def write(tmp_path):
+        with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+            def flush(chunk):
+                if chunk:
+                    writer.write_batch(_batch(pa, schema, chunk))
+                    written['rows'] += len(chunk)
+
+            def write_kept(before=None):
+                # Kept days sorting before `before` (all the rest when None)
+                stop = len(kept_dates) if before is None else bisect_left(kept_dates, before)
+                if stop > written['kept']:
+                    part = kept.slice(written['kept'], stop - written['kept'])
+                    writer.write_table(part, row_group_size=row_group_size())
+                    written['rows'] += part.num_rows
+                    written['kept'] = stop
+
+            # Hot days stream in SORT_ORDER; kept days are merged in between
+            # them, so the file stays sorted by date
+            sql = (
+                f"SELECT {', '.join(COLUMNS)} FROM floorsheet_raw "
+                "WHERE calculation_date BETWEEN %s AND %s "
+                f"ORDER BY {', '.join(SORT_ORDER)}"
+            )
+            _, rows = stream_query(sql, [first, last], chunk_size=row_group_size())
+            chunk, day = [], None
+            for row in rows:
+                if row[date_column] != day:
+                    flush(chunk)
+                    chunk, day = [], row[date_column]
+                    write_kept(before=day if isinstance(day, datetime.date) else datetime.date.fromisoformat(day))
+                chunk.append(row)
+                if len(chunk) >= row_group_size():
+                    flush(chunk)
+                    chunk = []
+            flush(chunk)
+            write_kept()
+
+        # Re-read the footer before trusting the file with the only copy
+        if pq.ParquetFile(tmp_path).metadata.num_rows != written['rows']:
+            raise ArchiveError(f"Row count check failed for {month}.")
+
+    _write_atomic(path, write)
+
+    dates = sorted(set(kept_dates) | set(hot_dates))
+    manifest[month] = {
+        'file': relative,
+        'rows': written['rows'],
+        'dates': [d.isoformat() for d in dates],
+        'archived_at': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    _save_manifest(manifest)
+    print(f"Archived floorsheet {month}: {written['rows']} rows, {len(dates)} days -> {path}")
+
+    deleted = 0
+    if delete:
+        for day in hot_dates:
+            with transaction.atomic():
+                cursor.execute("DELETE FROM floorsheet_raw WHERE calculation_date = %s", [day])
+                deleted += max(cursor.rowcount, 0)
+        print(f"Removed {deleted} rows for {month} from floorsheet_raw.")
+    return {'month': month, 'rows': written['rows'], 'dates': len(dates), 'deleted': deleted}
+
+
+def closed_months(cursor, keep_months):
+    """
+    Months in floorsheet_raw older than the newest `keep_months` calendar
+    months (counted back from the latest floorsheet date), oldest first.
+    """
+    cursor.execute("SELECT MIN(calculation_date), MAX(calculation_date) FROM floorsheet_raw")
+    oldest, latest = cursor.fetchone()
+    if latest is None:
+        return []
+    if not isinstance(latest, datetime.date):
+        oldest, latest = datetime.date.fromisoformat(oldest), datetime.date.fromisoformat(latest)
+    # First month that stays hot
+    months_back = latest.year * 12 + latest.month - 1 - (max(keep_months, 1) - 1)
+    cutoff = datetime.date(months_back // 12, months_back % 12 + 1, 1)
+
+    months = []
+    day = datetime.date(oldest.year, oldest.month, 1)
+    while day < cutoff:
+        months.append(month_key(day))
+        day = month_bounds(month_key(day))[1] + datetime.timedelta(days=1)
+    return months
+
+
+def remove_dates(dates):
+    """Drops whole days from the archive (the floorsheet delete view). Returns rows removed."""
+    manifest = load_manifest()
+    by_month = {}
+    for day in dates:
+        if month_key(day) in manifest and day.isoformat() in manifest[month_key(day)]['dates']:
+            by_month.setdefault(month_key(day), []).append(day)
+    if not by_month:
+        return 0
+
+    pa = _pyarrow()
+    pq = pa.parquet
+    schema = _schema(pa)
+    removed = 0
+    for month, days in by_month.items():
+        entry = manifest[month]
+        path = os.path.join(archive_dir(), entry['file'])
+        table = pq.read_table(path, schema=schema)
+        table = table.filter(pa.compute.invert(pa.compute.is_in(
+            table['calculation_date'], value_set=pa.array(days, type=pa.date32())
+        )))
+        removed += entry['rows'] - table.num_rows
+        remaining = sorted(set(entry['dates']) - {d.isoformat() for d in days})
+        if remaining:
+            _write_atomic(path, lambda tmp_path: pq.write_table(
+                table, tmp_path, compression='zstd', row_group_size=row_group_size()
+            ))
+            entry.update(rows=table.num_rows, dates=remaining)
+        else:
+            os.remove(path)
+            del manifest[month]
+    _save_manifest(manifest)
+    return removed
+
+
+# ==================================
+# --- QUERY LAYER ---
+# ==================================
+
+def scan(start_date=None, end_date=None, symbols=None, brokers=None, buyers=None, sellers=None,
+         columns=None, exclude_dates=None, symbol_prefix=None, contract_no=None):
+    """
+    Archived rows as a pyarrow Table. Months outside [start_date, end_date]
+    are skipped by file; the date, symbol and broker predicates are pushed
+    down to the Parquet row groups. brokers matches either side of the
+    trade, buyers / sellers only that side. exclude_dates drops days that
+    are read from floorsheet_raw instead.
+    """
+    manifest = load_manifest()
+    months = _months_between(manifest, start_date, end_date)
+    pa = _pyarrow()
+    schema = _schema(pa)
+    columns = columns or COLUMNS
+    if not months:
+        return schema.empty_table().select(columns)
+
+    ds = pa.dataset
+    dataset = ds.dataset(
+        [os.path.join(archive_dir(), manifest[month]['file']) for month in months],
+        schema=schema, format='parquet',
+    )
+    date_field = ds.field('calculation_date')
+    conditions = []
+    if start_date is not None:
+        conditions.append(date_field >= pa.scalar(start_date, type=pa.date32()))
+    if end_date is not None:
+        conditions.append(date_field <= pa.scalar(end_date, type=pa.date32()))
+    if symbols:
+        conditions.append(ds.field('stock_symbol').isin(list(symbols)))
+    if brokers:
+        brokers = [int(b) for b in brokers]
+        conditions.append(ds.field('buyer').isin(brokers) | ds.field('seller').isin(brokers))
+    if buyers:
+        conditions.append(ds.field('buyer').isin([int(b) for b in buyers]))
+    if sellers:
+        conditions.append(ds.field('seller').isin([int(s) for s in sellers]))
+    if exclude_dates:
+        conditions.append(~date_field.isin(pa.array(list(exclude_dates), type=pa.date32())))
+    if symbol_prefix:
+        conditions.append(pa.compute.starts_with(ds.field('stock_symbol'), pattern=symbol_prefix))
+    if contract_no:
+        conditions.append(ds.field('contract_no') == contract_no)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+def sort_table(table, ordering):
+    """
+    table sorted by ordering (field names, '-field' for descending) with
+    NULLs as the smallest value, the order MySQL and the keyset paginator use.
+    """
+    pa = _pyarrow()
+    pc = pa.compute
+    names = table.column_names
+    sort_keys = []
+    for i, name in enumerate(ordering):
+        field = name.lstrip('-')
+        order = 'descending' if name.startswith('-') else 'ascending'
+        if table[field].null_count:
+            # Sort on "is not NULL" first so NULLs land at the small end either way
+            valid = f"__valid_{i}"
+            table = table.append_column(valid, pc.is_valid(table[field]))
+            sort_keys.append((valid, order))
+        sort_keys.append((field, order))
+    indices = pc.sort_indices(table, sort_keys=sort_keys)
+    return table.take(indices).select(names)
+
+
+def column_sum(table, column):
+    """Sum of a column as a Python value (None when it is all NULL or empty)."""
+    return _pyarrow().compute.sum(table[column]).as_py()
+
+
+def scan_rows(**kwargs):
+    """scan() as a list of dicts (dates as date, prices as Decimal), like a dictionary cursor."""
+    return scan(**kwargs).to_pylist()
+
+
+def scan_frame(**kwargs):
+    """scan() as a pandas DataFrame, for the analysis helpers."""
+    return scan(**kwargs).to_pandas()
@@ -0,0 +1,206 @@
+# In: floorsheet_analysis/cumulative.py
+"""
+Prefix-sum (cumulative) tables for date-range broker queries.
+
+broker_stock_cumulative and broker_sector_cumulative hold running totals
+since the first floorsheet, written only on the days a pair traded. The
+total over [start, end] is then
+
+    row as of end  -  row as of the day before start
+
+for every pair, whatever the length of the range (range_totals_sql).
+
+Each row also carries valid_to, the last date it is its pair's latest row
+(the day before the pair next traded, OPEN_END while it is the newest), so
+"the row as of D" is a plain range lookup, D BETWEEN calculation_date AND
+valid_to, like the adjustment factor segments. Without it every as-of
+lookup is a MAX(calculation_date) per pair over all earlier rows, which is
+only cheap when MySQL picks a loose index scan. With the (valid_to,
+calculation_date) index an as-of lookup reads the rows dated after D plus
+one row per pair, so a range ending today costs about one row per pair and
+an older start costs the rows written since it.
+
+The tables are derived from broker_stock_daily: each new trading day is
+appended on top of the previous running totals, and uploading or deleting
+a historical day rebuilds everything from that day on (update_for_day,
+rebuild_from).
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Max
+
+from .models import BrokerSectorCumulative
+
+# level -> (table, pair key columns, matching expression over broker_stock_daily)
+LEVELS = {
+    'stock': ('broker_stock_cumulative', ['stock_symbol', 'broker'], ['stock_symbol', 'broker']),
+    'sector': ('broker_sector_cumulative', ['broker', 'sector'], ['broker', "COALESCE(sector, '')"]),
+}
+
+MEASURES = [
+    'buy_quantity', 'buy_amount', 'sell_quantity', 'sell_amount',
+    'matched_quantity', 'matched_amount',
+]
+
+OPEN_END = date(9999, 12, 31)  # valid_to of a pair's newest row
+
+
+def _as_of_sql(level, where):
+    """Latest cumulative row per pair on or before %s (the row whose validity covers it)."""
+    table, keys, _ = LEVELS[level]
+    filters = ''.join(f" AND {clause}" for clause in where)
+    return f"""
+        SELECT {', '.join(keys)}, calculation_date AS as_of, {', '.join(MEASURES)}
+        FROM {table}
+        WHERE %s BETWEEN calculation_date AND valid_to{filters}
+    """
+
+
+def range_totals_sql(level, start_date, end_date, filters=None):
+    """
+    Builds the query for per-pair totals over [start_date, end_date].
+
+    filters maps a column to a value ({'stock_symbol': 'NABIL'}); a key
+    containing %s is used as a raw clause ({'sector <> %s': ''}). Only
+    pairs that traded in the range are returned.
+    Returns (sql, params); the columns are the pair keys plus MEASURES.
+    """
+    _, keys, _ = LEVELS[level]
+    where, where_params = [], []
+    for column, value in (filters or {}).items():
+        if '%s' in column:
+            where.append(column)
+        else:
+            where.append(f"{column} = %s")
+        where_params.append(value)
+
+    join_on = ' AND '.join(f"hi.{key} = lo.{key}" for key in keys)
+    sql = f"""
+        WITH hi AS ({_as_of_sql(level, where)}),
+             lo AS ({_as_of_sql(level, where)})
+        SELECT {', '.join(f'hi.{key}' for key in keys)},
+               {', '.join(f'hi.{m} - COALESCE(lo.{m}, 0) AS {m}' for m in MEASURES)}
+        FROM hi
+        LEFT JOIN lo ON {join_on}
+        WHERE hi.as_of >= %s
+    """
+    params = [end_date] + where_params + [start_date - timedelta(days=1)] + where_params + [start_date]
+    return sql, params
+
+
+# ==================================
+# --- MAINTENANCE ---
+# ==================================
+
+def _open_rows(cursor, level):
+    """{pair: [measures]} of every pair's newest row (valid_to = OPEN_END)."""
+    table, keys, _ = LEVELS[level]
+    cursor.execute(
+        f"SELECT {', '.join(keys)}, {', '.join(MEASURES)} FROM {table} WHERE valid_to = %s", [OPEN_END]
+    )
+    return {tuple(row[:len(keys)]): [_number(v) for v in row[len(keys):]] for row in cursor.fetchall()}
+
+
+def _number(value):
+    if value is None:
+        return 0
+    return value if isinstance(value, (int, Decimal)) else Decimal(str(value))
+
+
+def _append_days(cursor, dates):
+    """
+    Adds the cube rows of `dates` (ascending, all after every stored row) on
+    top of the pairs' newest rows. A new row is held back until its pair
+    trades again, so it is inserted with its final valid_to; a stored
+    newest row is closed with one UPDATE when its pair first trades again.
+    """
+    written = 0
+    for level, (table, keys, source_keys) in LEVELS.items():
+        totals = _open_rows(cursor, level)
+        stored = set(totals)
+        pending = {}
+        select_keys = ', '.join(f"{expr} AS {key}" for expr, key in zip(source_keys, keys))
+        day_sql = f"""
+            SELECT {select_keys}, {', '.join(f'SUM({m})' for m in MEASURES)}
+            FROM broker_stock_daily
+            WHERE calculation_date = %s
+            GROUP BY {', '.join(source_keys)}
+        """
+        insert_sql = (
+            f"INSERT INTO {table} (calculation_date, {', '.join(keys)}, {', '.join(MEASURES)}, valid_to) "
+            f"VALUES ({', '.join(['%s'] * (2 + len(keys) + len(MEASURES)))})"
+        )
+        close_sql = (
+            f"UPDATE {table} SET valid_to = %s "
+            f"WHERE {' AND '.join(f'{key} = %s' for key in keys)} AND valid_to = %s"
+        )
+        for calculation_date in dates:
+            cursor.execute(day_sql, [calculation_date])
+            valid_to = calculation_date - timedelta(days=1)
+            rows, closed = [], []
+            for row in cursor.fetchall():
+                pair = tuple(row[:len(keys)])
+                if pair in pending:
+                    rows.append(pending[pair] + [valid_to])
+                elif pair in stored:
+                    closed.append([valid_to, *pair, OPEN_END])
+                    stored.discard(pair)
+                running = totals.get(pair, [0] * len(MEASURES))
+                running = [total + _number(value) for total, value in zip(running, row[len(keys):])]
+                totals[pair] = running
+                pending[pair] = [calculation_date, *pair, *running]
+            if closed:
+                cursor.executemany(close_sql, closed)
+            if rows:
+                cursor.executemany(insert_sql, rows)
+                written += len(rows)
+        if pending:
+            cursor.executemany(insert_sql, [row + [OPEN_END] for row in pending.values()])
+            written += len(pending)
+    return written
+
+
+def rebuild_from(cursor, start_date=None):
+    """
+    Drops cumulative rows on/after start_date (all rows if None) and
+    re-accumulates them from broker_stock_daily. Returns (days, rows).
+    """
+    for table, _, _ in LEVELS.values():
+        if start_date is None:
+            cursor.execute(f"DELETE FROM {table}")
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE calculation_date >= %s", [start_date])
+            # Rows that were superseded on/after start_date are their pairs' newest again
+            cursor.execute(
+                f"UPDATE {table} SET valid_to = %s WHERE valid_to >= %s",
+                [OPEN_END, start_date - timedelta(days=1)]
+            )
+
+    query = "SELECT DISTINCT calculation_date FROM broker_stock_daily"
+    params = []
+    if start_date is not None:
+        query += " WHERE calculation_date >= %s"
+        params.append(start_date)
+    cursor.execute(query + " ORDER BY calculation_date", params)
+    dates = [row[0] for row in cursor.fetchall()]
+
+    rows = _append_days(cursor, dates)
+    print(f"Cumulative broker tables rebuilt from {start_date or 'the first day'}: {len(dates)} days, {rows} rows.")
+    return len(dates), rows
+
+
+def update_for_day(cursor, calculation_date):
+    """
+    Brings the cumulative tables in line after calculation_date's cube rows
+    changed: a new latest day is appended, anything older triggers
+    rebuild_from(calculation_date).
+    """
+    # Both tables are always written together, so one of them is enough
+    latest = BrokerSectorCumulative.objects.aggregate(latest=Max('calculation_date'))['latest']
+    if latest is None:
+        # First run: accumulate every day already in the cube
+        return rebuild_from(cursor)[1]
+    if calculation_date > latest:
+        return _append_days(cursor, [calculation_date])
+    return rebuild_from(cursor, calculation_date)[1]
@@ -0,0 +1,186 @@
+# In: floorsheet_analysis/db.py
+"""
+Shared MySQL connection pool for the floorsheet_analysis reports.
+
+Every report helper used to open (and tear down) its own mysql.connector
+connection, and one page runs several helpers. They now borrow from one
+process-wide MySQLConnectionPool; calling .close() on a pooled connection
+hands it back to the pool instead of closing the socket.
+"""
+import threading
+import time
+
+from mysql.connector import Error, pooling
+from django.conf import settings
+
+# mysql.connector refuses pools larger than this
+MAX_POOL_SIZE = pooling.CNX_POOL_MAXSIZE
+
+# How long to sleep between attempts while every connection is checked out
+POOL_RETRY_INTERVAL = 0.05
+
+
+def _db_config():
+    """Connection kwargs from the Django DATABASES['default'] config."""
+    db_settings = settings.DATABASES['default']
+    return {
+        'host': db_settings.get('HOST') or '127.0.0.1',
+        'user': db_settings.get('USER') or 'root',
+        'password': db_settings.get('PASSWORD', ''),
+        'database': db_settings.get('NAME') or 'nepse_data',
+        'port': int(db_settings.get('PORT') or 3306),
+    }
+
+
+class PoolStats:
+    """Thread-safe counters for the pool (exposed via pool_stats())."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0            # got a free connection straight away
+            self.misses = 0          # pool was exhausted, had to wait
+            self.timeouts = 0        # gave up waiting
+            self.errors = 0          # pool creation / connect failures
+            self.wait_seconds = 0.0  # total time spent waiting on misses
+            self.max_wait_seconds = 0.0
+            self.checked_out = 0
+            self.peak_checked_out = 0
+
+    def record_checkout(self, waited):
+        with self._lock:
+            if waited:
+                self.misses += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            else:
+                self.hits += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def record_return(self):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def record_timeout(self, waited):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def as_dict(self):
+        with self._lock:
+            requests = self.hits + self.misses + self.timeouts
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'timeouts': self.timeouts,
+                'errors': self.errors,
+                'hit_ratio': round(self.hits / requests, 4) if requests else None,
+                'wait_seconds': round(self.wait_seconds, 4),
+                'avg_wait_seconds': round(self.wait_seconds / (self.misses + self.timeouts), 4) if (self.misses + self.timeouts) else 0.0,
+                'max_wait_seconds': round(self.max_wait_seconds, 4),
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+            }
+
+
+class _TrackedConnection:
+    """
+    Wraps a PooledMySQLConnection so returning it to the pool is counted.
+    Everything else is passed straight through.
+    """
+
+    def __init__(self, cnx, stats):
+        self._cnx = cnx
+        self._stats = stats
+        self._returned = False
+
+    def close(self):
+        if not self._returned:
+            self._returned = True
+            self._stats.record_return()
+        self._cnx.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+stats = PoolStats()
+
+
+def pool_size():
+    return max(1, min(int(settings.FLOORSHEET_DB_POOL_SIZE), MAX_POOL_SIZE))
+
+
+def get_pool():
+    """Creates the pool on first use (so importing this module never connects)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name='floorsheet_analysis',
+                    pool_size=pool_size(),
+                    **_db_config(),
+                )
+                print(f"Floorsheet analysis DB pool created ({pool_size()} connections).")
+    return _pool
+
+
+def get_connection(timeout=None):
+    """
+    Borrows a connection from the pool, waiting up to `timeout` seconds
+    (settings.FLOORSHEET_DB_POOL_TIMEOUT) when all of them are in use.
+    Raises mysql.connector.Error when none can be had.
+    """
+    if timeout is None:
+        timeout = settings.FLOORSHEET_DB_POOL_TIMEOUT
+    try:
+        pool = get_pool()
+    except Error:
+        stats.record_error()
+        raise
+
+    started = time.monotonic()
+    missed = False
+    while True:
+        try:
+            cnx = pool.get_connection()
+        except pooling.PoolError:
+            missed = True
+            waited = time.monotonic() - started
+            if waited >= timeout:
+                stats.record_timeout(waited)
+                raise
+            time.sleep(POOL_RETRY_INTERVAL)
+            continue
+        except Error:
+            # Reconnecting a stale pooled connection failed
+            stats.record_error()
+            raise
+        stats.record_checkout(time.monotonic() - started if missed else 0.0)
+        return _TrackedConnection(cnx, stats)
+
+
+def pool_stats():
+    """Hit/miss/wait counters plus the pool's configuration."""
+    data = stats.as_dict()
+    data['pool_size'] = pool_size()
+    data['pool_created'] = _pool is not None
+    return data
@@ -0,0 +1,56 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from floorsheet_analysis.archive import ArchiveError, archive_month, closed_months, month_bounds
+from nepse_data.trading_calendar import invalidate as invalidate_calendar
+
+
+class Command(BaseCommand):
+    help = "Moves closed months of floorsheet_raw into the Parquet archive (FLOORSHEET_ARCHIVE_DIR)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', action='append', default=[], help="Only this month (YYYY-MM); can be repeated.")
+        parser.add_argument('--keep-months', type=int, default=None,
+                            help="Recent months to leave in MySQL (default: settings.FLOORSHEET_ARCHIVE_KEEP_MONTHS).")
+        parser.add_argument('--copy-only', action='store_true', help="Write the archive but keep the rows in floorsheet_raw.")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the months that would be archived.")
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        keep_months = options['keep_months']
+        if keep_months is None:
+            keep_months = getattr(settings, 'FLOORSHEET_ARCHIVE_KEEP_MONTHS', 3)
+
+        with connection.cursor() as cursor:
+            months = options['month']
+            try:
+                for month in months:
+                    month_bounds(month)
+            except ArchiveError as e:
+                raise CommandError(str(e))
+            if not months:
+                months = closed_months(cursor, keep_months)
+
+            if not months:
+                self.stdout.write(self.style.SUCCESS("Nothing to archive."))
+                return
+            if options['dry_run']:
+                self.stdout.write("Would archive: " + ', '.join(months))
+                return
+
+            total_rows, total_deleted = 0, 0
+            for i, month in enumerate(months, start=1):
+                try:
+                    result = archive_month(cursor, month, delete=not options['copy_only'])
+                except ArchiveError as e:
+                    raise CommandError(str(e))
+                total_rows += result['rows']
+                total_deleted += result['deleted']
+                self.stdout.write(f"[{i}/{len(months)}] {month}: {result['rows']} rows archived, {result['deleted']} removed from MySQL")
+
+        invalidate_calendar('floorsheet')
+        self.stdout.write(self.style.SUCCESS(
+            f"--- Archived {len(months)} months ({total_rows} rows, {total_deleted} removed from floorsheet_raw) ---"
+        ))
+        self.stdout.write(f"Total time taken: {time.time() - start_time:.2f} seconds")
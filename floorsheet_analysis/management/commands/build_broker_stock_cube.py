@@ -0,0 +1,47 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from nepse_data.ingestion import rebuild_broker_stock_cube
+from floorsheet_analysis.cumulative import rebuild_from
+
+
+class Command(BaseCommand):
+    help = "Builds the broker_stock_daily cube from floorsheet_raw (for days loaded before the cube existed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', action='append', default=[], help="Only this date (YYYY-MM-DD); can be repeated.")
+        parser.add_argument('--all', action='store_true', help="Rebuild every floorsheet date, not just the missing ones.")
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        try:
+            dates = [datetime.date.fromisoformat(d) for d in options['date']]
+        except ValueError as e:
+            raise CommandError(f"Invalid --date: {e}")
+
+        with connection.cursor() as cursor:
+            if not dates:
+                query = "SELECT DISTINCT calculation_date FROM floorsheet_raw WHERE calculation_date IS NOT NULL"
+                if not options['all']:
+                    query += " AND calculation_date NOT IN (SELECT DISTINCT calculation_date FROM broker_stock_daily)"
+                cursor.execute(query + " ORDER BY calculation_date")
+                dates = [row[0] for row in cursor.fetchall()]
+
+            if not dates:
+                self.stdout.write(self.style.SUCCESS("Cube is up to date."))
+                return
+
+            total_rows = 0
+            for i, calculation_date in enumerate(dates, start=1):
+                with transaction.atomic():
+                    rows = rebuild_broker_stock_cube(cursor, calculation_date)
+                total_rows += rows
+                self.stdout.write(f"[{i}/{len(dates)}] {calculation_date}: {rows} cube rows")
+
+            # Running totals from the earliest rebuilt day on are stale now
+            with transaction.atomic():
+                rebuild_from(cursor, min(dates))
+
+        self.stdout.write(self.style.SUCCESS(f"--- Built {total_rows} cube rows for {len(dates)} dates ---"))
+        self.stdout.write(f"Total time taken: {time.time() - start_time:.2f} seconds")
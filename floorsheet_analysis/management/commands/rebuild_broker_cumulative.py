@@ -0,0 +1,27 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from floorsheet_analysis.cumulative import rebuild_from
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the broker x stock / broker x sector cumulative tables from broker_stock_daily."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', help="Only rebuild from this date (YYYY-MM-DD) on; default is a full rebuild.")
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        from_date = None
+        if options['from_date']:
+            try:
+                from_date = datetime.date.fromisoformat(options['from_date'])
+            except ValueError as e:
+                raise CommandError(f"Invalid --from: {e}")
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            days, rows = rebuild_from(cursor, from_date)
+
+        self.stdout.write(self.style.SUCCESS(f"--- Rebuilt {rows} cumulative rows over {days} trading days ---"))
+        self.stdout.write(f"Total time taken: {time.time() - start_time:.2f} seconds")
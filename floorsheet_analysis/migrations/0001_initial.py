@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BrokerStockDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calculation_date', models.DateField()),
+                ('stock_symbol', models.CharField(max_length=255)),
+                ('broker', models.IntegerField()),
+                ('sector', models.CharField(blank=True, max_length=255, null=True)),
+                ('buy_quantity', models.BigIntegerField(default=0)),
+                ('buy_amount', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('sell_quantity', models.BigIntegerField(default=0)),
+                ('sell_amount', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('matched_quantity', models.BigIntegerField(default=0)),
+                ('matched_amount', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+            options={
+                'verbose_name': 'Broker Stock Daily',
+                'verbose_name_plural': 'Broker Stock Daily',
+                'db_table': 'broker_stock_daily',
+                'indexes': [models.Index(fields=['stock_symbol', 'calculation_date'], name='bsd_stock_date_idx'), models.Index(fields=['broker', 'calculation_date'], name='bsd_broker_date_idx')],
+                'unique_together': {('calculation_date', 'stock_symbol', 'broker')},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('floorsheet_analysis', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BrokerSectorCumulative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calculation_date', models.DateField()),
+                ('broker', models.IntegerField()),
+                ('sector', models.CharField(max_length=255)),
+                ('buy_quantity', models.BigIntegerField(default=0)),
+                ('buy_amount', models.DecimalField(decimal_places=2, default=0, max_digits=22)),
+                ('sell_quantity', models.BigIntegerField(default=0)),
+                ('sell_amount', models.DecimalField(decimal_places=2, default=0, max_digits=22)),
+                ('matched_quantity', models.BigIntegerField(default=0)),
+                ('matched_amount', models.DecimalField(decimal_places=2, default=0, max_digits=22)),
+            ],
+            options={
+                'verbose_name': 'Broker Sector Cumulative',
+                'verbose_name_plural': 'Broker Sector Cumulative',
+                'db_table': 'broker_sector_cumulative',
+                'indexes': [models.Index(fields=['calculation_date'], name='bsec_date_idx')],
+                'unique_together': {('broker', 'sector', 'calculation_date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BrokerStockCumulative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calculation_date', models.DateField()),
+                ('stock_symbol', models.CharField(max_length=255)),
+                ('broker', models.IntegerField()),
+                ('buy_quantity', models.BigIntegerField(default=0)),
+                ('buy_amount', models.DecimalField(decimal_places=2, default=0, max_digits=22)),
+                ('sell_quantity', models.BigIntegerField(default=0)),
+                ('sell_amount', models.DecimalField(decimal_places=2, default=0, max_digits=22)),
+                ('matched_quantity', models.BigIntegerField(default=0)),
+                ('matched_amount', models.DecimalField(decimal_places=2, default=0, max_digits=22)),
+            ],
+            options={
+                'verbose_name': 'Broker Stock Cumulative',
+                'verbose_name_plural': 'Broker Stock Cumulative',
+                'db_table': 'broker_stock_cumulative',
+                'indexes': [models.Index(fields=['broker', 'stock_symbol', 'calculation_date'], name='bsc_broker_stock_date_idx'), models.Index(fields=['calculation_date'], name='bsc_date_idx')],
+                'unique_together': {('stock_symbol', 'broker', 'calculation_date')},
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-17 09:10
+
+import datetime
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+OPEN_END = datetime.date(9999, 12, 31)
+UPDATE_BATCH_SIZE = 1000
+
+
+def fill_valid_to(apps, schema_editor):
+    """
+    Sets each row's valid_to to the day before its pair's next row (rows
+    start out as OPEN_END, which is right for every pair's newest row).
+    Rows are grouped by their new valid_to, so it is one UPDATE per date
+    and batch rather than per row.
+    """
+    for model_name, keys in (
+        ('BrokerStockCumulative', ('stock_symbol', 'broker')),
+        ('BrokerSectorCumulative', ('broker', 'sector')),
+    ):
+        model = apps.get_model('floorsheet_analysis', model_name)
+        by_valid_to = defaultdict(list)
+        previous_pair, previous_id = None, None
+        rows = model.objects.order_by(*keys, 'calculation_date').values_list('id', *keys, 'calculation_date')
+        for row_id, *pair, calculation_date in rows.iterator(chunk_size=10000):
+            if pair == previous_pair:
+                by_valid_to[calculation_date - datetime.timedelta(days=1)].append(previous_id)
+            previous_pair, previous_id = pair, row_id
+        for valid_to, ids in by_valid_to.items():
+            for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                model.objects.filter(pk__in=ids[start:start + UPDATE_BATCH_SIZE]).update(valid_to=valid_to)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('floorsheet_analysis', '0002_cumulative_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='brokersectorcumulative',
+            name='valid_to',
+            field=models.DateField(default=OPEN_END),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='brokerstockcumulative',
+            name='valid_to',
+            field=models.DateField(default=OPEN_END),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='brokersectorcumulative',
+            index=models.Index(fields=['valid_to', 'calculation_date'], name='bsec_valid_to_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='brokerstockcumulative',
+            index=models.Index(fields=['valid_to', 'calculation_date'], name='bsc_valid_to_idx'),
+        ),
+        migrations.RunPython(fill_valid_to, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,100 @@
 from django.db import models
 
-# Create your models here.
+
+class BrokerStockDaily(models.Model):
+    """
+    Daily broker x stock cube built from floorsheet_raw at upload time
+    (see nepse_data.ingestion.FloorsheetAggregator). The settlement, net
+    position, top broker and holding history reports read this instead of
+    rescanning floorsheet_raw or the four summary tables.
+
+    matched_* is the broker's self-crossed volume (buyer = seller); those
+    contracts are also counted in both buy_* and sell_*.
+    """
+    calculation_date = models.DateField()
+    stock_symbol = models.CharField(max_length=255)
+    broker = models.IntegerField()
+    sector = models.CharField(max_length=255, blank=True, null=True)
+    buy_quantity = models.BigIntegerField(default=0)
+    buy_amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    sell_quantity = models.BigIntegerField(default=0)
+    sell_amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    matched_quantity = models.BigIntegerField(default=0)
+    matched_amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'broker_stock_daily'
+        unique_together = (('calculation_date', 'stock_symbol', 'broker'),)
+        indexes = [
+            models.Index(fields=['stock_symbol', 'calculation_date'], name='bsd_stock_date_idx'),
+            models.Index(fields=['broker', 'calculation_date'], name='bsd_broker_date_idx'),
+        ]
+        verbose_name = 'Broker Stock Daily'
+        verbose_name_plural = 'Broker Stock Daily'
+
+    def __str__(self):
+        return f"{self.stock_symbol} / {self.broker} on {self.calculation_date}"
+
+
+class BrokerStockCumulative(models.Model):
+    """
+    Running (since the first floorsheet) totals per (stock, broker), one row
+    for each trading day the pair traded. The total over any date range is
+    the row as of the end date minus the row as of the day before the start
+    (see cumulative.py). Built from broker_stock_daily.
+    """
+    calculation_date = models.DateField()
+    stock_symbol = models.CharField(max_length=255)
+    broker = models.IntegerField()
+    buy_quantity = models.BigIntegerField(default=0)
+    buy_amount = models.DecimalField(max_digits=22, decimal_places=2, default=0)
+    sell_quantity = models.BigIntegerField(default=0)
+    sell_amount = models.DecimalField(max_digits=22, decimal_places=2, default=0)
+    matched_quantity = models.BigIntegerField(default=0)
+    matched_amount = models.DecimalField(max_digits=22, decimal_places=2, default=0)
+    valid_to = models.DateField()  # last date this is the pair's newest row
+
+    class Meta:
+        db_table = 'broker_stock_cumulative'
+        unique_together = (('stock_symbol', 'broker', 'calculation_date'),)
+        indexes = [
+            models.Index(fields=['broker', 'stock_symbol', 'calculation_date'], name='bsc_broker_stock_date_idx'),
+            models.Index(fields=['calculation_date'], name='bsc_date_idx'),
+            models.Index(fields=['valid_to', 'calculation_date'], name='bsc_valid_to_idx'),
+        ]
+        verbose_name = 'Broker Stock Cumulative'
+        verbose_name_plural = 'Broker Stock Cumulative'
+
+    def __str__(self):
+        return f"{self.stock_symbol} / {self.broker} as of {self.calculation_date}"
+
+
+class BrokerSectorCumulative(models.Model):
+    """
+    Running totals per (broker, sector), same layout as BrokerStockCumulative.
+    Stocks without a known sector are kept under sector '' so matching
+    totals still cover every stock.
+    """
+    calculation_date = models.DateField()
+    broker = models.IntegerField()
+    sector = models.CharField(max_length=255)
+    buy_quantity = models.BigIntegerField(default=0)
+    buy_amount = models.DecimalField(max_digits=22, decimal_places=2, default=0)
+    sell_quantity = models.BigIntegerField(default=0)
+    sell_amount = models.DecimalField(max_digits=22, decimal_places=2, default=0)
+    matched_quantity = models.BigIntegerField(default=0)
+    matched_amount = models.DecimalField(max_digits=22, decimal_places=2, default=0)
+    valid_to = models.DateField()  # last date this is the pair's newest row
+
+    class Meta:
+        db_table = 'broker_sector_cumulative'
+        unique_together = (('broker', 'sector', 'calculation_date'),)
+        indexes = [
+            models.Index(fields=['calculation_date'], name='bsec_date_idx'),
+            models.Index(fields=['valid_to', 'calculation_date'], name='bsec_valid_to_idx'),
+        ]
+        verbose_name = 'Broker Sector Cumulative'
+        verbose_name_plural = 'Broker Sector Cumulative'
+
+    def __str__(self):
+        return f"{self.broker} / {self.sector or '-'} as of {self.calculation_date}"
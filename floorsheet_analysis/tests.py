@@ -1,3 +1,78 @@
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from .cumulative import MEASURES, range_totals_sql, rebuild_from, update_for_day
+from .models import BrokerStockDaily
+
+START = date(2024, 1, 1)
+DAYS = [START + timedelta(days=i) for i in range(0, 30) if i % 7 not in (5, 6)]
+
+
+class CumulativeRangeTotalsTests(TestCase):
+
+    def add_day(self, calculation_date, rng):
+        """A random broker x stock cube for one day; a pair trades on about a third of the days."""
+        rows = []
+        for symbol, sector in (('AAA', 'Banks'), ('BBB', 'Banks'), ('CCC', None)):
+            for broker in range(1, 6):
+                if rng.random() < 0.35:
+                    rows.append(BrokerStockDaily(
+                        calculation_date=calculation_date, stock_symbol=symbol, broker=broker, sector=sector,
+                        buy_quantity=rng.randint(0, 100), buy_amount=Decimal(rng.randint(0, 10000)) / 100,
+                        sell_quantity=rng.randint(0, 100), sell_amount=Decimal(rng.randint(0, 10000)) / 100,
+                        matched_quantity=rng.randint(0, 10), matched_amount=Decimal(rng.randint(0, 1000)) / 100,
+                    ))
+        BrokerStockDaily.objects.bulk_create(rows)
+
+    def expected(self, level, start_date, end_date):
+        totals = defaultdict(lambda: [0] * len(MEASURES))
+        for row in BrokerStockDaily.objects.filter(calculation_date__range=(start_date, end_date)):
+            pair = (row.stock_symbol, row.broker) if level == 'stock' else (row.broker, row.sector or '')
+            totals[pair] = [total + getattr(row, m) for total, m in zip(totals[pair], MEASURES)]
+        return dict(totals)
+
+    def assert_every_range_matches(self):
+        with connection.cursor() as cursor:
+            for level in ('stock', 'sector'):
+                for i, start_date in enumerate(DAYS):
+                    for end_date in DAYS[i:]:
+                        cursor.execute(*range_totals_sql(level, start_date, end_date))
+                        # sqlite does DECIMAL arithmetic in floats
+                        got = {
+                            tuple(row[:2]): [Decimal(str(v)).quantize(Decimal('0.01')) for v in row[2:]]
+                            for row in cursor.fetchall()
+                        }
+                        self.assertEqual(got, self.expected(level, start_date, end_date),
+                                         f"{level} {start_date}..{end_date}")
+
+    def test_appended_days_and_a_rebuilt_history(self):
+        rng = random.Random(7)
+        with connection.cursor() as cursor:
+            for calculation_date in DAYS:
+                self.add_day(calculation_date, rng)
+                update_for_day(cursor, calculation_date)
+        self.assert_every_range_matches()
+
+        # Re-upload a day in the middle and drop another one
+        BrokerStockDaily.objects.filter(calculation_date=DAYS[8]).delete()
+        self.add_day(DAYS[8], rng)
+        BrokerStockDaily.objects.filter(calculation_date=DAYS[12]).delete()
+        with connection.cursor() as cursor:
+            rebuild_from(cursor, DAYS[8])
+        self.assert_every_range_matches()
+
+    def test_filters(self):
+        rng = random.Random(3)
+        for calculation_date in DAYS:
+            self.add_day(calculation_date, rng)
+        with connection.cursor() as cursor:
+            rebuild_from(cursor)
+            cursor.execute(*range_totals_sql('stock', DAYS[3], DAYS[15], {'stock_symbol': 'BBB'}))
+            pairs = {tuple(row[:2]) for row in cursor.fetchall()}
+        expected = {pair for pair in self.expected('stock', DAYS[3], DAYS[15]) if pair[0] == 'BBB'}
+        self.assertEqual(pairs, expected)
@@ -19,4 +19,5 @@ urlpatterns = [
     path('api/broker_sector_details/', views.broker_sector_details, name='broker_sector_details'),
     path('api/broker_script_details/', views.broker_script_details, name='broker_script_details'),
     path('api/get_floorsheet_details/', views.get_floorsheet_details, name='get_floorsheet_details'),
+    path('api/db_pool_stats/', views.api_db_pool_stats, name='db_pool_stats'),
 ]
\ No newline at end of file
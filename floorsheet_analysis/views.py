@@ -10,61 +10,43 @@ from django.shortcuts import render
 from django.http import JsonResponse
 from django.conf import settings
 
-# --- Database Connection ---
-# This reads from your main Django settings.py DATABASES config
-db_settings = settings.DATABASES['default']
+from . import archive, db
+from .cumulative import range_totals_sql
+from nepse_data.trading_calendar import floorsheet_calendar
 
-DB_CONFIG = {
-    'host': db_settings.get('HOST', '127.0.0.1'),
-    'user': db_settings.get('USER', 'root'),
-    'password': db_settings.get('PASSWORD', ''),
-    'database': db_settings.get('NAME', 'nepse_data'),
-    'port': db_settings.get('PORT', 3306)
-}
+# --- Database Connection ---
+# Connections come from the shared pool in db.py (sized by FLOORSHEET_DB_POOL_SIZE).
+# .close() on them returns the connection to the pool.
 
 def create_connection():
-    """Create a database connection using the config."""
+    """Borrow a pooled database connection (None if the database is unreachable)."""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        return db.get_connection()
     except Error as e:
         print(f"Error while connecting to MySQL: {e}")
         return None
 
+
+def open_cursor(connection):
+    """A dictionary cursor on a pooled connection; the connection goes back to the pool if that fails."""
+    try:
+        return connection.cursor(dictionary=True)
+    except Error:
+        connection.close()
+        raise
+
 # --- Data Fetching Functions (Ported from Flask) ---
 
-def find_valid_trading_date(connection, target_date, available_dates, direction='closest'):
+def fetch_range_totals(cursor, level, start_date, end_date, filters=None):
     """
-    Finds the closest available trading date in the provided list of available_dates.
+    Per-pair buy/sell/matched totals over a date range from the cumulative
+    tables ('stock' = broker x stock, 'sector' = broker x sector): two rows
+    per pair, however long the range is.
     """
-    if not available_dates:
-        return None
-
-    if isinstance(target_date, datetime):
-        target_date = target_date.date()
-
-    available_dates_set = {d for d in available_dates}
-
-    if target_date in available_dates_set:
-        return target_date
+    sql, params = range_totals_sql(level, start_date, end_date, filters)
+    cursor.execute(sql, tuple(params))
+    return cursor.fetchall()
 
-    sorted_available_dates = sorted(available_dates)
-
-    if direction == 'closest':
-        closest_date = min(sorted_available_dates, key=lambda d: abs((d - target_date).days))
-        return closest_date
-    elif direction == 'previous':
-        suitable_dates = [d for d in sorted_available_dates if d <= target_date]
-        if suitable_dates:
-            return max(suitable_dates)
-        return sorted_available_dates[0]
-    elif direction == 'next':
-        suitable_dates = [d for d in sorted_available_dates if d >= target_date]
-        if suitable_dates:
-            return min(suitable_dates)
-        return sorted_available_dates[-1]
-
-    return None
 
 def get_broker_settlement_data(start_date, end_date):
     """
@@ -75,53 +57,31 @@ def get_broker_settlement_data(start_date, end_date):
     if connection is None:
         return []
 
-    cursor = connection.cursor(dictionary=True)
-    
-    # Query: Get Buy/Sell amounts from summary tables
-    settlement_query = """
-    SELECT
-        b.broker_no,
-        b.name AS broker_name,
-        COALESCE(SUM(T.buy_amount), 0) AS buy_amount,
-        COALESCE(SUM(T.sell_amount), 0) AS sell_amount
-    FROM
-        brokers b
-    LEFT JOIN (
-        SELECT buyer AS broker_no, total_amount AS buy_amount, 0 AS sell_amount
-        FROM sector_buyer_summary
-        WHERE calculation_date BETWEEN %s AND %s
-        UNION ALL
-        SELECT seller AS broker_no, 0 AS buy_amount, total_amount AS sell_amount
-        FROM sector_seller_summary
-        WHERE calculation_date BETWEEN %s AND %s
-    ) AS T ON b.broker_no = T.broker_no
-    GROUP BY b.broker_no, b.name
-    HAVING buy_amount > 0 OR sell_amount > 0
-    """
-    
-    # Query: Get internal matching amounts from raw floorsheet data
-    matching_query = """
-    SELECT
-        buyer AS broker_no,
-        SUM(amount) AS matching_amount
-    FROM floorsheet_raw
-    WHERE buyer = seller AND calculation_date BETWEEN %s AND %s
-    GROUP BY buyer
-    """
+    cursor = open_cursor(connection)
     
     try:
-        cursor.execute(settlement_query, (start_date, end_date, start_date, end_date))
-        settlement_data = cursor.fetchall()
-        
-        cursor.execute(matching_query, (start_date, end_date))
-        matching_data = cursor.fetchall()
-        
-        matching_map = {item['broker_no']: item['matching_amount'] for item in matching_data}
+        # Range totals from the broker x sector prefix sums. Buy/sell keep the
+        # old sector summary semantics (stocks with a known sector only);
+        # internal matching covers every stock (sector '').
+        per_broker = {}
+        for row in fetch_range_totals(cursor, 'sector', start_date, end_date):
+            totals = per_broker.setdefault(row['broker'], {'buy_amount': 0, 'sell_amount': 0, 'matching_amount': 0})
+            if row['sector']:
+                totals['buy_amount'] += row['buy_amount']
+                totals['sell_amount'] += row['sell_amount']
+            totals['matching_amount'] += row['matched_amount']
+
+        cursor.execute("SELECT broker_no, name FROM brokers")
+        settlement_data = []
+        for broker in cursor.fetchall():
+            totals = per_broker.get(broker['broker_no'])
+            if not totals or (totals['buy_amount'] <= 0 and totals['sell_amount'] <= 0):
+                continue
+            settlement_data.append({'broker_no': broker['broker_no'], 'broker_name': broker['name'], **totals})
 
         for row in settlement_data:
             row['total_amount'] = row['buy_amount'] + row['sell_amount']
             row['difference'] = row['buy_amount'] - row['sell_amount']
-            row['matching_amount'] = matching_map.get(row['broker_no'], 0)
 
         sorted_data = sorted(settlement_data, key=lambda x: x['total_amount'], reverse=True)
         return sorted_data
@@ -141,53 +101,31 @@ def get_daywise_broker_settlement_data(broker_no, start_date, end_date):
     if connection is None:
         return []
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     
     settlement_query = """
     SELECT
         b.broker_no,
         b.name AS broker_name,
-        T.calculation_date,
-        COALESCE(SUM(T.buy_amount), 0) AS buy_amount,
-        COALESCE(SUM(T.sell_amount), 0) AS sell_amount
-    FROM
-        brokers b
-    LEFT JOIN (
-        SELECT buyer AS broker_no, total_amount AS buy_amount, 0 AS sell_amount, calculation_date
-        FROM sector_buyer_summary
-        WHERE calculation_date BETWEEN %s AND %s AND buyer = %s
-        UNION ALL
-        SELECT seller AS broker_no, 0 AS buy_amount, total_amount AS sell_amount, calculation_date
-        FROM sector_seller_summary
-        WHERE calculation_date BETWEEN %s AND %s AND seller = %s
-    ) AS T ON b.broker_no = T.broker_no
-    WHERE b.broker_no = %s
-    GROUP BY b.broker_no, b.name, T.calculation_date
-    HAVING T.calculation_date IS NOT NULL
-    ORDER BY T.calculation_date DESC
-    """
-    
-    matching_query = """
-    SELECT
-        calculation_date,
-        SUM(amount) AS matching_amount
-    FROM floorsheet_raw
-    WHERE buyer = seller AND buyer = %s AND calculation_date BETWEEN %s AND %s
-    GROUP BY calculation_date
+        c.calculation_date,
+        SUM(CASE WHEN c.sector IS NOT NULL THEN c.buy_amount ELSE 0 END) AS buy_amount,
+        SUM(CASE WHEN c.sector IS NOT NULL THEN c.sell_amount ELSE 0 END) AS sell_amount,
+        SUM(c.matched_amount) AS matching_amount
+    FROM broker_stock_daily c
+    JOIN brokers b ON b.broker_no = c.broker
+    WHERE c.broker = %s AND c.calculation_date BETWEEN %s AND %s
+    GROUP BY b.broker_no, b.name, c.calculation_date
+    HAVING buy_amount > 0 OR sell_amount > 0
+    ORDER BY c.calculation_date DESC
     """
     
     try:
-        cursor.execute(settlement_query, (start_date, end_date, broker_no, start_date, end_date, broker_no, broker_no))
+        cursor.execute(settlement_query, (broker_no, start_date, end_date))
         settlement_data = cursor.fetchall()
-        
-        cursor.execute(matching_query, (broker_no, start_date, end_date))
-        matching_data = cursor.fetchall()
-        matching_map = {item['calculation_date']: item['matching_amount'] for item in matching_data}
 
         for row in settlement_data:
             row['total_amount'] = row['buy_amount'] + row['sell_amount']
             row['difference'] = row['buy_amount'] - row['sell_amount']
-            row['matching_amount'] = matching_map.get(row['calculation_date'], 0)
 
         return settlement_data
 
@@ -204,30 +142,20 @@ def get_broker_sector_details(broker_no, start_date, end_date):
     if not connection:
         return {"error": "Database connection failed"}
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     try:
-        sector_query = """
-        SELECT sector, SUM(buy_amount) AS sector_buy, SUM(sell_amount) AS sector_sell
-        FROM (
-            SELECT sector, total_amount AS buy_amount, 0 AS sell_amount FROM sector_buyer_summary WHERE buyer = %s AND calculation_date BETWEEN %s AND %s
-            UNION ALL
-            SELECT sector, 0 AS buy_amount, total_amount AS sell_amount FROM sector_seller_summary WHERE seller = %s AND calculation_date BETWEEN %s AND %s
-        ) AS combined GROUP BY sector
-        """
-        cursor.execute(sector_query, (broker_no, start_date, end_date, broker_no, start_date, end_date))
-        sector_data = cursor.fetchall()
-
-        broker_totals_query = """
-        SELECT 
-            (SELECT COALESCE(SUM(total_amount), 0) FROM sector_buyer_summary WHERE buyer = %s AND calculation_date BETWEEN %s AND %s) as total_buy,
-            (SELECT COALESCE(SUM(total_amount), 0) FROM sector_seller_summary WHERE seller = %s AND calculation_date BETWEEN %s AND %s) as total_sell
-        """
-        cursor.execute(broker_totals_query, (broker_no, start_date, end_date, broker_no, start_date, end_date))
-        broker_totals = cursor.fetchone()
+        sector_rows = fetch_range_totals(cursor, 'sector', start_date, end_date, {'broker': broker_no})
+        sector_data = [
+            {'sector': row['sector'], 'sector_buy': row['buy_amount'], 'sector_sell': row['sell_amount']}
+            for row in sector_rows if row['sector']
+        ]
+        broker_totals = {
+            'total_buy': sum(row['sector_buy'] for row in sector_data),
+            'total_sell': sum(row['sector_sell'] for row in sector_data),
+        }
 
-        grand_total_query = "SELECT COALESCE(SUM(total_amount), 0) AS total FROM sector_buyer_summary WHERE calculation_date BETWEEN %s AND %s"
-        cursor.execute(grand_total_query, (start_date, end_date))
-        grand_total_turnover = cursor.fetchone()['total']
+        market_rows = fetch_range_totals(cursor, 'sector', start_date, end_date, {'sector <> %s': ''})
+        grand_total_turnover = sum(row['buy_amount'] for row in market_rows)
 
         return {
             "sector_data": sector_data,
@@ -247,7 +175,7 @@ def get_broker_script_details(broker_no, sector, start_date, end_date, broker_to
     if not connection:
         return {"error": "Database connection failed"}
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     try:
         script_query = """
         SELECT stock_symbol, SUM(buy_amount) as script_buy, SUM(sell_amount) as script_sell
@@ -287,19 +215,9 @@ def settlement_report(request):
     """
     Main view for the Broker Settlement Report page.
     """
-    connection = create_connection()
-    if connection is None:
-        return render(request, 'floorsheet_analysis/settlement_report.html', {'error': 'Database connection failed.'})
-
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT DISTINCT calculation_date FROM sector_buyer_summary
-        UNION
-        SELECT DISTINCT calculation_date FROM sector_seller_summary
-        ORDER BY calculation_date DESC
-    """)
-    available_dates_db = sorted([d['calculation_date'] for d in cursor.fetchall()], reverse=True)
-    latest_available_date = available_dates_db[0] if available_dates_db else date.today()
+    # Trading dates come from the cached calendar (no query per request)
+    calendar = floorsheet_calendar()
+    latest_available_date = calendar.latest or date.today()
 
     # Handle form data from POST or GET
     form_data = request.POST if request.method == 'POST' else request.GET
@@ -310,7 +228,7 @@ def settlement_report(request):
         selected_date_range_type = 'custom'
         end_date = latest_available_date
         potential_start_date = end_date - timedelta(days=60)
-        start_date = find_valid_trading_date(connection, potential_start_date, available_dates_db, direction='next') or latest_available_date
+        start_date = calendar.snap(potential_start_date, 'next') or latest_available_date
     else:
         start_date = latest_available_date
         end_date = latest_available_date
@@ -319,7 +237,7 @@ def settlement_report(request):
         if end_date_str_form:
             try:
                 potential_end_date = datetime.strptime(end_date_str_form, '%Y-%m-%d').date()
-                end_date = find_valid_trading_date(connection, potential_end_date, available_dates_db, direction='previous') or latest_available_date
+                end_date = calendar.snap(potential_end_date, 'previous') or latest_available_date
             except (ValueError, TypeError):
                 pass
         
@@ -328,21 +246,13 @@ def settlement_report(request):
             '1_week': 7, 'fortnight': 15, 'monthly': 30
         }
         if selected_date_range_type in range_map:
-            count = 0
-            temp_start_date = end_date
-            for d in available_dates_db:
-                if d <= end_date:
-                    count += 1
-                    temp_start_date = d
-                    if count >= range_map[selected_date_range_type]:
-                        break
-            start_date = temp_start_date
+            start_date = calendar.window_start(end_date, range_map[selected_date_range_type])
         elif selected_date_range_type == 'custom':
             start_date_str_form = form_data.get('start_date')
             if start_date_str_form:
                 try:
                     potential_start_date = datetime.strptime(start_date_str_form, '%Y-%m-%d').date()
-                    start_date = find_valid_trading_date(connection, potential_start_date, available_dates_db, direction='next') or latest_available_date
+                    start_date = calendar.snap(potential_start_date, 'next') or latest_available_date
                 except (ValueError, TypeError):
                     pass
     
@@ -361,9 +271,6 @@ def settlement_report(request):
     else:
         settlement_data = get_broker_settlement_data(start_date, end_date)
 
-    cursor.close()
-    connection.close()
-
     # Helper function to serialize data for JavaScript
     def json_default(obj):
         if isinstance(obj, (date, datetime)):
@@ -378,7 +285,7 @@ def settlement_report(request):
         'start_date': start_date.strftime('%Y-%m-%d'),
         'end_date': end_date.strftime('%Y-%m-%d'),
         'selected_date_range_type': selected_date_range_type,
-        'available_dates_db': json.dumps([d.strftime('%Y-%m-%d') for d in available_dates_db]),
+        'available_dates_db': json.dumps([d.strftime('%Y-%m-%d') for d in calendar.descending()]),
         'search_broker_no': search_broker_no,
         'is_daywise_view': is_daywise_view
     }
@@ -449,7 +356,7 @@ def get_broker_name_map():
     if connection is None:
         return {}
     
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     broker_name_map = {}
     try:
         cursor.execute("SELECT broker_no, name FROM brokers")
@@ -472,51 +379,34 @@ def get_summary_data_for_range(stock_symbol, start_date, end_date):
     if connection is None:
         return [], [], {'total_traded_kitta': 0, 'total_amount': 0, 'atr': 0}
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     buyer_data = []
     seller_data = []
     overall_summary = {'total_traded_kitta': 0, 'total_amount': 0, 'atr': 0}
 
     try:
-        # Fetch buyer data
-        query_buyer = """
-        SELECT buyer, SUM(total_quantity) as total_quantity, SUM(total_amount) as total_amount
-        FROM buyer_summary
-        WHERE stock_symbol = %s AND calculation_date BETWEEN %s AND %s
-        GROUP BY buyer
-        ORDER BY total_amount DESC
-        """
-        cursor.execute(query_buyer, (stock_symbol, start_date, end_date))
-        buyer_data = cursor.fetchall()
+        # Both sides come from one broker x stock prefix-sum query
+        pairs = fetch_range_totals(cursor, 'stock', start_date, end_date, {'stock_symbol': stock_symbol})
+
+        buyer_data = sorted(
+            ({'buyer': row['broker'], 'total_quantity': row['buy_quantity'], 'total_amount': row['buy_amount']}
+             for row in pairs if row['buy_quantity'] or row['buy_amount']),
+            key=lambda row: row['total_amount'], reverse=True
+        )
         for row in buyer_data:
             row['average_rate'] = (row['total_amount'] / row['total_quantity']) if row['total_quantity'] else 0
 
-        # Fetch seller data
-        query_seller = """
-        SELECT seller, SUM(total_quantity) as total_quantity, SUM(total_amount) as total_amount
-        FROM seller_summary
-        WHERE stock_symbol = %s AND calculation_date BETWEEN %s AND %s
-        GROUP BY seller
-        ORDER BY total_amount DESC
-        """
-        cursor.execute(query_seller, (stock_symbol, start_date, end_date))
-        seller_data = cursor.fetchall()
+        seller_data = sorted(
+            ({'seller': row['broker'], 'total_quantity': row['sell_quantity'], 'total_amount': row['sell_amount']}
+             for row in pairs if row['sell_quantity'] or row['sell_amount']),
+            key=lambda row: row['total_amount'], reverse=True
+        )
         for row in seller_data:
             row['average_rate'] = (row['total_amount'] / row['total_quantity']) if row['total_quantity'] else 0
 
         # Calculate range-specific totals
-        query_buy_totals = """
-        SELECT
-            SUM(total_quantity) AS total_buy_quantity,
-            SUM(total_amount) AS total_buy_amount
-        FROM buyer_summary
-        WHERE stock_symbol = %s AND calculation_date BETWEEN %s AND %s
-        """
-        cursor.execute(query_buy_totals, (stock_symbol, start_date, end_date))
-        buy_totals = cursor.fetchone()
-
-        total_traded_kitta = buy_totals['total_buy_quantity'] or 0
-        total_amount = buy_totals['total_buy_amount'] or 0
+        total_traded_kitta = sum(row['total_quantity'] for row in buyer_data)
+        total_amount = sum(row['total_amount'] for row in buyer_data)
         atr = total_amount / total_traded_kitta if total_traded_kitta else 0
 
         overall_summary = {
@@ -540,29 +430,20 @@ def get_broker_net_data(stock_symbol, start_date, end_date):
     if connection is None:
         return []
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     broker_net_data = []
     
     try:
-        query_net_data = """
-        SELECT
-            broker,
-            SUM(CASE WHEN type = 'buy' THEN quantity ELSE 0 END) as total_buy_quantity,
-            SUM(CASE WHEN type = 'sell' THEN quantity ELSE 0 END) as total_sell_quantity,
-            SUM(CASE WHEN type = 'buy' THEN quantity ELSE 0 END) - SUM(CASE WHEN type = 'sell' THEN quantity ELSE 0 END) as net_quantity
-        FROM (
-            SELECT buyer as broker, total_quantity as quantity, 'buy' as type
-            FROM buyer_summary
-            WHERE stock_symbol = %s AND calculation_date BETWEEN %s AND %s
-            UNION ALL
-            SELECT seller as broker, total_quantity as quantity, 'sell' as type
-            FROM seller_summary
-            WHERE stock_symbol = %s AND calculation_date BETWEEN %s AND %s
-        ) as combined_data
-        GROUP BY broker
-        """
-        cursor.execute(query_net_data, (stock_symbol, start_date, end_date, stock_symbol, start_date, end_date))
-        broker_net_data = cursor.fetchall()
+        pairs = fetch_range_totals(cursor, 'stock', start_date, end_date, {'stock_symbol': stock_symbol})
+        broker_net_data = [
+            {
+                'broker': row['broker'],
+                'total_buy_quantity': row['buy_quantity'],
+                'total_sell_quantity': row['sell_quantity'],
+                'net_quantity': row['buy_quantity'] - row['sell_quantity'],
+            }
+            for row in pairs
+        ]
 
     except Error as e:
         print(f"Error in get_broker_net_data: {e}")
@@ -581,38 +462,26 @@ def company_trades_report(request):
     if connection is None:
         return render(request, 'floorsheet_analysis/company_trades_report.html', {'error': 'Database connection failed.'})
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     
     try:
         cursor.execute("SELECT DISTINCT stock_symbol FROM buyer_summary ORDER BY stock_symbol")
         stocks = cursor.fetchall()
         
         broker_name_map = get_broker_name_map()
-
-        cursor.execute("""
-            SELECT DISTINCT calculation_date FROM buyer_summary
-            UNION
-            SELECT DISTINCT calculation_date FROM seller_summary
-            ORDER BY calculation_date DESC
-        """)
-        available_dates_db = sorted([d['calculation_date'] for d in cursor.fetchall()], reverse=True)
         
     except Error as e:
         print(f"Error fetching initial data: {e}")
         stocks = []
         broker_name_map = {}
-        available_dates_db = []
     
     finally:
         cursor.close()
-        # Don't close connection yet, find_valid_trading_date might need it (oh, wait, it doesn't)
-        # But the date logic below does. Let's re-open if needed or just keep it.
-        # Re-reading my code: find_valid_trading_date does not need the connection.
-        # So we can close it.
-        if connection.is_connected():
-            connection.close()
+        # Always hand pooled connections back, even if the socket dropped
+        connection.close()
 
-    latest_available_date = available_dates_db[0] if available_dates_db else date.today()
+    calendar = floorsheet_calendar()
+    latest_available_date = calendar.latest or date.today()
 
     # Handle form data from POST or GET
     form_data = request.POST if request.method == 'POST' else request.GET
@@ -627,7 +496,7 @@ def company_trades_report(request):
     if end_date_str_form:
         try:
             potential_end_date = datetime.strptime(end_date_str_form, '%Y-%m-%d').date()
-            end_date = find_valid_trading_date(None, potential_end_date, available_dates_db, direction='previous') or latest_available_date
+            end_date = calendar.snap(potential_end_date, 'previous') or latest_available_date
         except (ValueError, TypeError):
             pass
 
@@ -652,20 +521,12 @@ def company_trades_report(request):
         try:
             if start_date_str_form:
                 potential_start_date = datetime.strptime(start_date_str_form, '%Y-%m-%d').date()
-                start_date = find_valid_trading_date(None, potential_start_date, available_dates_db, direction='next') or latest_available_date
+                start_date = calendar.snap(potential_start_date, 'next') or latest_available_date
         except (ValueError, TypeError):
             pass
     
     if selected_date_range_type not in ['custom', 'current_day']:
-        count = 0
-        temp_start_date = end_date
-        for d in available_dates_db:
-            if d <= end_date:
-                count += 1
-                temp_start_date = d
-                if count >= days_to_find:
-                    break
-        start_date = temp_start_date
+        start_date = calendar.window_start(end_date, days_to_find)
 
     if start_date > end_date:
         start_date, end_date = end_date, start_date
@@ -696,7 +557,7 @@ def company_trades_report(request):
         'overall_summary': overall_summary,
         'broker_net_data_asc': broker_net_data_asc,
         'broker_net_data_desc': broker_net_data_desc,
-        'available_dates_db_json': json.dumps([d.strftime('%Y-%m-%d') for d in available_dates_db]),
+        'available_dates_db_json': json.dumps([d.strftime('%Y-%m-%d') for d in calendar.descending()]),
         'broker_name_map_json': json.dumps(broker_name_map, default=json_default_decimal)
     }
 
@@ -728,7 +589,7 @@ def get_floorsheet_details(request):
     detailed_data = []
 
     if conn:
-        cursor = conn.cursor(dictionary=True)
+        cursor = open_cursor(conn)
         try:
             start_date_obj = datetime.strptime(start_date_str, '%Y-%m-%d').date()
             end_date_obj = datetime.strptime(end_date_str, '%Y-%m-%d').date()
@@ -754,6 +615,22 @@ def get_floorsheet_details(request):
             cursor.execute(query, tuple(params))
             detailed_data = cursor.fetchall()
 
+            # Closed months live in the Parquet archive (days back in MySQL win)
+            if archive.load_manifest():
+                cursor.execute(
+                    "SELECT DISTINCT calculation_date FROM floorsheet_raw WHERE calculation_date BETWEEN %s AND %s",
+                    (start_date_obj, end_date_obj),
+                )
+                hot_dates = [row['calculation_date'] for row in cursor.fetchall()]
+                side = {'buyer': 'buyers', 'seller': 'sellers', 'broker': 'brokers'}.get(detail_type)
+                detailed_data.extend(archive.scan_rows(
+                    start_date=start_date_obj, end_date=end_date_obj, symbols=[stock_symbol],
+                    exclude_dates=hot_dates, **({side: [detail_name]} if side else {})
+                ))
+
+        except archive.ArchiveError as err:
+            print(f"Error reading the floorsheet archive: {err}")
+            return JsonResponse({"error": "Archive unavailable"}, status=500)
         except mysql.connector.Error as err:
             print(f"Error fetching detailed data: {err}")
             return JsonResponse({"error": "Database error"}, status=500)
@@ -780,38 +657,24 @@ def get_broker_transaction_summary(broker_no, start_date, end_date):
     if connection is None:
         return [], []  # Return empty lists for buy and sell data
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     buy_data = []
     sell_data = []
 
     try:
-        # Query for all stocks BOUGHT by the broker in the date range
-        query_buyer = """
-        SELECT
-            stock_symbol,
-            SUM(total_quantity) as total_quantity,
-            SUM(total_amount) as total_amount
-        FROM buyer_summary
-        WHERE buyer = %s AND calculation_date BETWEEN %s AND %s
-        GROUP BY stock_symbol
-        ORDER BY total_amount DESC
-        """
-        cursor.execute(query_buyer, (broker_no, start_date, end_date))
-        buy_data = cursor.fetchall()
-
-        # Query for all stocks SOLD by the broker in the date range
-        query_seller = """
-        SELECT
-            stock_symbol,
-            SUM(total_quantity) as total_quantity,
-            SUM(total_amount) as total_amount
-        FROM seller_summary
-        WHERE seller = %s AND calculation_date BETWEEN %s AND %s
-        GROUP BY stock_symbol
-        ORDER BY total_amount DESC
-        """
-        cursor.execute(query_seller, (broker_no, start_date, end_date))
-        sell_data = cursor.fetchall()
+        # Every stock the broker traded in the range, from the prefix sums
+        pairs = fetch_range_totals(cursor, 'stock', start_date, end_date, {'broker': broker_no})
+
+        buy_data = sorted(
+            ({'stock_symbol': row['stock_symbol'], 'total_quantity': row['buy_quantity'], 'total_amount': row['buy_amount']}
+             for row in pairs if row['buy_quantity'] or row['buy_amount']),
+            key=lambda row: row['total_amount'], reverse=True
+        )
+        sell_data = sorted(
+            ({'stock_symbol': row['stock_symbol'], 'total_quantity': row['sell_quantity'], 'total_amount': row['sell_amount']}
+             for row in pairs if row['sell_quantity'] or row['sell_amount']),
+            key=lambda row: row['total_amount'], reverse=True
+        )
 
     except Error as e:
         print(f"Error fetching broker transaction summary: {e}")
@@ -859,40 +722,32 @@ def get_stock_holding_history(stock_symbol, broker_nos, start_date, end_date):
     Calculates the day-wise buy, sell, net, and cumulative holding history for
     a specific stock and a LIST of brokers within the given date range.
     """
+    if not broker_nos: return []
     connection = create_connection()
     if not connection: return []
-    if not broker_nos: return []
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     history_data = []
     try:
         broker_placeholders = ', '.join(['%s'] * len(broker_nos))
+        # Cube rows already hold each broker's daily buy/sell for the stock;
+        # a contract between two selected brokers counts on both sides, as before.
         daily_summary_query = f"""
         SELECT
             calculation_date,
-            SUM(CASE WHEN buyer IN ({broker_placeholders}) THEN quantity ELSE 0 END) as buy_quantity,
-            SUM(CASE WHEN buyer IN ({broker_placeholders}) THEN amount ELSE 0 END) as buy_amount,
-            SUM(CASE WHEN seller IN ({broker_placeholders}) THEN quantity ELSE 0 END) as sell_quantity,
-            SUM(CASE WHEN seller IN ({broker_placeholders}) THEN amount ELSE 0 END) as sell_amount
-        FROM floorsheet_raw
+            SUM(buy_quantity) as buy_quantity,
+            SUM(buy_amount) as buy_amount,
+            SUM(sell_quantity) as sell_quantity,
+            SUM(sell_amount) as sell_amount
+        FROM broker_stock_daily
         WHERE
             stock_symbol = %s
-            AND (buyer IN ({broker_placeholders}) OR seller IN ({broker_placeholders}))
+            AND broker IN ({broker_placeholders})
             AND calculation_date BETWEEN %s AND %s
         GROUP BY calculation_date
         ORDER BY calculation_date ASC
         """
-        params_list = []
-        params_list.extend(broker_nos) # for buy_quantity
-        params_list.extend(broker_nos) # for buy_amount
-        params_list.extend(broker_nos) # for sell_quantity
-        params_list.extend(broker_nos) # for sell_amount
-        params_list.append(stock_symbol)
-        params_list.extend(broker_nos) # for WHERE buyer IN (...)
-        params_list.extend(broker_nos) # for WHERE seller IN (...)
-        params_list.append(start_date)
-        params_list.append(end_date)
-        params = tuple(params_list)
+        params = tuple([stock_symbol] + list(broker_nos) + [start_date, end_date])
 
         cursor.execute(daily_summary_query, params)
         daily_transactions = cursor.fetchall()
@@ -923,19 +778,11 @@ def broker_trades_report(request):
     if connection is None:
         return render(request, 'floorsheet_analysis/broker_trades_report.html', {'error': 'Database connection failed.'})
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     
     try:
         cursor.execute("SELECT broker_no, name FROM brokers ORDER BY broker_no")
         all_brokers = cursor.fetchall()
-
-        cursor.execute("""
-            SELECT DISTINCT calculation_date FROM buyer_summary
-            UNION
-            SELECT DISTINCT calculation_date FROM seller_summary
-            ORDER BY calculation_date DESC
-        """)
-        available_dates_db = sorted([d['calculation_date'] for d in cursor.fetchall()], reverse=True)
         
         # --- NEW: Get the company name map ---
         cursor.execute("SELECT script_ticker, company_name FROM companies")
@@ -945,15 +792,14 @@ def broker_trades_report(request):
     except Error as e:
         print(f"Error fetching initial data: {e}")
         all_brokers = []
-        available_dates_db = []
         company_name_map = {} # <-- Add this
     
     finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+        cursor.close()
+        connection.close()
 
-    latest_available_date = available_dates_db[0] if available_dates_db else date.today()
+    calendar = floorsheet_calendar()
+    latest_available_date = calendar.latest or date.today()
 
     form_data = request.POST if request.method == 'POST' else request.GET
     
@@ -967,7 +813,7 @@ def broker_trades_report(request):
     if end_date_str_form:
         try:
             potential_end_date = datetime.strptime(end_date_str_form, '%Y-%m-%d').date()
-            end_date = find_valid_trading_date(None, potential_end_date, available_dates_db, direction='previous') or latest_available_date
+            end_date = calendar.snap(potential_end_date, 'previous') or latest_available_date
         except (ValueError, TypeError):
             pass
             
@@ -991,20 +837,12 @@ def broker_trades_report(request):
         if start_date_str_form:
             try:
                 potential_start_date = datetime.strptime(start_date_str_form, '%Y-%m-%d').date()
-                start_date = find_valid_trading_date(None, potential_start_date, available_dates_db, direction='next') or latest_available_date
+                start_date = calendar.snap(potential_start_date, 'next') or latest_available_date
             except (ValueError, TypeError):
                 pass
     
     if days_to_find > 0:
-        count = 0
-        temp_start_date = end_date
-        for d in available_dates_db:
-            if d <= end_date:
-                count += 1
-                temp_start_date = d
-                if count >= days_to_find:
-                    break
-        start_date = temp_start_date
+        start_date = calendar.window_start(end_date, days_to_find)
     
     if start_date > end_date:
         start_date, end_date = end_date, start_date
@@ -1035,7 +873,7 @@ def broker_trades_report(request):
         'end_date': end_date.strftime('%Y-%m-%d'),
         'total_buy_amount': total_buy_amount,
         'total_sell_amount': total_sell_amount,
-        'available_dates_db_json': json.dumps([d.strftime('%Y-%m-%d') for d in available_dates_db]),
+        'available_dates_db_json': json.dumps([d.strftime('%Y-%m-%d') for d in calendar.descending()]),
         'selected_date_range_type': selected_date_range_type,
         'company_name_map_json': json.dumps(company_name_map) # <-- ADD THIS LINE
     }
@@ -1059,30 +897,22 @@ def stock_holding_history_report(request):
     if not connection:
         return render(request, 'floorsheet_analysis/stock_holding_history_report.html', {'error': 'Database connection failed.'})
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     
     try:
-        cursor.execute("SELECT DISTINCT stock_symbol FROM floorsheet_raw ORDER BY stock_symbol")
+        cursor.execute("SELECT DISTINCT stock_symbol FROM broker_stock_daily ORDER BY stock_symbol")
         stocks = cursor.fetchall()
         cursor.execute("SELECT broker_no, name FROM brokers ORDER BY broker_no")
         brokers = cursor.fetchall()
-        
-        cursor.execute("""
-            SELECT DISTINCT calculation_date FROM floorsheet_raw
-            ORDER BY calculation_date DESC
-        """)
-        available_dates_db = [d['calculation_date'] for d in cursor.fetchall()]
     
     except Error as e:
         print(f"Error fetching initial data: {e}")
         stocks = []
         brokers = []
-        available_dates_db = []
 
     finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+        cursor.close()
+        connection.close()
 
     history_data = []
     
@@ -1118,10 +948,10 @@ def stock_holding_history_report(request):
     
     num_trading_days = trading_day_count_map.get(selected_period, 30)
     
-    if available_dates_db:
-        end_date = available_dates_db[0]
-        start_date_index = min(num_trading_days - 1, len(available_dates_db) - 1)
-        start_date = available_dates_db[start_date_index]
+    calendar = floorsheet_calendar()
+    if calendar.latest:
+        end_date = calendar.latest
+        start_date = calendar.window_start(end_date, num_trading_days)
     else:
         end_date = date.today()
         start_date = end_date - timedelta(days=num_trading_days)
@@ -1153,30 +983,21 @@ def get_top_brokers_for_stock(stock_symbol, start_date, end_date, limit=10):
     if not connection:
         return {'net_buyers': [], 'net_sellers': []}
 
-    cursor = connection.cursor(dictionary=True)
-    
-    query = """
-    SELECT
-        broker,
-        SUM(buy_qty) as total_buy_quantity,
-        SUM(buy_amount) as total_buy_amount,
-        SUM(sell_qty) as total_sell_quantity,
-        SUM(sell_amount) as total_sell_amount,
-        SUM(buy_qty) - SUM(sell_qty) as net_quantity
-    FROM (
-        SELECT buyer as broker, quantity as buy_qty, amount as buy_amount, 0 as sell_qty, 0 as sell_amount FROM floorsheet_raw
-        WHERE stock_symbol = %s AND calculation_date BETWEEN %s AND %s AND buyer IS NOT NULL
-        UNION ALL
-        SELECT seller as broker, 0 as buy_qty, 0 as buy_amount, quantity as sell_qty, amount as sell_amount FROM floorsheet_raw
-        WHERE stock_symbol = %s AND calculation_date BETWEEN %s AND %s AND seller IS NOT NULL
-    ) as combined_data
-    GROUP BY broker
-    HAVING net_quantity != 0
-    """
+    cursor = open_cursor(connection)
     
     try:
-        cursor.execute(query, (stock_symbol, start_date, end_date, stock_symbol, start_date, end_date))
-        all_brokers_net = cursor.fetchall()
+        all_brokers_net = [
+            {
+                'broker': row['broker'],
+                'total_buy_quantity': row['buy_quantity'],
+                'total_buy_amount': row['buy_amount'],
+                'total_sell_quantity': row['sell_quantity'],
+                'total_sell_amount': row['sell_amount'],
+                'net_quantity': row['buy_quantity'] - row['sell_quantity'],
+            }
+            for row in fetch_range_totals(cursor, 'stock', start_date, end_date, {'stock_symbol': stock_symbol})
+            if row['buy_quantity'] != row['sell_quantity']
+        ]
         
         for row in all_brokers_net:
             for key, value in row.items():
@@ -1210,30 +1031,22 @@ def stock_holding_history_report(request):
     if not connection:
         return render(request, 'floorsheet_analysis/stock_holding_history_report.html', {'error': 'Database connection failed.'})
 
-    cursor = connection.cursor(dictionary=True)
+    cursor = open_cursor(connection)
     
     try:
-        cursor.execute("SELECT DISTINCT stock_symbol FROM floorsheet_raw ORDER BY stock_symbol")
+        cursor.execute("SELECT DISTINCT stock_symbol FROM broker_stock_daily ORDER BY stock_symbol")
         stocks = cursor.fetchall()
         cursor.execute("SELECT broker_no, name FROM brokers ORDER BY broker_no")
         brokers = cursor.fetchall()
-        
-        cursor.execute("""
-            SELECT DISTINCT calculation_date FROM floorsheet_raw
-            ORDER BY calculation_date DESC
-        """)
-        available_dates_db = [d['calculation_date'] for d in cursor.fetchall()]
     
     except Error as e:
         print(f"Error fetching initial data: {e}")
         stocks = []
         brokers = []
-        available_dates_db = []
 
     finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+        cursor.close()
+        connection.close()
 
     history_data = []
     
@@ -1269,10 +1082,10 @@ def stock_holding_history_report(request):
     
     num_trading_days = trading_day_count_map.get(selected_period, 30)
     
-    if available_dates_db:
-        end_date = available_dates_db[0]
-        start_date_index = min(num_trading_days - 1, len(available_dates_db) - 1)
-        start_date = available_dates_db[start_date_index]
+    calendar = floorsheet_calendar()
+    if calendar.latest:
+        end_date = calendar.latest
+        start_date = calendar.window_start(end_date, num_trading_days)
     else:
         end_date = date.today()
         start_date = end_date - timedelta(days=num_trading_days)
@@ -1309,4 +1122,11 @@ def api_stock_summary_report(request):
         return JsonResponse({"error": "Missing required parameters"}, status=400)
 
     data = get_top_brokers_for_stock(stock_symbol, start_date, end_date)
-    return JsonResponse(data)
\ No newline at end of file
+    return JsonResponse(data)
+
+def api_db_pool_stats(request):
+    """
+    API endpoint exposing the floorsheet_analysis connection pool metrics
+    (hits, misses, wait times, connections checked out).
+    """
+    return JsonResponse(db.pool_stats())
@@ -160,4 +160,70 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0'
 
 # Use Redis as the result backend
-CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
\ No newline at end of file
+CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
+
+# Recalculation batches are CPU-bound (NumPy) and use blocking DB calls, so they
+# go to their own queue, served by the prefork 'recalc' worker in the Procfile
+# (one process per core); the gevent worker keeps the default queue.
+CELERY_TASK_ROUTES = {
+    'adjustments_stock_price.tasks.recalculate_symbol_batch': {'queue': env('RECALC_QUEUE', default='recalc')},
+}
+
+# --- CACHE ---
+# Shared by the web and Celery processes so invalidations (e.g. the trading
+# calendar after an upload) reach every worker. Set CACHE_URL=locmemcache://
+# to run without Redis.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='redis://127.0.0.1:6379/1'),
+}
+
+# Seconds the cached trading-date calendars (nepse_data.trading_calendar) live
+# without an invalidation; only matters for writes that bypass the upload/delete views.
+TRADING_CALENDAR_CACHE_TIMEOUT = env.int('TRADING_CALENDAR_CACHE_TIMEOUT', default=3600)
+
+# --- DATA INGESTION SETTINGS ---
+# Re-compute the floorsheet summary rollups in SQL after each upload and
+# report any difference from the streamed aggregates (slower; for debugging).
+FLOORSHEET_VERIFY_SUMMARIES = env.bool('FLOORSHEET_VERIFY_SUMMARIES', default=False)
+
+# Uploads are copied here so the Celery worker can read them (see nepse_data.tasks)
+INGESTION_STAGING_DIR = env('INGESTION_STAGING_DIR', default=os.path.join(BASE_DIR, 'staging', 'ingestion'))
+
+# Rows fetched per round-trip by the streaming CSV downloads (nepse_data.exports)
+CSV_EXPORT_CHUNK_SIZE = env.int('CSV_EXPORT_CHUNK_SIZE', default=2000)
+
+# Symbols per recalculate_symbol_batch task in do_recalculation_work
+RECALC_BATCH_SIZE = env.int('RECALC_BATCH_SIZE', default=25)
+
+# Keep writing the full stock_prices_adj copy. Adjusted views and
+# MarketDataService.get_ohlcv read raw prices x adjustment_factor_segments
+# either way; turn this off once nothing else reads stock_prices_adj.
+ADJUSTED_PRICES_MATERIALIZE = env.bool('ADJUSTED_PRICES_MATERIALIZE', default=True)
+
+# --- FLOORSHEET ARCHIVE ---
+# Closed months of floorsheet_raw are moved here as Parquet files by
+# `manage.py archive_floorsheet` (see floorsheet_analysis.archive)
+FLOORSHEET_ARCHIVE_DIR = env('FLOORSHEET_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive', 'floorsheet'))
+# Most recent calendar months that stay in MySQL
+FLOORSHEET_ARCHIVE_KEEP_MONTHS = env.int('FLOORSHEET_ARCHIVE_KEEP_MONTHS', default=3)
+# Rows per Parquet row group (the unit the date/symbol filters can skip)
+FLOORSHEET_ARCHIVE_ROW_GROUP = env.int('FLOORSHEET_ARCHIVE_ROW_GROUP', default=100000)
+
+# --- PRICE PANEL ---
+# Adjusted OHLCV as (dates x symbols) .npy arrays that the technical
+# analysis services memory-map (see technical_analysis.services.price_panel)
+PRICE_PANEL_DIR = env('PRICE_PANEL_DIR', default=os.path.join(BASE_DIR, 'data', 'price_panel'))
+# Update the panel after price uploads / adjustment refreshes and let
+# MarketDataService read from it; off = every read goes to MySQL
+PRICE_PANEL_ENABLED = env.bool('PRICE_PANEL_ENABLED', default=True)
+
+# --- INDICATOR CACHE ---
+# Size budget of the indicator series cached in indicator_cache by the
+# chart / indicator views; least recently used series are evicted beyond it
+INDICATOR_CACHE_MAX_BYTES = env.int('INDICATOR_CACHE_MAX_BYTES', default=64 * 1024 * 1024)
+
+# --- FLOORSHEET ANALYSIS DB POOL ---
+# Shared mysql.connector pool for the floorsheet_analysis reports (max 32)
+FLOORSHEET_DB_POOL_SIZE = env.int('FLOORSHEET_DB_POOL_SIZE', default=8)
+# Seconds a request waits for a free pooled connection before failing
+FLOORSHEET_DB_POOL_TIMEOUT = env.float('FLOORSHEET_DB_POOL_TIMEOUT', default=10.0)
@@ -0,0 +1,138 @@
+# nepse_data/exports.py
+"""
+Streaming CSV downloads.
+
+The download views used to render the whole CSV into an HttpResponse from a
+fully fetched queryset, so an all-dates floorsheet export held every row
+(and the text) in the worker's memory. Here rows come off the database in
+fetchmany() chunks and CSV text goes out as it is produced, so memory stays
+at one chunk and the first bytes leave straight away.
+
+On MySQL the query runs on an unbuffered server-side cursor (SSCursor);
+mysqlclient's default cursor would pull the whole result set into the
+client first, which is also what QuerySet.iterator() does on MySQL. An
+unbuffered result blocks its connection until it is read to the end (any
+other query fails with "Commands out of sync"), and a streamed response
+is read long after the view returned, so the cursor gets a connection of
+its own, closed with the cursor, instead of Django's shared one. That
+connection only sees committed rows, so inside an atomic block the query
+falls back to a buffered cursor on the shared connection.
+"""
+import csv
+import io
+import zlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import StreamingHttpResponse
+
+# Flush CSV text to the client in blocks of roughly this many bytes
+CSV_FLUSH_BYTES = 64 * 1024
+
+
+def export_chunk_size():
+    return getattr(settings, 'CSV_EXPORT_CHUNK_SIZE', 2000)
+
+
+def _server_side_cursor():
+    """Returns (cursor, dedicated connection or None); close both when done."""
+    if connection.vendor != 'mysql' or connection.in_atomic_block:
+        return connection.cursor(), None
+    from MySQLdb.cursors import SSCursor
+    streaming = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        streaming.ensure_connection()
+        return streaming.connection.cursor(SSCursor), streaming
+    except Exception:
+        streaming.close()
+        raise
+
+
+def stream_query(sql, params=None, chunk_size=None):
+    """
+    Runs a query and returns (column names, row iterator). Rows are fetched
+    chunk_size at a time; the cursor (and its connection) is closed once the
+    iterator is done.
+    """
+    chunk_size = chunk_size or export_chunk_size()
+    cursor, streaming = _server_side_cursor()
+
+    def close():
+        cursor.close()
+        if streaming is not None:
+            streaming.close()
+
+    try:
+        cursor.execute(sql, params or ())
+    except Exception:
+        close()
+        raise
+    columns = [col[0] for col in cursor.description]
+
+    def rows():
+        try:
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                yield from chunk
+        finally:
+            close()
+
+    return columns, rows()
+
+
+def stream_queryset(queryset, chunk_size=None):
+    """stream_query() for a (values_list) queryset."""
+    sql, params = queryset.query.sql_with_params()
+    return stream_query(sql, params, chunk_size)
+
+
+def _csv_chunks(header, first_row, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    writer.writerow(first_row)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CSV_FLUSH_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def wants_gzip(request):
+    """?gzip=1 asks for a .csv.gz download."""
+    return request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+
+def streaming_csv_response(filename, header, rows, gzip=False):
+    """
+    StreamingHttpResponse writing header + rows as CSV (gzipped into
+    filename.gz when gzip=True). Returns None when rows is empty, so the
+    caller can answer 404 instead.
+    """
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+        return None
+
+    chunks = _csv_chunks(header, first_row, rows)
+    if gzip:
+        response = StreamingHttpResponse(_gzip_chunks(chunks), content_type='application/gzip')
+        filename = f"{filename}.gz"
+    else:
+        response = StreamingHttpResponse(chunks, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,1000 @@
+# nepse_data/ingestion.py
+import csv
+import datetime
+import io
+import re
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+
+from adjustments_stock_price.incremental import record_price_changes
+from floorsheet_analysis.cumulative import update_for_day as update_cumulative_for_day
+from listed_companies.models import Companies
+from nepali_datetime.models import FiscalYear
+from nepali_datetime.utils import bs_to_ad, NEPALI_CALENDAR_DATA
+from .models import StockPrices, Indices, Marcap, DividendHistory
+from .trading_calendar import invalidate as invalidate_calendar
+from .utils import clean_decimal, clean_int, clean_date
+
+
+class IngestionError(Exception):
+    """Raised when an uploaded file cannot be ingested at all (bad header, empty file...)."""
+    pass
+
+
+# --- Batch size for multi-row INSERTs. ---
+# 500 rows keeps each statement well under MySQL's max_allowed_packet
+# while turning a ~300 row trading day into a single round-trip.
+PRICE_BATCH_SIZE = 500
+
+# The price export has at least 19 columns; business date is column 1.
+PRICE_MIN_COLUMNS = 19
+
+# Only the first few failures are kept in full, the rest are just counted.
+MAX_REPORTED_FAILURES = 50
+
+
+def _report(progress, phase, done=0, total=0):
+    """Calls the optional progress callback: progress(phase, rows_done, rows_total)."""
+    if progress is not None:
+        progress(phase, done, total)
+
+
+def _parse_business_date(value, cache):
+    """Parses a 'YYYY-MM-DD' business date, memoised per file (a file has very few distinct dates)."""
+    value = (value or '').strip()
+    if value not in cache:
+        cache[value] = datetime.date.fromisoformat(value)
+    return cache[value]
+
+
+def _fix_merged_name(row, expected_columns):
+    """
+    Security names containing commas spill over into extra columns.
+    Glue them back into column 4 so every row has the header's width.
+    """
+    if len(row) > expected_columns:
+        extra_col_count = len(row) - expected_columns
+        merged_name = ' '.join(row[4: 4 + extra_col_count + 1])
+        return row[:4] + [merged_name] + row[4 + extra_col_count + 1:]
+    return row
+
+
+def _row_to_stock_price(row, business_date):
+    return StockPrices(
+        business_date=business_date,
+        security_id=row[2].strip(),
+        symbol=row[3].strip(),
+        security_name=row[4].strip(),
+        open_price=clean_decimal(row[5]),
+        high_price=clean_decimal(row[6]),
+        low_price=clean_decimal(row[7]),
+        close_price=clean_decimal(row[8]),
+        total_traded_quantity=clean_int(row[9]),
+        total_traded_value=clean_decimal(row[10]),
+        previous_close=clean_decimal(row[11]),
+        fifty_two_week_high=clean_decimal(row[12]),
+        fifty_two_week_low=clean_decimal(row[13]),
+        last_updated_time=row[14].strip() or None,
+        last_updated_price=clean_decimal(row[15]),
+        total_trades=clean_int(row[16]),
+        average_traded_price=clean_decimal(row[17]),
+        market_capitalization=clean_decimal(row[18])
+    )
+
+
+def ingest_price_file(fileobj, batch_size=PRICE_BATCH_SIZE, progress=None):
+    """
+    Bulk-loads a daily price CSV (one or many business dates) into stock_prices.
+
+    The file is parsed in one pass, deduplicated against the
+    (business_date, security_id) unique key with a single query and written
+    with batched multi-row INSERTs inside one transaction. If a batch fails,
+    only that batch is retried row by row, so one bad row never costs the
+    whole upload.
+
+    Returns a dict:
+        {'inserted', 'duplicates', 'failed', 'failures', 'dates'}
+    where 'failures' is a list of {'line', 'symbol', 'error'}.
+    """
+    if isinstance(fileobj, (bytes, bytearray)):
+        fileobj = io.BytesIO(fileobj)
+    if not isinstance(fileobj, io.TextIOBase):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig')
+
+    reader = csv.reader(fileobj)
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise IngestionError("CSV file is empty.")
+
+    expected_columns = len(header)
+    if expected_columns < PRICE_MIN_COLUMNS:
+        raise IngestionError(
+            f"CSV format error. Expected {PRICE_MIN_COLUMNS}+ columns, found {expected_columns}."
+        )
+
+    failures = []
+    failed_count = 0
+
+    def record_failure(line, symbol, error):
+        nonlocal failed_count
+        failed_count += 1
+        if len(failures) < MAX_REPORTED_FAILURES:
+            failures.append({'line': line, 'symbol': symbol, 'error': str(error)})
+
+    # --- 1. Parse the whole file in one pass ---
+    _report(progress, 'parse')
+    date_cache = {}
+    parsed = []  # (line_no, StockPrices)
+    seen_keys = set()
+    duplicates = 0
+    for line_no, row in enumerate(reader, start=2):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        row = _fix_merged_name(row, expected_columns)
+        symbol = row[3].strip() if len(row) > 3 else ''
+        if len(row) < PRICE_MIN_COLUMNS:
+            record_failure(line_no, symbol, f"Expected {PRICE_MIN_COLUMNS}+ columns, found {len(row)}")
+            continue
+        try:
+            business_date = _parse_business_date(row[1], date_cache)
+        except ValueError:
+            record_failure(line_no, symbol, f"Invalid business date '{row[1]}'")
+            continue
+
+        obj = _row_to_stock_price(row, business_date)
+        key = (business_date, obj.security_id)
+        if key in seen_keys:
+            # Same security twice in one file: keep the first one
+            duplicates += 1
+            continue
+        seen_keys.add(key)
+        parsed.append((line_no, obj))
+
+    if not parsed and not failed_count and not duplicates:
+        raise IngestionError("CSV file is empty or contains only a header.")
+
+    dates = sorted({obj.business_date for _, obj in parsed})
+
+    # --- 2. Dedupe against the DB with ONE query over the file's date range ---
+    _report(progress, 'dedupe', 0, len(parsed))
+    if dates:
+        existing = set(
+            StockPrices.objects.filter(business_date__range=(dates[0], dates[-1]))
+            .values_list('business_date', 'security_id')
+        )
+        if existing:
+            before = len(parsed)
+            parsed = [
+                (line_no, obj) for line_no, obj in parsed
+                if (obj.business_date, obj.security_id) not in existing
+            ]
+            duplicates += before - len(parsed)
+
+    # --- 3. Batched INSERTs in a single transaction ---
+    inserted_keys = []  # (symbol, business_date) of rows that made it in
+    _report(progress, 'write', 0, len(parsed))
+    with transaction.atomic():
+        for start in range(0, len(parsed), batch_size):
+            batch = parsed[start:start + batch_size]
+            try:
+                # Savepoint per batch so a failure can be retried row by row
+                with transaction.atomic():
+                    StockPrices.objects.bulk_create([obj for _, obj in batch])
+                inserted_keys.extend((obj.symbol, obj.business_date) for _, obj in batch)
+            except DatabaseError as e:
+                print(f"Price batch starting at line {batch[0][0]} failed ({e}); retrying row by row.")
+                for line_no, obj in batch:
+                    try:
+                        with transaction.atomic():
+                            obj.pk = None
+                            obj.save(force_insert=True)
+                        inserted_keys.append((obj.symbol, obj.business_date))
+                    except DatabaseError as row_error:
+                        record_failure(line_no, obj.symbol, row_error)
+            _report(progress, 'write', start + len(batch), len(parsed))
+
+        # Tell the adjusted-price refresher which symbols/dates are new
+        record_price_changes(inserted_keys)
+        if inserted_keys:
+            invalidate_calendar('prices')
+
+    inserted = len(inserted_keys)
+    inserted_dates = sorted({business_date for _, business_date in inserted_keys})
+    print(f"Price ingestion: inserted {inserted}, duplicates {duplicates}, failed {failed_count}.")
+    return {
+        'inserted': inserted,
+        'duplicates': duplicates,
+        'failed': failed_count,
+        'failures': failures,
+        'dates': inserted_dates,
+    }
+
+
+# ==================================
+# --- FLOORSHEET INGESTION ---
+# ==================================
+
+# Rows per chunk. Peak memory is bounded by this, not by the size of the day.
+FLOORSHEET_CHUNK_SIZE = 20000
+
+FLOORSHEET_REQUIRED_COLUMNS = [
+    'SN', 'CONTRACT NO.', 'STOCK SYMBOL', 'BUYER', 'SELLER',
+    'QUANTITY', 'RATE (RS)', 'AMOUNT (RS)'
+]
+
+# Same special cases as utils.buyer_seller_to_int
+BROKER_CODE_MAP = {'D01': 60, 'D02': 77}
+
+FLOORSHEET_COLUMNS = [
+    'id', 'contract_no', 'stock_symbol', 'buyer', 'seller',
+    'quantity', 'rate', 'amount', 'calculation_date', 'sector'
+]
+
+
+def _normalize_columns(df):
+    df.columns = [str(col).upper().strip() for col in df.columns]
+    return df
+
+
+def _iter_xlsx_chunks(fileobj, chunk_size):
+    """Streams an .xlsx sheet with openpyxl's read-only mode (never loads the whole sheet)."""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(col) if col is not None else '' for col in header]
+        buffer = []
+        for row in rows:
+            if row is None or all(cell is None for cell in row):
+                continue
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield _normalize_columns(pd.DataFrame(buffer, columns=header, dtype=object))
+                buffer = []
+        if buffer:
+            yield _normalize_columns(pd.DataFrame(buffer, columns=header, dtype=object))
+    finally:
+        workbook.close()
+
+
+def iter_floorsheet_chunks(fileobj, filename, chunk_size=FLOORSHEET_CHUNK_SIZE):
+    """
+    Yields the uploaded floorsheet as DataFrames of at most `chunk_size` rows,
+    with upper-cased, stripped column names. CSV and .xlsx are streamed;
+    .xls is the one format held in memory whole (the data entry page says so).
+    """
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        reader = pd.read_csv(fileobj, encoding='utf-8-sig', dtype=str, chunksize=chunk_size)
+        for chunk in reader:
+            yield _normalize_columns(chunk)
+    elif name.endswith('.xlsx'):
+        yield from _iter_xlsx_chunks(fileobj, chunk_size)
+    else:
+        # Legacy .xls has no streaming reader; load once and slice.
+        df = _normalize_columns(pd.read_excel(fileobj, dtype=object))
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+
+
+def _to_number(series):
+    """Vectorised clean_decimal: strips commas/whitespace, invalid values become NaN."""
+    return pd.to_numeric(
+        series.astype(str).str.replace(',', '', regex=False).str.strip(),
+        errors='coerce'
+    )
+
+
+def _to_paisa(series):
+    """
+    Vectorised clean_decimal rounded half-up to whole paisa, the way MySQL
+    stores a value in a DECIMAL(.., 2) column (100.005 -> 10001). Values with
+    at most 2 decimals are exact as float * 100; the rest are rounded from
+    their text with Decimal, so a tie is never lost to binary representation.
+    Returns an Int64 Series; invalid values are <NA>.
+    """
+    text = series.astype(str).str.replace(',', '', regex=False).str.strip()
+    numbers = pd.to_numeric(text, errors='coerce')
+    numbers = numbers.where(np.isfinite(numbers))
+    cents = numbers * 100
+    whole = cents.round()
+    exact = (cents - whole).abs() < 1e-6
+    paisa = whole.where(exact).astype('Int64')
+
+    finer = numbers.notna() & ~exact
+    if finer.any():
+        paisa[finer] = [
+            int(Decimal(value).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100) for value in text[finer]
+        ]
+    return paisa
+
+
+def _paisa_to_decimal(paisa):
+    """Int64 paisa -> object Series of 2 dp Decimals (None for <NA>), for the DECIMAL columns."""
+    return paisa.astype(object).map(lambda value: None if value is pd.NA else Decimal(int(value)).scaleb(-2))
+
+
+def _to_broker(series):
+    """Vectorised buyer_seller_to_int."""
+    as_str = series.astype(str).str.strip()
+    mapped = as_str.map(BROKER_CODE_MAP)
+    numbers = pd.to_numeric(as_str.str.replace(',', '', regex=False), errors='coerce')
+    return mapped.fillna(numbers).round().astype('Int64')
+
+
+def clean_floorsheet_chunk(df, calculation_date, sector_map):
+    """
+    Column-wise cleaning of one raw floorsheet chunk.
+
+    Returns (clean_df, failed_rows). clean_df has FLOORSHEET_COLUMNS plus
+    'amount_paisa' (exact integer amount, used for the summary rollups).
+    """
+    sn = _to_number(df['SN'])
+    valid = sn.notna() & (sn >= 0) & (sn < 1_000_000)
+    failed_rows = int((~valid).sum())
+    if failed_rows:
+        df = df[valid]
+        sn = sn[valid]
+
+    # Synthetic id: YYYYMMDD followed by the zero-padded 6 digit SN
+    date_prefix = int(calculation_date.strftime('%Y%m%d')) * 1_000_000
+    ids = sn.astype(np.int64) + date_prefix
+
+    symbols = df['STOCK SYMBOL'].astype(str).str.strip().str.upper()
+    quantity = np.trunc(_to_number(df['QUANTITY'])).astype('Int64')
+    amount_paisa = _to_paisa(df['AMOUNT (RS)'])
+
+    contract_no = df['CONTRACT NO.'].astype(object)
+    contract_no = contract_no.where(contract_no.notna(), None)
+    contract_no = contract_no.map(lambda v: None if v is None else str(v).strip())
+
+    # All columns are Series sharing df's index, so they stay aligned
+    clean = pd.DataFrame({
+        'id': ids,
+        'contract_no': contract_no,
+        'stock_symbol': symbols.astype(object),
+        'buyer': _to_broker(df['BUYER']),
+        'seller': _to_broker(df['SELLER']),
+        'quantity': quantity,
+        'rate': _paisa_to_decimal(_to_paisa(df['RATE (RS)'])),
+        'amount': _paisa_to_decimal(amount_paisa),
+        'calculation_date': calculation_date,
+        'sector': symbols.map(sector_map).astype(object),
+        'amount_paisa': amount_paisa,
+    })
+    return clean, failed_rows
+
+
+def _floorsheet_insert_sql():
+    columns = ', '.join(FLOORSHEET_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(FLOORSHEET_COLUMNS))
+    if connection.vendor == 'mysql':
+        return f"INSERT IGNORE INTO floorsheet_raw ({columns}) VALUES ({placeholders})"
+    return f"INSERT INTO floorsheet_raw ({columns}) VALUES ({placeholders}) ON CONFLICT DO NOTHING"
+
+
+def _chunk_to_params(clean):
+    """Turns a cleaned chunk into executemany() tuples with NaN/NA as None."""
+    frame = clean[FLOORSHEET_COLUMNS].astype(object)
+    frame = frame.where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
+
+
+def delete_floorsheet_day(cursor, calculation_date):
+    """Removes a day's raw rows, its four summary rollups and its broker x stock cube rows."""
+    print(f"Deleting existing records for {calculation_date}")
+    cursor.execute("DELETE FROM floorsheet_raw WHERE calculation_date = %s", [calculation_date])
+    cursor.execute("DELETE FROM broker_stock_daily WHERE calculation_date = %s", [calculation_date])
+    cursor.execute("DELETE FROM buyer_summary WHERE calculation_date = %s", [calculation_date])
+    cursor.execute("DELETE FROM seller_summary WHERE calculation_date = %s", [calculation_date])
+    cursor.execute("DELETE FROM sector_buyer_summary WHERE calculation_date = %s", [calculation_date])
+    cursor.execute("DELETE FROM sector_seller_summary WHERE calculation_date = %s", [calculation_date])
+
+
+# --- Summary rollups ---
+# table -> group-by columns. Mirrors the GROUP BYs that used to run over
+# floorsheet_raw after each upload; the sector tables skip NULL sectors.
+SUMMARY_TABLES = {
+    'buyer_summary': ['stock_symbol', 'buyer', 'sector'],
+    'seller_summary': ['stock_symbol', 'seller', 'sector'],
+    'sector_buyer_summary': ['sector', 'buyer'],
+    'sector_seller_summary': ['sector', 'seller'],
+}
+
+SECTOR_ONLY_TABLES = ('sector_buyer_summary', 'sector_seller_summary')
+
+AVERAGE_RATE_QUANT = Decimal('0.000001')
+
+# --- Broker x stock daily cube (floorsheet_analysis.BrokerStockDaily) ---
+CUBE_KEYS = ['stock_symbol', 'broker']
+CUBE_MEASURES = ['buy', 'sell', 'matched']
+CUBE_COLUMNS = [
+    'calculation_date', 'stock_symbol', 'broker', 'sector',
+    'buy_quantity', 'buy_amount', 'sell_quantity', 'sell_amount',
+    'matched_quantity', 'matched_amount',
+]
+CUBE_INSERT_SQL = (
+    f"INSERT INTO broker_stock_daily ({', '.join(CUBE_COLUMNS)}) "
+    f"VALUES ({', '.join(['%s'] * len(CUBE_COLUMNS))})"
+)
+
+# Same cube computed from floorsheet_raw in SQL: used to backfill days
+# loaded before the cube existed and to verify the streamed rollup.
+# NULL brokers are skipped; a self-crossed contract counts as a buy, a
+# sell and a match for its broker.
+CUBE_FROM_RAW_SQL = """
+    SELECT stock_symbol, broker, MAX(sector),
+           SUM(buy_quantity), SUM(buy_amount), SUM(sell_quantity), SUM(sell_amount),
+           SUM(matched_quantity), SUM(matched_amount)
+    FROM (
+        SELECT stock_symbol, buyer AS broker, sector,
+               COALESCE(quantity, 0) AS buy_quantity, COALESCE(amount, 0) AS buy_amount,
+               0 AS sell_quantity, 0 AS sell_amount,
+               CASE WHEN buyer = seller THEN COALESCE(quantity, 0) ELSE 0 END AS matched_quantity,
+               CASE WHEN buyer = seller THEN COALESCE(amount, 0) ELSE 0 END AS matched_amount
+        FROM floorsheet_raw
+        WHERE calculation_date = %s AND buyer IS NOT NULL
+        UNION ALL
+        SELECT stock_symbol, seller AS broker, sector,
+               0, 0, COALESCE(quantity, 0), COALESCE(amount, 0), 0, 0
+        FROM floorsheet_raw
+        WHERE calculation_date = %s AND seller IS NOT NULL
+    ) AS sides
+    GROUP BY stock_symbol, broker
+"""
+
+
+class FloorsheetAggregator:
+    """
+    Single-pass rollup of buyer/seller/sector summaries from the cleaned
+    chunk stream, so the summary tables never have to rescan floorsheet_raw.
+
+    Running totals are merged after every chunk, so memory is bounded by the
+    number of groups (brokers x symbols), not by the number of contracts.
+    Amounts are summed as integer paisa to stay exact.
+    """
+
+    def __init__(self, calculation_date):
+        self.calculation_date = calculation_date
+        self.totals = {table: None for table in SUMMARY_TABLES}
+        self.cube = None
+
+    def add_chunk(self, clean):
+        self._add_cube_chunk(clean)
+        for table, keys in SUMMARY_TABLES.items():
+            frame = clean
+            if table in SECTOR_ONLY_TABLES:
+                frame = frame[frame['sector'].notna()]
+            if frame.empty:
+                continue
+            # The *_count columns let us tell SUM(NULLs) = NULL apart from 0
+            partial = frame.groupby(keys, dropna=False, sort=False).agg(
+                total_quantity=('quantity', 'sum'),
+                quantity_count=('quantity', 'count'),
+                amount_paisa=('amount_paisa', 'sum'),
+                amount_count=('amount_paisa', 'count'),
+            )
+            running = self.totals[table]
+            if running is not None:
+                partial = pd.concat([running, partial]).groupby(level=keys, dropna=False, sort=False).sum()
+            self.totals[table] = partial
+
+    def _add_cube_chunk(self, clean):
+        quantity = clean['quantity'].fillna(0).astype('int64')
+        paisa = clean['amount_paisa'].fillna(0).astype('int64')
+        matched = (clean['buyer'] == clean['seller']).fillna(False).astype(bool)
+        zeros = pd.Series(0, index=clean.index, dtype='int64')
+        sides = []
+        for side, broker in (('buy', clean['buyer']), ('sell', clean['seller'])):
+            frame = pd.DataFrame({
+                'stock_symbol': clean['stock_symbol'],
+                'broker': broker,
+                'sector': clean['sector'],
+                'buy_quantity': quantity if side == 'buy' else zeros,
+                'buy_paisa': paisa if side == 'buy' else zeros,
+                'sell_quantity': quantity if side == 'sell' else zeros,
+                'sell_paisa': paisa if side == 'sell' else zeros,
+                # Self-crossed contracts are counted once, on the buy side
+                'matched_quantity': quantity.where(matched, 0) if side == 'buy' else zeros,
+                'matched_paisa': paisa.where(matched, 0) if side == 'buy' else zeros,
+            })
+            sides.append(frame[frame['broker'].notna()])
+        combined = pd.concat(sides)
+        if combined.empty:
+            return
+        measures = {col: 'sum' for col in combined.columns if col not in CUBE_KEYS + ['sector']}
+        measures['sector'] = 'first'
+        partial = combined.groupby(CUBE_KEYS, sort=False).agg(measures)
+        if self.cube is not None:
+            partial = pd.concat([self.cube, partial]).groupby(level=CUBE_KEYS, sort=False).agg(measures)
+        self.cube = partial
+
+    def cube_rows(self):
+        """Final broker x stock rows for broker_stock_daily, as dicts keyed like its columns."""
+        if self.cube is None:
+            return []
+        result = []
+        for (symbol, broker), row in self.cube.iterrows():
+            record = {
+                'calculation_date': self.calculation_date,
+                'stock_symbol': symbol,
+                'broker': int(broker),
+                'sector': None if pd.isna(row['sector']) else row['sector'],
+            }
+            for measure in CUBE_MEASURES:
+                record[f'{measure}_quantity'] = int(row[f'{measure}_quantity'])
+                record[f'{measure}_amount'] = (Decimal(int(row[f'{measure}_paisa'])) / 100).quantize(Decimal('0.01'))
+            result.append(record)
+        return result
+
+    def rows(self, table):
+        """Final rollup rows for one table, as dicts keyed like the summary table columns."""
+        totals = self.totals[table]
+        if totals is None:
+            return []
+        keys = SUMMARY_TABLES[table]
+        result = []
+        for index, row in totals.iterrows():
+            index = index if isinstance(index, tuple) else (index,)
+            record = {
+                key: (None if pd.isna(value) else (int(value) if key in ('buyer', 'seller') else value))
+                for key, value in zip(keys, index)
+            }
+            quantity = int(row['total_quantity']) if row['quantity_count'] else None
+            amount = (Decimal(int(row['amount_paisa'])) / 100).quantize(Decimal('0.01')) if row['amount_count'] else None
+            average_rate = None
+            if quantity and amount is not None:
+                average_rate = (amount / quantity).quantize(AVERAGE_RATE_QUANT, rounding=ROUND_HALF_UP)
+            record.update({
+                'total_quantity': quantity,
+                'total_amount': amount,
+                'average_rate': average_rate,
+            })
+            result.append(record)
+        return result
+
+    def write(self, cursor):
+        """Upserts all four rollups and inserts the cube rows, one executemany per table."""
+        print(f"Populating summary tables for {self.calculation_date}...")
+        for table, keys in SUMMARY_TABLES.items():
+            rows = self.rows(table)
+            if not rows:
+                continue
+            columns = ['calculation_date'] + keys + ['total_quantity', 'total_amount', 'average_rate']
+            updates = [col for col in columns if col not in ('calculation_date', 'stock_symbol', 'buyer', 'seller')
+                       and not (table in SECTOR_ONLY_TABLES and col == 'sector')]
+            sql = (
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON DUPLICATE KEY UPDATE {', '.join(f'{col} = VALUES({col})' for col in updates)}"
+            )
+            cursor.executemany(sql, [
+                [self.calculation_date] + [row[col] for col in columns[1:]]
+                for row in rows
+            ])
+
+        cube_rows = self.cube_rows()
+        if cube_rows:
+            cursor.executemany(
+                CUBE_INSERT_SQL,
+                [[row[col] for col in CUBE_COLUMNS] for row in cube_rows],
+            )
+
+    def verify(self, cursor):
+        """
+        Diffs the in-memory rollups against the same aggregates computed by
+        SQL from floorsheet_raw. Returns a list of human readable mismatches.
+        """
+        mismatches = []
+        for table, keys in SUMMARY_TABLES.items():
+            where = "calculation_date = %s"
+            if table in SECTOR_ONLY_TABLES:
+                where += " AND sector IS NOT NULL"
+            cursor.execute(f"""
+                SELECT {', '.join(keys)}, SUM(quantity), SUM(amount)
+                FROM floorsheet_raw WHERE {where} GROUP BY {', '.join(keys)}
+            """, [self.calculation_date])
+            expected = {
+                tuple(row[:len(keys)]): (
+                    None if row[-2] is None else int(row[-2]),
+                    None if row[-1] is None else Decimal(str(row[-1])).quantize(Decimal('0.01')),
+                )
+                for row in cursor.fetchall()
+            }
+            actual = {
+                tuple(row[key] for key in keys): (row['total_quantity'], row['total_amount'])
+                for row in self.rows(table)
+            }
+            for key in expected.keys() | actual.keys():
+                if expected.get(key) != actual.get(key):
+                    mismatches.append(f"{table} {key}: sql={expected.get(key)} stream={actual.get(key)}")
+
+        measure_columns = CUBE_COLUMNS[4:]
+        expected = {
+            (row[0], int(row[1])): tuple(
+                Decimal(str(value)).quantize(Decimal('0.01')) if col.endswith('_amount') else int(value)
+                for col, value in zip(measure_columns, row[3:])
+            )
+            for row in cube_from_raw(cursor, self.calculation_date)
+        }
+        actual = {
+            (row['stock_symbol'], row['broker']): tuple(row[col] for col in measure_columns)
+            for row in self.cube_rows()
+        }
+        for key in expected.keys() | actual.keys():
+            if expected.get(key) != actual.get(key):
+                mismatches.append(f"broker_stock_daily {key}: sql={expected.get(key)} stream={actual.get(key)}")
+        return mismatches
+
+
+def cube_from_raw(cursor, calculation_date):
+    """Computes one day of the broker x stock cube from floorsheet_raw (list of row tuples)."""
+    cursor.execute(CUBE_FROM_RAW_SQL, [calculation_date, calculation_date])
+    return cursor.fetchall()
+
+
+def rebuild_broker_stock_cube(cursor, calculation_date):
+    """Replaces one day of broker_stock_daily from floorsheet_raw. Returns rows written."""
+    rows = cube_from_raw(cursor, calculation_date)
+    cursor.execute("DELETE FROM broker_stock_daily WHERE calculation_date = %s", [calculation_date])
+    if rows:
+        cursor.executemany(
+            CUBE_INSERT_SQL,
+            [[calculation_date] + list(row) for row in rows],
+        )
+    return len(rows)
+
+
+def ingest_floorsheet_file(fileobj, filename, calculation_date,
+                           chunk_size=FLOORSHEET_CHUNK_SIZE, verify=None, progress=None):
+    """
+    Replaces one day of floorsheet data from an uploaded CSV/XLSX.
+
+    The file is read in fixed-size chunks; each chunk is cleaned with
+    vectorised pandas ops, written with one executemany() (multi-row
+    INSERT IGNORE) and fed to a FloorsheetAggregator, so peak memory stays
+    flat and floorsheet_raw is only touched once. Everything runs in a
+    single transaction.
+
+    verify (default: settings.FLOORSHEET_VERIFY_SUMMARIES) re-computes the
+    rollups in SQL and reports any difference.
+
+    Returns {'inserted', 'failed', 'chunks', 'summary_mismatches'}.
+    """
+    if verify is None:
+        verify = getattr(settings, 'FLOORSHEET_VERIFY_SUMMARIES', False)
+    sector_map = {
+        k.upper(): v for k, v in
+        Companies.objects.values_list('script_ticker', 'sector')
+        if k
+    }
+    insert_sql = _floorsheet_insert_sql()
+
+    _report(progress, 'parse')
+    chunks = iter_floorsheet_chunks(fileobj, filename, chunk_size)
+    try:
+        first_chunk = next(chunks, None)
+    except Exception as e:
+        raise IngestionError(f"Error reading file: {e}")
+    if first_chunk is None:
+        raise IngestionError("Floorsheet file is empty.")
+
+    missing = [col for col in FLOORSHEET_REQUIRED_COLUMNS if col not in first_chunk.columns]
+    if missing:
+        raise IngestionError(f"File is missing required columns: {', '.join(missing)}")
+
+    aggregator = FloorsheetAggregator(calculation_date)
+    mismatches = []
+    inserted, failed_rows, chunk_count = 0, 0, 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            delete_floorsheet_day(cursor, calculation_date)
+
+            def all_chunks():
+                yield first_chunk
+                yield from chunks
+
+            for raw_chunk in all_chunks():
+                clean, failed = clean_floorsheet_chunk(raw_chunk, calculation_date, sector_map)
+                failed_rows += failed
+                chunk_count += 1
+                if clean.empty:
+                    continue
+                cursor.executemany(insert_sql, _chunk_to_params(clean))
+                inserted += max(cursor.rowcount, 0)
+                aggregator.add_chunk(clean)
+                print(f"Floorsheet chunk {chunk_count}: {len(clean)} rows")
+                # Total row count is unknown while streaming
+                _report(progress, 'write', inserted + failed_rows, 0)
+
+            _report(progress, 'summaries', inserted + failed_rows, 0)
+            aggregator.write(cursor)
+
+            # Running broker totals: append this day, or rebuild from it if it's a re-upload
+            _report(progress, 'cumulative', inserted + failed_rows, 0)
+            update_cumulative_for_day(cursor, calculation_date)
+            invalidate_calendar('floorsheet')
+
+            if verify:
+                _report(progress, 'verify', inserted + failed_rows, 0)
+                mismatches = aggregator.verify(cursor)
+                for mismatch in mismatches[:20]:
+                    print(f"Summary mismatch: {mismatch}")
+                print(f"Summary verification for {calculation_date}: {len(mismatches)} mismatches.")
+
+    return {
+        'inserted': inserted,
+        'failed': failed_rows,
+        'chunks': chunk_count,
+        'summary_mismatches': mismatches,
+    }
+
+
+# ==================================
+# --- INDICES / MARKET CAP / DIVIDEND INGESTION ---
+# ==================================
+
+INDICES_BATCH_SIZE = 1000
+
+
+def ingest_indices_file(fileobj, batch_size=INDICES_BATCH_SIZE, progress=None):
+    """
+    Loads an indices CSV. Rows whose (date, sector) already exist are skipped;
+    the check is one query over the file's date range and new rows are
+    written with batched bulk_create.
+
+    Returns {'inserted', 'skipped', 'failed'}.
+    """
+    if not isinstance(fileobj, io.TextIOBase):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig')
+    reader = csv.reader(fileobj)
+    next(reader, None)  # header
+
+    _report(progress, 'parse')
+    parsed, failed_rows = [], 0
+    for row in reader:
+        try:
+            row_date = datetime.datetime.strptime(row[1], '%Y-%m-%d').date()
+            parsed.append(Indices(
+                sn=clean_int(row[0]),
+                date=row_date,
+                open=clean_decimal(row[2]),
+                high=clean_decimal(row[3]),
+                low=clean_decimal(row[4]),
+                close=clean_decimal(row[5]),
+                absolute_change=clean_decimal(row[6]),
+                percentage_change=row[7] or None,
+                number_52_weeks_high=clean_decimal(row[8]),
+                number_52_weeks_low=clean_decimal(row[9]),
+                turnover_values=clean_decimal(row[10]),
+                turnover_volume=clean_int(row[11]),
+                total_transaction=clean_int(row[12]),
+                sector=row[13].strip()
+            ))
+        except Exception as e:
+            print(f"Error parsing index row: {e}")
+            failed_rows += 1
+
+    _report(progress, 'dedupe', 0, len(parsed))
+    skipped_rows = 0
+    if parsed:
+        dates = [obj.date for obj in parsed]
+        seen = set(
+            Indices.objects.filter(date__range=(min(dates), max(dates)))
+            .values_list('date', 'sector')
+        )
+        new_rows = []
+        for obj in parsed:
+            key = (obj.date, obj.sector)
+            if key in seen:
+                skipped_rows += 1
+                continue
+            seen.add(key)
+            new_rows.append(obj)
+        parsed = new_rows
+
+    _report(progress, 'write', 0, len(parsed))
+    with transaction.atomic():
+        for start in range(0, len(parsed), batch_size):
+            Indices.objects.bulk_create(parsed[start:start + batch_size])
+            _report(progress, 'write', min(start + batch_size, len(parsed)), len(parsed))
+        if parsed:
+            invalidate_calendar('indices')
+
+    return {'inserted': len(parsed), 'skipped': skipped_rows, 'failed': failed_rows}
+
+
+MARCAP_REQUIRED_COLUMNS = ['business_date', 'market_capitalization', 'total_turnover']
+
+
+def ingest_marcap_file(fileobj, progress=None):
+    """
+    Loads a market cap CSV, creating or updating one row per business date.
+
+    Returns {'inserted', 'updated', 'failed'}.
+    """
+    _report(progress, 'parse')
+    df = pd.read_csv(fileobj, encoding='utf-8-sig')
+
+    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+
+    if 'bussiness_date' in df.columns:
+        df.rename(columns={'bussiness_date': 'business_date'}, inplace=True)
+
+    missing = [col for col in MARCAP_REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise IngestionError(f"CSV is missing required columns. Must include: {', '.join(missing)}")
+
+    inserted_rows, updated_rows, failed_rows = 0, 0, 0
+    total = len(df)
+    _report(progress, 'write', 0, total)
+    for index, row in df.iterrows():
+        try:
+            row_date = pd.to_datetime(row['business_date']).date()
+
+            data_to_insert = {
+                'sn': clean_int(row.get('s.n')),
+                'market_capitalization': clean_decimal(row.get('market_capitalization')),
+                'sensitive_market_capitalization': clean_decimal(row.get('sensitive_market_capitalization')),
+                'float_market_capitalization': clean_decimal(row.get('float_market_capitalization')),
+                'sensitive_float_market_capitalization': clean_decimal(row.get('sensitive_float_market_capitalization')),
+                'total_turnover': clean_decimal(row.get('total_turnover')),
+                'total_traded_shares': clean_int(row.get('total_traded_shares')),
+                'total_transactions': clean_int(row.get('total_transactions')),
+                'total_scrips_traded': clean_int(row.get('total_scrips_traded')),
+            }
+
+            obj, created = Marcap.objects.update_or_create(
+                business_date=row_date,
+                defaults=data_to_insert
+            )
+
+            if created:
+                inserted_rows += 1
+            else:
+                updated_rows += 1
+
+        except Exception as e:
+            print(f"Error inserting marcap row {index}: {e}")
+            failed_rows += 1
+        if (inserted_rows + updated_rows + failed_rows) % 100 == 0:
+            _report(progress, 'write', inserted_rows + updated_rows + failed_rows, total)
+
+    return {'inserted': inserted_rows, 'updated': updated_rows, 'failed': failed_rows}
+
+
+def _get_or_create_fiscal_year(fiscal_year):
+    """Validates a 'YYYY/YY' fiscal year and makes sure its FiscalYear row exists."""
+    if not re.match(r'^\d{4}/\d{2}$', fiscal_year):
+        raise ValueError("Invalid FY format. Expected '2079/80'.")
+
+    bs_start_year = int(fiscal_year.split('/')[0])
+    bs_end_year = bs_start_year + 1
+
+    ad_start_date = bs_to_ad(bs_start_year, 4, 1)  # Shrawan 1
+    bs_end_day = NEPALI_CALENDAR_DATA[bs_end_year][2]  # Ashadh (index 2)
+    ad_end_date = bs_to_ad(bs_end_year, 3, bs_end_day)  # Ashadh end
+    total_days = (ad_end_date - ad_start_date).days + 1
+
+    defaults = {
+        'bs_start_year': bs_start_year,
+        'bs_end_year': bs_end_year,
+        'bs_end_day': bs_end_day,
+        'ad_start_date': ad_start_date,
+        'ad_end_date': ad_end_date,
+        'total_days': total_days,
+    }
+
+    fy_obj, fy_created = FiscalYear.objects.get_or_create(
+        fiscal_year=fiscal_year,
+        defaults=defaults
+    )
+    if fy_created:
+        print(f"Created new FiscalYear: {fiscal_year}")
+    return fy_obj
+
+
+def ingest_dividend_file(fileobj, filename, progress=None):
+    """
+    Loads a dividend history CSV/Excel file, creating or updating rows on
+    (symbol, fiscal_year, book_closure_date).
+
+    Returns {'inserted', 'updated', 'failed'}.
+    """
+    _report(progress, 'parse')
+    try:
+        if (filename or '').lower().endswith('.csv'):
+            df = pd.read_csv(fileobj, encoding='utf-8-sig')
+        else:
+            df = pd.read_excel(fileobj)
+
+        df.columns = (
+            df.columns.str.strip()
+            .str.lower()
+            .str.replace(' (%)', '_percent', regex=False)
+            .str.replace('(%', '_percent', regex=False)
+            .str.replace(' %', '_percent', regex=False)
+            .str.replace(' ', '_', regex=False)
+            .str.replace('.', '', regex=False)
+            .str.replace('/', '_', regex=False)
+            .str.replace(')', '', regex=False)
+        )
+    except Exception as e:
+        raise IngestionError(f"Error reading file: {e}")
+
+    company_map = {
+        k: v for k, v in
+        Companies.objects.values_list('script_ticker', 'company_name')
+        if k
+    }
+    known_fiscal_years = set()
+
+    inserted_rows, updated_rows, failed_rows = 0, 0, 0
+    total = len(df)
+    _report(progress, 'write', 0, total)
+
+    for index, row in df.iterrows():
+        symbol = ''
+        try:
+            symbol = str(row.get('symbol', '')).strip().upper()
+            fiscal_year = str(row.get('fiscal_year', '')).strip()
+
+            if not symbol or not fiscal_year:
+                print(f"Skipping row {index}: Missing Symbol or Fiscal Year. Symbol: '{symbol}', FY: '{fiscal_year}'")
+                failed_rows += 1
+                continue
+
+            if fiscal_year not in known_fiscal_years:
+                try:
+                    _get_or_create_fiscal_year(fiscal_year)
+                    known_fiscal_years.add(fiscal_year)
+                except Exception as e:
+                    print(f"Skipping row {index}: Could not validate/create FiscalYear '{fiscal_year}'. Error: {e}")
+                    failed_rows += 1
+                    continue
+
+            unique_key = {
+                'symbol': symbol,
+                'fiscal_year': fiscal_year,
+                'book_closure_date': clean_date(row.get('book_closure_date')),
+            }
+
+            data_to_insert = {
+                'company_name': company_map.get(symbol, row.get('company_name', None)),
+                'bonus_percent': clean_decimal(row.get('bonus_percent')),
+                'cash_percent': clean_decimal(row.get('cash_percent')),
+                'right_percent': clean_decimal(row.get('right_percent')),
+                'tax_percent': clean_decimal(row.get('tax_percent')),
+                'total_percent': clean_decimal(row.get('total_percent')),
+                'announcement_date': clean_date(row.get('announcement_date')),
+                'book_closure_status': str(row.get('book_closure_status', '')).strip() or None,
+                'distribution_date': clean_date(row.get('distribution_date')),
+                'bonus_listing_date': clean_date(row.get('bonus_listing_date')),
+            }
+
+            obj, created = DividendHistory.objects.update_or_create(
+                **unique_key,
+                defaults=data_to_insert
+            )
+
+            if created:
+                inserted_rows += 1
+            else:
+                updated_rows += 1
+
+        except Exception as e:
+            print(f"Error processing row {index} ({symbol}): {e}")
+            failed_rows += 1
+        if (inserted_rows + updated_rows + failed_rows) % 100 == 0:
+            _report(progress, 'write', inserted_rows + updated_rows + failed_rows, total)
+
+    return {'inserted': inserted_rows, 'updated': updated_rows, 'failed': failed_rows}
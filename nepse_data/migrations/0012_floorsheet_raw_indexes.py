@@ -0,0 +1,50 @@
+# floorsheet_raw is not managed by Django, so its indexes are added by hand.
+
+from django.db import migrations
+
+# name -> columns. Every InnoDB secondary index also carries the primary key
+# (id), so the sort indexes serve the keyset seek on (date, key, id) directly.
+FLOORSHEET_RAW_INDEXES = {
+    'fr_date_contract_idx': ['calculation_date', 'contract_no'],
+    'fr_date_quantity_idx': ['calculation_date', 'quantity'],
+    'fr_date_amount_idx': ['calculation_date', 'amount'],
+    # Covers the page totals for a day / day + symbol without touching rows
+    'fr_date_symbol_cover_idx': ['calculation_date', 'stock_symbol', 'quantity', 'amount'],
+    'fr_symbol_date_idx': ['stock_symbol', 'calculation_date'],
+}
+
+
+def _existing_indexes(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, 'floorsheet_raw')
+    return set(constraints)
+
+
+def add_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    missing = {name: cols for name, cols in FLOORSHEET_RAW_INDEXES.items() if name not in _existing_indexes(schema_editor)}
+    if missing:
+        # One ALTER so the table is only rebuilt once
+        clauses = ', '.join(f"ADD INDEX {name} ({', '.join(cols)})" for name, cols in missing.items())
+        schema_editor.execute(f"ALTER TABLE floorsheet_raw {clauses}")
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    present = [name for name in FLOORSHEET_RAW_INDEXES if name in _existing_indexes(schema_editor)]
+    if present:
+        clauses = ', '.join(f"DROP INDEX {name}" for name in present)
+        schema_editor.execute(f"ALTER TABLE floorsheet_raw {clauses}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nepse_data', '0011_alter_dividendhistory_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_indexes, drop_indexes),
+    ]
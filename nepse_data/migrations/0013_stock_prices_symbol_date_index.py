@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nepse_data', '0012_floorsheet_raw_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockprices',
+            index=models.Index(fields=['symbol', 'business_date'], name='sp_symbol_date_idx'),
+        ),
+    ]
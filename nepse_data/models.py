@@ -25,6 +25,8 @@ class StockPrices(models.Model):
     class Meta:
         db_table = 'stock_prices'
         unique_together = (('business_date', 'security_id'),)
+        # Per-symbol history reads (and the indicator cache's data version)
+        indexes = [models.Index(fields=['symbol', 'business_date'], name='sp_symbol_date_idx')]
         verbose_name_plural = 'Stock Prices'
 
     def __str__(self):
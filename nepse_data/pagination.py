@@ -0,0 +1,219 @@
+# nepse_data/pagination.py
+"""
+Keyset (seek) pagination.
+
+Django's Paginator does COUNT(*) plus LIMIT/OFFSET, so page N reads and
+throws away N * per_page rows. Here each page is fetched with a WHERE on
+the last (or first) row of the previous page, which walks straight along
+an index:
+
+    WHERE (date, key, id) "after" (d, k, i) ORDER BY date, key, id LIMIT n
+
+Cursors are signed tokens holding that row's key values, so they are
+opaque to the browser and cannot be tampered with. NULLs sort as the
+smallest value (MySQL's and SQLite's order).
+"""
+import datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Q, QuerySet
+
+CURSOR_SALT = 'nepse_data.keyset'
+
+
+def _after(field, value, descending):
+    """Rows strictly past `value` in one column's sort order."""
+    if descending:
+        if value is None:
+            return Q(pk__in=[])  # nothing sorts below NULL
+        return Q(**{f"{field}__lt": value}) | Q(**{f"{field}__isnull": True})
+    if value is None:
+        return Q(**{f"{field}__isnull": False})
+    return Q(**{f"{field}__gt": value})
+
+
+def seek_filter(keys):
+    """
+    Q for rows after a key tuple. keys is [(field, value, descending)],
+    most significant first: (a > x) OR (a = x AND (b > y OR (b = y AND ...))).
+    """
+    field, value, descending = keys[0]
+    after = _after(field, value, descending)
+    if len(keys) == 1:
+        return after
+    same = Q(**{f"{field}__isnull": True}) if value is None else Q(**{field: value})
+    return after | (same & seek_filter(keys[1:]))
+
+
+def _dump(value):
+    if isinstance(value, datetime.date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+
+def _load(value):
+    if isinstance(value, dict):
+        if 'd' in value:
+            return datetime.date.fromisoformat(value['d'])
+        return Decimal(value['n'])
+    return value
+
+
+def _sort_value(value):
+    """Sort key for one column in memory, NULLs smallest (as in the DB)."""
+    return (value is not None, value)
+
+
+class KeysetPage:
+    """One page of rows plus the cursors around it (Page-like for templates)."""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+
+class KeysetPaginator:
+    """
+    Pages a queryset by `ordering`, a list of field names ('-field' for
+    descending) that must end in a unique column (e.g. 'id'). A plain list
+    of objects is sorted and paged in memory; any other sequence (the
+    floorsheet archive's ArchivedRows) must already be in `ordering` order
+    and is paged by bisecting it, so only the probed rows and the page are read.
+
+    scope is anything JSON-able that identifies the listing (sort, filters);
+    a cursor minted under a different scope is ignored, so a stale cursor
+    left in the URL after changing the sort just restarts at page one.
+    """
+
+    def __init__(self, queryset, ordering, per_page, scope=None):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.scope = scope
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f"-{name}" for name in self.ordering]
+
+    def _cursor(self, row, direction):
+        values = [_dump(getattr(row, field)) for field, _ in self.fields]
+        return signing.dumps({'v': values, 'dir': direction, 'scope': self.scope}, salt=CURSOR_SALT, compress=True)
+
+    def decode(self, token):
+        """(values, direction) from a cursor token, or None if it is unusable."""
+        if not token:
+            return None
+        try:
+            payload = signing.loads(token, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None
+        if payload.get('scope') != self.scope or len(payload.get('v', [])) != len(self.fields):
+            return None
+        return [_load(v) for v in payload['v']], payload['dir']
+
+    def _compare(self, row, values):
+        """-1 / 0 / 1 as row sorts before, at or after the key values under the ordering."""
+        for (field, descending), value in zip(self.fields, values):
+            a, b = _sort_value(getattr(row, field)), _sort_value(value)
+            if a != b:
+                return (1 if a < b else -1) if descending else (1 if a > b else -1)
+        return 0
+
+    def _bisect(self, rows, values):
+        """Number of rows that sort at or before the key values (rows in ordering order)."""
+        lo, hi = 0, len(rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._compare(rows[mid], values) <= 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _list_page(self, decoded, last):
+        """page() over an in-memory sequence of rows (same cursors and flags as the queryset path)."""
+        rows = self.queryset
+        if isinstance(rows, list):
+            rows = list(rows)
+            # Stable sorts, least significant column first
+            for field, descending in reversed(self.fields):
+                rows.sort(key=lambda row: _sort_value(getattr(row, field)), reverse=descending)
+
+        if last:
+            start, stop = max(len(rows) - self.per_page, 0), len(rows)
+            has_previous, has_next = start > 0, False
+        elif decoded is not None and decoded[1] == 'prev':
+            # The ordering ends in a unique column, so the cursor row is the only tie
+            stop = self._bisect(rows, decoded[0])
+            if stop and self._compare(rows[stop - 1], decoded[0]) == 0:
+                stop -= 1
+            start = max(stop - self.per_page, 0)
+            has_previous, has_next = start > 0, True
+        else:
+            start = 0
+            if decoded is not None:
+                start = self._bisect(rows, decoded[0])
+            stop = start + self.per_page
+            has_previous, has_next = decoded is not None, len(rows) > stop
+
+        rows = rows[start:stop]
+        return KeysetPage(
+            rows,
+            has_next=has_next and bool(rows),
+            has_previous=has_previous and bool(rows),
+            next_cursor=self._cursor(rows[-1], 'next') if rows else None,
+            previous_cursor=self._cursor(rows[0], 'prev') if rows else None,
+        )
+
+    def page(self, cursor=None, last=False):
+        """
+        The page after (dir 'next') or before (dir 'prev') a cursor; the
+        first page without one, or the last page when last=True.
+        """
+        decoded = self.decode(cursor)
+        if not isinstance(self.queryset, QuerySet):
+            return self._list_page(decoded, last)
+        backwards = last or (decoded is not None and decoded[1] == 'prev')
+        query = self.queryset
+        if decoded is not None:
+            values, _ = decoded
+            # Walking backwards flips every column's direction
+            query = query.filter(seek_filter([
+                (field, value, descending != backwards)
+                for (field, descending), value in zip(self.fields, values)
+            ]))
+        ordering = self._reversed_ordering() if backwards else self.ordering
+        rows = list(query.order_by(*ordering)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_previous, has_next = more, not last
+        else:
+            has_previous, has_next = decoded is not None, more
+
+        return KeysetPage(
+            rows,
+            has_next=has_next and bool(rows),
+            has_previous=has_previous and bool(rows),
+            next_cursor=self._cursor(rows[-1], 'next') if rows else None,
+            previous_cursor=self._cursor(rows[0], 'prev') if rows else None,
+        )
@@ -0,0 +1,263 @@
+# nepse_data/tasks.py
+import datetime
+import os
+import time
+import uuid
+
+from celery import shared_task
+from django.conf import settings
+
+from adjustments_stock_price.incremental import refresh_dirty_symbols
+from technical_analysis.services.alert_service import AlertService
+from technical_analysis.services.price_panel import panel_enabled, refresh_panel
+
+from .ingestion import (
+    IngestionError,
+    ingest_price_file,
+    ingest_floorsheet_file,
+    ingest_indices_file,
+    ingest_marcap_file,
+    ingest_dividend_file,
+)
+
+# Human readable names for the data_entry_view upload actions
+INGESTION_ACTIONS = {
+    'upload_price': 'Price upload',
+    'upload_indices': 'Indices upload',
+    'upload_marcap': 'Market cap upload',
+    'upload_floorsheet': 'Floorsheet upload',
+    'upload_dividend': 'Dividend history upload',
+}
+
+# Don't push a PROGRESS state to the result backend more often than this (seconds)
+PROGRESS_UPDATE_INTERVAL = 0.5
+
+
+def stage_upload(uploaded_file):
+    """
+    Copies an uploaded file to INGESTION_STAGING_DIR so the Celery worker can
+    read it after the request is gone. Returns the staged path.
+    """
+    staging_dir = settings.INGESTION_STAGING_DIR
+    os.makedirs(staging_dir, exist_ok=True)
+    safe_name = os.path.basename(uploaded_file.name)
+    staged_path = os.path.join(staging_dir, f"{uuid.uuid4().hex}_{safe_name}")
+    with open(staged_path, 'wb') as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    return staged_path
+
+
+class IngestionProgress:
+    """
+    Progress callback for the ingestion functions. Tracks how long each phase
+    took and the overall rows/sec, and publishes them as Celery PROGRESS meta.
+    """
+
+    def __init__(self, task, label):
+        self.task = task
+        self.label = label
+        self.started = time.monotonic()
+        self.phase = None
+        self.phase_started = self.started
+        self.phase_timings = {}
+        self.rows_done = 0
+        self.rows_total = 0
+        self.last_push = 0.0
+
+    def __call__(self, phase, done=0, total=0):
+        now = time.monotonic()
+        phase_changed = phase != self.phase
+        if phase_changed:
+            self._close_phase(now)
+            self.phase = phase
+            self.phase_started = now
+        self.rows_done = done
+        self.rows_total = total
+        if phase_changed or now - self.last_push >= PROGRESS_UPDATE_INTERVAL:
+            self.last_push = now
+            self._push()
+
+    def _close_phase(self, now):
+        if self.phase is not None:
+            elapsed = self.phase_timings.get(self.phase, 0) + (now - self.phase_started)
+            self.phase_timings[self.phase] = round(elapsed, 3)
+
+    def _push(self):
+        # Called outside a worker (e.g. task.apply() in a shell) there's no id to report on
+        if not self.task.request.id:
+            return
+        self.task.update_state(state='PROGRESS', meta=self.meta())
+
+    def finish(self):
+        self._close_phase(time.monotonic())
+        self.phase = None
+
+    @property
+    def rows_per_sec(self):
+        elapsed = time.monotonic() - self.started
+        return round(self.rows_done / elapsed, 1) if elapsed > 0 else 0.0
+
+    def meta(self, message=None):
+        return {
+            "progress": self.rows_done,
+            "total": self.rows_total,
+            "message": message or f"{self.label}: {self.phase} ({self.rows_done:,} rows)",
+            "phase": self.phase,
+            "rows_per_sec": self.rows_per_sec,
+            "phase_timings": dict(self.phase_timings),
+        }
+
+
+def _run_action(action, fileobj, original_name, options, progress):
+    """
+    Dispatches one upload action. Returns (result, rows_processed, message, warnings).
+    """
+    if action == 'upload_price':
+        result = ingest_price_file(fileobj, progress=progress)
+        dates = result['dates']
+        if dates:
+            date_label = str(dates[0]) if len(dates) == 1 else f"{dates[0]} to {dates[-1]} ({len(dates)} dates)"
+        else:
+            date_label = "no new dates"
+        # Celery results are JSON
+        result['dates'] = [d.isoformat() for d in dates]
+        message = (
+            f"Inserted {result['inserted']} price records for {date_label}. "
+            f"Skipped {result['duplicates']} existing rows. Failed {result['failed']} rows."
+        )
+        warnings = [
+            f"line {f['line']} ({f['symbol'] or '?'}): {f['error']}"
+            for f in result['failures'][:5]
+        ]
+        rows = result['inserted'] + result['duplicates'] + result['failed']
+
+        if result['inserted']:
+            # Bring stock_prices_adj up to date for just the symbols that changed
+            # The prices are already committed: a failure here is a warning,
+            # and the change log keeps the symbols for the next refresh
+            progress('adjust', rows, rows)
+            try:
+                refresh = refresh_dirty_symbols()
+                message += (
+                    f" Adjusted prices: {sum(refresh['appended'].values())} rows appended,"
+                    f" {len(refresh['rebuilt'])} symbols rebuilt."
+                )
+                if refresh['failed']:
+                    warnings.append(f"Adjusted price refresh failed for: {', '.join(refresh['failed'])}")
+            except Exception as e:
+                warnings.append(f"Adjusted price refresh failed: {e}")
+            # Append the new dates to the memory-mapped price panel
+            progress('panel', rows, rows)
+            panel = refresh_panel()
+            if panel_enabled() and panel is None:
+                warnings.append("Price panel update failed; technical analysis reads fall back to the DB.")
+            # Fire the price alerts the new bars meet
+            progress('alerts', rows, rows)
+            try:
+                alerts = AlertService.evaluate(dates=dates)
+                message += f" Price alerts triggered: {alerts['triggered']}."
+            except Exception as e:
+                warnings.append(f"Price alert evaluation failed: {e}")
+
+    elif action == 'upload_floorsheet':
+        calculation_date = datetime.date.fromisoformat(options['calculation_date'])
+        result = ingest_floorsheet_file(fileobj, original_name, calculation_date, progress=progress)
+        message = (
+            f"Floorsheet for {calculation_date}: inserted {result['inserted']} records. "
+            f"Skipped {result['failed']} rows. Summary tables updated."
+        )
+        warnings = []
+        if result['summary_mismatches']:
+            warnings.append(f"Summary verification found {len(result['summary_mismatches'])} mismatches (see worker log).")
+        rows = result['inserted'] + result['failed']
+
+    elif action == 'upload_indices':
+        result = ingest_indices_file(fileobj, progress=progress)
+        message = (
+            f"Inserted {result['inserted']} new index records. "
+            f"Skipped {result['skipped']} duplicate rows. Failed {result['failed']} rows."
+        )
+        warnings = []
+        rows = result['inserted'] + result['skipped'] + result['failed']
+
+    elif action == 'upload_marcap':
+        result = ingest_marcap_file(fileobj, progress=progress)
+        message = (
+            f"Created {result['inserted']} market cap records. "
+            f"Updated {result['updated']} records. Failed {result['failed']} rows."
+        )
+        warnings = []
+        rows = result['inserted'] + result['updated'] + result['failed']
+
+    elif action == 'upload_dividend':
+        result = ingest_dividend_file(fileobj, original_name, progress=progress)
+        message = (
+            f"Created {result['inserted']} dividend records. "
+            f"Updated {result['updated']} records. Failed {result['failed']} rows."
+        )
+        warnings = []
+        rows = result['inserted'] + result['updated'] + result['failed']
+
+    else:
+        raise IngestionError(f"Unknown ingestion action '{action}'.")
+
+    return result, rows, message, warnings
+
+
+@shared_task(bind=True)
+def run_ingestion_job(self, action, staged_path, original_name, options=None):
+    """
+    Background task for every data_entry_view upload. Reads the staged file,
+    runs the matching ingestion function and reports progress (rows/sec and
+    per-phase timings) via Celery state. The staged file is always removed.
+    """
+    job_id = self.request.id
+    label = INGESTION_ACTIONS.get(action, action)
+    progress = IngestionProgress(self, label)
+    try:
+        progress('queued')
+        with open(staged_path, 'rb') as fileobj:
+            result, rows, message, warnings = _run_action(
+                action, fileobj, original_name, options or {}, progress
+            )
+        progress.rows_done = rows
+        progress.rows_total = rows
+        progress.finish()
+        print(f"{label} ({job_id}) finished: {message} Timings: {progress.phase_timings}")
+        return {
+            "status": "completed_with_errors" if warnings else "success",
+            "progress": rows,
+            "total": rows,
+            "message": f"{label} successful! {message}",
+            "warnings": warnings,
+            "rows_per_sec": progress.rows_per_sec,
+            "phase_timings": progress.phase_timings,
+            "result": result,
+        }
+
+    except IngestionError as e:
+        progress.finish()
+        return {
+            "status": "error",
+            "progress": 0,
+            "total": 0,
+            "message": str(e),
+            "phase_timings": progress.phase_timings,
+        }
+    except Exception as e:
+        progress.finish()
+        error_msg = f"Critical error: {str(e)}"
+        print(f"!!! --- CRITICAL ERROR in ingestion job {job_id}: {error_msg} --- !!!")
+        return {
+            "status": "error",
+            "progress": 0,
+            "total": 0,
+            "message": error_msg,
+            "phase_timings": progress.phase_timings,
+        }
+    finally:
+        try:
+            os.remove(staged_path)
+        except OSError:
+            pass
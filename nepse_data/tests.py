@@ -1,3 +1,28 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from .ingestion import clean_floorsheet_chunk
+
+
+class FloorsheetCleaningTests(SimpleTestCase):
+
+    def test_rate_and_amount_round_half_up_like_a_decimal_column(self):
+        rates = ['100.005', '1,234.565', '-2.345', '12.3456', 1.005, '1e+3', '7', 'N/A', np.nan]
+        df = pd.DataFrame({
+            'SN': [str(i) for i in range(len(rates))], 'CONTRACT NO.': 'c', 'STOCK SYMBOL': 'abc',
+            'BUYER': '1', 'SELLER': '2', 'QUANTITY': '10', 'RATE (RS)': rates, 'AMOUNT (RS)': rates,
+        })
+        clean, failed = clean_floorsheet_chunk(df, date(2024, 1, 1), {})
+        expected = [
+            Decimal('100.01'), Decimal('1234.57'), Decimal('-2.35'), Decimal('12.35'), Decimal('1.01'),
+            Decimal('1000.00'), Decimal('7.00'), None, None,
+        ]
+        self.assertEqual(failed, 0)
+        self.assertEqual(list(clean['rate']), expected)
+        self.assertEqual(list(clean['amount']), expected)
+        self.assertEqual(list(clean['amount_paisa'].astype(object).where(clean['amount_paisa'].notna(), None)),
+                         [None if value is None else int(value * 100) for value in expected])
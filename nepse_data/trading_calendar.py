@@ -0,0 +1,206 @@
+# nepse_data/trading_calendar.py
+"""
+Cached trading-date index shared by the report views.
+
+Each dataset (prices, floorsheet, indices) keeps its distinct trading
+dates as one sorted tuple. Lookups (previous / next / closest trading day,
+the start of an N-day window) are bisects instead of the linear scans the
+views used to do on a freshly queried list.
+
+The sorted dates live in process memory and in Django's cache. A small
+stamp key in the cache tells every process (web workers and the Celery
+worker) whether its in-memory copy is still current, so a request costs one
+cache read and no SQL. Uploads and deletes call invalidate() once their
+transaction commits; the cache timeout bounds staleness for any write that
+bypasses them.
+"""
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import StockPrices, FloorsheetRaw, Indices
+
+# dataset -> (model, date field)
+DATASETS = {
+    'prices': (StockPrices, 'business_date'),
+    'floorsheet': (FloorsheetRaw, 'calculation_date'),
+    'indices': (Indices, 'date'),
+}
+
+CACHE_PREFIX = 'trading_calendar'
+
+
+class TradingCalendar:
+    """Sorted trading dates of one dataset with O(log n) lookups."""
+
+    def __init__(self, dataset, dates, stamp=None):
+        self.dataset = dataset
+        self.dates = tuple(sorted(set(dates)))
+        self.stamp = stamp
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, day):
+        i = bisect_left(self.dates, day)
+        return i < len(self.dates) and self.dates[i] == day
+
+    @property
+    def earliest(self):
+        return self.dates[0] if self.dates else None
+
+    @property
+    def latest(self):
+        return self.dates[-1] if self.dates else None
+
+    def descending(self):
+        """Newest first, the order the report date pickers show."""
+        return list(reversed(self.dates))
+
+    def previous(self, day):
+        """Latest trading date on or before day (None if there is none)."""
+        i = bisect_right(self.dates, day)
+        return self.dates[i - 1] if i else None
+
+    def next(self, day):
+        """Earliest trading date on or after day (None if there is none)."""
+        i = bisect_left(self.dates, day)
+        return self.dates[i] if i < len(self.dates) else None
+
+    def closest(self, day):
+        """Nearest trading date to day; ties go to the earlier date."""
+        before, after = self.previous(day), self.next(day)
+        if before is None or after is None:
+            return before or after
+        return before if (day - before) <= (after - day) else after
+
+    def snap(self, day, direction='closest'):
+        """
+        Moves day onto a trading date. 'previous' and 'next' fall back to
+        the first / last trading date when day is outside the calendar
+        (what find_valid_trading_date used to do).
+        """
+        if not self.dates:
+            return None
+        if direction == 'previous':
+            return self.previous(day) or self.dates[0]
+        if direction == 'next':
+            return self.next(day) or self.dates[-1]
+        return self.closest(day)
+
+    def window_start(self, end_date, trading_days):
+        """
+        First date of the `trading_days` trading days ending on end_date
+        (the earliest date if there are fewer; end_date if none are on or
+        before it).
+        """
+        i = bisect_right(self.dates, end_date)
+        if not i:
+            return end_date
+        return self.dates[max(0, i - max(trading_days, 1))]
+
+    def between(self, start_date, end_date):
+        """Trading dates in [start_date, end_date], oldest first."""
+        return list(self.dates[bisect_left(self.dates, start_date):bisect_right(self.dates, end_date)])
+
+
+# ==================================
+# --- CACHING ---
+# ==================================
+
+_local = {}  # dataset -> TradingCalendar
+_lock = threading.Lock()
+
+
+def _keys(dataset):
+    return f"{CACHE_PREFIX}:{dataset}:stamp", f"{CACHE_PREFIX}:{dataset}:dates"
+
+
+def _cache_timeout():
+    return getattr(settings, 'TRADING_CALENDAR_CACHE_TIMEOUT', 3600)
+
+
+def _load_dates(dataset):
+    model, field = DATASETS[dataset]
+    dates = list(
+        model.objects.filter(**{f"{field}__isnull": False})
+        .values_list(field, flat=True)
+        .distinct()
+    )
+    if dataset == 'floorsheet':
+        # Closed months moved out of floorsheet_raw are still trading days
+        from floorsheet_analysis.archive import archived_dates
+        dates.extend(archived_dates())
+    return dates
+
+
+def get_calendar(dataset):
+    """The TradingCalendar for a dataset, from memory, the cache or the DB."""
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown trading calendar dataset: {dataset}")
+    stamp_key, dates_key = _keys(dataset)
+
+    try:
+        stamp = cache.get(stamp_key)
+    except Exception as e:
+        # Cache backend down: serve straight from the DB
+        print(f"Trading calendar cache unavailable ({e}); loading {dataset} dates from the DB.")
+        return TradingCalendar(dataset, _load_dates(dataset))
+
+    local = _local.get(dataset)
+    if stamp is not None and local is not None and local.stamp == stamp:
+        return local
+
+    with _lock:
+        local = _local.get(dataset)
+        if stamp is not None and local is not None and local.stamp == stamp:
+            return local
+
+        payload = cache.get(dates_key) if stamp is not None else None
+        if payload and payload['stamp'] == stamp:
+            calendar = TradingCalendar(dataset, payload['dates'], stamp)
+        else:
+            stamp = uuid.uuid4().hex
+            calendar = TradingCalendar(dataset, _load_dates(dataset), stamp)
+            cache.set_many({
+                stamp_key: stamp,
+                dates_key: {'stamp': stamp, 'dates': calendar.dates},
+            }, _cache_timeout())
+            print(f"Trading calendar '{dataset}' loaded: {len(calendar)} dates.")
+        _local[dataset] = calendar
+        return calendar
+
+
+def invalidate(*datasets):
+    """
+    Drops the cached calendars (all of them if none are named). Inside a
+    transaction this waits for the commit, so nobody re-caches the old dates.
+    """
+    names = datasets or tuple(DATASETS)
+
+    def _drop():
+        for dataset in names:
+            _local.pop(dataset, None)
+        try:
+            cache.delete_many([key for dataset in names for key in _keys(dataset)])
+        except Exception as e:
+            print(f"Could not invalidate trading calendar cache: {e}")
+
+    transaction.on_commit(_drop)
+
+
+# Shorthands for the three calendars
+def price_calendar():
+    return get_calendar('prices')
+
+
+def floorsheet_calendar():
+    return get_calendar('floorsheet')
+
+
+def indices_calendar():
+    return get_calendar('indices')
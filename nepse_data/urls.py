@@ -9,6 +9,7 @@ urlpatterns = [
     
     path('data-entry/', views.data_entry_view, name='data_entry'),
     path('data-entry/delete/', views.delete_price_data_view, name='delete_price_data'),
+    path('data-entry/ingestion-status/<str:job_id>/', views.ingestion_status_view, name='ingestion_status'),
 
     path('indices/', views.indices_view, name='indices'),
     path('download-indices/', views.download_indices_view, name='download_indices'),
@@ -0,0 +1,88 @@
+# nepse_data/utils.py
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+
+
+# ==================================
+# --- CONSOLIDATED HELPER FUNCTIONS ---
+# ==================================
+# These used to live at the top of views.py. They are shared by the views
+# and by the ingestion module, so they now live here.
+
+def clean_decimal(value):
+    """
+    Safely converts any input (str, float, int) with commas
+    to a Decimal or None.
+    """
+    if value is None: return None
+    if not isinstance(value, str):
+        value = str(value)
+    if value.strip() in ('', 'N/A', '-'):
+        return None
+    try:
+        return Decimal(value.replace(',', ''))
+    except (InvalidOperation, ValueError, TypeError):
+        print(f"Could not convert '{value}' to Decimal")
+        return None
+
+def clean_int(value):
+    """
+    Safely converts any input (str, float, int) with commas
+    and .00 decimals to an Integer or None.
+    """
+    if value is None: return None
+    if not isinstance(value, str):
+        value = str(value)
+    if value.strip() in ('', 'N/A', '-'):
+        return None
+    try:
+        # Use float first to handle "40,591.00"
+        return int(float(value.replace(',', '')))
+    except (InvalidOperation, ValueError, TypeError):
+        print(f"Could not convert '{value}' to Integer")
+        return None
+
+# A helper function to fetch raw SQL as a dictionary
+def dictfetchall(cursor):
+    "Return all rows from a cursor as a dict"
+    columns = [col[0] for col in cursor.description]
+    return [
+        dict(zip(columns, row))
+        for row in cursor.fetchall()
+    ]
+
+def clean_date(value):
+    """
+    Safely converts any input (str, datetime, etc.) to a Date object or None.
+    Handles NaT, None, empty strings, or common Excel null dates like '1900-01-00'.
+    """
+    if not value or pd.isna(value):
+        return None
+
+    # Convert to string to handle various inputs and check for known bad dates
+    value_str = str(value).strip()
+
+    # Pre-emptively catch empty strings or common "bad null" dates
+    if value_str in ('', '1900-01-00', 'NaT'):
+        return None
+
+    try:
+        # pd.to_datetime is very flexible with input formats
+        return pd.to_datetime(value_str).date()
+    except (ValueError, TypeError):
+        # This will now only catch *truly* unexpected date formats
+        print(f"Could not convert '{value_str}' to Date")
+        return None
+
+
+def buyer_seller_to_int(value):
+    """Converts buyer/seller value, handling 'D01'/'D02' specifically."""
+    if str(value).strip() == 'D01':
+        return 60
+    elif str(value).strip() == 'D02':
+        return 77
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
@@ -1,20 +1,28 @@
 # nepse_data/views.py
 from django.shortcuts import render, redirect
-from django.db import connection
+from django.db import connection, transaction
 from django.db.models import Q, Max
 from listed_companies.models import Companies
 import datetime
+from collections import OrderedDict
 from django.http import HttpResponse
 from django.contrib import messages
+from django.conf import settings
+from django.core.cache import cache
 from django.views.decorators.http import require_POST
 from adjustments_stock_price.models import StockPricesAdj
 import io
 import csv
+import hashlib
+import json
 import pandas as pd
 from decimal import Decimal, InvalidOperation
 from django.core.paginator import Paginator
-from django.db.models import Q, Max, Sum, F
+from django.db.models import Q, Max, Sum, F, Count
 from .models import StockPrices, Indices, Marcap, FloorsheetRaw, DividendHistory
+from .tasks import INGESTION_ACTIONS, run_ingestion_job, stage_upload
+from celery.result import AsyncResult
+from django.urls import reverse
 from django.http import JsonResponse
 from django.db.models import Value
 from django.db.models.functions import Concat
@@ -33,90 +41,23 @@ import re # For parsing the fiscal year string
 # --- *** NEW IMPORT *** ---
 # This is the model we will be WRITING to
 from adjustments_stock_price.models import PriceAdjustments
+from adjustments_stock_price.incremental import record_price_changes, record_adjustment_changes
+from adjustments_stock_price.segments import segment_join, adjusted_column, adjusted_select
+from floorsheet_analysis.cumulative import rebuild_from as rebuild_cumulative_from
+from floorsheet_analysis.archive import (
+    ArchiveError, archived_dates, column_sum, scan, sort_table, remove_dates as remove_archived_dates
+)
+from .exports import export_chunk_size, stream_query, stream_queryset, streaming_csv_response, wants_gzip
+from .pagination import KeysetPaginator
+from .trading_calendar import price_calendar, floorsheet_calendar, indices_calendar, invalidate as invalidate_calendar
 # --- *** END OF NEW IMPORT *** ---
 
 
 # ==================================
 # --- CONSOLIDATED HELPER FUNCTIONS ---
 # ==================================
-
-# ... (all your existing helper functions like clean_decimal, clean_int, etc. remain unchanged) ...
-def clean_decimal(value):
-    """
-    Safely converts any input (str, float, int) with commas 
-    to a Decimal or None.
-    """
-    if value is None: return None
-    if not isinstance(value, str):
-        value = str(value)
-    if value.strip() in ('', 'N/A', '-'):
-        return None
-    try:
-        return Decimal(value.replace(',', ''))
-    except (InvalidOperation, ValueError, TypeError):
-        print(f"Could not convert '{value}' to Decimal")
-        return None
-
-def clean_int(value):
-    """
-    Safely converts any input (str, float, int) with commas 
-    and .00 decimals to an Integer or None.
-    """
-    if value is None: return None
-    if not isinstance(value, str):
-        value = str(value)
-    if value.strip() in ('', 'N/A', '-'):
-        return None
-    try:
-        # Use float first to handle "40,591.00"
-        return int(float(value.replace(',', '')))
-    except (InvalidOperation, ValueError, TypeError):
-        print(f"Could not convert '{value}' to Integer")
-        return None
-
-# A helper function to fetch raw SQL as a dictionary
-def dictfetchall(cursor):
-    "Return all rows from a cursor as a dict"
-    columns = [col[0] for col in cursor.description]
-    return [
-        dict(zip(columns, row))
-        for row in cursor.fetchall()
-    ]
-
-def clean_date(value):
-    """
-    Safely converts any input (str, datetime, etc.) to a Date object or None.
-    Handles NaT, None, empty strings, or common Excel null dates like '1900-01-00'.
-    """
-    if not value or pd.isna(value):
-        return None
-    
-    # Convert to string to handle various inputs and check for known bad dates
-    value_str = str(value).strip()
-    
-    # Pre-emptively catch empty strings or common "bad null" dates
-    if value_str in ('', '1900-01-00', 'NaT'):
-        return None
-        
-    try:
-        # pd.to_datetime is very flexible with input formats
-        return pd.to_datetime(value_str).date()
-    except (ValueError, TypeError):
-        # This will now only catch *truly* unexpected date formats
-        print(f"Could not convert '{value_str}' to Date")
-        return None
-
-
-def buyer_seller_to_int(value):
-    """Converts buyer/seller value, handling 'D01'/'D02' specifically."""
-    if str(value).strip() == 'D01':
-        return 60
-    elif str(value).strip() == 'D02':
-        return 77
-    try:
-        return int(value)
-    except (ValueError, TypeError):
-        return None
+# The cleaning helpers now live in utils.py so ingestion.py can share them.
+from .utils import clean_decimal, dictfetchall, clean_date
 
 # ==================================
 # --- ALL YOUR VIEWS (Corrected) ---
@@ -133,9 +74,8 @@ def todays_price_view(request):
     title = "Stock Prices"
     all_companies = Companies.objects.values('script_ticker', 'company_name').order_by('script_ticker')
     if not selected_date_str:
-        latest_date_result = StockPrices.objects.aggregate(max_date=Max('business_date'))
-        if latest_date_result['max_date']:
-            query_date = latest_date_result['max_date']
+        query_date = price_calendar().latest
+        if query_date:
             selected_date_str = query_date.isoformat()
     else:
         try:
@@ -154,29 +94,26 @@ def todays_price_view(request):
         ).order_by('-business_date', 'symbol')
     elif view == 'adjusted' and query_date:
         title = "Adjusted Stock Prices by Date"
-        query = """
+        query = f"""
         WITH PricesToday AS (
             SELECT 
                 p.id, p.business_date, p.symbol, p.security_name,
                 p.total_traded_quantity, p.total_trades, p.market_capitalization, p.close_price,
                 p.fifty_two_week_high, p.fifty_two_week_low,
-                COALESCE(adj.open_price_adj, p.open_price) as open_price_adj,
-                COALESCE(adj.high_price_adj, p.high_price) as high_price_adj,
-                COALESCE(adj.low_price_adj, p.low_price) as low_price_adj,
-                COALESCE(adj.close_price_adj, p.close_price) as close_price_adj,
-                COALESCE(adj.average_traded_price_adj, p.average_traded_price) as average_traded_price_adj
+                {adjusted_select()}
             FROM stock_prices p
-            LEFT JOIN stock_prices_adj adj ON p.id = adj.id
+            {segment_join()}
             WHERE p.business_date = %s
         ),
         WindowStats AS (
             SELECT
-                symbol,
-                MAX(high_price_adj) as calculated_52w_high,
-                MIN(low_price_adj) as calculated_52w_low
-            FROM stock_prices_adj
-            WHERE business_date BETWEEN DATE_SUB(%s, INTERVAL 364 DAY) AND %s
-            GROUP BY symbol
+                p.symbol,
+                MAX({adjusted_column('high_price')}) as calculated_52w_high,
+                MIN({adjusted_column('low_price')}) as calculated_52w_low
+            FROM stock_prices p
+            {segment_join()}
+            WHERE p.business_date BETWEEN DATE_SUB(%s, INTERVAL 364 DAY) AND %s
+            GROUP BY p.symbol
         )
         SELECT 
             pt.*,
@@ -199,16 +136,12 @@ def todays_price_view(request):
             query = f"""
             SELECT
                 p.id, p.business_date, p.symbol,
-                COALESCE(adj.open_price_adj, p.open_price) as open_price_adj,
-                COALESCE(adj.high_price_adj, p.high_price) as high_price_adj,
-                COALESCE(adj.low_price_adj, p.low_price) as low_price_adj,
-                COALESCE(adj.close_price_adj, p.close_price) as close_price_adj,
-                COALESCE(adj.average_traded_price_adj, p.average_traded_price) as average_traded_price_adj,
-                MAX(COALESCE(adj.high_price_adj, p.high_price)) OVER (
+                {adjusted_select()},
+                MAX({adjusted_column('high_price')}) OVER (
                     PARTITION BY p.symbol ORDER BY p.business_date
                     ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
                 ) as fifty_two_week_high_adj,
-                MIN(COALESCE(adj.low_price_adj, p.low_price)) OVER (
+                MIN({adjusted_column('low_price')}) OVER (
                     PARTITION BY p.symbol ORDER BY p.business_date
                     ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
                 ) as fifty_two_week_low_adj,
@@ -216,8 +149,7 @@ def todays_price_view(request):
                 p.market_capitalization, p.close_price
             FROM
                 stock_prices p
-            LEFT JOIN
-                stock_prices_adj adj ON p.id = adj.id
+            {segment_join()}
             WHERE
                 p.symbol IN ({format_strings})
             ORDER BY
@@ -253,18 +185,21 @@ def todays_price_view(request):
     }
     return render(request, 'nepse_data/todays_price.html', context)
 
+# Columns of the unadjusted price export (every StockPrices field, in model order)
+STOCK_PRICE_EXPORT_FIELDS = [field.attname for field in StockPrices._meta.fields]
+STOCK_PRICE_EXPORT_HEADER = [field.name for field in StockPrices._meta.fields]
+
+
 def download_stock_prices_view(request):
-    # (This view is unchanged)
     view = request.GET.get('view', 'date')
     selected_date_str = request.GET.get('selected_date')
     search_term = request.GET.get('search_term', '').strip()
-    stock_prices = []
+    header, rows = None, []
     query_date = None
     download_name = "stock_prices.csv"
     if not selected_date_str:
-        latest_date_result = StockPrices.objects.aggregate(max_date=Max('business_date'))
-        if latest_date_result['max_date']:
-            query_date = latest_date_result['max_date']
+        query_date = price_calendar().latest
+        if query_date:
             selected_date_str = query_date.isoformat()
     else:
         try:
@@ -272,33 +207,36 @@ def download_stock_prices_view(request):
         except ValueError:
             query_date = None
     if view == 'date' and query_date:
-        stock_prices = StockPrices.objects.filter(business_date=query_date).order_by('symbol')
+        _, rows = stream_queryset(
+            StockPrices.objects.filter(business_date=query_date).order_by('symbol')
+            .values_list(*STOCK_PRICE_EXPORT_FIELDS)
+        )
+        header = STOCK_PRICE_EXPORT_HEADER
         download_name = f'stock_prices_unadjusted_{query_date}.csv'
     elif view == 'company' and search_term:
-        stock_prices = StockPrices.objects.filter(
-            Q(symbol=search_term) | Q(security_name=search_term)
-        ).order_by('-business_date', 'symbol')
+        _, rows = stream_queryset(
+            StockPrices.objects.filter(
+                Q(symbol=search_term) | Q(security_name=search_term)
+            ).order_by('-business_date', 'symbol').values_list(*STOCK_PRICE_EXPORT_FIELDS)
+        )
+        header = STOCK_PRICE_EXPORT_HEADER
         download_name = f"stock_prices_unadjusted_{search_term.replace(' ', '_')}.csv"
     elif view == 'adjusted' and query_date:
-        query = """
+        query = f"""
         WITH PricesToday AS (
             SELECT 
                 p.id, p.business_date, p.symbol, p.security_name,
                 p.total_traded_quantity, p.total_trades, p.market_capitalization, p.close_price,
                 p.fifty_two_week_high, p.fifty_two_week_low,
-                COALESCE(adj.open_price_adj, p.open_price) as open_price_adj,
-                COALESCE(adj.high_price_adj, p.high_price) as high_price_adj,
-                COALESCE(adj.low_price_adj, p.low_price) as low_price_adj,
-                COALESCE(adj.close_price_adj, p.close_price) as close_price_adj,
-                COALESCE(adj.average_traded_price_adj, p.average_traded_price) as average_traded_price_adj
-            FROM stock_prices p LEFT JOIN stock_prices_adj adj ON p.id = adj.id
+                {adjusted_select()}
+            FROM stock_prices p {segment_join()}
             WHERE p.business_date = %s
         ),
         WindowStats AS (
-            SELECT symbol, MAX(high_price_adj) as calculated_52w_high, MIN(low_price_adj) as calculated_52w_low
-            FROM stock_prices_adj
-            WHERE business_date BETWEEN DATE_SUB(%s, INTERVAL 364 DAY) AND %s
-            GROUP BY symbol
+            SELECT p.symbol, MAX({adjusted_column('high_price')}) as calculated_52w_high, MIN({adjusted_column('low_price')}) as calculated_52w_low
+            FROM stock_prices p {segment_join()}
+            WHERE p.business_date BETWEEN DATE_SUB(%s, INTERVAL 364 DAY) AND %s
+            GROUP BY p.symbol
         )
         SELECT 
             pt.id, pt.business_date, pt.symbol, pt.security_name,
@@ -310,9 +248,7 @@ def download_stock_prices_view(request):
         FROM PricesToday pt LEFT JOIN WindowStats ws ON pt.symbol = ws.symbol
         ORDER BY pt.symbol
         """
-        with connection.cursor() as cursor:
-            cursor.execute(query, [query_date, query_date, query_date])
-            stock_prices = dictfetchall(cursor)
+        header, rows = stream_query(query, [query_date, query_date, query_date])
         download_name = f'stock_prices_adjusted_{query_date}.csv'
     elif view == 'corporate' and search_term:
         matching_symbols = list(Companies.objects.filter(
@@ -323,481 +259,83 @@ def download_stock_prices_view(request):
             query = f"""
             SELECT
                 p.id, p.business_date, p.symbol,
-                COALESCE(adj.open_price_adj, p.open_price) as open_price_adj,
-                COALESCE(adj.high_price_adj, p.high_price) as high_price_adj,
-                COALESCE(adj.low_price_adj, p.low_price) as low_price_adj,
-                COALESCE(adj.close_price_adj, p.close_price) as close_price_adj,
-                COALESCE(adj.average_traded_price_adj, p.average_traded_price) as average_traded_price_adj,
-                MAX(COALESCE(adj.high_price_adj, p.high_price)) OVER (
+                {adjusted_select()},
+                MAX({adjusted_column('high_price')}) OVER (
                     PARTITION BY p.symbol ORDER BY p.business_date ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
                 ) as fifty_two_week_high_adj,
-                MIN(COALESCE(adj.low_price_adj, p.low_price)) OVER (
+                MIN({adjusted_column('low_price')}) OVER (
                     PARTITION BY p.symbol ORDER BY p.business_date ROWS BETWEEN 364 PRECEDING AND CURRENT ROW
                 ) as fifty_two_week_low_adj,
                 p.total_traded_quantity, p.total_trades,
                 p.market_capitalization, p.close_price
-            FROM stock_prices p LEFT JOIN stock_prices_adj adj ON p.id = adj.id
+            FROM stock_prices p {segment_join()}
             WHERE p.symbol IN ({format_strings})
             ORDER BY p.symbol, p.business_date DESC
             """
-            with connection.cursor() as cursor:
-                cursor.execute(query, matching_symbols)
-                stock_prices = dictfetchall(cursor)
+            header, rows = stream_query(query, matching_symbols)
         download_name = f"stock_prices_adjusted_{search_term.replace(' ', '_')}.csv"
-    if not stock_prices:
+    response = streaming_csv_response(download_name, header, rows, gzip=wants_gzip(request))
+    if response is None:
         return HttpResponse("No data found for this query.", status=404)
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{download_name}"'
-    if isinstance(stock_prices, list):
-        headers = stock_prices[0].keys()
-        writer = csv.DictWriter(response, fieldnames=headers)
-        writer.writeheader()
-        writer.writerows(stock_prices)
-    else:
-        headers = [field.name for field in stock_prices.model._meta.fields]
-        writer = csv.writer(response)
-        writer.writerow(headers)
-        for row in stock_prices:
-            writer.writerow([getattr(row, field) for field in headers])
     return response
 
+# --- Upload form fields: action -> (file input name, allowed extensions, "missing file" message) ---
+UPLOAD_FILE_FIELDS = {
+    'upload_price': ('price_file', ('.csv',), "No file selected for uploading."),
+    'upload_indices': ('indices_file', ('.csv',), "No indices file selected."),
+    'upload_marcap': ('marcap_file', ('.csv',), "No market cap file selected."),
+    'upload_floorsheet': ('floorsheet_file', ('.csv', '.xlsx', '.xls'), "No floorsheet file selected."),
+    'upload_dividend': ('dividend_file', ('.csv', '.xlsx', '.xls'), "No dividend history file selected."),
+}
+
 # --- Main View for Data Entry Page (CORRECTED) ---
 def data_entry_view(request):
     if request.method == 'POST':
-        if request.POST.get('action') == 'upload_price':
-            # --- HANDLE PRICE UPLOAD (Unchanged) ---
-            price_file = request.FILES.get('price_file')
-            if not price_file:
-                messages.error(request, "No file selected for uploading.")
-                return redirect('nepse_data:data_entry')
-            if not price_file.name.endswith('.csv'):
-                messages.error(request, "Invalid file type. Please upload a .csv file.")
-                return redirect('nepse_data:data_entry')
-            try:
-                csv_file = io.TextIOWrapper(price_file.file, encoding='utf-8-sig')
-                reader = csv.reader(csv_file)
-                header = next(reader)
-                expected_columns = len(header)
-                if expected_columns < 19:
-                    messages.error(request, f"CSV format error. Expected 19+ columns, found {expected_columns}.")
-                    return redirect('nepse_data:data_entry')
-                all_rows_raw = list(reader)
-                if not all_rows_raw:
-                    messages.error(request, "CSV file is empty or contains only a header.")
-                    return redirect('nepse_data:data_entry')
-                business_date_str = all_rows_raw[0][1].strip()
-                if StockPrices.objects.filter(business_date=business_date_str).exists():
-                    messages.error(request, f"Error: Data for date {business_date_str} (from file) already exists.")
-                    return redirect('nepse_data:data_entry')
-                corrected_rows = []
-                for row in all_rows_raw:
-                    if len(row) > expected_columns:
-                        extra_col_count = len(row) - expected_columns
-                        merged_name = ' '.join(row[4 : 4 + extra_col_count + 1])
-                        corrected_row = row[:4] + [merged_name] + row[4 + extra_col_count + 1:]
-                        corrected_rows.append(corrected_row)
-                    elif len(row) == expected_columns:
-                        corrected_rows.append(row)
-                inserted_rows, failed_rows = 0, 0
-                for row in corrected_rows:
-                    if len(row) < 19:
-                        failed_rows += 1
-                        continue
-                    try:
-                        StockPrices.objects.create(
-                            business_date=business_date_str,
-                            security_id=row[2].strip(),
-                            symbol=row[3].strip(),
-                            security_name=row[4].strip(),
-                            open_price=clean_decimal(row[5]),
-                            high_price=clean_decimal(row[6]),
-                            low_price=clean_decimal(row[7]),
-                            close_price=clean_decimal(row[8]),
-                            total_traded_quantity=clean_int(row[9]),
-                            total_traded_value=clean_decimal(row[10]),
-                            previous_close=clean_decimal(row[11]),
-                            fifty_two_week_high=clean_decimal(row[12]),
-                            fifty_two_week_low=clean_decimal(row[13]),
-                            last_updated_time=row[14].strip() or None,
-                            last_updated_price=clean_decimal(row[15]),
-                            total_trades=clean_int(row[16]),
-                            average_traded_price=clean_decimal(row[17]),
-                            market_capitalization=clean_decimal(row[18])
-                        )
-                        inserted_rows += 1
-                    except Exception as e:
-                        print(f"Error inserting row: {e}")
-                        failed_rows += 1
-                messages.success(request, f"Upload successful! Inserted {inserted_rows} price records for {business_date_str}. Skipped {failed_rows} rows.")
-            except Exception as e:
-                messages.error(request, f"An error occurred: {e}")
+        # --- ALL UPLOADS RUN AS BACKGROUND JOBS (see tasks.run_ingestion_job) ---
+        action = request.POST.get('action')
+        if action not in INGESTION_ACTIONS:
+            messages.warning(request, "Unknown action.")
             return redirect('nepse_data:data_entry')
 
-        elif request.POST.get('action') == 'upload_indices':
-            # --- HANDLE INDICES UPLOAD (Unchanged) ---
-            indices_file = request.FILES.get('indices_file')
-            if not indices_file:
-                messages.error(request, "No indices file selected.")
-                return redirect('nepse_data:data_entry')
-            if not indices_file.name.endswith('.csv'):
-                messages.error(request, "Invalid file type. Please upload a .csv file.")
-                return redirect('nepse_data:data_entry')
-            try:
-                csv_file = io.TextIOWrapper(indices_file.file, encoding='utf-8-sig')
-                reader = csv.reader(csv_file)
-                header = next(reader)
-                inserted_rows, skipped_rows, failed_rows = 0, 0, 0
-                for row in reader:
-                    try:
-                        row_date = datetime.datetime.strptime(row[1], '%Y-%m-%d').date()
-                        row_sector = row[13].strip()
-                        if Indices.objects.filter(date=row_date, sector=row_sector).exists():
-                            skipped_rows += 1
-                            continue
-                        
-                        Indices.objects.create(
-                            sn=clean_int(row[0]),
-                            date=row_date,
-                            open=clean_decimal(row[2]),
-                            high=clean_decimal(row[3]),
-                            low=clean_decimal(row[4]),
-                            close=clean_decimal(row[5]),
-                            absolute_change=clean_decimal(row[6]),
-                            percentage_change=row[7] or None,
-                            number_52_weeks_high=clean_decimal(row[8]),
-                            number_52_weeks_low=clean_decimal(row[9]),
-                            turnover_values=clean_decimal(row[10]),
-                            turnover_volume=clean_int(row[11]),
-                            total_transaction=clean_int(row[12]),
-                            sector=row_sector
-                        )
-                        inserted_rows += 1
-                    except Exception as e:
-                        print(f"Error inserting index row: {e}")
-                        failed_rows += 1
-                messages.success(request, f"Indices upload successful! Inserted {inserted_rows} new records. Skipped {skipped_rows} duplicate rows. Failed {failed_rows} rows.")
-            except Exception as e:
-                messages.error(request, f"An error occurred during indices upload: {e}")
+        file_field, allowed_extensions, missing_message = UPLOAD_FILE_FIELDS[action]
+        uploaded_file = request.FILES.get(file_field)
+        if not uploaded_file:
+            messages.error(request, missing_message)
             return redirect('nepse_data:data_entry')
-
-        elif request.POST.get('action') == 'upload_marcap':
-            # --- HANDLE MARKET CAP UPLOAD (Unchanged) ---
-            marcap_file = request.FILES.get('marcap_file')
-            if not marcap_file:
-                messages.error(request, "No market cap file selected.")
-                return redirect('nepse_data:data_entry')
-            if not marcap_file.name.endswith('.csv'):
-                messages.error(request, "Invalid file type. Please upload a .csv file.")
-                return redirect('nepse_data:data_entry')
-            
-            try:
-                df = pd.read_csv(marcap_file, encoding='utf-8-sig')
-                
-                df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
-                
-                if 'bussiness_date' in df.columns:
-                    df.rename(columns={'bussiness_date': 'business_date'}, inplace=True)
-
-                required_cols = ['business_date', 'market_capitalization', 'total_turnover']
-                if not all(col in df.columns for col in required_cols):
-                    missing = [col for col in required_cols if col not in df.columns]
-                    messages.error(request, f"CSV is missing required columns. Must include: {', '.join(missing)}")
-                    return redirect('nepse_data:data_entry')
-
-                inserted_rows, updated_rows, failed_rows = 0, 0, 0
-                
-                for index, row in df.iterrows():
-                    try:
-                        row_date = pd.to_datetime(row['business_date']).date()
-
-                        data_to_insert = {
-                            'sn': clean_int(row.get('s.n')),
-                            'market_capitalization': clean_decimal(row.get('market_capitalization')),
-                            'sensitive_market_capitalization': clean_decimal(row.get('sensitive_market_capitalization')),
-                            'float_market_capitalization': clean_decimal(row.get('float_market_capitalization')),
-                            'sensitive_float_market_capitalization': clean_decimal(row.get('sensitive_float_market_capitalization')),
-                            'total_turnover': clean_decimal(row.get('total_turnover')),
-                            'total_traded_shares': clean_int(row.get('total_traded_shares')),
-                            'total_transactions': clean_int(row.get('total_transactions')),
-                            'total_scrips_traded': clean_int(row.get('total_scrips_traded')),
-                        }
-                        
-                        obj, created = Marcap.objects.update_or_create(
-                            business_date=row_date,
-                            defaults=data_to_insert
-                        )
-
-                        if created:
-                            inserted_rows += 1
-                        else:
-                            updated_rows += 1
-                    
-                    except Exception as e:
-                        print(f"Error inserting marcap row {index}: {e}")
-                        failed_rows += 1
-
-                messages.success(request, f"Market Cap upload successful! Created {inserted_rows} new records. Updated {updated_rows} records. Failed {failed_rows} rows.")
-            except Exception as e:
-                messages.error(request, f"An error occurred during market cap upload: {e}")
+        if allowed_extensions and not uploaded_file.name.lower().endswith(allowed_extensions):
+            messages.error(request, f"Invalid file type. Please upload a {' or '.join(allowed_extensions)} file.")
             return redirect('nepse_data:data_entry')
-        
-        elif request.POST.get('action') == 'upload_floorsheet':
-            # --- FLOORSHEET UPLOAD LOGIC (Unchanged) ---
-            floorsheet_file = request.FILES.get('floorsheet_file')
-            date_str = request.POST.get('floorsheet_date')
 
-            if not floorsheet_file:
-                messages.error(request, "No floorsheet file selected.")
-                return redirect('nepse_data:data_entry')
+        options = {}
+        if action == 'upload_floorsheet':
+            date_str = request.POST.get('floorsheet_date')
             if not date_str:
                 messages.error(request, "No calculation date selected.")
                 return redirect('nepse_data:data_entry')
-
             try:
-                calculation_date = datetime.date.fromisoformat(date_str)
+                options['calculation_date'] = datetime.date.fromisoformat(date_str).isoformat()
             except ValueError:
                 messages.error(request, "Invalid date format.")
                 return redirect('nepse_data:data_entry')
 
-            try:
-                if floorsheet_file.name.endswith('.csv'):
-                    df = pd.read_csv(floorsheet_file, encoding='utf-8-sig')
-                else:
-                    df = pd.read_excel(floorsheet_file)
-                df.columns = [col.upper().strip() for col in df.columns]
-            except Exception as e:
-                messages.error(request, f"Error reading file: {e}")
-                return redirect('nepse_data:data_entry')
-
-            required_cols = ['SN', 'CONTRACT NO.', 'STOCK SYMBOL', 'BUYER', 'SELLER', 'QUANTITY', 'RATE (RS)', 'AMOUNT (RS)']
-            if not all(col in df.columns for col in required_cols):
-                missing = [col for col in required_cols if col not in df.columns]
-                messages.error(request, f"File is missing required columns: {', '.join(missing)}")
-                return redirect('nepse_data:data_entry')
-
-            sector_map = {
-                k.upper(): v for k, v in
-                Companies.objects.values_list('script_ticker', 'sector')
-                if k
-            }
-            
-            with connection.cursor() as cursor:
-                print(f"Deleting existing records for {calculation_date}")
-                cursor.execute("DELETE FROM floorsheet_raw WHERE calculation_date = %s", [calculation_date])
-                cursor.execute("DELETE FROM buyer_summary WHERE calculation_date = %s", [calculation_date])
-                cursor.execute("DELETE FROM seller_summary WHERE calculation_date = %s", [calculation_date])
-                cursor.execute("DELETE FROM sector_buyer_summary WHERE calculation_date = %s", [calculation_date])
-                cursor.execute("DELETE FROM sector_seller_summary WHERE calculation_date = %s", [calculation_date])
-
-            records_to_insert = []
-            failed_rows = 0
-            for index, row in df.iterrows():
-                try:
-                    original_id = int(row['SN'])
-                    stock_symbol = str(row['STOCK SYMBOL']).upper()
-                    sector = sector_map.get(stock_symbol, None)
-
-                    new_id = int(f"{calculation_date.strftime('%Y%m%d')}{original_id:06d}")
-
-                    records_to_insert.append(FloorsheetRaw(
-                        id=new_id,
-                        contract_no=str(row['CONTRACT NO.']),
-                        stock_symbol=stock_symbol,
-                        buyer=buyer_seller_to_int(row['BUYER']),
-                        seller=buyer_seller_to_int(row['SELLER']),
-                        quantity=clean_int(row['QUANTITY']),
-                        rate=clean_decimal(row['RATE (RS)']),
-                        amount=clean_decimal(row['AMOUNT (RS)']),
-                        calculation_date=calculation_date,
-                        sector=sector
-                    ))
-                except Exception as e:
-                    print(f"Skipping row {index}: {e}")
-                    failed_rows += 1
-
-            FloorsheetRaw.objects.bulk_create(records_to_insert, ignore_conflicts=True)
-            inserted_count = len(records_to_insert)
-
-            with connection.cursor() as cursor:
-                print(f"Populating summary tables for {calculation_date}...")
-                
-                cursor.execute("""
-                    INSERT INTO buyer_summary (calculation_date, stock_symbol, buyer, sector, total_quantity, total_amount, average_rate)
-                    SELECT calculation_date, stock_symbol, buyer, sector, SUM(quantity), SUM(amount), SUM(amount) / SUM(quantity)
-                    FROM floorsheet_raw WHERE calculation_date = %s GROUP BY calculation_date, stock_symbol, buyer, sector
-                    ON DUPLICATE KEY UPDATE
-                        sector = VALUES(sector), total_quantity = VALUES(total_quantity),
-                        total_amount = VALUES(total_amount), average_rate = VALUES(average_rate);
-                """, [calculation_date])
-
-                cursor.execute("""
-                    INSERT INTO seller_summary (calculation_date, stock_symbol, seller, sector, total_quantity, total_amount, average_rate)
-                    SELECT calculation_date, stock_symbol, seller, sector, SUM(quantity), SUM(amount), SUM(amount) / SUM(quantity)
-                    FROM floorsheet_raw WHERE calculation_date = %s GROUP BY calculation_date, stock_symbol, seller, sector
-                    ON DUPLICATE KEY UPDATE
-                        sector = VALUES(sector), total_quantity = VALUES(total_quantity),
-                        total_amount = VALUES(total_amount), average_rate = VALUES(average_rate);
-                """, [calculation_date])
-
-                cursor.execute("""
-                    INSERT INTO sector_buyer_summary (calculation_date, sector, buyer, total_quantity, total_amount, average_rate)
-                    SELECT calculation_date, sector, buyer, SUM(quantity), SUM(amount), SUM(amount) / SUM(quantity)
-                    FROM floorsheet_raw WHERE calculation_date = %s AND sector IS NOT NULL GROUP BY calculation_date, sector, buyer
-                    ON DUPLICATE KEY UPDATE
-                        total_quantity = VALUES(total_quantity), total_amount = VALUES(total_amount), average_rate = VALUES(average_rate);
-                """, [calculation_date])
-
-                cursor.execute("""
-                    INSERT INTO sector_seller_summary (calculation_date, sector, seller, total_quantity, total_amount, average_rate)
-                    SELECT calculation_date, sector, seller, SUM(quantity), SUM(amount), SUM(amount) / SUM(quantity)
-                    FROM floorsheet_raw WHERE calculation_date = %s AND sector IS NOT NULL GROUP BY calculation_date, sector, seller
-                    ON DUPLICATE KEY UPDATE
-                        total_quantity = VALUES(total_quantity), total_amount = VALUES(total_amount), average_rate = VALUES(average_rate);
-                """, [calculation_date])
-
-            messages.success(request, f"Floorsheet upload for {calculation_date} successful! Inserted {inserted_count} records. Skipped {failed_rows} rows. Summary tables updated.")
+        try:
+            staged_path = stage_upload(uploaded_file)
+            task = run_ingestion_job.delay(action, staged_path, uploaded_file.name, options)
+        except Exception as e:
+            messages.error(request, f"Could not queue the upload: {e}")
             return redirect('nepse_data:data_entry')
-    
-
-        # --- MODIFIED DIVIDEND HISTORY UPLOAD LOGIC (STEP 3b) ---
-        elif request.POST.get('action') == 'upload_dividend':
-            dividend_file = request.FILES.get('dividend_file')
-            if not dividend_file:
-                messages.error(request, "No dividend history file selected.")
-                return redirect('nepse_data:data_entry')
 
-            try:
-                if dividend_file.name.endswith('.csv'):
-                    df = pd.read_csv(dividend_file, encoding='utf-8-sig')
-                else:
-                    df = pd.read_excel(dividend_file)
-                
-                df.columns = (
-                    df.columns.str.strip()
-                    .str.lower()
-                    .str.replace(' (%)', '_percent', regex=False)
-                    .str.replace('(%', '_percent', regex=False)
-                    .str.replace(' %', '_percent', regex=False)
-                    .str.replace(' ', '_', regex=False)
-                    .str.replace('.', '', regex=False)
-                    .str.replace('/', '_', regex=False)
-                    .str.replace(')', '', regex=False)
-                )
-
-            except Exception as e:
-                messages.error(request, f"Error reading file: {e}")
-                return redirect('nepse_data:data_entry')
-
-            company_map = {
-                k: v for k, v in
-                Companies.objects.values_list('script_ticker', 'company_name')
-                if k
-            }
-            
-            inserted_rows, updated_rows, failed_rows = 0, 0, 0
-
-            for index, row in df.iterrows():
-                try:
-                    symbol = str(row.get('symbol', '')).strip().upper()
-                    fiscal_year = str(row.get('fiscal_year', '')).strip()
-
-                    if not symbol or not fiscal_year:
-                        print(f"Skipping row {index}: Missing Symbol or Fiscal Year. Symbol: '{symbol}', FY: '{fiscal_year}'")
-                        failed_rows += 1
-                        continue
-
-                    # --- NEW: Find or create the FiscalYear object ---
-                    try:
-                        if not re.match(r'^\d{4}/\d{2}$', fiscal_year):
-                            raise ValueError("Invalid FY format. Expected '2079/80'.")
-                            
-                        bs_start_year = int(fiscal_year.split('/')[0])
-                        bs_end_year = bs_start_year + 1
-                        
-                        ad_start_date = bs_to_ad(bs_start_year, 4, 1) # Shrawan 1
-                        bs_end_day = NEPALI_CALENDAR_DATA[bs_end_year][2] # Ashadh (index 2)
-                        ad_end_date = bs_to_ad(bs_end_year, 3, bs_end_day) # Ashadh end
-                        total_days = (ad_end_date - ad_start_date).days + 1
-                        
-                        defaults = {
-                            'bs_start_year': bs_start_year,
-                            'bs_end_year': bs_end_year,
-                            'bs_end_day': bs_end_day,
-                            'ad_start_date': ad_start_date,
-                            'ad_end_date': ad_end_date,
-                            'total_days': total_days,
-                        }
-                        
-                        fy_obj, fy_created = FiscalYear.objects.get_or_create(
-                            fiscal_year=fiscal_year,
-                            defaults=defaults
-                        )
-                        if fy_created:
-                            print(f"Created new FiscalYear: {fiscal_year}")
-                            
-                    except Exception as e:
-                        print(f"Skipping row {index}: Could not validate/create FiscalYear '{fiscal_year}'. Error: {e}")
-                        failed_rows += 1
-                        continue
-                    # --- END OF NEW FY LOGIC ---
-
-                    announcement_date = clean_date(row.get('announcement_date'))
-                    book_closure_date = clean_date(row.get('book_closure_date')) 
-                    distribution_date = clean_date(row.get('distribution_date'))
-                    bonus_listing_date = clean_date(row.get('bonus_listing_date'))
-
-                    unique_key = {
-                        'symbol': symbol,
-                        'fiscal_year': fiscal_year,
-                        'book_closure_date': book_closure_date # <-- Corrected typo here
-                    }
-                    
-                    data_to_insert = {
-                        'company_name': company_map.get(symbol, row.get('company_name', None)),
-                        'bonus_percent': clean_decimal(row.get('bonus_percent')),
-                        'cash_percent': clean_decimal(row.get('cash_percent')),
-                        'right_percent': clean_decimal(row.get('right_percent')),
-                        'tax_percent': clean_decimal(row.get('tax_percent')),
-                        'total_percent': clean_decimal(row.get('total_percent')),
-                        'announcement_date': announcement_date,
-                        'book_closure_status': str(row.get('book_closure_status', '')).strip() or None,
-                        'distribution_date': distribution_date,
-                        'bonus_listing_date': bonus_listing_date,
-                    }
-                    
-                    obj, created = DividendHistory.objects.update_or_create(
-                        **unique_key,
-                        defaults=data_to_insert
-                    )
-
-                    if created:
-                        inserted_rows += 1
-                    else:
-                        updated_rows += 1
-
-                except Exception as e:
-                    print(f"Error processing row {index} ({symbol}): {e}")
-                    failed_rows += 1
-
-            messages.success(request, f"Dividend History upload successful! Created {inserted_rows} new records. Updated {updated_rows} records. Failed {failed_rows} rows.")
-            return redirect('nepse_data:data_entry')
-        
-        else:
-            messages.warning(request, "Unknown action.")
-            return redirect('nepse_data:data_entry')
+        messages.info(request, f"{INGESTION_ACTIONS[action]} queued. Progress is shown below.")
+        return redirect(f"{reverse('nepse_data:data_entry')}?job_id={task.id}")
 
     else:
         # --- HANDLE GET REQUEST (MODIFIED IN STEP 1) ---
         
-        # 1. Fetch available dates for the 'Delete Price Data' modal
-        available_dates = StockPrices.objects.values('business_date') \
-                                            .distinct() \
-                                            .order_by('-business_date')
+        # 1. Available dates for the 'Delete Price Data' modal (newest first)
+        available_dates = price_calendar().descending()
 
-        # 2. Fetch available dates for the 'Delete Floorsheet Data' modal
-        available_floorsheet_dates = FloorsheetRaw.objects.values('calculation_date') \
-                                                        .distinct() \
-                                                        .order_by('-calculation_date')
+        # 2. Available dates for the 'Delete Floorsheet Data' modal
+        available_floorsheet_dates = floorsheet_calendar().descending()
 
         # 3. Fetch Fiscal Year data (as per your new requirement)
         all_fiscal_years = FiscalYear.objects.all().order_by('-fiscal_year')
@@ -811,10 +349,55 @@ def data_entry_view(request):
             'available_floorsheet_dates': available_floorsheet_dates,
             'all_fiscal_years': all_fiscal_years,
             'current_fiscal_year': current_fiscal_year,
+            'ingestion_job_id': request.GET.get('job_id', ''),
         }
         return render(request, 'nepse_data/data_entry.html', context)
     
 
+def ingestion_status_view(request, job_id):
+    """ API endpoint for the data entry page to POLL an upload job (same shape as recalc_status_view). """
+    task_result = AsyncResult(job_id)
+    status = task_result.status
+
+    if status == 'SUCCESS':
+        result = task_result.result or {}
+        job_status = result.get("status", "success")
+        return JsonResponse({
+            "status": {"success": "complete"}.get(job_status, job_status),
+            "progress": result.get("progress", 0),
+            "total": result.get("total", 0),
+            "message": result.get("message", "Complete!"),
+            "warnings": result.get("warnings", []),
+            "rows_per_sec": result.get("rows_per_sec"),
+            "phase_timings": result.get("phase_timings", {}),
+        })
+    elif status == 'FAILURE':
+        return JsonResponse({
+            "status": "error",
+            "progress": 0,
+            "total": 0,
+            "message": str(task_result.info) if task_result.info else "Task failed",
+        })
+    elif status == 'PROGRESS':
+        result = task_result.info or {}
+        return JsonResponse({
+            "status": "running",
+            "progress": result.get("progress", 0),
+            "total": result.get("total", 0),
+            "message": result.get("message", "Running..."),
+            "phase": result.get("phase"),
+            "rows_per_sec": result.get("rows_per_sec"),
+            "phase_timings": result.get("phase_timings", {}),
+        })
+    else:
+        return JsonResponse({
+            "status": "pending",
+            "progress": 0,
+            "total": 0,
+            "message": "Job is queued...",
+        })
+
+
 # ... (all your other existing views like delete_floorsheet_data_view, indices_view, etc. remain unchanged) ...
 
 
@@ -827,15 +410,21 @@ def delete_floorsheet_data_view(request):
         return redirect('nepse_data:data_entry')
     
     try:
-        with connection.cursor() as cursor:
+        with transaction.atomic(), connection.cursor() as cursor:
             placeholders = ','.join(['%s'] * len(dates_to_delete))
             
             cursor.execute(f"DELETE FROM sector_seller_summary WHERE calculation_date IN ({placeholders})", dates_to_delete)
             cursor.execute(f"DELETE FROM sector_buyer_summary WHERE calculation_date IN ({placeholders})", dates_to_delete)
             cursor.execute(f"DELETE FROM seller_summary WHERE calculation_date IN ({placeholders})", dates_to_delete)
             cursor.execute(f"DELETE FROM buyer_summary WHERE calculation_date IN ({placeholders})", dates_to_delete)
+            cursor.execute(f"DELETE FROM broker_stock_daily WHERE calculation_date IN ({placeholders})", dates_to_delete)
             cursor.execute(f"DELETE FROM floorsheet_raw WHERE calculation_date IN ({placeholders})", dates_to_delete)
+            # Running broker totals after the earliest deleted day are now stale
+            rebuild_cumulative_from(cursor, min(datetime.date.fromisoformat(d) for d in dates_to_delete))
+            invalidate_calendar('floorsheet')
 
+        # Days in archived months also have to go from the Parquet files
+        remove_archived_dates([datetime.date.fromisoformat(d) for d in dates_to_delete])
         messages.success(request, f"Successfully deleted all floorsheet and summary data for {len(dates_to_delete)} selected date(s).")
     except Exception as e:
         messages.error(request, f"An error occurred while deleting: {e}")
@@ -852,8 +441,20 @@ def delete_price_data_view(request):
         messages.warning(request, "No dates were selected for deletion.")
         return redirect('nepse_data:data_entry')
     try:
-        StockPricesAdj.objects.filter(business_date__in=dates_to_delete).delete()
-        count, _ = StockPrices.objects.filter(business_date__in=dates_to_delete).delete()
+        # Symbols with corporate actions need a rebuild: a deleted day can be
+        # the reference price of a right/cash adjustment
+        adjusted_symbols = set(PriceAdjustments.objects.values_list('symbol_id', flat=True))
+        affected = [
+            (symbol, business_date) for symbol, business_date in
+            StockPrices.objects.filter(business_date__in=dates_to_delete).values_list('symbol', 'business_date')
+            if symbol in adjusted_symbols
+        ]
+        # The change log entries must land with the delete, or the adjusted tables are never repaired
+        with transaction.atomic():
+            StockPricesAdj.objects.filter(business_date__in=dates_to_delete).delete()
+            count, _ = StockPrices.objects.filter(business_date__in=dates_to_delete).delete()
+            record_price_changes(affected, change_type='rebuild')
+        invalidate_calendar('prices')
         messages.success(request, f"Successfully deleted all price data for {len(dates_to_delete)} selected date(s).")
     except Exception as e:
         messages.error(request, f"An error occurred while deleting: {e}")
@@ -878,9 +479,7 @@ def indices_view(request):
             except ValueError:
                 query_date = None
         else:
-            latest_date_result = Indices.objects.aggregate(max_date=Max('date'))
-            if latest_date_result['max_date']:
-                query_date = latest_date_result['max_date']
+            query_date = indices_calendar().latest
         if query_date:
             indices_data = Indices.objects.filter(date=query_date).order_by('sector')
             selected_date_str = query_date.isoformat()
@@ -913,7 +512,6 @@ def indices_view(request):
     return render(request, 'nepse_data/indices.html', {'title': 'Indices', 'view': view})
 
 def download_indices_view(request):
-    # (This view is unchanged)
     view = request.GET.get('view', 'date')
     search_term = request.GET.get('search_term', '').strip()
     selected_date_str = request.GET.get('selected_date')
@@ -927,9 +525,7 @@ def download_indices_view(request):
             except ValueError:
                 query_date = None
         else:
-            latest_date_result = Indices.objects.aggregate(max_date=Max('date'))
-            if latest_date_result['max_date']:
-                query_date = latest_date_result['max_date']
+            query_date = indices_calendar().latest
         if query_date:
             query = query.filter(date=query_date).order_by('sector')
             download_name = f'indices_by_date_{query_date}.csv'
@@ -945,18 +541,14 @@ def download_indices_view(request):
         'absolute_change', 'percentage_change', 'number_52_weeks_high', 
         'number_52_weeks_low', 'turnover_values', 'turnover_volume', 'total_transaction'
     )
-    if not indices_data.exists():
-        return HttpResponse("No index data to download for that query.", status=404)
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{download_name}"'
-    writer = csv.writer(response)
-    writer.writerow([
+    _, rows = stream_queryset(indices_data)
+    response = streaming_csv_response(download_name, [
         'id', 'sn', 'date', 'sector', 'open', 'high', 'low', 'close',
         'absolute_change', 'percentage_change', '52_weeks_high', 
         '52_weeks_low', 'turnover_values', 'turnover_volume', 'total_transaction'
-    ])
-    for row in indices_data:
-        writer.writerow(row)
+    ], rows, gzip=wants_gzip(request))
+    if response is None:
+        return HttpResponse("No index data to download for that query.", status=404)
     return response
 
 def market_cap_view(request):
@@ -982,7 +574,6 @@ def market_cap_view(request):
     return render(request, 'nepse_data/market_cap.html', context)
 
 def download_marcap_view(request):
-    # (This view is unchanged)
     marcap_data = Marcap.objects.all().order_by('-business_date').values_list(
         'id', 'sn', 'business_date', 'market_capitalization',
         'sensitive_market_capitalization', 'float_market_capitalization',
@@ -990,40 +581,31 @@ def download_marcap_view(request):
         'total_turnover', 'total_traded_shares', 'total_transactions', 'total_scrips_traded',
         'created_at'
     )
-    if not marcap_data.exists():
-        return HttpResponse("No market cap data to download.", status=404)
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="market_cap_history.csv"'
-    writer = csv.writer(response)
-    writer.writerow([
+    _, rows = stream_queryset(marcap_data)
+    response = streaming_csv_response('market_cap_history.csv', [
         'id', 'sn', 'business_date', 'market_capitalization',
         'sensitive_market_capitalization', 'float_market_capitalization',
         'sensitive_float_market_capitalization',
         'total_turnover', 'total_traded_shares', 'total_transactions', 'total_scrips_traded',
         'created_at'
-    ])
-    for row in marcap_data:
-        writer.writerow(row)
+    ], rows, gzip=wants_gzip(request))
+    if response is None:
+        return HttpResponse("No market cap data to download.", status=404)
     return response
 
-def floorsheet_view(request):
-    # (This view is unchanged)
-    title = "Floorsheet History"
-    selected_date_str = request.GET.get('selected_date')
-    contract_no = request.GET.get('contract_no', '').strip()
-    stock_symbol = request.GET.get('stock_symbol', '').strip()
-    buyer = request.GET.get('buyer', '').strip()
-    seller = request.GET.get('seller', '').strip()
-    page = request.GET.get('page', 1)
-    per_page_str = request.GET.get('per_page', '20')
-    sort_by = request.GET.get('sort', 'contract_no')
-    direction = request.GET.get('dir', 'desc')
-    allowed_sort_fields = ['contract_no', 'quantity', 'amount']
-    if sort_by not in allowed_sort_fields:
-        sort_by = 'contract_no'
-    if direction not in ['asc', 'desc']:
-        direction = 'desc'
-    base_query = FloorsheetRaw.objects.all()
+# --- FLOORSHEET LISTING (keyset pagination) ---
+FLOORSHEET_SORT_FIELDS = ['contract_no', 'quantity', 'amount']
+
+
+def floorsheet_filters(params, calendar):
+    """
+    Reads the floorsheet filter form. The date defaults to the latest
+    trading day. The symbol is an exact match, or a prefix match when it
+    ends in '*' (NAB*); both can use the (calculation_date, stock_symbol)
+    and (stock_symbol, calculation_date) indexes, unlike the old icontains.
+    Returns (queryset, filters dict, query_date).
+    """
+    selected_date_str = params.get('selected_date')
     query_date = None
     if selected_date_str:
         try:
@@ -1031,42 +613,205 @@ def floorsheet_view(request):
         except ValueError:
             query_date = None
     else:
-        latest_date_result = FloorsheetRaw.objects.aggregate(max_date=Max('calculation_date'))
-        if latest_date_result['max_date']:
-            query_date = latest_date_result['max_date']
+        query_date = calendar.latest
+
+    filters = {
+        'date': query_date.isoformat() if query_date else None,
+        'contract_no': params.get('contract_no', '').strip(),
+        'stock_symbol': params.get('stock_symbol', '').strip().upper(),
+        'buyer': params.get('buyer', '').strip(),
+        'seller': params.get('seller', '').strip(),
+    }
+    base_query = FloorsheetRaw.objects.all()
     if query_date:
         base_query = base_query.filter(calculation_date=query_date)
-        selected_date_str = query_date.isoformat()
-    if contract_no:
-        base_query = base_query.filter(contract_no=contract_no)
-    if stock_symbol:
-        base_query = base_query.filter(stock_symbol__icontains=stock_symbol)
-    if buyer:
-        base_query = base_query.filter(buyer=buyer)
-    if seller:
-        base_query = base_query.filter(seller=seller)
+    if filters['contract_no']:
+        base_query = base_query.filter(contract_no=filters['contract_no'])
+    symbol = filters['stock_symbol']
+    if symbol.endswith('*') and symbol.rstrip('*'):
+        base_query = base_query.filter(stock_symbol__startswith=symbol.rstrip('*'))
+    elif symbol:
+        base_query = base_query.filter(stock_symbol=symbol)
+    if filters['buyer']:
+        base_query = base_query.filter(buyer=filters['buyer'])
+    if filters['seller']:
+        base_query = base_query.filter(seller=filters['seller'])
+    return base_query, filters, query_date
+
+
+class ArchivedRows:
+    """
+    A sorted Arrow table of archived floorsheet rows as a read-only
+    sequence of unsaved FloorsheetRaw objects. Objects are only built for
+    the rows that are indexed or sliced, so KeysetPaginator can bisect and
+    page it without materializing the whole day.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(len(self))
+            return [FloorsheetRaw(**row) for row in self.table.slice(start, max(stop - start, 0)).to_pylist()]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return FloorsheetRaw(**self.table.slice(index, 1).to_pylist()[0])
+
+
+class ArchivedDay:
+    """The filtered rows of one archived day, their totals and their sorted orders."""
+
+    def __init__(self, table):
+        self.table = table
+        self.totals = {
+            'total_rows': table.num_rows,
+            'total_quantity': column_sum(table, 'quantity'),
+            'total_amount': column_sum(table, 'amount'),
+        }
+        self._sorted = {}
+
+    def rows(self, ordering):
+        key = tuple(ordering)
+        if key not in self._sorted:
+            self._sorted[key] = ArchivedRows(sort_table(self.table, ordering))
+        return self._sorted[key]
+
+
+# (calendar stamp, filters) -> ArchivedDay; a page flip reuses the day instead of re-reading Parquet
+_archived_days = OrderedDict()
+ARCHIVED_DAYS_KEPT = 4
+
+
+def archived_floorsheet_day(filters, query_date, calendar):
+    """
+    The ArchivedDay for a floorsheet filter set when its day only lives in
+    the Parquet archive; None when the day is read from floorsheet_raw (days
+    re-uploaded after archiving win, as in the reports). Filtered days are
+    kept in process memory, keyed by the floorsheet calendar's stamp like
+    floorsheet_totals, so only the first page of a day scans the archive.
+    """
+    if query_date is None or query_date not in set(archived_dates()):
+        return None
+    if FloorsheetRaw.objects.filter(calculation_date=query_date).exists():
+        return None
+
+    cache_key = None
+    if calendar.stamp:
+        cache_key = (calendar.stamp, json.dumps(filters, sort_keys=True))
+        day = _archived_days.get(cache_key)
+        if day is not None:
+            _archived_days.move_to_end(cache_key)
+            return day
+
+    try:
+        buyers = [int(filters['buyer'])] if filters['buyer'] else None
+        sellers = [int(filters['seller'])] if filters['seller'] else None
+    except ValueError:
+        buyers = sellers = [-1]  # no broker has that number: an empty day
+    symbol = filters['stock_symbol']
+    prefix = symbol.rstrip('*') if symbol.endswith('*') else None
+    day = ArchivedDay(scan(
+        start_date=query_date, end_date=query_date,
+        symbols=[symbol] if symbol and prefix is None else None, buyers=buyers, sellers=sellers,
+        symbol_prefix=prefix, contract_no=filters['contract_no'] or None,
+    ))
+    if cache_key is not None:
+        _archived_days[cache_key] = day
+        while len(_archived_days) > ARCHIVED_DAYS_KEPT:
+            _archived_days.popitem(last=False)
+    return day
+
+
+def floorsheet_totals(base_query, filters, calendar):
+    """
+    Row count and quantity/amount totals for a filter set, cached so page
+    flips don't re-aggregate. The key includes the floorsheet calendar's
+    stamp, which changes on every floorsheet upload or delete.
+    """
+    cache_key = None
+    if calendar.stamp:
+        digest = hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+        cache_key = f"floorsheet_totals:{calendar.stamp}:{digest}"
+        totals = cache.get(cache_key)
+        if totals is not None:
+            return totals
     totals = base_query.aggregate(
+        total_rows=Count('id'),
         total_quantity=Sum('quantity'),
-        total_amount=Sum('amount')
+        total_amount=Sum('amount'),
+    )
+    if cache_key:
+        cache.set(cache_key, totals, getattr(settings, 'TRADING_CALENDAR_CACHE_TIMEOUT', 3600))
+    return totals
+
+
+def floorsheet_view(request):
+    title = "Floorsheet History"
+    per_page_str = request.GET.get('per_page', '20')
+    sort_by = request.GET.get('sort', 'contract_no')
+    direction = request.GET.get('dir', 'desc')
+    if sort_by not in FLOORSHEET_SORT_FIELDS:
+        sort_by = 'contract_no'
+    if direction not in ['asc', 'desc']:
+        direction = 'desc'
+    try:
+        per_page = max(1, min(int(per_page_str), 500))
+    except ValueError:
+        per_page, per_page_str = 20, '20'
+
+    calendar = floorsheet_calendar()
+    base_query, filters, query_date = floorsheet_filters(request.GET, calendar)
+    # Seek on (calculation_date, sort key, id): newest day first, then the chosen sort
+    sign = '-' if direction == 'desc' else ''
+    ordering = ['-calculation_date', f"{sign}{sort_by}", f"{sign}id"]
+    try:
+        archived = archived_floorsheet_day(filters, query_date, calendar)
+    except ArchiveError as e:
+        messages.error(request, f"Could not read the floorsheet archive: {e}")
+        base_query, totals = [], {'total_rows': 0, 'total_quantity': 0, 'total_amount': 0}
+    else:
+        if archived is None:
+            totals = floorsheet_totals(base_query, filters, calendar)
+        else:
+            # An archived day is paged by bisecting its sorted rows
+            base_query = archived.rows(ordering)
+            totals = archived.totals
+
+    paginator = KeysetPaginator(base_query, ordering, per_page, scope=[sort_by, direction, filters])
+    page_obj = paginator.page(
+        request.GET.get('after') or request.GET.get('before'),
+        last=request.GET.get('page') == 'last',
     )
-    sort_param = sort_by
-    if direction == 'desc':
-        sort_param = f"-{sort_by}"
-    base_query = base_query.order_by(sort_param, '-id')
-    paginator = Paginator(base_query, int(per_page_str), allow_empty_first_page=True)
-    page_obj = paginator.get_page(page)
+
+    # Page links drop whichever cursor the current URL carries
+    def page_query(**cursor):
+        params = request.GET.copy()
+        for key in ('after', 'before', 'page'):
+            params.pop(key, None)
+        params.update(cursor)
+        return params.urlencode()
+
     context = {
         'floorsheet_data': page_obj,
         'title': title,
         'page_obj': page_obj,
-        'paginator': paginator,
         'per_page': per_page_str,
-        'page': page,
-        'selected_date': selected_date_str,
-        'contract_no': contract_no,
-        'stock_symbol': stock_symbol,
-        'buyer': buyer,
-        'seller': seller,
+        'first_page_query': page_query(),
+        'last_page_query': page_query(page='last'),
+        'next_page_query': page_query(after=page_obj.next_cursor) if page_obj.has_next() else None,
+        'previous_page_query': page_query(before=page_obj.previous_cursor) if page_obj.has_previous() else None,
+        'selected_date': filters['date'] or request.GET.get('selected_date'),
+        'contract_no': filters['contract_no'],
+        'stock_symbol': filters['stock_symbol'],
+        'buyer': filters['buyer'],
+        'seller': filters['seller'],
+        'total_rows': totals['total_rows'],
         'total_quantity': totals['total_quantity'],
         'total_amount': totals['total_amount'],
         'current_sort': sort_by,
@@ -1076,49 +821,25 @@ def floorsheet_view(request):
 
 
 def download_floorsheet_view(request):
-    # (This view is unchanged)
-    selected_date_str = request.GET.get('selected_date')
-    contract_no = request.GET.get('contract_no', '').strip()
-    stock_symbol = request.GET.get('stock_symbol', '').strip()
-    buyer = request.GET.get('buyer', '').strip()
-    seller = request.GET.get('seller', '').strip()
-    base_query = FloorsheetRaw.objects.all()
-    query_date = None
-    if selected_date_str:
-        try:
-            query_date = datetime.date.fromisoformat(selected_date_str)
-        except ValueError:
-            query_date = None
+    # Same filters as the floorsheet page
+    base_query, filters, query_date = floorsheet_filters(request.GET, floorsheet_calendar())
+    columns = ['calculation_date', 'contract_no', 'stock_symbol', 'buyer', 'seller', 'quantity', 'rate', 'amount', 'sector']
+    try:
+        archived = archived_floorsheet_day(filters, query_date, floorsheet_calendar())
+    except ArchiveError as e:
+        return HttpResponse(f"Could not read the floorsheet archive: {e}", status=500)
+    if archived is None:
+        _, rows = stream_queryset(base_query.order_by('-id').values_list(*columns))
     else:
-        latest_date_result = FloorsheetRaw.objects.aggregate(max_date=Max('calculation_date'))
-        if latest_date_result['max_date']:
-            query_date = latest_date_result['max_date']
-    if query_date:
-        base_query = base_query.filter(calculation_date=query_date)
-    if contract_no:
-        base_query = base_query.filter(contract_no=contract_no)
-    if stock_symbol:
-        base_query = base_query.filter(stock_symbol__icontains=stock_symbol)
-    if buyer:
-        base_query = base_query.filter(buyer=buyer)
-    if seller:
-        base_query = base_query.filter(seller=seller)
-    floorsheet_data = base_query.order_by('-id').values_list(
-        'calculation_date', 'contract_no', 'stock_symbol', 'buyer', 
-        'seller', 'quantity', 'rate', 'amount', 'sector'
-    )
-    if not floorsheet_data.exists():
-        return HttpResponse("No floorsheet data to download for that query.", status=404)
-    response = HttpResponse(content_type='text/csv')
+        table = sort_table(archived.table, ['-id']).select(columns)
+        rows = (row for batch in table.to_batches(export_chunk_size()) for row in zip(*batch.to_pydict().values()))
     download_name = f"floorsheet_{query_date or 'all_dates'}.csv"
-    response['Content-Disposition'] = f'attachment; filename="{download_name}"'
-    writer = csv.writer(response)
-    writer.writerow([
+    response = streaming_csv_response(download_name, [
         'Date', 'Contract No', 'Symbol', 'Buyer', 
         'Seller', 'Quantity', 'Rate', 'Amount', 'Sector'
-    ])
-    for row in floorsheet_data:
-        writer.writerow(row)
+    ], rows, gzip=wants_gzip(request))
+    if response is None:
+        return HttpResponse("No floorsheet data to download for that query.", status=404)
     return response
 
 
@@ -1167,7 +888,6 @@ def dividend_history_view(request):
 
 
 def download_dividend_history_view(request):
-    # (This view is unchanged)
     symbol = request.GET.get('symbol', '').strip().upper()
     fiscal_year = request.GET.get('fiscal_year', '').strip()
     base_query = DividendHistory.objects.all()
@@ -1185,22 +905,17 @@ def download_dividend_history_view(request):
         'announcement_date', 'book_closure_date', 'book_closure_status',
         'distribution_date', 'bonus_listing_date'
     )
-    if not dividend_data.exists():
-        return HttpResponse("No dividend history to download for that query.", status=44)
-    response = HttpResponse(content_type='text/csv')
-    download_name = f"dividend_history.csv"
-    response['Content-Disposition'] = f'attachment; filename="{download_name}"'
-    writer = csv.writer(response)
-    writer.writerow([
+    _, rows = stream_queryset(dividend_data)
+    response = streaming_csv_response("dividend_history.csv", [
         'Fiscal Year', 'Symbol', 'Company Name',
         'Bonus %', 'Cash %', 
         'Right %', 
         'Tax %', 'Total %',
         'Announcement Date', 'Book Closure Date', 'BC Status',
         'Distribution Date', 'Bonus Listing Date'
-    ])
-    for row in dividend_data:
-        writer.writerow(row)
+    ], rows, gzip=wants_gzip(request))
+    if response is None:
+        return HttpResponse("No dividend history to download for that query.", status=404)
     return response
 
 
@@ -1576,6 +1291,7 @@ def sync_dividends_to_adjustments(request):
         # 6. Bulk create all new adjustments
         if new_adjustments_to_create:
             PriceAdjustments.objects.bulk_create(new_adjustments_to_create)
+            record_adjustment_changes(adj.symbol_id for adj in new_adjustments_to_create)
 
         messages.success(request, 
             f"Dividend Sync Complete! "
@@ -0,0 +1,11 @@
+from .trend import calculate_sma, calculate_ema, calculate_macd
+from .momentum import calculate_rsi
+from .volatility import calculate_bollinger_bands
+from .volume import calculate_obv
+
+__all__ = [
+    'calculate_sma', 'calculate_ema', 'calculate_macd',
+    'calculate_rsi',
+    'calculate_bollinger_bands',
+    'calculate_obv',
+]
@@ -0,0 +1,85 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from technical_analysis.models import TradingStrategy
+from technical_analysis.services import MarketDataService, BacktestService
+
+
+def _value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            continue
+    return text
+
+
+class Command(BaseCommand):
+    help = "Backtests active trading strategies over the adjusted price history and fills SignalPerformance."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strategy', type=str, help='Backtest a single strategy by its `strategy_type` (e.g., MA_CROSSOVER).')
+        parser.add_argument('--symbol', type=str, help='Backtest a single symbol.')
+        parser.add_argument('--years', type=float, default=10, help='Length of the backtest in years (default 10).')
+        parser.add_argument('--no-store', action='store_true', help='Only print the results; leave SignalPerformance alone.')
+        parser.add_argument(
+            '--sweep',
+            action='append',
+            metavar='KEY=V1,V2,...',
+            help='Parameter sweep over a config key (repeat for a grid). Nothing is stored.',
+        )
+        parser.add_argument('--processes', type=int, help='Worker processes for --sweep (default: CPU count).')
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+
+        if options['symbol']:
+            symbols = [options['symbol'].upper()]
+        else:
+            symbols = MarketDataService.get_active_symbols()
+        self.stdout.write(f"Backtesting over {len(symbols)} symbols, {options['years']:g} years.")
+
+        strategies_query = TradingStrategy.objects.filter(is_active=True)
+        if options['strategy']:
+            strategies_query = strategies_query.filter(strategy_type=options['strategy'])
+        strategies = list(strategies_query)
+        if not strategies:
+            self.stdout.write(self.style.ERROR("No active TradingStrategy found. Please populate the database."))
+            return
+
+        if options['sweep']:
+            grid = {}
+            for item in options['sweep']:
+                key, _, values = item.partition('=')
+                if not key or not values:
+                    raise CommandError(f"--sweep expects KEY=V1,V2,... (got '{item}')")
+                grid[key] = [_value(v) for v in values.split(',')]
+
+            for strategy in strategies:
+                results = BacktestService.sweep(
+                    strategy, grid, symbols, years=options['years'], processes=options['processes']
+                )
+                self.stdout.write(self.style.SUCCESS(f"--- {strategy.name}: {len(results)} configurations ---"))
+                for config, summary in results:
+                    point = ', '.join(f"{key}={config[key]}" for key in sorted(grid))
+                    self.stdout.write(
+                        f"  {point}: return {summary['total_return_pct']}%, max drawdown {summary['max_drawdown_pct']}%, "
+                        f"{summary['trades']} trades, win rate {summary['win_rate']}%"
+                    )
+        else:
+            packed = BacktestService.load(symbols)
+            for strategy in strategies:
+                try:
+                    result = BacktestService.run(
+                        strategy, symbols, years=options['years'], store=not options['no_store'], packed=packed
+                    )
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"  Failed to backtest {strategy.name}: {e}"))
+                    continue
+                summary = result['summary']
+                self.stdout.write(self.style.SUCCESS(
+                    f"  {strategy.name}: return {summary['total_return_pct']}%, max drawdown {summary['max_drawdown_pct']}%, "
+                    f"{summary['trades']} trades, win rate {summary['win_rate']}%"
+                ))
+
+        self.stdout.write(self.style.SUCCESS("--- Backtest Complete ---"))
+        self.stdout.write(f"Total time taken: {time.time() - start_time:.2f} seconds")
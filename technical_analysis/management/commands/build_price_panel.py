@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from technical_analysis.services.price_panel import build_panel, load_panel, update_panel
+
+
+class Command(BaseCommand):
+    help = "Builds or incrementally updates the memory-mapped price panel (PRICE_PANEL_DIR)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rebuild every date and symbol from MySQL.")
+        parser.add_argument('--info', action='store_true', help="Only describe the published panel.")
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+
+        if options['info']:
+            panel = load_panel()
+            if panel is None:
+                self.stdout.write(self.style.WARNING("No price panel has been built yet."))
+                return
+            meta = panel.meta
+            self.stdout.write(
+                f"{panel.version} ({meta['mode']}, built {meta['built_at']}): "
+                f"{meta['dates']} dates x {meta['symbols']} symbols, last date {panel.last_date}"
+            )
+            return
+
+        meta = build_panel() if options['full'] else update_panel()
+        self.stdout.write(self.style.SUCCESS(
+            f"--- Price panel {meta['version']}: {meta['dates']} dates x {meta['symbols']} symbols ---"
+        ))
+        self.stdout.write(f"Total time taken: {time.time() - start_time:.2f} seconds")
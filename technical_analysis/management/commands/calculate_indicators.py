@@ -2,7 +2,10 @@ import time
 from datetime import datetime
 from django.core.management.base import BaseCommand
 from technical_analysis.models import IndicatorType
-from technical_analysis.services import MarketDataService, IndicatorService
+from technical_analysis.services import (
+    MarketDataService, IndicatorService, BatchIndicatorService, IndicatorStateService, ScreenerService,
+)
+from technical_analysis.services.indicator_state import is_recursive
 
 class Command(BaseCommand):
     help = "Calculates and stores technical indicator values for all active symbols."
@@ -13,6 +16,16 @@ class Command(BaseCommand):
             type=str,
             help='Calculate indicators for a single symbol.',
         )
+        parser.add_argument(
+            '--per-symbol',
+            action='store_true',
+            help='Use the old one-symbol-at-a-time path instead of the batch engine.',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute EMA/RSI/MACD/OBV from full history instead of stepping their stored state.',
+        )
 
     def handle(self, *args, **options):
         start_time = time.time()
@@ -36,19 +49,44 @@ class Command(BaseCommand):
         self.stdout.write(f"Calculating {len(indicator_types)} active indicators...")
         
         total_symbols = len(symbols)
-        
-        for i, symbol in enumerate(symbols):
-            self.stdout.write(f"--- Processing {symbol} ({i+1}/{total_symbols}) ---")
-            for ind_type in indicator_types:
-                try:
-                    IndicatorService.calculate_and_store(
-                        symbol=symbol,
-                        indicator_type=ind_type,
-                        end_date=today
-                    )
-                    self.stdout.write(self.style.SUCCESS(f"  Successfully calculated {ind_type.name} for {symbol}"))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"  Failed to calculate {ind_type.name} for {symbol}: {e}"))
+
+        if not options['per_symbol']:
+            # Whole universe at once: one load, one bulk upsert per indicator.
+            # Recursive indicators step their stored state over the new bars.
+            recursive = [t for t in indicator_types if is_recursive(t.name)]
+            others = [t for t in indicator_types if not is_recursive(t.name)]
+            written = {}
+            if recursive:
+                written.update(IndicatorStateService.calculate_and_store_all(
+                    symbols, recursive, end_date=today, full=options['full']
+                ))
+            if others:
+                written.update(BatchIndicatorService.calculate_and_store_all(symbols, others, end_date=today))
+            for name, result in written.items():
+                if isinstance(result, int):
+                    self.stdout.write(self.style.SUCCESS(f"  {name}: {result} values stored"))
+                else:
+                    self.stdout.write(self.style.ERROR(f"  Failed to calculate {name}: {result}"))
+
+            # Latest-values table behind the screener (and the saved scans' cached results)
+            try:
+                refreshed = ScreenerService.refresh_snapshot(symbols, end_date=today, prune=not symbol_option)
+                self.stdout.write(self.style.SUCCESS(f"  Screener snapshot: {refreshed} symbols"))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"  Failed to refresh the screener snapshot: {e}"))
+        else:
+            for i, symbol in enumerate(symbols):
+                self.stdout.write(f"--- Processing {symbol} ({i+1}/{total_symbols}) ---")
+                for ind_type in indicator_types:
+                    try:
+                        IndicatorService.calculate_and_store(
+                            symbol=symbol,
+                            indicator_type=ind_type,
+                            end_date=today
+                        )
+                        self.stdout.write(self.style.SUCCESS(f"  Successfully calculated {ind_type.name} for {symbol}"))
+                    except Exception as e:
+                        self.stdout.write(self.style.ERROR(f"  Failed to calculate {ind_type.name} for {symbol}: {e}"))
 
         end_time = time.time()
         self.stdout.write(self.style.SUCCESS(f"--- Task Complete ---"))
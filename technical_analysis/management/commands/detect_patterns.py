@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from technical_analysis.services import MarketDataService, CandlestickPatternService
+
+
+class Command(BaseCommand):
+    help = "Detects candlestick patterns on the newest bars of all active symbols and stores them in ChartPattern."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--symbol', type=str, help='Detect patterns for a single symbol.')
+        parser.add_argument('--bars', type=int, default=5, help="Newest bars per symbol to (re)detect (default 5).")
+        parser.add_argument('--full', action='store_true', help='Re-detect over the full price history.')
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+
+        if options['symbol']:
+            symbols = [options['symbol'].upper()]
+            self.stdout.write(self.style.WARNING(f"Detecting patterns for single symbol: {options['symbol']}"))
+        else:
+            symbols = MarketDataService.get_active_symbols()
+            self.stdout.write(f"Processing {len(symbols)} active symbols.")
+
+        stored = CandlestickPatternService.detect_and_store(symbols, bars=options['bars'], full=options['full'])
+
+        self.stdout.write(self.style.SUCCESS(f"--- {stored} candlestick patterns stored ---"))
+        self.stdout.write(f"Total time taken: {time.time() - start_time:.2f} seconds")
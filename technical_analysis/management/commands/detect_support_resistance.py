@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from technical_analysis.services import MarketDataService, SupportResistanceService
+
+
+class Command(BaseCommand):
+    help = "Updates SupportResistanceLevel for the symbols whose newest bars change their levels."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--symbol', type=str, help='Update a single symbol.')
+        parser.add_argument('--bars', type=int, default=1, help='Newest bars per symbol since the last run (default 1).')
+        parser.add_argument('--full', action='store_true', help='Rebuild the levels of every symbol.')
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+
+        if options['symbol']:
+            symbols = [options['symbol'].upper()]
+            self.stdout.write(self.style.WARNING(f"Updating levels for single symbol: {options['symbol']}"))
+        else:
+            symbols = MarketDataService.get_active_symbols()
+            self.stdout.write(f"Processing {len(symbols)} active symbols.")
+
+        affected, stored = SupportResistanceService.update(symbols, bars=options['bars'], full=options['full'])
+
+        self.stdout.write(self.style.SUCCESS(f"--- {len(affected)} symbols rebuilt, {stored} levels stored ---"))
+        self.stdout.write(f"Total time taken: {time.time() - start_time:.2f} seconds")
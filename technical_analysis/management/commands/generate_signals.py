@@ -1,7 +1,7 @@
 import time
 from django.core.management.base import BaseCommand
 from technical_analysis.models import TradingStrategy
-from technical_analysis.services import MarketDataService, SignalService
+from technical_analysis.services import MarketDataService, SignalService, BatchSignalService
 
 class Command(BaseCommand):
     help = "Runs all active trading strategies to generate new signals."
@@ -17,6 +17,11 @@ class Command(BaseCommand):
             type=str,
             help='Run a single strategy by its `strategy_type` (e.g., MA_CROSSOVER).',
         )
+        parser.add_argument(
+            '--per-symbol',
+            action='store_true',
+            help='Use the old one-symbol-at-a-time path instead of the batch evaluator.',
+        )
 
     def handle(self, *args, **options):
         start_time = time.time()
@@ -47,21 +52,30 @@ class Command(BaseCommand):
         self.stdout.write(f"Using {len(active_strategies)} active strategies.")
 
         total_symbols = len(symbols)
-        
-        for i, symbol in enumerate(symbols):
-            self.stdout.write(f"--- Scanning {symbol} ({i+1}/{total_symbols}) ---")
-            for strategy in active_strategies:
-                try:
-                    # The SignalService methods will find/create signals
-                    if strategy.strategy_type == 'RSI_OVERSOLD':
-                        SignalService.generate_rsi_signals(symbol, strategy)
-                    elif strategy.strategy_type == 'MA_CROSSOVER':
-                        SignalService.generate_ma_crossover_signals(symbol, strategy)
-                    # Add more strategy types here as services are built
+
+        if not options['per_symbol']:
+            # All strategies over all symbols from one shared OHLCV load
+            created = BatchSignalService.generate_all(symbols, active_strategies)
+            for name, result in created.items():
+                if isinstance(result, int):
+                    self.stdout.write(self.style.SUCCESS(f"  Ran strategy '{name}': {result} new signals"))
+                else:
+                    self.stdout.write(self.style.ERROR(f"  Failed to run {name}: {result}"))
+        else:
+            for i, symbol in enumerate(symbols):
+                self.stdout.write(f"--- Scanning {symbol} ({i+1}/{total_symbols}) ---")
+                for strategy in active_strategies:
+                    try:
+                        # The SignalService methods will find/create signals
+                        if strategy.strategy_type == 'RSI_OVERSOLD':
+                            SignalService.generate_rsi_signals(symbol, strategy)
+                        elif strategy.strategy_type == 'MA_CROSSOVER':
+                            SignalService.generate_ma_crossover_signals(symbol, strategy)
+                        # Add more strategy types here as services are built
                     
-                    self.stdout.write(self.style.SUCCESS(f"  Ran strategy '{strategy.name}' for {symbol}"))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"  Failed to run {strategy.name} for {symbol}: {e}"))
+                        self.stdout.write(self.style.SUCCESS(f"  Ran strategy '{strategy.name}' for {symbol}"))
+                    except Exception as e:
+                        self.stdout.write(self.style.ERROR(f"  Failed to run {strategy.name} for {symbol}: {e}"))
 
         end_time = time.time()
         self.stdout.write(self.style.SUCCESS(f"--- Task Complete ---"))
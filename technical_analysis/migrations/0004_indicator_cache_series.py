@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('technical_analysis', '0003_add_obv_indicator'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='indicatorcache',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='indicatorcache',
+            name='data_version',
+            field=models.CharField(default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='indicatorcache',
+            name='hits',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='indicatorcache',
+            name='last_accessed',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='indicatorcache',
+            name='params_key',
+            field=models.CharField(default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='indicatorcache',
+            name='payload',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='indicatorcache',
+            name='size_bytes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='indicatorcache',
+            unique_together={('symbol', 'indicator_type', 'timeframe', 'params_key')},
+        ),
+        migrations.AddIndex(
+            model_name='indicatorcache',
+            index=models.Index(fields=['timeframe', 'last_accessed'], name='indicator_cache_lru_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('technical_analysis', '0004_indicator_cache_series'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScreenerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=20, unique=True)),
+                ('business_date', models.DateField()),
+                ('close', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('prev_close', models.DecimalField(decimal_places=2, max_digits=14, null=True)),
+                ('change_percent', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('volume', models.BigIntegerField(null=True)),
+                ('avg_volume_20', models.DecimalField(decimal_places=2, max_digits=20, null=True)),
+                ('volume_ratio', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('rsi_14', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('sma_20', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('sma_50', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('sma_200', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('ema_20', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('macd', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('macd_signal', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('macd_histogram', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('bb_upper', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('bb_lower', models.DecimalField(decimal_places=6, max_digits=18, null=True)),
+                ('high_52w', models.DecimalField(decimal_places=2, max_digits=14, null=True)),
+                ('low_52w', models.DecimalField(decimal_places=2, max_digits=14, null=True)),
+                ('pct_from_52w_high', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('pct_from_52w_low', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'screener_snapshots',
+                'indexes': [models.Index(fields=['rsi_14'], name='screener_rsi_idx'), models.Index(fields=['change_percent'], name='screener_change_idx'), models.Index(fields=['volume_ratio'], name='screener_volume_ratio_idx'), models.Index(fields=['pct_from_52w_high'], name='screener_52w_high_idx'), models.Index(fields=['business_date'], name='screener_date_idx')],
+            },
+        ),
+    ]
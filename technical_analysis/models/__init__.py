@@ -1,10 +1,10 @@
-from .indicators import IndicatorType, IndicatorValue, IndicatorCache
+from .indicators import IndicatorType, IndicatorValue, IndicatorCache, ScreenerSnapshot
 from .signals import TradingStrategy, Signal, SignalPerformance
 from .patterns import ChartPattern, SupportResistanceLevel
 from .user_preferences import Watchlist, PriceAlert, TechnicalScan
 
 __all__ = [
-    'IndicatorType', 'IndicatorValue', 'IndicatorCache',
+    'IndicatorType', 'IndicatorValue', 'IndicatorCache', 'ScreenerSnapshot',
     'TradingStrategy', 'Signal', 'SignalPerformance',
     'ChartPattern', 'SupportResistanceLevel',
     'Watchlist', 'PriceAlert', 'TechnicalScan',
@@ -57,10 +57,68 @@ class IndicatorCache(models.Model):
     """Cache frequently accessed indicator data"""
     symbol = models.CharField(max_length=20)
     indicator_type = models.ForeignKey(IndicatorType, on_delete=models.CASCADE)
-    timeframe = models.CharField(max_length=20)  # daily, weekly, monthly
+    timeframe = models.CharField(max_length=20)  # daily, weekly, monthly; 'state' = recursive indicator state (services.indicator_state)
+    params_key = models.CharField(max_length=32, default='')  # md5 of the parameters ('' for state rows)
     data = models.JSONField()  # Cached calculations
+    
+    # Read-through series cache (services.indicator_cache)
+    data_version = models.CharField(max_length=32, default='')  # the symbol's price data the payload was built from
+    payload = models.BinaryField(null=True)  # compressed .npz of the indicator series
+    size_bytes = models.PositiveIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    last_accessed = models.DateTimeField(null=True)
     last_updated = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'indicator_cache'
-        unique_together = [['symbol', 'indicator_type', 'timeframe']]
\ No newline at end of file
+        unique_together = [['symbol', 'indicator_type', 'timeframe', 'params_key']]
+        indexes = [
+            models.Index(fields=['timeframe', 'last_accessed'], name='indicator_cache_lru_idx'),
+        ]
+
+
+class ScreenerSnapshot(models.Model):
+    """Latest close and indicator values of each symbol, one row per symbol (services.screener_service)"""
+    symbol = models.CharField(max_length=20, unique=True)
+    business_date = models.DateField()
+    
+    # Price and volume (adjusted)
+    close = models.DecimalField(max_digits=14, decimal_places=2)
+    prev_close = models.DecimalField(max_digits=14, decimal_places=2, null=True)
+    change_percent = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    volume = models.BigIntegerField(null=True)
+    avg_volume_20 = models.DecimalField(max_digits=20, decimal_places=2, null=True)
+    volume_ratio = models.DecimalField(max_digits=10, decimal_places=2, null=True)  # volume / avg_volume_20
+    
+    # Indicators at business_date
+    rsi_14 = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    sma_20 = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    sma_50 = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    sma_200 = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    ema_20 = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    macd = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    macd_signal = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    macd_histogram = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    bb_upper = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    bb_lower = models.DecimalField(max_digits=18, decimal_places=6, null=True)
+    
+    # 52-week range
+    high_52w = models.DecimalField(max_digits=14, decimal_places=2, null=True)
+    low_52w = models.DecimalField(max_digits=14, decimal_places=2, null=True)
+    pct_from_52w_high = models.DecimalField(max_digits=10, decimal_places=2, null=True)  # <= 0
+    pct_from_52w_low = models.DecimalField(max_digits=10, decimal_places=2, null=True)  # >= 0
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'screener_snapshots'
+        indexes = [
+            models.Index(fields=['rsi_14'], name='screener_rsi_idx'),
+            models.Index(fields=['change_percent'], name='screener_change_idx'),
+            models.Index(fields=['volume_ratio'], name='screener_volume_ratio_idx'),
+            models.Index(fields=['pct_from_52w_high'], name='screener_52w_high_idx'),
+            models.Index(fields=['business_date'], name='screener_date_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.symbol} snapshot on {self.business_date}"
@@ -1,9 +1,31 @@
 from .data_service import MarketDataService
 from .indicator_service import IndicatorService
 from .signal_service import SignalService
+from .batch_indicator_service import BatchIndicatorService
+from .indicator_state import IndicatorStateService
+from .indicator_cache import IndicatorCacheService
+from .batch_signal_service import BatchSignalService
+from .backtest_service import BacktestService
+from .screener_service import ScreenerService
+from .pattern_service import CandlestickPatternService
+from .support_resistance_service import SupportResistanceService
+from .alert_service import AlertService
+from .price_panel import PricePanel, load_panel, current_panel
 
 __all__ = [
     'MarketDataService',
     'IndicatorService',
     'SignalService',
+    'BatchIndicatorService',
+    'IndicatorStateService',
+    'IndicatorCacheService',
+    'BatchSignalService',
+    'BacktestService',
+    'ScreenerService',
+    'CandlestickPatternService',
+    'SupportResistanceService',
+    'AlertService',
+    'PricePanel',
+    'load_panel',
+    'current_panel',
 ]
\ No newline at end of file
@@ -0,0 +1,188 @@
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from django.utils import timezone
+
+from technical_analysis.models import PriceAlert
+from .batch_indicator_service import BatchIndicatorService, align_right
+
+# Alert types that fire when the observed value reaches condition_value from below / above
+RISING = {'PRICE_ABOVE': 'close', 'RSI_OVERBOUGHT': 'rsi', 'VOLUME_SPIKE': 'volume_ratio'}
+FALLING = {'PRICE_BELOW': 'close', 'RSI_OVERSOLD': 'rsi'}
+RSI_WINDOW = 14
+MACD_PARAMS = {'short_window': 12, 'long_window': 26, 'signal_window': 9}
+UPDATE_BATCH_SIZE = 1000
+
+
+def _cross(prev_a, prev_b, a, b):
+    """+1 where a crossed above b on the last bar, -1 where it crossed below, 0 otherwise."""
+    up = (prev_a <= prev_b) & (a > b)
+    down = (prev_a >= prev_b) & (a < b)
+    return np.where(up, 1, np.where(down, -1, 0))
+
+
+class AlertIndex:
+    """
+    PriceAlerts (active() loads the untriggered ones in one query) bucketed
+    by (alert type, symbol) with each bucket's condition values sorted, so an
+    alert type is checked with a bisect against the symbol's new value.
+    CHANGE_PERCENT alerts are split by sign: a positive value fires on a
+    rise of at least that much, a negative one on a fall.
+    """
+
+    def __init__(self, rows):
+        """rows: (alert id, alert type, symbol, condition value) tuples."""
+        buckets = defaultdict(list)
+        for alert_id, alert_type, symbol, value in rows:
+            buckets[(alert_type, symbol)].append((float(value), alert_id))
+        self.buckets = {}
+        for key, items in buckets.items():
+            items.sort()
+            self.buckets[key] = (
+                np.array([value for value, _ in items], dtype=np.float64),
+                np.array([alert_id for _, alert_id in items], dtype=np.int64),
+            )
+        self.size = len(rows)
+
+    @classmethod
+    def active(cls, symbols=None):
+        """The index of the active, untriggered alerts (of symbols, if given)."""
+        alerts = PriceAlert.objects.filter(is_active=True, is_triggered=False)
+        if symbols is not None:
+            alerts = alerts.filter(symbol__in=list(symbols))
+        return cls(list(alerts.values_list('id', 'alert_type', 'symbol', 'condition_value')))
+
+    @property
+    def symbols(self):
+        return sorted({symbol for _, symbol in self.buckets})
+
+    @property
+    def ma_windows(self):
+        """Distinct SMA windows the MA_CROSSOVER alerts watch."""
+        return sorted({
+            int(v) for (alert_type, _), (values, _) in self.buckets.items()
+            if alert_type == 'MA_CROSSOVER' for v in values if v >= 1
+        })
+
+
+class AlertService:
+    """
+    Evaluates every active PriceAlert against the newest bar of its symbol,
+    right after a price upload. The alerts are indexed once (AlertIndex), the
+    values they compare against are computed for all watched symbols from
+    one OHLCV load, and the triggered alerts are written with one UPDATE per
+    symbol.
+
+    condition_value means, per type: the price (PRICE_ABOVE / PRICE_BELOW),
+    the signed change % (CHANGE_PERCENT), the multiple of the 20-bar average
+    volume (VOLUME_SPIKE), the RSI(14) level (RSI_OVERBOUGHT / RSI_OVERSOLD),
+    the SMA window the close must cross (MA_CROSSOVER) and, for
+    MACD_CROSSOVER, the direction (> 0 bullish, < 0 bearish, 0 either).
+    """
+
+    @staticmethod
+    def snapshot(symbols, ma_windows=(), end_date=None):
+        """DataFrame indexed by symbol with each one's last bar date and the values alerts compare against."""
+        frames = BatchIndicatorService.load_universe(symbols, end_date)
+        packed, last_dates = align_right(frames)
+        close, volume = packed['close'], packed['volume']
+        if len(close) < 2:
+            return pd.DataFrame()
+
+        prev_close = close.iloc[-2]
+        macd = BatchIndicatorService.macd(close, **MACD_PARAMS)
+        table = pd.DataFrame({
+            'business_date': last_dates,
+            'close': close.iloc[-1],
+            'change_percent': (close.iloc[-1] / prev_close - 1.0) * 100.0,
+            'volume_ratio': volume.iloc[-1] / volume.rolling(window=20, min_periods=20).mean().iloc[-1],
+            'rsi': BatchIndicatorService.rsi(close, RSI_WINDOW).iloc[-1],
+            'macd_cross': _cross(
+                macd['macd'].iloc[-2], macd['signal'].iloc[-2], macd['macd'].iloc[-1], macd['signal'].iloc[-1]
+            ),
+        })
+        crosses = {}
+        for window in ma_windows:
+            sma = BatchIndicatorService.sma(close, window)
+            crosses[f'ma_cross_{window}'] = _cross(prev_close, sma.iloc[-2], close.iloc[-1], sma.iloc[-1])
+        table = pd.concat([table, pd.DataFrame(crosses, index=table.index)], axis=1)
+        return table.replace([np.inf, -np.inf], np.nan)
+
+    @staticmethod
+    def triggered(index, snapshot):
+        """[(alert id, symbol)] of the alerts the snapshot fires, one pass over the index."""
+        fired = []
+        for (alert_type, symbol), (values, ids) in index.buckets.items():
+            if symbol not in snapshot.index:
+                continue
+            row = snapshot.loc[symbol]
+
+            if alert_type in RISING or alert_type in FALLING:
+                observed = row[RISING.get(alert_type) or FALLING[alert_type]]
+                if pd.isna(observed):
+                    continue
+                if alert_type in RISING:
+                    hit = ids[:np.searchsorted(values, observed, side='right')]
+                else:
+                    hit = ids[np.searchsorted(values, observed, side='left'):]
+
+            elif alert_type == 'CHANGE_PERCENT':
+                change = row['change_percent']
+                if pd.isna(change):
+                    continue
+                zero = np.searchsorted(values, 0.0, side='left')
+                rises = ids[zero:][:np.searchsorted(values[zero:], change, side='right')]
+                falls = ids[:zero][np.searchsorted(values[:zero], change, side='left'):]
+                hit = np.concatenate([rises, falls])
+
+            elif alert_type == 'MACD_CROSSOVER':
+                direction = row['macd_cross']
+                if direction > 0:
+                    hit = ids[np.searchsorted(values, 0.0, side='left'):]
+                elif direction < 0:
+                    hit = ids[:np.searchsorted(values, 0.0, side='right')]
+                else:
+                    continue
+
+            elif alert_type == 'MA_CROSSOVER':
+                windows = values.astype(np.int64)
+                crossed = [w for w in np.unique(windows) if row.get(f'ma_cross_{w}', 0) != 0]
+                hit = ids[np.isin(windows, crossed)]
+
+            else:
+                continue
+            fired.extend((int(alert_id), symbol) for alert_id in hit)
+        return fired
+
+    @staticmethod
+    def evaluate(dates=None, end_date=None):
+        """
+        Checks all active alerts against their symbols' newest bar and marks
+        the ones that fire. With dates (e.g. the dates a price upload added)
+        only symbols whose newest bar is on one of them are checked.
+        Returns {'alerts', 'symbols', 'triggered'}.
+        """
+        index = AlertIndex.active()
+        if not index.size:
+            return {'alerts': 0, 'symbols': 0, 'triggered': 0}
+        snapshot = AlertService.snapshot(index.symbols, index.ma_windows, end_date)
+        if dates is not None and not snapshot.empty:
+            snapshot = snapshot[snapshot['business_date'].isin(set(dates))]
+
+        fired = AlertService.triggered(index, snapshot)
+        by_symbol = defaultdict(list)
+        for alert_id, symbol in fired:
+            by_symbol[symbol].append(alert_id)
+
+        # Every alert of a symbol triggers at the same close: one UPDATE per symbol
+        now = timezone.now()
+        for symbol, ids in by_symbol.items():
+            price = Decimal(repr(float(snapshot.at[symbol, 'close']))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                PriceAlert.objects.filter(pk__in=ids[start:start + UPDATE_BATCH_SIZE]).update(
+                    is_triggered=True, triggered_at=now, triggered_price=price, updated_at=now
+                )
+        print(f"Price alerts: {len(fired)} of {index.size} triggered across {len(snapshot)} symbols.")
+        return {'alerts': index.size, 'symbols': len(snapshot), 'triggered': len(fired)}
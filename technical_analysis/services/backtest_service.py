@@ -0,0 +1,358 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from django.db import connections
+from django.db.models import Avg, Count, Max, Q
+
+from technical_analysis.models import Signal, SignalPerformance
+from .batch_indicator_service import BatchIndicatorService, align_right, day_numbers
+
+BACKTEST_SOURCE = 'backtest'
+CENTS = Decimal('0.01')
+
+# Read by the parameter-sweep worker processes (set once per worker)
+_SWEEP_STATE = {}
+
+
+def _decimal(value):
+    if value is None or pd.isna(value):
+        return None
+    return Decimal(repr(float(value))).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def _dates(days):
+    """Day numbers (days since 1970-01-01) to datetime.date objects."""
+    return [d.date() for d in pd.to_datetime(np.asarray(days, dtype=np.int64), unit='D')]
+
+
+def _start_day(day, years):
+    """First day number of a `years` long backtest ending at the last bar (None: everything)."""
+    if not years or not len(day) or np.isnan(day).all():
+        return None
+    return float(np.nanmax(day) - int(round(365.25 * years)))
+
+
+# --- ENTRY / EXIT RULES (the live rules of SignalService, over every bar) ---
+
+def rsi_masks(config, packed):
+    """Enter when RSI crosses back above oversold, exit when it crosses below overbought."""
+    params = config.get('rsi_params', {'window': 14})
+    overbought = config.get('overbought', 70)
+    oversold = config.get('oversold', 30)
+    rsi = BatchIndicatorService.rsi(packed['close'], params.get('window', 14))
+    previous = rsi.shift(1)
+    exits = (previous >= overbought) & (rsi < overbought)
+    entries = (previous <= oversold) & (rsi > oversold) & ~exits
+    return entries.to_numpy(), exits.to_numpy()
+
+
+def ma_crossover_masks(config, packed):
+    """Enter on a golden cross, exit on a death cross."""
+    close = packed['close']
+    short = BatchIndicatorService.sma(close, config.get('short_window', 50))
+    long = BatchIndicatorService.sma(close, config.get('long_window', 200))
+    short_prev, long_prev = short.shift(1), long.shift(1)
+    ready = short.notna() & long.notna() & short_prev.notna() & long_prev.notna()
+    entries = ready & (short_prev <= long_prev) & (short > long)
+    exits = ready & (short_prev >= long_prev) & (short < long) & ~entries
+    return entries.to_numpy(), exits.to_numpy()
+
+
+# strategy_type: (masks, Signal.strength, Signal.confidence) -- as SignalService rates the entry
+RULES = {
+    'RSI_OVERSOLD': (rsi_masks, 8, 80.0),
+    'MA_CROSSOVER': (ma_crossover_masks, 7, 75.0),
+}
+
+
+def describe(strategy_type, config):
+    if strategy_type == 'RSI_OVERSOLD':
+        window = config.get('rsi_params', {'window': 14}).get('window', 14)
+        return (
+            f"Backtest: RSI({window}) crossed above Oversold level ({config.get('oversold', 30)}); "
+            f"exit when it crosses below Overbought level ({config.get('overbought', 70)})."
+        )
+    return (
+        f"Backtest: Golden Cross SMA({config.get('short_window', 50)}) / SMA({config.get('long_window', 200)}); "
+        f"exit on the Death Cross."
+    )
+
+
+# --- PARAMETER SWEEP WORKERS ---
+
+def _init_sweep_worker(strategy_type, packed, start_day):
+    _SWEEP_STATE.update(strategy_type=strategy_type, packed=packed, start_day=start_day)
+
+
+def _sweep_point(config):
+    result = BacktestService.simulate(
+        _SWEEP_STATE['strategy_type'], config, _SWEEP_STATE['packed'], _SWEEP_STATE['start_day']
+    )
+    return config, result['summary']
+
+
+class BacktestService:
+    """
+    Vectorized backtests of TradingStrategy configs over the adjusted price
+    history of the whole universe. Entry and exit masks, the position
+    vectors, trades and equity curves are all computed on (bars x symbols)
+    matrices packed by align_right; nothing loops over bars in Python.
+    Long only: a position opens at the close of an entry bar and closes at
+    the close of the next exit bar.
+    """
+
+    @staticmethod
+    def load(symbols, end_date=None):
+        """Packed OHLCV of every symbol up to end_date, plus a 'day' matrix of day numbers."""
+        frames = BatchIndicatorService.load_universe(symbols, end_date)
+        frames['day'] = day_numbers(frames['close'])
+        packed, _ = align_right(frames)
+        return packed
+
+    @staticmethod
+    def positions(entries, exits):
+        """1 while a position is held (from its entry bar), 0 otherwise."""
+        marks = np.full(entries.shape, np.nan)
+        marks[exits] = 0.0
+        marks[entries] = 1.0
+        return pd.DataFrame(marks).ffill().fillna(0.0).to_numpy(copy=True)
+
+    @staticmethod
+    def trades(state, close, day):
+        """
+        One row per trade: column, entry / exit row, prices and day numbers,
+        return and the worst drawdown from the peak close while it was held.
+        Trades still open at the last bar have NaN exit fields.
+        """
+        previous = np.vstack([np.zeros((1, state.shape[1])), state[:-1]])
+        change = state - previous
+        entry_cols, entry_rows = np.nonzero((change == 1).T)
+        exit_cols, exit_rows = np.nonzero((change == -1).T)
+
+        # The k-th exit of a column closes its k-th entry
+        entries = pd.DataFrame({
+            'col': entry_cols, 'entry_row': entry_rows,
+            'rank': np.arange(len(entry_cols)) - np.searchsorted(entry_cols, entry_cols),
+        })
+        exits = pd.DataFrame({
+            'col': exit_cols, 'exit_row': exit_rows,
+            'rank': np.arange(len(exit_cols)) - np.searchsorted(exit_cols, exit_cols),
+        })
+        trades = entries.merge(exits, on=['col', 'rank'], how='left')
+        closed = trades['exit_row'].notna().to_numpy()
+        exit_rows = trades['exit_row'].fillna(0).to_numpy(dtype=np.int64)
+        cols = trades['col'].to_numpy()
+
+        trades['entry_price'] = close[trades['entry_row'].to_numpy(), cols]
+        trades['entry_day'] = day[trades['entry_row'].to_numpy(), cols]
+        trades['exit_price'] = np.where(closed, close[exit_rows, cols], np.nan)
+        trades['exit_day'] = np.where(closed, day[exit_rows, cols], np.nan)
+        trades['return_pct'] = (trades['exit_price'] / trades['entry_price'] - 1.0) * 100.0
+
+        # Drawdown: every held bar (and the exit bar) grouped by trade
+        number = np.cumsum(change == 1, axis=0) - 1
+        held = (state == 1) | (change == -1)
+        key = np.broadcast_to(np.arange(state.shape[1]), state.shape) * (state.shape[0] + 1) + number
+        cells = pd.DataFrame({'key': key[held], 'close': close[held]})
+        peak = cells.groupby('key')['close'].cummax()
+        drawdown = ((1.0 - cells['close'] / peak) * 100.0).groupby(cells['key']).max()
+        trades['max_drawdown_pct'] = drawdown.reindex(cols * (state.shape[0] + 1) + trades['rank'].to_numpy()).to_numpy()
+        return trades
+
+    @staticmethod
+    def simulate(strategy_type, config, packed, start_day=None):
+        """
+        Runs one config over packed (see load). Entries before start_day are
+        ignored so indicators can warm up on the earlier history. Returns
+        {'trades', 'last_days' (each symbol's last day number), 'equity' (per
+        symbol, packed), 'portfolio' (by day), 'summary'}.
+        """
+        if strategy_type not in RULES:
+            raise NotImplementedError(f"No backtest rules for strategy type {strategy_type}")
+        masks = RULES[strategy_type][0]
+        close = packed['close'].to_numpy()
+        day = packed['day'].to_numpy()
+
+        entries, exits = masks(config, packed)
+        if start_day is not None:
+            entries = entries & (day >= start_day)
+        state = BacktestService.positions(entries, exits)
+        state[np.isnan(close)] = 0.0
+
+        # Returns accrue from the bar after the entry up to the exit bar
+        returns = np.zeros_like(close)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[1:] = np.nan_to_num(close[1:] / close[:-1] - 1.0)
+        strategy_returns = np.vstack([np.zeros((1, close.shape[1])), state[:-1] * returns[1:]])
+        equity = np.cumprod(1.0 + strategy_returns, axis=0)
+
+        # Portfolio: capital split equally over the open positions each day
+        invested = np.vstack([np.zeros((1, close.shape[1]), dtype=bool), state[:-1] == 1])
+        daily = pd.Series(strategy_returns[invested]).groupby(day[invested]).mean()
+        all_days = np.unique(day[~np.isnan(day)])
+        if start_day is not None:
+            all_days = all_days[all_days >= start_day]
+        portfolio = (1.0 + daily.reindex(all_days, fill_value=0.0)).cumprod()
+
+        trades = BacktestService.trades(state, close, day)
+        closed = trades[trades['exit_row'].notna()]
+        peak = portfolio.cummax()
+        summary = {
+            'symbols': int((~np.isnan(close)).any(axis=0).sum()),
+            'trades': len(trades),
+            'closed_trades': len(closed),
+            'winners': int((closed['return_pct'] > 0).sum()),
+            'win_rate': round(float((closed['return_pct'] > 0).mean() * 100), 2) if len(closed) else None,
+            'avg_return_pct': round(float(closed['return_pct'].mean()), 2) if len(closed) else None,
+            'avg_holding_days': round(float((closed['exit_day'] - closed['entry_day']).mean()), 1) if len(closed) else None,
+            'total_return_pct': round(float((portfolio.iloc[-1] - 1.0) * 100), 2) if len(portfolio) else 0.0,
+            'max_drawdown_pct': round(float(((1.0 - portfolio / peak) * 100).max()), 2) if len(portfolio) else 0.0,
+        }
+        return {
+            'trades': trades,
+            'last_days': day[-1] if len(day) else np.array([]),
+            'equity': pd.DataFrame(equity, columns=packed['close'].columns),
+            'portfolio': portfolio,
+            'summary': summary,
+        }
+
+    # --- STORING ---
+
+    @staticmethod
+    def store(strategy, result, columns):
+        """
+        Replaces the strategy's previous backtest with one inactive Signal
+        (the entry) and one SignalPerformance per trade, in bulk.
+        """
+        trades = result['trades']
+        _, strength, confidence = RULES[strategy.strategy_type]
+        reason = describe(strategy.strategy_type, strategy.config)
+
+        Signal.objects.filter(strategy=strategy, technical_summary__source=BACKTEST_SOURCE).delete()
+        if trades.empty:
+            return 0
+
+        symbols = columns[trades['col'].to_numpy()]
+        entry_dates = _dates(trades['entry_day'])
+        closed = trades['exit_row'].notna().to_numpy()
+        exit_dates = [d if c else None for d, c in zip(_dates(trades['exit_day'].fillna(0)), closed)]
+        # Open trades have been held up to their symbol's last bar
+        held_until = _dates(np.where(closed, trades['exit_day'].fillna(0), result['last_days'][trades['col'].to_numpy()]))
+
+        signals = [
+            Signal(
+                symbol=symbol, strategy=strategy, signal_type='BUY', strength=strength, confidence=confidence,
+                business_date=entry_date, price_at_signal=_decimal(row.entry_price),
+                reason=reason,
+                technical_summary={'source': BACKTEST_SOURCE, 'config': strategy.config},
+                is_active=False, closed_at=exit_date, closed_price=_decimal(row.exit_price),
+            )
+            for symbol, entry_date, exit_date, row in zip(symbols, entry_dates, exit_dates, trades.itertuples())
+        ]
+        Signal.objects.bulk_create(signals, batch_size=1000)
+        if any(s.pk is None for s in signals):
+            # MySQL does not return the ids of a bulk insert
+            ids = {
+                (symbol, business_date): pk
+                for symbol, business_date, pk in Signal.objects.filter(
+                    strategy=strategy, technical_summary__source=BACKTEST_SOURCE
+                ).values_list('symbol', 'business_date', 'id')
+            }
+            for s in signals:
+                s.pk = ids[(s.symbol, s.business_date)]
+
+        performances = []
+        for signal, entry_date, exit_date, until, row in zip(
+            signals, entry_dates, exit_dates, held_until, trades.itertuples()
+        ):
+            closed = exit_date is not None
+            performances.append(SignalPerformance(
+                signal_id=signal.pk,
+                entry_date=entry_date,
+                entry_price=_decimal(row.entry_price),
+                exit_date=exit_date,
+                exit_price=_decimal(row.exit_price),
+                profit_loss=_decimal(row.exit_price - row.entry_price) if closed else None,
+                profit_loss_percent=_decimal(row.return_pct) if closed else None,
+                holding_days=(until - entry_date).days,
+                max_drawdown=_decimal(row.max_drawdown_pct),
+                is_winner=bool(row.exit_price > row.entry_price) if closed else None,
+            ))
+        SignalPerformance.objects.bulk_create(performances, batch_size=1000)
+        return len(performances)
+
+    @staticmethod
+    def run(strategy, symbols, years=10, end_date=None, store=True, packed=None):
+        """
+        Backtests a TradingStrategy over the last `years` years up to
+        end_date (the latest bar when None) and, if store, writes the trades
+        to SignalPerformance. Returns the simulate() result.
+        """
+        packed = BacktestService.load(symbols, end_date) if packed is None else packed
+        start_day = _start_day(packed['day'].to_numpy(), years)
+
+        result = BacktestService.simulate(strategy.strategy_type, strategy.config, packed, start_day)
+        if store:
+            result['summary']['stored'] = BacktestService.store(strategy, result, packed['close'].columns)
+        print(
+            f"Backtest {strategy.name}: {result['summary']['trades']} trades over "
+            f"{result['summary']['symbols']} symbols, total return {result['summary']['total_return_pct']}%."
+        )
+        return result
+
+    @staticmethod
+    def sweep(strategy, grid, symbols, years=10, end_date=None, processes=None):
+        """
+        Backtests every combination of grid ({config key: [values]}) on top
+        of the strategy's config, fanned out over a process pool. The price
+        history is loaded once and handed to each worker when it starts.
+        Returns [(config, summary)] ordered by total return, best first.
+        """
+        packed = BacktestService.load(symbols, end_date)
+        packed = {field: packed[field] for field in ('close', 'day')}
+        start_day = _start_day(packed['day'].to_numpy(), years)
+
+        keys = sorted(grid)
+        configs = [
+            {**strategy.config, **dict(zip(keys, values))}
+            for values in itertools.product(*(grid[key] for key in keys))
+        ]
+        processes = min(processes or os.cpu_count() or 1, len(configs)) or 1
+
+        if processes == 1:
+            _init_sweep_worker(strategy.strategy_type, packed, start_day)
+            results = [_sweep_point(config) for config in configs]
+        else:
+            # Forked workers must not share the parent's database sockets
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=_init_sweep_worker,
+                initargs=(strategy.strategy_type, packed, start_day),
+            ) as pool:
+                results = list(pool.map(_sweep_point, configs))
+
+        print(f"Parameter sweep {strategy.name}: {len(configs)} configurations on {processes} processes.")
+        return sorted(results, key=lambda item: item[1]['total_return_pct'], reverse=True)
+
+    @staticmethod
+    def stored_summary(strategy):
+        """Aggregates of the strategy's stored backtest trades."""
+        performances = SignalPerformance.objects.filter(
+            signal__strategy=strategy, signal__technical_summary__source=BACKTEST_SOURCE
+        )
+        summary = performances.aggregate(
+            trades=Count('id'),
+            closed_trades=Count('id', filter=Q(exit_date__isnull=False)),
+            winners=Count('id', filter=Q(is_winner=True)),
+            avg_return_pct=Avg('profit_loss_percent'),
+            avg_holding_days=Avg('holding_days', filter=Q(exit_date__isnull=False)),
+            worst_trade_drawdown_pct=Max('max_drawdown'),
+        )
+        closed = summary['closed_trades']
+        summary['win_rate'] = round(summary['winners'] * 100.0 / closed, 2) if closed else None
+        return summary
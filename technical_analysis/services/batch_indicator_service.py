@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+from django.db import connection
+
+from adjustments_stock_price.models import AdjustmentFactorSegment
+from technical_analysis.models import IndicatorValue
+from .price_panel import FIELDS, current_panel
+
+UPSERT_BATCH_SIZE = 1000
+
+
+def indicator_kind(indicator_name):
+    """Maps an IndicatorType name onto its calculation, the way get_indicator_data matches it."""
+    name_lower = indicator_name.lower()
+    for kind in ('sma', 'ema', 'rsi', 'macd', 'bollinger', 'obv'):
+        if kind in name_lower:
+            return kind
+    raise NotImplementedError(f"Indicator '{indicator_name}' is not implemented.")
+
+
+def align_right(frames):
+    """
+    Packs each symbol's trading days to the bottom of its column.
+
+    frames is {field: dates x symbols DataFrame} with NaN where a symbol
+    did not trade. Rolling windows and EMAs over a calendar-aligned matrix
+    would count those holes, while the per-symbol functions only see the
+    symbol's own bars. After packing, column j holds exactly the series
+    get_ohlcv returns for symbol j (leading NaN padding, which rolling /
+    ewm skip), and the last row is everyone's latest bar.
+    Returns ({field: packed DataFrame}, Series of each symbol's last date).
+    """
+    close = frames['close'].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(close)
+    order = np.argsort(valid, axis=0, kind='stable')  # holes first, bars in date order last
+    columns = frames['close'].columns
+    packed = {}
+    for field, frame in frames.items():
+        values = np.take_along_axis(frame.to_numpy(dtype=np.float64), order, axis=0)
+        packed[field] = pd.DataFrame(values, columns=columns)
+
+    dates = frames['close'].index
+    if len(dates):
+        last_rows = np.where(valid.any(axis=0), len(dates) - 1 - np.argmax(valid[::-1], axis=0), -1)
+    else:
+        last_rows = np.full(len(columns), -1)
+    last_dates = pd.Series(
+        [dates[i].date() if i >= 0 else None for i in last_rows], index=columns
+    )
+    return packed, last_dates
+
+
+def day_numbers(close):
+    """Day numbers (days since 1970-01-01) where close has a bar, NaN elsewhere; pack it with the prices."""
+    days = close.index.values.astype('datetime64[D]').astype(np.int64).astype(np.float64)
+    return pd.DataFrame(
+        np.where(close.notna().to_numpy(), days[:, None], np.nan), index=close.index, columns=close.columns
+    )
+
+
+class BatchIndicatorService:
+    """
+    Whole-universe indicator engine: loads the adjusted OHLCV of every
+    symbol once and computes each indicator for all of them on a
+    (bars x symbols) matrix. Results match the per-symbol functions in
+    technical_analysis.indicators; see align_right for why the matrix is
+    packed per symbol rather than aligned by date.
+    """
+
+    @staticmethod
+    def load_universe(symbols, end_date=None, start_date=None):
+        """
+        {field: dates x symbols DataFrame} of adjusted OHLCV up to end_date
+        (from start_date if given), from the price panel when it is current,
+        otherwise in one query.
+        """
+        symbols = sorted(set(symbols))
+        panel = current_panel()
+        if panel is not None:
+            return {field: panel.window(field, symbols, start_date, end_date) for field in FIELDS}
+
+        rows = AdjustmentFactorSegment.objects.adjusted_prices(symbols, start_date, end_date)
+        df = pd.DataFrame(rows, columns=[
+            'symbol', 'business_date', 'open_price_adj', 'high_price_adj',
+            'low_price_adj', 'close_price_adj', 'total_traded_quantity',
+        ])
+        df['business_date'] = pd.to_datetime(df['business_date'])
+        columns = {
+            'open': 'open_price_adj', 'high': 'high_price_adj', 'low': 'low_price_adj',
+            'close': 'close_price_adj', 'volume': 'total_traded_quantity',
+        }
+        frames = {}
+        for field, column in columns.items():
+            frame = df.pivot(index='business_date', columns='symbol', values=column)
+            frames[field] = frame.apply(pd.to_numeric, errors='coerce').reindex(columns=symbols)
+        frames['volume'] = frames['volume'].fillna(0).where(frames['close'].notna())
+        return frames
+
+    # --- CALCULATIONS (column-wise, on packed matrices) ---
+
+    @staticmethod
+    def sma(close, window):
+        return close.rolling(window=window, min_periods=window).mean()
+
+    @staticmethod
+    def ema(close, window):
+        return close.ewm(span=window, adjust=False, min_periods=window).mean()
+
+    @staticmethod
+    def rsi(close, window=14):
+        delta = close.diff(1)
+        bars = close.notna()
+        # The first bar's gain/loss is 0 (as in calculate_rsi); padding stays NaN
+        gain = delta.where(delta > 0, 0).where(bars)
+        loss = (-delta.where(delta < 0, 0)).where(bars)
+        avg_gain = gain.ewm(com=window - 1, min_periods=window, adjust=False).mean()
+        avg_loss = loss.ewm(com=window - 1, min_periods=window, adjust=False).mean()
+        rs = avg_gain / avg_loss
+        return 100.0 - (100.0 / (1.0 + rs))
+
+    @staticmethod
+    def macd(close, short_window=12, long_window=26, signal_window=9):
+        macd_line = BatchIndicatorService.ema(close, short_window) - BatchIndicatorService.ema(close, long_window)
+        signal_line = BatchIndicatorService.ema(macd_line, signal_window)
+        return {'macd': macd_line, 'signal': signal_line, 'histogram': macd_line - signal_line}
+
+    @staticmethod
+    def bollinger_bands(close, window=20, std_dev=2):
+        sma = BatchIndicatorService.sma(close, window)
+        rolling_std = close.rolling(window=window, min_periods=window).std()
+        return {'bb_upper': sma + rolling_std * std_dev, 'bb_middle': sma, 'bb_lower': sma - rolling_std * std_dev}
+
+    @staticmethod
+    def obv(close, volume):
+        bars = close.notna().to_numpy()
+        direction = np.sign(close.diff(1).fillna(0).to_numpy())
+        obv = np.cumsum(np.where(bars, volume.to_numpy() * direction, 0), axis=0)
+        # calculate_obv overwrites each symbol's first value with its volume
+        first = np.argmax(bars, axis=0)
+        cols = np.arange(obv.shape[1])
+        obv[first, cols] = volume.to_numpy()[first, cols]
+        return pd.DataFrame(np.where(bars, obv, np.nan), columns=close.columns)
+
+    @staticmethod
+    def calculate(indicator_name, params, packed):
+        """
+        One indicator for every symbol. Returns a packed DataFrame, or a
+        dict of them for the multi-value indicators (MACD, Bollinger Bands).
+        """
+        close = packed['close']
+        kind = indicator_kind(indicator_name)
+        if kind == 'sma':
+            return BatchIndicatorService.sma(close, params.get('window', 20))
+        if kind == 'ema':
+            return BatchIndicatorService.ema(close, params.get('window', 20))
+        if kind == 'rsi':
+            return BatchIndicatorService.rsi(close, params.get('window', 14))
+        if kind == 'macd':
+            return BatchIndicatorService.macd(
+                close,
+                short_window=params.get('short_window', 12),
+                long_window=params.get('long_window', 26),
+                signal_window=params.get('signal_window', 9),
+            )
+        if kind == 'bollinger':
+            return BatchIndicatorService.bollinger_bands(
+                close, window=params.get('window', 20), std_dev=params.get('std_dev', 2)
+            )
+        return BatchIndicatorService.obv(close, packed['volume'])
+
+    # --- STORING ---
+
+    @staticmethod
+    def latest_values(result, last_dates, indicator_type, params):
+        """Unsaved IndicatorValue rows holding each symbol's latest value (NaN results are skipped)."""
+        objs = []
+        if isinstance(result, dict):
+            latest = {key: frame.iloc[-1] for key, frame in result.items()} if len(last_dates) else {}
+            for symbol, business_date in last_dates.items():
+                if business_date is None:
+                    continue
+                values = {key: latest[key][symbol] for key in result}
+                if all(pd.isna(v) for v in values.values()):
+                    continue
+                objs.append(IndicatorValue(
+                    symbol=symbol, indicator_type=indicator_type, business_date=business_date,
+                    value=None, value_json={k: (None if pd.isna(v) else float(v)) for k, v in values.items()},
+                    parameters=params,
+                ))
+        else:
+            latest = result.iloc[-1] if len(result) else pd.Series(dtype=float)
+            for symbol, business_date in last_dates.items():
+                value = latest.get(symbol, np.nan)
+                if business_date is None or pd.isna(value):
+                    continue
+                objs.append(IndicatorValue(
+                    symbol=symbol, indicator_type=indicator_type, business_date=business_date,
+                    value=round(float(value), 6), value_json=None, parameters=params,
+                ))
+        return objs
+
+    @staticmethod
+    def upsert(objs):
+        """One bulk INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT elsewhere) per batch."""
+        unique_fields = None
+        if connection.features.supports_update_conflicts_with_target:
+            unique_fields = ['symbol', 'indicator_type', 'business_date']
+        IndicatorValue.objects.bulk_create(
+            objs,
+            batch_size=UPSERT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['value', 'value_json', 'parameters', 'updated_at'],
+        )
+        return len(objs)
+
+    @staticmethod
+    def calculate_and_store_all(symbols, indicator_types, end_date=None):
+        """
+        Batch counterpart of IndicatorService.calculate_and_store for every
+        symbol and indicator type. Returns {indicator name: rows written}
+        (an error message instead of a count if that indicator failed).
+        """
+        frames = BatchIndicatorService.load_universe(symbols, end_date)
+        packed, last_dates = align_right(frames)
+
+        written = {}
+        for indicator_type in indicator_types:
+            params = indicator_type.default_parameters or {}
+            try:
+                result = BatchIndicatorService.calculate(indicator_type.name, params, packed)
+                objs = BatchIndicatorService.latest_values(result, last_dates, indicator_type, params)
+                written[indicator_type.name] = BatchIndicatorService.upsert(objs)
+            except Exception as e:
+                print(f"Error calculating {indicator_type.name} in batch: {e}")
+                written[indicator_type.name] = str(e)
+        return written
@@ -0,0 +1,135 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from django.db.models import Q
+
+from technical_analysis.models import Signal
+from .batch_indicator_service import BatchIndicatorService, align_right
+
+PRICE_QUANT = Decimal('0.01')
+
+
+def _price(value):
+    return Decimal(repr(float(value))).quantize(PRICE_QUANT, rounding=ROUND_HALF_UP)
+
+
+class BatchSignalService:
+    """
+    Evaluates every active TradingStrategy across the universe from one
+    shared OHLCV load. Crossovers are found with masks over the last two
+    bars of the packed (bars x symbols) matrices; the rules and the signal
+    fields are those of SignalService.generate_*_signals.
+    """
+
+    @staticmethod
+    def rsi_signals(strategy, packed):
+        """[(symbol, Signal kwargs)] for an RSI_OVERSOLD strategy."""
+        params = strategy.config.get('rsi_params', {'window': 14})
+        overbought = strategy.config.get('overbought', 70)
+        oversold = strategy.config.get('oversold', 30)
+
+        rsi = BatchIndicatorService.rsi(packed['close'], params.get('window', 14))
+        if len(rsi) < 2:
+            return []
+        today, yesterday = rsi.iloc[-1], rsi.iloc[-2]
+        sell = (yesterday >= overbought) & (today < overbought)
+        buy = (yesterday <= oversold) & (today > oversold) & ~sell
+
+        found = []
+        for symbol in rsi.columns[sell.to_numpy()]:
+            t, y = today[symbol], yesterday[symbol]
+            found.append((symbol, {
+                'signal_type': 'SELL', 'strength': 8, 'confidence': 80.0,
+                'reason': f"RSI crossed below Overbought level ({overbought}) from {y:.2f} to {t:.2f}.",
+                'technical_summary': {'rsi': float(t), 'prev_rsi': float(y)},
+            }))
+        for symbol in rsi.columns[buy.to_numpy()]:
+            t, y = today[symbol], yesterday[symbol]
+            found.append((symbol, {
+                'signal_type': 'BUY', 'strength': 8, 'confidence': 80.0,
+                'reason': f"RSI crossed above Oversold level ({oversold}) from {y:.2f} to {t:.2f}.",
+                'technical_summary': {'rsi': float(t), 'prev_rsi': float(y)},
+            }))
+        return found
+
+    @staticmethod
+    def ma_crossover_signals(strategy, packed):
+        """[(symbol, Signal kwargs)] for an MA_CROSSOVER strategy."""
+        short_window = strategy.config.get('short_window', 50)
+        long_window = strategy.config.get('long_window', 200)
+
+        close = packed['close']
+        short = BatchIndicatorService.sma(close, short_window)
+        long = BatchIndicatorService.sma(close, long_window)
+        if len(close) < 2:
+            return []
+        s_today, s_yesterday = short.iloc[-1], short.iloc[-2]
+        l_today, l_yesterday = long.iloc[-1], long.iloc[-2]
+        # Both averages must exist on both bars (the per-symbol path drops NaN rows)
+        ready = s_today.notna() & s_yesterday.notna() & l_today.notna() & l_yesterday.notna()
+        golden = ready & (s_yesterday <= l_yesterday) & (s_today > l_today)
+        death = ready & (s_yesterday >= l_yesterday) & (s_today < l_today) & ~golden
+
+        found = []
+        for symbol in close.columns[golden.to_numpy()]:
+            found.append((symbol, {
+                'signal_type': 'BUY', 'strength': 7, 'confidence': 75.0,
+                'reason': f"Golden Cross: SMA({short_window}) crossed above SMA({long_window}).",
+                'technical_summary': {'short_ma': float(s_today[symbol]), 'long_ma': float(l_today[symbol])},
+            }))
+        for symbol in close.columns[death.to_numpy()]:
+            found.append((symbol, {
+                'signal_type': 'SELL', 'strength': 7, 'confidence': 75.0,
+                'reason': f"Death Cross: SMA({short_window}) crossed below SMA({long_window}).",
+                'technical_summary': {'short_ma': float(s_today[symbol]), 'long_ma': float(l_today[symbol])},
+            }))
+        return found
+
+    EVALUATORS = {
+        'RSI_OVERSOLD': 'rsi_signals',
+        'MA_CROSSOVER': 'ma_crossover_signals',
+    }
+
+    @staticmethod
+    def generate_all(symbols, strategies, end_date=None):
+        """
+        Runs the strategies over all symbols: one OHLCV load, one UPDATE
+        deactivating the signals the new ones supersede, one bulk insert.
+        Returns {strategy name: new signals} (an error message if it failed).
+        """
+        frames = BatchIndicatorService.load_universe(symbols, end_date)
+        packed, last_dates = align_right(frames)
+        latest_close = packed['close'].iloc[-1] if len(packed['close']) else pd.Series(dtype=float)
+
+        new_signals, superseded, summary = [], Q(), {}
+        for strategy in strategies:
+            evaluator = BatchSignalService.EVALUATORS.get(strategy.strategy_type)
+            if evaluator is None:
+                summary[strategy.name] = f"No batch evaluator for strategy type {strategy.strategy_type}"
+                continue
+            try:
+                found = getattr(BatchSignalService, evaluator)(strategy, packed)
+            except Exception as e:
+                print(f"Error running strategy {strategy.name} in batch: {e}")
+                summary[strategy.name] = str(e)
+                continue
+
+            found = [(s, kw) for s, kw in found if last_dates[s] is not None and not np.isnan(latest_close[s])]
+            for symbol, kwargs in found:
+                new_signals.append(Signal(
+                    symbol=symbol,
+                    strategy=strategy,
+                    business_date=last_dates[symbol],
+                    price_at_signal=_price(latest_close[symbol]),
+                    **kwargs,
+                ))
+            if found:
+                superseded |= Q(strategy=strategy, symbol__in=[s for s, _ in found])
+            summary[strategy.name] = len(found)
+
+        if new_signals:
+            Signal.objects.filter(superseded, is_active=True).update(is_active=False)
+            Signal.objects.bulk_create(new_signals, batch_size=1000)
+        print(f"Batch signals: {len(new_signals)} created across {len(symbols)} symbols.")
+        return summary
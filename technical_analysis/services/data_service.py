@@ -1,14 +1,16 @@
 from django.db.models import Q
 from django.db import models
-from adjustments_stock_price.models import StockPricesAdj
+from adjustments_stock_price.models import StockPricesAdj, AdjustmentFactorSegment
+from nepse_data.models import StockPrices
+from .price_panel import current_panel
 import pandas as pd
 from datetime import datetime, timedelta
 
 class MarketDataService:
-    """Service to fetch data from existing StockPricesAdj model"""
+    """Service to fetch (adjusted) price data for the technical analysis app"""
     
     @staticmethod
-    def get_ohlcv(symbol, start_date=None, end_date=None, use_adjusted=True):
+    def get_ohlcv(symbol, start_date=None, end_date=None, use_adjusted=True, use_panel=True):
         """
         Fetch OHLCV data for a symbol
         
@@ -17,40 +19,32 @@ class MarketDataService:
             start_date: Start date for data
             end_date: End date for data
             use_adjusted: Use adjusted prices or raw prices
+            use_panel: Slice adjusted prices from the memory-mapped price
+                panel when it is current (no DB query); falls back to the DB
         
         Returns:
             DataFrame with OHLCV data
         """
-        queryset = StockPricesAdj.objects.filter(symbol=symbol)
-        
-        if start_date:
-            queryset = queryset.filter(business_date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(business_date__lte=end_date)
-        
-        queryset = queryset.order_by('business_date')
-        
-        # Select adjusted or raw prices
-        if use_adjusted:
-            # THIS IS THE CORRECT IMPLEMENTATION USING .values()
-            data = queryset.values(
-                'business_date',
-                open='open_price_adj',
-                high='high_price_adj',
-                low='low_price_adj',
-                close='close_price_adj',
-                volume='total_traded_quantity' # <-- Includes Volume
-            )
-        else:
-            # THIS IS THE CORRECT IMPLEMENTATION USING .values()
-            data = queryset.values(
-                'business_date',
-                open='open_price',
-                high='high_price',
-                low='low_price',
-                close='close_price',
-                volume='total_traded_quantity' # <-- Includes Volume
-            )
+        if use_adjusted and use_panel:
+            panel = current_panel()
+            if panel is not None:
+                return panel.symbol_frame(symbol, start_date, end_date)
+
+        # Raw prices x adjustment_factor_segments (range join); works without
+        # the materialized stock_prices_adj copy and carries volume from stock_prices
+        rows = AdjustmentFactorSegment.objects.adjusted_prices(symbol, start_date, end_date)
+        suffix = '_adj' if use_adjusted else ''
+        data = [
+            {
+                'business_date': row['business_date'],
+                'open': row[f'open_price{suffix}'],
+                'high': row[f'high_price{suffix}'],
+                'low': row[f'low_price{suffix}'],
+                'close': row[f'close_price{suffix}'],
+                'volume': row['total_traded_quantity'],
+            }
+            for row in rows
+        ]
         
         df = pd.DataFrame(list(data))
         
@@ -65,20 +59,25 @@ class MarketDataService:
     @staticmethod
     def get_latest_price(symbol):
         """Get the latest price for a symbol"""
-        try:
-            latest = StockPricesAdj.objects.filter(
-                symbol=symbol
-            ).latest('business_date')
-            return {
-                'symbol': symbol,
-                'date': latest.business_date,
-                'close': float(latest.close_price_adj or latest.close_price),
-                'open': float(latest.open_price_adj or latest.open_price),
-                'high': float(latest.high_price_adj or latest.high_price),
-                'low': float(latest.low_price_adj or latest.low_price),
-            }
-        except StockPricesAdj.DoesNotExist:
+        latest_date = StockPrices.objects.filter(symbol=symbol).aggregate(
+            latest=models.Max('business_date')
+        )['latest']
+        if latest_date is None:
             return None
+        latest = AdjustmentFactorSegment.objects.adjusted_prices(symbol, latest_date, latest_date)[-1]
+        return {
+            'symbol': symbol,
+            'date': latest['business_date'],
+            'close': float(latest['close_price_adj'] or latest['close_price']),
+            'open': float(latest['open_price_adj'] or latest['open_price']),
+            'high': float(latest['high_price_adj'] or latest['high_price']),
+            'low': float(latest['low_price_adj'] or latest['low_price']),
+        }
+    
+    @staticmethod
+    def get_panel():
+        """The current price panel for whole-universe work (None if missing or stale)."""
+        return current_panel()
     
     @staticmethod
     def get_multiple_symbols(symbols, start_date=None, end_date=None):
@@ -98,7 +97,7 @@ class MarketDataService:
         # Get symbols with data in last 30 days
         cutoff_date = datetime.now().date() - timedelta(days=30)
         
-        symbols = StockPricesAdj.objects.filter(
+        symbols = StockPrices.objects.filter(
             business_date__gte=cutoff_date
         ).values_list('symbol', flat=True).distinct()
         
@@ -107,7 +106,7 @@ class MarketDataService:
     @staticmethod
     def get_date_range(symbol):
         """Get available date range for a symbol"""
-        data = StockPricesAdj.objects.filter(
+        data = StockPrices.objects.filter(
             symbol=symbol
         ).aggregate(
             min_date=models.Min('business_date'),
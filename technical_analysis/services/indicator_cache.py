@@ -0,0 +1,265 @@
+import hashlib
+import io
+import json
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from technical_analysis.models import IndicatorCache, IndicatorType
+from .batch_indicator_service import indicator_kind
+from .indicator_service import IndicatorService
+from .indicator_state import STATE_TIMEFRAME
+from .data_service import MarketDataService
+from .price_panel import current_panel, segment_fingerprints
+
+TIMEFRAMES = ('daily',)
+STATS_PREFIX = 'indicator_cache:stats'
+STAT_NAMES = ('hits', 'misses', 'stale')
+# Kinds whose look-back is the 'window' parameter (what ?period= overrides)
+WINDOWED_KINDS = ('sma', 'ema', 'rsi', 'bollinger')
+
+
+def cache_max_bytes():
+    return getattr(settings, 'INDICATOR_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+
+def params_key(params):
+    return hashlib.md5(json.dumps(params or {}, sort_keys=True).encode()).hexdigest()
+
+
+def data_version(symbol):
+    """
+    (version, ohlcv): identifies the symbol's adjusted price history a cached
+    series is built from. While the price panel is current ohlcv is the
+    symbol's panel frame and the version a hash of its dates and values, so
+    it only moves when that symbol's bars do, not with every panel rebuild.
+    Otherwise it is the symbol's raw price rows (count, newest id and date,
+    read off the (symbol, business_date) index) plus its factor segments,
+    and ohlcv is None (read it with MarketDataService.get_ohlcv on a miss).
+    """
+    panel = current_panel()
+    if panel is not None:
+        ohlcv = panel.symbol_frame(symbol)
+        digest = hashlib.md5(b'panel|')
+        if not ohlcv.empty:
+            digest.update(ohlcv.index.values.astype('datetime64[D]').tobytes())
+            digest.update(np.ascontiguousarray(ohlcv.to_numpy(dtype=np.float64)).tobytes())
+        return digest.hexdigest(), ohlcv
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*), MAX(id), MAX(business_date) FROM stock_prices WHERE symbol = %s", [symbol]
+        )
+        count, max_id, max_date = cursor.fetchone()
+    segments = segment_fingerprints([symbol]).get(symbol, '')
+    return hashlib.md5(f"{count}|{max_id}|{max_date}|{segments}".encode()).hexdigest(), None
+
+
+# --- PAYLOAD (compressed .npz: day numbers + float64 values) ---
+
+def encode_frame(frame):
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        dates=frame.index.values.astype('datetime64[D]').astype(np.int32),
+        values=frame.to_numpy(dtype=np.float64),
+    )
+    return buffer.getvalue()
+
+
+def decode_frame(payload, columns):
+    with np.load(io.BytesIO(bytes(payload)), allow_pickle=False) as arrays:
+        index = pd.DatetimeIndex(arrays['dates'].astype('datetime64[D]'), name='business_date')
+        return pd.DataFrame(arrays['values'], index=index, columns=columns)
+
+
+def frame_records(frame):
+    """[{'date': 'YYYY-MM-DD', column: value or None, ...}] for JSON responses."""
+    records = []
+    for day, row in zip(frame.index, frame.itertuples(index=False)):
+        record = {'date': day.date().isoformat()}
+        record.update({col: (None if pd.isna(v) else float(v)) for col, v in zip(frame.columns, row)})
+        records.append(record)
+    return records
+
+
+# --- HIT / MISS COUNTERS (shared by every process through the Django cache) ---
+
+def _count(stat):
+    key = f"{STATS_PREFIX}:{stat}"
+    try:
+        cache.add(key, 0, None)
+        cache.incr(key)
+    except Exception:
+        pass  # Counters are best effort
+
+
+def touch_seconds():
+    return getattr(settings, 'INDICATOR_CACHE_TOUCH_SECONDS', 300)
+
+
+def _record_hit(entry):
+    """
+    Counts a hit on an entry without writing the row each time: hits pile up
+    in a cache counter and are flushed, with last_accessed, once the row's
+    last_accessed is older than INDICATOR_CACHE_TOUCH_SECONDS (so LRU
+    eviction works to that resolution).
+    """
+    key = f"{STATS_PREFIX}:entry:{entry.pk}"
+    try:
+        cache.add(key, 0, None)
+        pending = cache.incr(key)
+    except Exception:
+        key, pending = None, 1
+    now = timezone.now()
+    if entry.last_accessed is not None and (now - entry.last_accessed).total_seconds() < touch_seconds():
+        return
+    if key is not None:
+        try:
+            cache.delete(key)
+        except Exception:
+            pass
+    IndicatorCache.objects.filter(pk=entry.pk).update(hits=F('hits') + pending, last_accessed=now)
+
+
+class IndicatorCacheService:
+    """
+    Read-through cache of full indicator series for the chart and indicator
+    views. An entry is keyed by (symbol, indicator type, parameters,
+    timeframe) and remembers the data version it was computed from; when the
+    symbol's prices or adjustment segments change, the next read recomputes
+    it. Entries beyond INDICATOR_CACHE_MAX_BYTES are evicted least recently
+    used first.
+    """
+
+    @staticmethod
+    def indicator_type_for(name):
+        """The IndicatorType called name, or the first one computing the same kind of indicator."""
+        indicator_type = IndicatorType.objects.filter(name__iexact=name).first()
+        if indicator_type is not None:
+            return indicator_type
+        kind = indicator_kind(name)
+        for candidate in IndicatorType.objects.order_by('id'):
+            try:
+                if indicator_kind(candidate.name) == kind:
+                    return candidate
+            except NotImplementedError:
+                continue
+        return None
+
+    @staticmethod
+    def params_for(indicator_type, period=None):
+        """The type's default parameters, with period as the window of windowed indicators."""
+        params = dict(indicator_type.default_parameters or {})
+        if period is not None and indicator_kind(indicator_type.name) in WINDOWED_KINDS:
+            params['window'] = int(period)
+        return params
+
+    @staticmethod
+    def get_series(symbol, indicator_type, params=None, timeframe='daily', source=None):
+        """
+        The full indicator series for a symbol as a DataFrame indexed by
+        business_date (a single 'value' column for single-value indicators).
+        Pass source (a data_version() result) when reading several
+        indicators of one symbol.
+        """
+        if timeframe not in TIMEFRAMES:
+            raise ValueError(f"Unsupported timeframe: {timeframe}")
+        params = indicator_type.default_parameters or {} if params is None else params
+        key = params_key(params)
+        version, ohlcv = source or data_version(symbol)
+
+        entry = IndicatorCache.objects.filter(
+            symbol=symbol, indicator_type=indicator_type, timeframe=timeframe, params_key=key
+        ).only('id', 'data', 'data_version', 'payload', 'last_accessed').first()
+
+        if entry is not None and entry.payload is not None and entry.data_version == version:
+            _count('hits')
+            _record_hit(entry)
+            return decode_frame(entry.payload, entry.data['columns'])
+
+        _count('stale' if entry is not None else 'misses')
+        # Computed from the same prices the version describes
+        if ohlcv is None:
+            ohlcv = MarketDataService.get_ohlcv(symbol, use_panel=False)
+        result = IndicatorService.get_indicator_data(symbol, indicator_type.name, params, ohlcv_df=ohlcv)
+        frame = result.to_frame('value') if isinstance(result, pd.Series) else result
+        if frame.empty:
+            return frame
+        frame = frame.astype(np.float64)
+        payload = encode_frame(frame)
+
+        IndicatorCache.objects.update_or_create(
+            symbol=symbol, indicator_type=indicator_type, timeframe=timeframe, params_key=key,
+            defaults={
+                'data': {'params': params, 'columns': [str(c) for c in frame.columns]},
+                'data_version': version,
+                'payload': payload,
+                'size_bytes': len(payload),
+                'last_accessed': timezone.now(),
+            },
+        )
+        IndicatorCacheService.evict()
+        return frame
+
+    @staticmethod
+    def get_many(symbol, indicator_types, start_date=None, end_date=None):
+        """{indicator name: series DataFrame} for one symbol, sliced to [start_date, end_date]."""
+        source = data_version(symbol)
+        series = {}
+        for indicator_type in indicator_types:
+            try:
+                frame = IndicatorCacheService.get_series(symbol, indicator_type, source=source)
+            except Exception as e:
+                print(f"Error calculating {indicator_type.name} for {symbol}: {e}")
+                continue
+            series[indicator_type.name] = frame.loc[start_date:end_date] if not frame.empty else frame
+        return series
+
+    @staticmethod
+    def evict(max_bytes=None):
+        """Deletes least recently used series until the cache fits in max_bytes. Returns rows removed."""
+        max_bytes = cache_max_bytes() if max_bytes is None else max_bytes
+        entries = IndicatorCache.objects.exclude(timeframe=STATE_TIMEFRAME)
+        total = entries.aggregate(total=Sum('size_bytes'))['total'] or 0
+        if total <= max_bytes:
+            return 0
+
+        doomed = []
+        for pk, size in entries.order_by(F('last_accessed').asc(nulls_first=True), 'id').values_list('id', 'size_bytes'):
+            if total <= max_bytes:
+                break
+            doomed.append(pk)
+            total -= size
+        for offset in range(0, len(doomed), 1000):
+            IndicatorCache.objects.filter(pk__in=doomed[offset:offset + 1000]).delete()
+        print(f"Indicator cache: evicted {len(doomed)} series to stay under {max_bytes} bytes.")
+        return len(doomed)
+
+    @staticmethod
+    def stats():
+        """Hit / miss counters and the cache's current size."""
+        try:
+            counters = cache.get_many([f"{STATS_PREFIX}:{stat}" for stat in STAT_NAMES])
+        except Exception:
+            counters = {}
+        stats = {stat: counters.get(f"{STATS_PREFIX}:{stat}", 0) for stat in STAT_NAMES}
+        lookups = sum(stats.values())
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+
+        entries = IndicatorCache.objects.exclude(timeframe=STATE_TIMEFRAME)
+        stats['entries'] = entries.count()
+        stats['bytes'] = entries.aggregate(total=Sum('size_bytes'))['total'] or 0
+        stats['max_bytes'] = cache_max_bytes()
+        return stats
+
+    @staticmethod
+    def reset_stats():
+        try:
+            cache.delete_many([f"{STATS_PREFIX}:{stat}" for stat in STAT_NAMES])
+        except Exception:
+            pass
@@ -12,16 +12,16 @@ class IndicatorService:
     """
     
     @staticmethod
-    def get_indicator_data(symbol: str, indicator_name: str, params: dict, start_date=None, end_date=None) -> pd.Series | pd.DataFrame:
+    def get_indicator_data(symbol: str, indicator_name: str, params: dict, start_date=None, end_date=None, ohlcv_df=None) -> pd.Series | pd.DataFrame:
         """
         Main method to get data for a specific indicator.
-        Fetches data and calls the appropriate calculation function.
+        Fetches data (unless ohlcv_df is given) and calls the appropriate calculation function.
         """
         
         # 1. Determine required data length
         # We need extra data for "warm-up" (e.g., a 200-day SMA needs 200 days of data)
         # Find the largest 'window' or 'period' in params
-        max_period = max(v for k, v in params.items() if k in ['window', 'period', 'long_window'] + [0])
+        max_period = max([v for k, v in params.items() if k in ['window', 'period', 'long_window']] + [0])
         
         # Fetch at least 2x the max period, or a default (e.g., 250 days),
         # to ensure indicators are stable.
@@ -34,11 +34,12 @@ class IndicatorService:
             
         # 2. Get OHLCV data
         # Note: Volume indicators will need a modified MarketDataService
-        ohlcv_df = MarketDataService.get_ohlcv(
-            symbol=symbol,
-            start_date=calc_start_date,
-            end_date=end_date
-        )
+        if ohlcv_df is None:
+            ohlcv_df = MarketDataService.get_ohlcv(
+                symbol=symbol,
+                start_date=calc_start_date,
+                end_date=end_date
+            )
         
         if ohlcv_df.empty:
             return pd.DataFrame() # Return empty if no price data
@@ -0,0 +1,290 @@
+import math
+
+import numpy as np
+import pandas as pd
+from django.db import connection
+
+from technical_analysis.models import IndicatorCache, IndicatorValue
+from .batch_indicator_service import BatchIndicatorService, align_right, indicator_kind
+from .price_panel import segment_fingerprints
+
+# Indicators whose value at bar t only needs the state at bar t-1
+RECURSIVE_KINDS = ('ema', 'rsi', 'macd', 'obv')
+# IndicatorCache.timeframe of the rows holding that state
+STATE_TIMEFRAME = 'state'
+# Two closes within this are the same bar (both come from ROUND(raw * factor, 2))
+CLOSE_TOLERANCE = 1e-6
+
+
+def is_recursive(indicator_name):
+    try:
+        return indicator_kind(indicator_name) in RECURSIVE_KINDS
+    except NotImplementedError:
+        return False
+
+
+def _number(value):
+    """float, or None for NaN / missing (JSON has no NaN)."""
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _ema_step(previous, value, alpha):
+    # Same form as pandas' ewm(adjust=False): (1 - a) * previous + a * value
+    return value if previous is None else (1 - alpha) * previous + alpha * value
+
+
+class IndicatorStateService:
+    """
+    Incremental EMA / RSI / MACD / OBV. The last recursive state of each
+    (symbol, indicator type) is kept in IndicatorCache (timeframe 'state'),
+    so the daily run advances it over the new bars instead of recomputing
+    from the start of history. The state records the parameters, the
+    symbol's adjustment-segment fingerprint and the last bar's date and
+    close; if any of them no longer matches (an adjusted-price rebuild moved
+    past bars, or the parameters changed) that symbol is recomputed in full.
+    """
+
+    # --- STATE FROM A FULL HISTORY (packed bars x symbols, see align_right) ---
+
+    @staticmethod
+    def states_from_history(kind, params, packed):
+        """{symbol: state} after the last bar, computed column-wise."""
+        close = packed['close']
+        if kind == 'ema':
+            states = pd.DataFrame({'ema': close.ewm(span=params.get('window', 20), adjust=False).mean().iloc[-1]})
+        elif kind == 'rsi':
+            window = params.get('window', 14)
+            delta = close.diff(1)
+            bars = close.notna()
+            gain = delta.where(delta > 0, 0).where(bars)
+            loss = (-delta.where(delta < 0, 0)).where(bars)
+            states = pd.DataFrame({
+                'avg_gain': gain.ewm(com=window - 1, adjust=False).mean().iloc[-1],
+                'avg_loss': loss.ewm(com=window - 1, adjust=False).mean().iloc[-1],
+            })
+        elif kind == 'macd':
+            short_window = params.get('short_window', 12)
+            long_window = params.get('long_window', 26)
+            macd_line = BatchIndicatorService.ema(close, short_window) - BatchIndicatorService.ema(close, long_window)
+            states = pd.DataFrame({
+                'ema_short': close.ewm(span=short_window, adjust=False).mean().iloc[-1],
+                'ema_long': close.ewm(span=long_window, adjust=False).mean().iloc[-1],
+                'signal': macd_line.ewm(span=params.get('signal_window', 9), adjust=False).mean().iloc[-1],
+                'macd_count': macd_line.notna().sum(),
+            })
+        else:
+            obv = BatchIndicatorService.obv(close, packed['volume']).iloc[-1]
+            bars = close.notna().sum()
+            states = pd.DataFrame({'obv': obv, 'cum': obv.where(bars > 1, 0)})
+
+        return {
+            symbol: {key: _number(value) for key, value in row.items()}
+            for symbol, row in states.iterrows()
+        }
+
+    # --- ONE BAR AT A TIME ---
+
+    @staticmethod
+    def advance(kind, params, state, bars, previous_close, count):
+        """
+        Moves a state over new (close, volume) bars. previous_close and
+        count describe the bar the state was taken at (None / 0 for none).
+        Returns the new state; the caller tracks the close and bar count.
+        """
+        state = dict(state)
+        for close, volume in bars:
+            count += 1
+            if kind == 'ema':
+                state['ema'] = _ema_step(state.get('ema'), close, 2.0 / (params.get('window', 20) + 1))
+            elif kind == 'rsi':
+                alpha = 1.0 / params.get('window', 14)
+                delta = 0.0 if previous_close is None else close - previous_close
+                state['avg_gain'] = _ema_step(state.get('avg_gain'), max(delta, 0.0), alpha)
+                state['avg_loss'] = _ema_step(state.get('avg_loss'), max(-delta, 0.0), alpha)
+            elif kind == 'macd':
+                short_window = params.get('short_window', 12)
+                long_window = params.get('long_window', 26)
+                state['ema_short'] = _ema_step(state.get('ema_short'), close, 2.0 / (short_window + 1))
+                state['ema_long'] = _ema_step(state.get('ema_long'), close, 2.0 / (long_window + 1))
+                if count >= short_window and count >= long_window:
+                    macd = state['ema_short'] - state['ema_long']
+                    state['signal'] = _ema_step(state.get('signal'), macd, 2.0 / (params.get('signal_window', 9) + 1))
+                    state['macd_count'] = (state.get('macd_count') or 0) + 1
+            else:
+                if previous_close is None:
+                    state['cum'], state['obv'] = 0.0, volume
+                else:
+                    state['cum'] = state.get('cum', 0.0) + volume * float(np.sign(close - previous_close))
+                    state['obv'] = state['cum']
+            previous_close = close
+        return state
+
+    @staticmethod
+    def output(kind, params, state, count):
+        """The indicator value at the state's bar: a float, a dict (MACD) or None."""
+        if kind == 'ema':
+            return state.get('ema') if count >= params.get('window', 20) else None
+        if kind == 'rsi':
+            if count < params.get('window', 14):
+                return None
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rs = np.float64(state['avg_gain']) / np.float64(state['avg_loss'])
+                return _number(100.0 - (100.0 / (1.0 + rs)))
+        if kind == 'macd':
+            if count < params.get('short_window', 12) or count < params.get('long_window', 26):
+                return None
+            macd = state['ema_short'] - state['ema_long']
+            signal = state.get('signal') if (state.get('macd_count') or 0) >= params.get('signal_window', 9) else None
+            return {'macd': macd, 'signal': signal, 'histogram': None if signal is None else macd - signal}
+        return state.get('obv') if count else None
+
+    # --- PERSISTENCE ---
+
+    @staticmethod
+    def load_states(symbols, indicator_types):
+        """{(symbol, indicator_type_id): stored data} for the 'state' rows."""
+        rows = IndicatorCache.objects.filter(
+            symbol__in=list(symbols), indicator_type__in=list(indicator_types), timeframe=STATE_TIMEFRAME
+        ).values_list('symbol', 'indicator_type_id', 'data')
+        return {(symbol, type_id): data for symbol, type_id, data in rows}
+
+    @staticmethod
+    def save_states(objs):
+        unique_fields = None
+        if connection.features.supports_update_conflicts_with_target:
+            unique_fields = ['symbol', 'indicator_type', 'timeframe', 'params_key']
+        IndicatorCache.objects.bulk_create(
+            objs,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['data', 'last_updated'],
+        )
+
+    @staticmethod
+    def _record(symbol, indicator_type, params, fingerprint, business_date, close, count, state):
+        return IndicatorCache(
+            symbol=symbol, indicator_type=indicator_type, timeframe=STATE_TIMEFRAME,
+            data={
+                'params': params,
+                'segments': fingerprint,
+                'last_date': business_date.isoformat(),
+                'last_close': close,
+                'bars': int(count),
+                'state': state,
+            },
+        )
+
+    @staticmethod
+    def _value(symbol, indicator_type, params, business_date, value):
+        if isinstance(value, dict):
+            if all(v is None for v in value.values()):
+                return None
+            return IndicatorValue(
+                symbol=symbol, indicator_type=indicator_type, business_date=business_date,
+                value=None, value_json={k: _number(v) for k, v in value.items()}, parameters=params,
+            )
+        value = _number(value)
+        if value is None:
+            return None
+        return IndicatorValue(
+            symbol=symbol, indicator_type=indicator_type, business_date=business_date,
+            value=round(value, 6), value_json=None, parameters=params,
+        )
+
+    # --- DAILY RUN ---
+
+    @staticmethod
+    def calculate_and_store_all(symbols, indicator_types, end_date=None, full=False):
+        """
+        Brings the recursive indicators of every symbol up to end_date,
+        stepping stored states forward and recomputing only the symbols
+        whose state is missing or inconsistent (all of them when full=True).
+        Returns {indicator name: rows written}.
+        """
+        symbols = sorted(set(symbols))
+        indicator_types = list(indicator_types)
+        fingerprints = segment_fingerprints()
+        stored = {} if full else IndicatorStateService.load_states(symbols, indicator_types)
+
+        # Which (symbol, type) pairs can step forward from their stored state
+        candidates = {}
+        for (symbol, type_id), data in stored.items():
+            indicator_type = next(t for t in indicator_types if t.id == type_id)
+            if data.get('params') != (indicator_type.default_parameters or {}):
+                continue
+            if data.get('segments') != fingerprints.get(symbol):
+                continue
+            candidates[(symbol, type_id)] = data
+
+        values, states = {t.name: [] for t in indicator_types}, []
+        stepped = set()
+        if candidates:
+            start = min(data['last_date'] for data in candidates.values())
+            frames = BatchIndicatorService.load_universe({s for s, _ in candidates}, end_date, start_date=start)
+            close, volume = frames['close'], frames['volume']
+            for indicator_type in indicator_types:
+                kind = indicator_kind(indicator_type.name)
+                params = indicator_type.default_parameters or {}
+                for symbol in close.columns:
+                    data = candidates.get((symbol, indicator_type.id))
+                    if data is None:
+                        continue
+                    series = close[symbol].dropna()
+                    last_date = pd.Timestamp(data['last_date'])
+                    # The bar the state was taken at must still be there, unchanged
+                    if last_date not in series.index or abs(series[last_date] - data['last_close']) > CLOSE_TOLERANCE:
+                        continue
+                    new = series[series.index > last_date]
+                    bars = list(zip(new.tolist(), volume[symbol].reindex(new.index).fillna(0).tolist()))
+                    count = data['bars'] + len(bars)
+                    state = IndicatorStateService.advance(kind, params, data['state'], bars, data['last_close'], data['bars'])
+                    business_date = (new.index[-1] if len(new) else last_date).date()
+                    last_close = new.iloc[-1] if len(new) else data['last_close']
+
+                    states.append(IndicatorStateService._record(
+                        symbol, indicator_type, params, fingerprints.get(symbol), business_date, last_close, count, state
+                    ))
+                    obj = IndicatorStateService._value(
+                        symbol, indicator_type, params, business_date, IndicatorStateService.output(kind, params, state, count)
+                    )
+                    if obj is not None:
+                        values[indicator_type.name].append(obj)
+                    stepped.add((symbol, indicator_type.id))
+
+        # Everything else is recomputed from its full history
+        pending = {s for s in symbols for t in indicator_types if (s, t.id) not in stepped}
+        if pending:
+            frames = BatchIndicatorService.load_universe(pending, end_date)
+            packed, last_dates = align_right(frames)
+            counts = packed['close'].notna().sum()
+            last_closes = packed['close'].iloc[-1] if len(packed['close']) else pd.Series(dtype=float)
+            for indicator_type in indicator_types:
+                kind = indicator_kind(indicator_type.name)
+                params = indicator_type.default_parameters or {}
+                todo = [s for s in last_dates.index if (s, indicator_type.id) not in stepped and last_dates[s] is not None]
+                if not todo:
+                    continue
+                full_states = IndicatorStateService.states_from_history(kind, params, packed)
+                for symbol in todo:
+                    state, count = full_states[symbol], int(counts[symbol])
+                    states.append(IndicatorStateService._record(
+                        symbol, indicator_type, params, fingerprints.get(symbol), last_dates[symbol],
+                        float(last_closes[symbol]), count, state,
+                    ))
+                    obj = IndicatorStateService._value(
+                        symbol, indicator_type, params, last_dates[symbol], IndicatorStateService.output(kind, params, state, count)
+                    )
+                    if obj is not None:
+                        values[indicator_type.name].append(obj)
+
+        written = {name: BatchIndicatorService.upsert(objs) for name, objs in values.items()}
+        IndicatorStateService.save_states(states)
+        print(
+            f"Indicator states: {len(stepped)} stepped forward, "
+            f"{len(states) - len(stepped)} recomputed from full history."
+        )
+        return written
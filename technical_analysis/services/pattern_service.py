@@ -0,0 +1,188 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.db.models import Max, Q
+
+from nepse_data.models import StockPrices
+from technical_analysis.models import ChartPattern
+from .batch_indicator_service import BatchIndicatorService, align_right, day_numbers
+
+# pattern_type: (sentiment, bars in the pattern, base confidence)
+CANDLESTICK_PATTERNS = {
+    'DOJI': ('NEUTRAL', 1, 50),
+    'HAMMER': ('BULLISH', 1, 60),
+    'SHOOTING_STAR': ('BEARISH', 1, 60),
+    'ENGULFING_BULL': ('BULLISH', 2, 65),
+    'ENGULFING_BEAR': ('BEARISH', 2, 65),
+    'MORNING_STAR': ('BULLISH', 3, 70),
+    'EVENING_STAR': ('BEARISH', 3, 70),
+}
+# Added to the confidence when the pattern bar traded above its 20-bar average volume
+VOLUME_BONUS = 10
+# History an incremental run loads (average volume and trend need ~25 bars before the newest)
+INCREMENTAL_CALENDAR_DAYS = 120
+INSERT_BATCH_SIZE = 2000
+
+
+def _shift(values, n):
+    """values (as floats) moved n rows down, so row t holds row t - n; NaN-padded."""
+    values = np.asarray(values, dtype=np.float64)
+    shifted = np.full_like(values, np.nan)
+    shifted[n:] = values[:-n]
+    return shifted
+
+
+class CandlestickPatternService:
+    """
+    Detects the ChartPattern candlestick types on every bar of every symbol
+    at once. The OHLC matrices are packed by align_right, so row t - 1 of a
+    column is that symbol's previous bar; each rule is a boolean expression
+    over whole (bars x symbols) arrays.
+
+    A pattern is completed by the symbol's next bar, which confirms it when
+    it closes beyond the pattern bar (above its high for bullish patterns,
+    below its low for bearish ones).
+    """
+
+    @staticmethod
+    def detect(packed):
+        """{pattern_type: (bars x symbols) boolean matrix of the bars completing that pattern}."""
+        o, h, l, c = (packed[field].to_numpy(dtype=np.float64) for field in ('open', 'high', 'low', 'close'))
+        body = np.abs(c - o)
+        rng = h - l
+        upper = h - np.maximum(o, c)
+        lower = np.minimum(o, c) - l
+        bull = c > o
+        bear = c < o
+
+        o1, c1, body1, bull1, bear1 = _shift(o, 1), _shift(c, 1), _shift(body, 1), _shift(bull, 1), _shift(bear, 1)
+        o2, c2, body2, rng2, bull2, bear2 = (
+            _shift(o, 2), _shift(c, 2), _shift(body, 2), _shift(rng, 2), _shift(bull, 2), _shift(bear, 2)
+        )
+        # Trend into the pattern: the previous close against the close five bars before it
+        downtrend = c1 < _shift(c, 6)
+        uptrend = c1 > _shift(c, 6)
+
+        with np.errstate(invalid='ignore'):
+            small_body1 = body1 <= 0.3 * body2
+            long_body2 = body2 >= 0.6 * rng2
+            matrices = {
+                'DOJI': (rng > 0) & (body <= 0.1 * rng),
+                'HAMMER': (body > 0) & (lower >= 2 * body) & (upper <= 0.5 * body) & downtrend,
+                'SHOOTING_STAR': (body > 0) & (upper >= 2 * body) & (lower <= 0.5 * body) & uptrend,
+                'ENGULFING_BULL': (bear1 == 1) & bull & (o <= c1) & (c >= o1) & (body > body1),
+                'ENGULFING_BEAR': (bull1 == 1) & bear & (o >= c1) & (c <= o1) & (body > body1),
+                'MORNING_STAR': (
+                    (bear2 == 1) & long_body2 & small_body1 & (np.maximum(o1, c1) <= c2)
+                    & bull & (c > (o2 + c2) / 2)
+                ),
+                'EVENING_STAR': (
+                    (bull2 == 1) & long_body2 & small_body1 & (np.minimum(o1, c1) >= c2)
+                    & bear & (c < (o2 + c2) / 2)
+                ),
+            }
+        return matrices
+
+    @staticmethod
+    def patterns(packed, first_row=0):
+        """Unsaved ChartPattern rows for the detections on packed rows >= first_row."""
+        o, h, l, c = (packed[field].to_numpy(dtype=np.float64) for field in ('open', 'high', 'low', 'close'))
+        volume = packed['volume']
+        day = packed['day'].to_numpy()
+        columns = packed['close'].columns
+        with np.errstate(invalid='ignore'):
+            busy = (volume > volume.rolling(window=20, min_periods=20).mean()).to_numpy()
+        next_close, next_day = _shift(c[::-1], 1)[::-1], _shift(day[::-1], 1)[::-1]
+        dates = {}
+
+        def as_date(value):
+            if value not in dates:
+                dates[value] = (pd.Timestamp(0) + pd.Timedelta(days=int(value))).date()
+            return dates[value]
+
+        objs = []
+        for pattern_type, matrix in CandlestickPatternService.detect(packed).items():
+            sentiment, bars, confidence = CANDLESTICK_PATTERNS[pattern_type]
+            matrix[:first_row] = False
+            rows, cols = np.nonzero(matrix)
+            start_rows = rows - (bars - 1)
+            if sentiment == 'BULLISH':
+                confirmed = next_close[rows, cols] > h[rows, cols]
+            elif sentiment == 'BEARISH':
+                confirmed = next_close[rows, cols] < l[rows, cols]
+            else:
+                confirmed = np.zeros(len(rows), dtype=bool)
+            completed = ~np.isnan(next_close[rows, cols])
+
+            for row, col, start_row, ok, done in zip(rows, cols, start_rows, confirmed, completed):
+                objs.append(ChartPattern(
+                    symbol=columns[col],
+                    pattern_type=pattern_type,
+                    sentiment=sentiment,
+                    detected_date=as_date(day[row, col]),
+                    start_date=as_date(day[start_row, col]),
+                    end_date=as_date(day[row, col]),
+                    confidence=Decimal(confidence + (VOLUME_BONUS if busy[row, col] else 0)),
+                    pattern_data={
+                        'bars': bars,
+                        'open': round(float(o[row, col]), 2),
+                        'high': round(float(h[row, col]), 2),
+                        'low': round(float(l[row, col]), 2),
+                        'close': round(float(c[row, col]), 2),
+                        'volume_confirmed': bool(busy[row, col]),
+                    },
+                    is_completed=bool(done),
+                    breakout_confirmed=bool(ok),
+                    breakout_date=as_date(next_day[row, col]) if ok else None,
+                ))
+        return objs
+
+    @staticmethod
+    def detect_and_store(symbols, end_date=None, bars=5, full=False):
+        """
+        Replaces the candlestick patterns of each symbol's newest `bars` bars
+        (its whole history when full=True) with a fresh detection, in bulk.
+        Re-running over the same bars is harmless. Returns rows inserted.
+        """
+        symbols = sorted(set(symbols))
+        start_date = None
+        if not full:
+            end = end_date or StockPrices.objects.filter(symbol__in=symbols).aggregate(
+                last=Max('business_date')
+            )['last']
+            if end is None:
+                return 0
+            start_date = end - timedelta(days=INCREMENTAL_CALENDAR_DAYS)
+        frames = BatchIndicatorService.load_universe(symbols, end_date, start_date=start_date)
+        frames['day'] = day_numbers(frames['close'])
+        packed, last_dates = align_right(frames)
+        day = packed['day'].to_numpy()
+
+        if full:
+            first_row = 0
+            stale = Q(symbol__in=symbols)
+        else:
+            # The last `bars` packed rows are each symbol's newest bars; one
+            # more row so yesterday's pattern is completed by today's bar
+            first_row = max(len(day) - bars - 1, 0)
+            cutoffs = {}
+            for col, symbol in enumerate(packed['close'].columns):
+                first = day[first_row:, col]
+                first = first[~np.isnan(first)]
+                if len(first):
+                    cutoffs.setdefault(first[0], []).append(symbol)
+            stale = Q(pk__in=[])
+            for first_day, group in cutoffs.items():
+                since = (pd.Timestamp(0) + pd.Timedelta(days=int(first_day))).date()
+                stale |= Q(symbol__in=group, detected_date__gte=since)
+
+        objs = CandlestickPatternService.patterns(packed, first_row)
+        ChartPattern.objects.filter(stale, pattern_type__in=list(CANDLESTICK_PATTERNS)).delete()
+        ChartPattern.objects.bulk_create(objs, batch_size=INSERT_BATCH_SIZE)
+        print(
+            f"Candlestick patterns: {len(objs)} detected over {int((last_dates.notna()).sum())} symbols "
+            f"({'full history' if full else f'last {bars} bars'})."
+        )
+        return len(objs)
@@ -0,0 +1,478 @@
+# technical_analysis/services/price_panel.py
+"""
+Memory-mapped price panel.
+
+Adjusted OHLCV for every symbol is kept as aligned (dates x symbols)
+float64 arrays in .npy files under PRICE_PANEL_DIR. Loading them with
+np.load(mmap_mode='r') costs nothing until a slice is touched, and the OS
+page cache is shared by every web worker and Celery process, so a symbol's
+history or one day's cross-section comes back without a DB round trip.
+Days a symbol did not trade are NaN.
+
+Each build is written to its own version directory and published by
+rewriting the CURRENT file, so readers never see a half-written panel.
+update_panel() only reads what changed since the last build from MySQL:
+new trading dates, plus the full history of symbols whose adjustment
+segments changed or that got rows on dates the panel already has. Anything
+else (a trading date deleted or inserted in the middle) forces a full build.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import date, datetime
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from adjustments_stock_price.models import AdjustmentFactorSegment
+from adjustments_stock_price.segments import adjusted_column, segment_join, segments_stamp
+from nepse_data.exports import stream_query
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+PRICE_COLUMNS = {
+    'open': 'open_price',
+    'high': 'high_price',
+    'low': 'low_price',
+    'close': 'close_price',
+}
+CURRENT_FILE = 'CURRENT'
+META_FILE = 'meta.json'
+FETCH_CHUNK = 20000
+KEEP_VERSIONS = 2  # the current build and the one before it
+
+
+class PricePanelError(Exception):
+    pass
+
+
+def panel_dir():
+    return getattr(settings, 'PRICE_PANEL_DIR', os.path.join(settings.BASE_DIR, 'data', 'price_panel'))
+
+
+def panel_enabled():
+    return getattr(settings, 'PRICE_PANEL_ENABLED', True)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+# ==================================
+# --- READING ---
+# ==================================
+
+class PricePanel:
+    """One published panel version. The OHLCV arrays are opened lazily as read-only memmaps."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.version = meta['version']
+        self.dates = np.load(os.path.join(path, 'dates.npy'))
+        self.symbols = [str(s) for s in np.load(os.path.join(path, 'symbols.npy'))]
+        self.columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._arrays = {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def last_date(self):
+        return self.dates[-1].astype(object) if len(self.dates) else None
+
+    def array(self, field):
+        """The (dates x symbols) memmap for one of FIELDS."""
+        if field not in FIELDS:
+            raise PricePanelError(f"Unknown price panel field: {field}")
+        arr = self._arrays.get(field)
+        if arr is None:
+            arr = self._arrays[field] = np.load(os.path.join(self.path, f"{field}.npy"), mmap_mode='r')
+        return arr
+
+    def date_slice(self, start_date=None, end_date=None):
+        """Row slice covering [start_date, end_date]."""
+        start = np.searchsorted(self.dates, np.datetime64(start_date, 'D')) if start_date else 0
+        stop = np.searchsorted(self.dates, np.datetime64(end_date, 'D'), side='right') if end_date else len(self.dates)
+        return slice(int(start), int(stop))
+
+    def is_current(self, calendar):
+        """Whether the panel holds exactly the trading dates of the (prices) calendar."""
+        return len(self.dates) == len(calendar) and self.last_date == calendar.latest
+
+    def symbol_frame(self, symbol, start_date=None, end_date=None):
+        """
+        OHLCV DataFrame for one symbol, indexed by business_date (the shape
+        MarketDataService.get_ohlcv returns). Empty if the symbol is unknown.
+        """
+        col = self.columns.get(symbol)
+        if col is None:
+            return pd.DataFrame()
+        rows = self.date_slice(start_date, end_date)
+        df = pd.DataFrame(
+            {field: np.array(self.array(field)[rows, col]) for field in FIELDS},
+            index=pd.DatetimeIndex(self.dates[rows], name='business_date'),
+        )
+        df = df[df['close'].notna()]
+        df['volume'] = df['volume'].fillna(0)
+        return df
+
+    def cross_section(self, day, fields=FIELDS):
+        """One trading day for every symbol that traded, indexed by symbol."""
+        i = np.searchsorted(self.dates, np.datetime64(day, 'D'))
+        if i >= len(self.dates) or self.dates[i] != np.datetime64(day, 'D'):
+            return pd.DataFrame(columns=list(fields))
+        df = pd.DataFrame(
+            {field: np.array(self.array(field)[i]) for field in fields},
+            index=pd.Index(self.symbols, name='symbol'),
+        )
+        return df[df[fields[0]].notna()]
+
+    def window(self, field='close', symbols=None, start_date=None, end_date=None):
+        """A dates x symbols DataFrame of one field (all symbols unless given)."""
+        rows = self.date_slice(start_date, end_date)
+        if symbols is None:
+            symbols = self.symbols
+            values = self.array(field)[rows]
+        else:
+            symbols = [s for s in symbols if s in self.columns]
+            values = self.array(field)[rows][:, [self.columns[s] for s in symbols]]
+        return pd.DataFrame(
+            np.array(values),
+            index=pd.DatetimeIndex(self.dates[rows], name='business_date'),
+            columns=pd.Index(symbols, name='symbol'),
+        )
+
+
+_loaded = {}  # base dir -> PricePanel
+_lock = threading.Lock()
+
+
+def _current_version(base):
+    try:
+        with open(os.path.join(base, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_panel():
+    """The published PricePanel (None if none has been built). Reopened only when CURRENT changes."""
+    base = panel_dir()
+    version = _current_version(base)
+    if version is None:
+        return None
+    panel = _loaded.get(base)
+    if panel is not None and panel.version == version:
+        return panel
+    with _lock:
+        panel = _loaded.get(base)
+        if panel is None or panel.version != version:
+            path = os.path.join(base, version)
+            with open(os.path.join(path, META_FILE)) as f:
+                panel = PricePanel(path, json.load(f))
+            _loaded[base] = panel
+        return panel
+
+
+_segments_checked = {}  # base dir -> (panel version, segments stamp, whether the segments match)
+
+
+def segments_match(panel):
+    """
+    Whether the adjustment segments are still the ones the panel was built
+    from. The fingerprints are only recomputed when segments_stamp() moves,
+    so a current panel costs a cache read here, not a query.
+    """
+    base = os.path.dirname(panel.path)
+    stamp = segments_stamp()
+    checked = _segments_checked.get(base)
+    if checked is not None and checked[:2] == (panel.version, stamp):
+        return checked[2]
+    ok = segment_fingerprints() == panel.meta.get('segments', {})
+    _segments_checked[base] = (panel.version, stamp, ok)
+    return ok
+
+
+def current_panel():
+    """
+    The panel if it is enabled, matches the price calendar (no trading
+    date added or deleted since it was built) and was built from the
+    current adjustment segments, otherwise None.
+    """
+    if not panel_enabled():
+        return None
+    try:
+        panel = load_panel()
+    except (OSError, ValueError) as e:
+        print(f"Price panel unreadable ({e}); falling back to the DB.")
+        return None
+    if panel is None:
+        return None
+    from nepse_data.trading_calendar import price_calendar
+    if not panel.is_current(price_calendar()) or not segments_match(panel):
+        return None
+    return panel
+
+
+# ==================================
+# --- BUILDING ---
+# ==================================
+
+def _rows_sql(where, params):
+    """Adjusted OHLCV rows (symbol, date, o, h, l, c, volume) from the segment range join."""
+    selects = ', '.join(adjusted_column(column) for column in PRICE_COLUMNS.values())
+    sql = f"""
+        SELECT p.symbol, p.business_date, {selects}, p.total_traded_quantity
+        FROM stock_prices p
+        {segment_join()}
+        WHERE {' AND '.join(where) if where else '1 = 1'}
+        ORDER BY p.id
+    """
+    return sql, params
+
+
+def _fetch_scalar_list(sql, params=()):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _max_price_id():
+    ids = _fetch_scalar_list("SELECT MAX(id) FROM stock_prices")
+    return ids[0] or 0
+
+
+def segment_fingerprints(symbols=None):
+    """symbol -> hash of its adjustment factor segments (a change means its history moved)."""
+    by_symbol = {}
+    segments = AdjustmentFactorSegment.objects.order_by('symbol', 'valid_from')
+    if symbols is not None:
+        segments = segments.filter(symbol__in=list(symbols))
+    segments = segments.values_list('symbol', 'valid_from', 'valid_to', 'cumulative_factor')
+    for symbol, valid_from, valid_to, factor in segments:
+        by_symbol.setdefault(symbol, []).append(f"{valid_from}|{valid_to}|{factor}")
+    return {symbol: hashlib.md5(';'.join(parts).encode()).hexdigest() for symbol, parts in by_symbol.items()}
+
+
+def _fill(arrays, rows, row_index, col_index):
+    """Scatters (symbol, date, o, h, l, c, volume) rows into the arrays, a chunk at a time."""
+    rows = iter(rows)
+    filled = 0
+    while True:
+        chunk = list(islice(rows, FETCH_CHUNK))
+        if not chunk:
+            return filled
+        r = np.fromiter((row_index[_as_date(row[1])] for row in chunk), dtype=np.intp, count=len(chunk))
+        c = np.fromiter((col_index[row[0]] for row in chunk), dtype=np.intp, count=len(chunk))
+        values = np.array([row[2:] for row in chunk], dtype=np.float64)  # Decimal / None -> float / NaN
+        # Rows come in id order; of two rows for one (symbol, date) the newest wins, like the DB fallback
+        _, last = np.unique((r * len(col_index) + c)[::-1], return_index=True)
+        if len(last) < len(chunk):
+            keep = len(chunk) - 1 - last
+            r, c, values = r[keep], c[keep], values[keep]
+        for k, field in enumerate(FIELDS):
+            arrays[field][r, c] = values[:, k]
+        filled += len(chunk)
+
+
+def _new_arrays(path, n_dates, n_symbols):
+    return {
+        field: np.lib.format.open_memmap(
+            os.path.join(path, f"{field}.npy"), mode='w+', dtype=np.float64, shape=(n_dates, n_symbols)
+        )
+        for field in FIELDS
+    }
+
+
+def _publish(base, tmp_path, version, dates, symbols, arrays, meta):
+    """Finishes a build in tmp_path, moves it to base/version and points CURRENT at it."""
+    for arr in arrays.values():
+        arr.flush()
+    arrays.clear()
+    np.save(os.path.join(tmp_path, 'dates.npy'), np.array(dates, dtype='datetime64[D]'))
+    np.save(os.path.join(tmp_path, 'symbols.npy'), np.array(symbols, dtype=str))
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    os.rename(tmp_path, os.path.join(base, version))
+    pointer = os.path.join(base, f".{CURRENT_FILE}.{uuid.uuid4().hex}")
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(base, CURRENT_FILE))
+    _prune(base, version)
+
+
+def _prune(base, current):
+    versions = sorted(
+        name for name in os.listdir(base)
+        if name.startswith('v') and os.path.isdir(os.path.join(base, name))
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name == current:
+            continue
+        # Processes that still have the old files mapped keep them on POSIX;
+        # on Windows the delete fails and is retried after the next build
+        shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+
+
+def _start_build(base):
+    os.makedirs(base, exist_ok=True)
+    version = f"v{timezone.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:6]}"
+    tmp_path = os.path.join(base, f".build-{version}")
+    os.makedirs(tmp_path)
+    return version, tmp_path
+
+
+def build_panel():
+    """Writes a full panel from stock_prices x adjustment_factor_segments. Returns its meta."""
+    base = panel_dir()
+    version, tmp_path = _start_build(base)
+    try:
+        max_id = _max_price_id()
+        dates = [_as_date(d) for d in _fetch_scalar_list(
+            "SELECT DISTINCT business_date FROM stock_prices WHERE id <= %s ORDER BY business_date", [max_id]
+        )]
+        symbols = sorted(_fetch_scalar_list("SELECT DISTINCT symbol FROM stock_prices WHERE id <= %s", [max_id]))
+        fingerprints = segment_fingerprints()
+
+        arrays = _new_arrays(tmp_path, len(dates), len(symbols))
+        for arr in arrays.values():
+            arr[:] = np.nan
+        sql, params = _rows_sql(["p.id <= %s"], [max_id])
+        _, rows = stream_query(sql, params, chunk_size=FETCH_CHUNK)
+        filled = _fill(arrays, rows, {d: i for i, d in enumerate(dates)}, {s: i for i, s in enumerate(symbols)})
+
+        meta = {
+            'version': version,
+            'built_at': timezone.now().isoformat(),
+            'mode': 'full',
+            'dates': len(dates),
+            'symbols': len(symbols),
+            'rows_read': filled,
+            'max_price_id': max_id,
+            'segments': fingerprints,
+        }
+        _publish(base, tmp_path, version, dates, symbols, arrays, meta)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    print(f"Price panel {version}: full build, {len(dates)} dates x {len(symbols)} symbols ({filled} rows).")
+    return meta
+
+
+def update_panel(full=False):
+    """
+    Brings the panel up to date with stock_prices, reading only what changed
+    (see the module docstring). Returns the new meta, or the current one if
+    nothing changed.
+    """
+    panel = None if full else load_panel()
+    if panel is None:
+        return build_panel()
+
+    max_id = _max_price_id()
+    old_dates = [d.astype(object) for d in panel.dates]
+    last_date = old_dates[-1] if old_dates else date.min
+    db_dates = [_as_date(d) for d in _fetch_scalar_list(
+        "SELECT DISTINCT business_date FROM stock_prices WHERE id <= %s ORDER BY business_date", [max_id]
+    )]
+    if db_dates[:len(old_dates)] != old_dates:
+        print("Price panel: trading dates changed inside the panel; rebuilding in full.")
+        return build_panel()
+    new_dates = db_dates[len(old_dates):]
+
+    # Symbols whose whole history has to be re-read
+    fingerprints = segment_fingerprints()
+    old_fingerprints = panel.meta.get('segments', {})
+    stale = {s for s in set(fingerprints) | set(old_fingerprints) if fingerprints.get(s) != old_fingerprints.get(s)}
+    stale.update(_fetch_scalar_list(
+        "SELECT DISTINCT symbol FROM stock_prices WHERE id > %s AND id <= %s AND business_date <= %s",
+        [panel.meta.get('max_price_id', 0), max_id, last_date],
+    ))
+
+    if not new_dates and not stale:
+        print(f"Price panel {panel.version} is up to date.")
+        return panel.meta
+
+    sql, params = _rows_sql(["p.business_date > %s", "p.id <= %s"], [last_date, max_id])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        new_rows = cursor.fetchall()
+    stale_rows = []
+    if stale:
+        placeholders = ', '.join(['%s'] * len(stale))
+        sql, params = _rows_sql([f"p.symbol IN ({placeholders})", "p.business_date <= %s"], [*sorted(stale), last_date])
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            stale_rows = cursor.fetchall()
+
+    symbols = sorted(set(panel.symbols) | {row[0] for row in new_rows} | {row[0] for row in stale_rows})
+    col_index = {s: i for i, s in enumerate(symbols)}
+    dates = old_dates + new_dates
+    old_cols = np.array([col_index[s] for s in panel.symbols], dtype=np.intp)
+    stale_cols = np.array(sorted(col_index[s] for s in stale if s in col_index), dtype=np.intp)
+
+    base = panel_dir()
+    version, tmp_path = _start_build(base)
+    try:
+        arrays = _new_arrays(tmp_path, len(dates), len(symbols))
+        for field, arr in arrays.items():
+            arr[:] = np.nan
+            # Copy the old block over in row bands to keep memory flat
+            old = panel.array(field)
+            for start in range(0, len(old_dates), 1000):
+                band = slice(start, min(start + 1000, len(old_dates)))
+                arr[band, old_cols] = old[band]
+            if len(stale_cols):
+                arr[:, stale_cols] = np.nan
+        row_index = {d: i for i, d in enumerate(dates)}
+        filled = _fill(arrays, new_rows, row_index, col_index) + _fill(arrays, stale_rows, row_index, col_index)
+
+        meta = {
+            'version': version,
+            'built_at': timezone.now().isoformat(),
+            'mode': 'incremental',
+            'dates': len(dates),
+            'symbols': len(symbols),
+            'rows_read': filled,
+            'max_price_id': max_id,
+            'segments': fingerprints,
+            'previous': panel.version,
+        }
+        _publish(base, tmp_path, version, dates, symbols, arrays, meta)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    print(
+        f"Price panel {version}: {len(new_dates)} new dates, {len(stale)} symbols re-read, "
+        f"{len(symbols) - len(panel.symbols)} new symbols."
+    )
+    return meta
+
+
+def refresh_panel():
+    """
+    update_panel() for the post-ingest hooks: a no-op when the panel is
+    disabled, and a failed update is reported rather than raised (readers
+    fall back to the DB until the next one succeeds).
+    """
+    if not panel_enabled():
+        return None
+    try:
+        return update_panel()
+    except Exception as e:
+        print(f"!!! --- ERROR updating the price panel: {e} --- !!!")
+        return None
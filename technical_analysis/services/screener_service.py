@@ -0,0 +1,286 @@
+import hashlib
+import json
+import operator
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from django.db import connection
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from technical_analysis.models import ScreenerSnapshot, TechnicalScan
+from .batch_indicator_service import BatchIndicatorService, align_right
+
+# Numeric snapshot columns a filter can use, and their decimal places
+FILTER_FIELDS = {
+    'close': 2, 'prev_close': 2, 'change_percent': 2, 'volume': 0, 'avg_volume_20': 2, 'volume_ratio': 2,
+    'rsi_14': 6, 'sma_20': 6, 'sma_50': 6, 'sma_200': 6, 'ema_20': 6,
+    'macd': 6, 'macd_signal': 6, 'macd_histogram': 6, 'bb_upper': 6, 'bb_lower': 6,
+    'high_52w': 2, 'low_52w': 2, 'pct_from_52w_high': 2, 'pct_from_52w_low': 2,
+}
+OPERATORS = {
+    'gt': operator.gt, 'gte': operator.ge, 'lt': operator.lt, 'lte': operator.le, 'eq': operator.eq,
+}
+SNAPSHOT_DAYS_52W = 365
+
+# Process-local copy of the snapshot table for the NumPy engine: {'version', 'frame'}
+_SNAPSHOT_FRAME = {}
+
+
+def _quantize(value, places):
+    if value is None or pd.isna(value):
+        return None
+    if places == 0:
+        return int(round(float(value)))
+    return Decimal(repr(float(value))).quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+
+
+def criteria_key(criteria):
+    return hashlib.md5(json.dumps(criteria or {}, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def parse_criteria(criteria):
+    """
+    Validates scan criteria and returns ([(field, op, value or other field)], symbols).
+
+    criteria is a dict of "<field>__<op>": value pairs, op one of gt, gte,
+    lt, lte, eq. A string value names another field ({"close__gt":
+    "sma_50"}). The optional "symbols" key limits the scan to a list.
+    """
+    conditions, symbols = [], None
+    for key, value in (criteria or {}).items():
+        if key == 'symbols':
+            symbols = [str(s).upper() for s in value]
+            continue
+        field, _, op = key.rpartition('__')
+        if field not in FILTER_FIELDS or op not in OPERATORS:
+            raise ValueError(f"Unknown screener filter '{key}'")
+        if isinstance(value, str):
+            if value not in FILTER_FIELDS:
+                try:
+                    value = float(value)
+                except ValueError:
+                    raise ValueError(f"Unknown screener field '{value}' in filter '{key}'")
+        elif value is None or isinstance(value, bool) or not isinstance(value, (int, float, Decimal)):
+            raise ValueError(f"Filter '{key}' needs a number or a field name")
+        conditions.append((field, op, value))
+    return conditions, symbols
+
+
+def snapshot_version():
+    """Changes whenever the snapshot table is refreshed."""
+    stats = ScreenerSnapshot.objects.aggregate(updated=Max('updated_at'), rows=Count('id'))
+    updated = stats['updated'].isoformat() if stats['updated'] else ''
+    return f"{updated}|{stats['rows']}"
+
+
+class ScreenerService:
+    """
+    Stock screener over ScreenerSnapshot, the one-row-per-symbol table of
+    latest prices and indicator values refreshed by calculate_indicators.
+    A scan's criteria compile either to one SQL query on the indexed
+    snapshot columns or to a NumPy mask over an in-memory copy of the
+    table; saved TechnicalScan results are cached until the snapshot
+    changes.
+    """
+
+    # --- SNAPSHOT ---
+
+    @staticmethod
+    def snapshot_rows(symbols, end_date=None):
+        """Unsaved ScreenerSnapshot rows for every symbol with a bar up to end_date."""
+        frames = BatchIndicatorService.load_universe(symbols, end_date)
+        packed, last_dates = align_right(frames)
+        close, volume = packed['close'], packed['volume']
+        if not len(close):
+            return []
+
+        prev_close = close.iloc[-2] if len(close) > 1 else close.iloc[-1] * np.nan
+        avg_volume = volume.rolling(window=20, min_periods=20).mean()
+        macd = BatchIndicatorService.macd(close)
+        bands = BatchIndicatorService.bollinger_bands(close)
+        columns = {
+            'close': close.iloc[-1],
+            'prev_close': prev_close,
+            'change_percent': (close.iloc[-1] / prev_close - 1.0) * 100.0,
+            'volume': volume.iloc[-1],
+            'avg_volume_20': avg_volume.iloc[-1],
+            'volume_ratio': volume.iloc[-1] / avg_volume.iloc[-1],
+            'rsi_14': BatchIndicatorService.rsi(close, 14).iloc[-1],
+            'sma_20': BatchIndicatorService.sma(close, 20).iloc[-1],
+            'sma_50': BatchIndicatorService.sma(close, 50).iloc[-1],
+            'sma_200': BatchIndicatorService.sma(close, 200).iloc[-1],
+            'ema_20': BatchIndicatorService.ema(close, 20).iloc[-1],
+            'macd': macd['macd'].iloc[-1],
+            'macd_signal': macd['signal'].iloc[-1],
+            'macd_histogram': macd['histogram'].iloc[-1],
+            'bb_upper': bands['bb_upper'].iloc[-1],
+            'bb_lower': bands['bb_lower'].iloc[-1],
+        }
+
+        # 52 weeks back from each symbol's own last bar (date-aligned frames)
+        days = frames['close'].index.values.astype('datetime64[D]')
+        last_days = np.array(
+            [np.datetime64(d, 'D') if d is not None else np.datetime64('NaT') for d in last_dates], dtype='datetime64[D]'
+        )
+        in_year = (days[:, None] > last_days[None, :] - np.timedelta64(SNAPSHOT_DAYS_52W, 'D')) & (days[:, None] <= last_days[None, :])
+        with np.errstate(all='ignore'):
+            high = np.fmax.reduce(np.where(in_year, frames['high'].to_numpy(dtype=np.float64), np.nan), axis=0)
+            low = np.fmin.reduce(np.where(in_year, frames['low'].to_numpy(dtype=np.float64), np.nan), axis=0)
+        columns['high_52w'] = pd.Series(high, index=close.columns)
+        columns['low_52w'] = pd.Series(low, index=close.columns)
+        columns['pct_from_52w_high'] = (columns['close'] / columns['high_52w'] - 1.0) * 100.0
+        columns['pct_from_52w_low'] = (columns['close'] / columns['low_52w'] - 1.0) * 100.0
+
+        table = pd.DataFrame(columns).replace([np.inf, -np.inf], np.nan)
+        rows = []
+        for symbol, values in table.iterrows():
+            if last_dates[symbol] is None or pd.isna(values['close']):
+                continue
+            rows.append(ScreenerSnapshot(
+                symbol=symbol,
+                business_date=last_dates[symbol],
+                **{field: _quantize(values[field], places) for field, places in FILTER_FIELDS.items()},
+            ))
+        return rows
+
+    @staticmethod
+    def refresh_snapshot(symbols, end_date=None, prune=False):
+        """
+        Recomputes the snapshot rows of symbols in one bulk upsert and
+        refreshes the cached results of the saved scans. prune drops the
+        rows of symbols not in the list. Returns rows written.
+        """
+        rows = ScreenerService.snapshot_rows(symbols, end_date)
+        if prune:
+            ScreenerSnapshot.objects.exclude(symbol__in=[row.symbol for row in rows]).delete()
+        unique_fields = None
+        if connection.features.supports_update_conflicts_with_target:
+            unique_fields = ['symbol']
+        ScreenerSnapshot.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['business_date', *FILTER_FIELDS, 'updated_at'],
+        )
+        print(f"Screener snapshot: {len(rows)} symbols refreshed.")
+        ScreenerService.refresh_scans()
+        return len(rows)
+
+    @staticmethod
+    def snapshot_frame():
+        """The snapshot table as a float DataFrame indexed by symbol, reloaded when it changes."""
+        version = snapshot_version()
+        if _SNAPSHOT_FRAME.get('version') != version:
+            rows = ScreenerSnapshot.objects.values('symbol', 'business_date', *FILTER_FIELDS)
+            frame = pd.DataFrame(list(rows), columns=['symbol', 'business_date', *FILTER_FIELDS]).set_index('symbol')
+            frame[list(FILTER_FIELDS)] = frame[list(FILTER_FIELDS)].apply(pd.to_numeric, errors='coerce').astype(np.float64)
+            _SNAPSHOT_FRAME.update(version=version, frame=frame)
+        return _SNAPSHOT_FRAME['frame']
+
+    # --- SCREENING ---
+
+    @staticmethod
+    def to_q(conditions, symbols=None):
+        """The criteria as one Q over the snapshot columns (field-to-field via F)."""
+        q = Q()
+        for field, op, value in conditions:
+            lookup = 'exact' if op == 'eq' else op
+            q &= Q(**{f"{field}__{lookup}": F(value) if isinstance(value, str) else value})
+        if symbols is not None:
+            q &= Q(symbol__in=symbols)
+        return q
+
+    @staticmethod
+    def to_mask(frame, conditions, symbols=None):
+        """The criteria as a boolean NumPy mask over snapshot_frame() (NaN never matches)."""
+        mask = np.ones(len(frame), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for field, op, value in conditions:
+                other = frame[value].to_numpy() if isinstance(value, str) else float(value)
+                mask &= OPERATORS[op](frame[field].to_numpy(), other)
+        if symbols is not None:
+            mask &= np.isin(frame.index.to_numpy(), symbols)
+        return mask
+
+    @staticmethod
+    def screen(criteria, order_by='symbol', limit=None, engine='numpy'):
+        """
+        Symbols matching criteria (see parse_criteria) as JSON-ready dicts,
+        sorted by order_by ('-field' for descending). engine is 'numpy' (mask
+        over the in-memory snapshot) or 'sql' (one query on the table).
+        """
+        conditions, symbols = parse_criteria(criteria)
+        descending = order_by.startswith('-')
+        sort_field = order_by.lstrip('-')
+        if sort_field != 'symbol' and sort_field not in FILTER_FIELDS:
+            raise ValueError(f"Cannot order by '{order_by}'")
+
+        if engine == 'sql':
+            query = ScreenerSnapshot.objects.filter(ScreenerService.to_q(conditions, symbols))
+            sort = F(sort_field).desc(nulls_last=True) if descending else F(sort_field).asc(nulls_last=True)
+            query = query.order_by(sort, 'symbol').values('symbol', 'business_date', *FILTER_FIELDS)
+            rows = list(query[:limit] if limit else query)
+            return [
+                {
+                    'symbol': row['symbol'],
+                    'business_date': row['business_date'].isoformat(),
+                    **{field: None if row[field] is None else float(row[field]) for field in FILTER_FIELDS},
+                }
+                for row in rows
+            ]
+        if engine != 'numpy':
+            raise ValueError(f"Unknown screener engine '{engine}'")
+
+        frame = ScreenerService.snapshot_frame()
+        matched = frame[ScreenerService.to_mask(frame, conditions, symbols)]
+        if sort_field == 'symbol':
+            matched = matched.sort_index(ascending=not descending)
+        else:
+            # Ties in symbol order, as the SQL engine's order_by(sort, 'symbol')
+            matched = matched.sort_index().sort_values(
+                [sort_field], ascending=not descending, na_position='last', kind='stable'
+            )
+        if limit:
+            matched = matched.iloc[:limit]
+        return [
+            {
+                'symbol': symbol,
+                'business_date': row['business_date'].isoformat(),
+                **{field: None if pd.isna(row[field]) else float(row[field]) for field in FILTER_FIELDS},
+            }
+            for symbol, row in zip(matched.index, matched.to_dict('records'))
+        ]
+
+    # --- SAVED SCANS ---
+
+    @staticmethod
+    def run_scan(scan, force=False):
+        """A TechnicalScan's results, from last_results while the snapshot and criteria are unchanged."""
+        version = snapshot_version()
+        key = criteria_key(scan.criteria)
+        cached = scan.last_results or {}
+        if not force and cached.get('snapshot') == version and cached.get('criteria') == key:
+            return cached['results']
+
+        results = ScreenerService.screen(scan.criteria)
+        scan.last_results = {'snapshot': version, 'criteria': key, 'count': len(results), 'results': results}
+        scan.last_run = timezone.now()
+        scan.save(update_fields=['last_results', 'last_run'])
+        return results
+
+    @staticmethod
+    def refresh_scans():
+        """Re-runs every active saved scan against the current snapshot."""
+        refreshed = 0
+        for scan in TechnicalScan.objects.filter(is_active=True):
+            try:
+                ScreenerService.run_scan(scan, force=True)
+                refreshed += 1
+            except ValueError as e:
+                print(f"Error running scan {scan.name} (id {scan.id}): {e}")
+        if refreshed:
+            print(f"Screener: {refreshed} saved scans refreshed.")
+        return refreshed
@@ -0,0 +1,207 @@
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from django.db.models import Max
+
+from nepse_data.models import StockPrices
+from technical_analysis.models import SupportResistanceLevel
+from .batch_indicator_service import BatchIndicatorService, align_right, day_numbers
+
+SWING_WINDOW = 5           # a swing high/low is the extreme of the bars this far on either side
+LEVEL_TOLERANCE = 0.015    # swings within 1.5% of each other form one level; closes 1.5% through break it
+MIN_TOUCHES = 2
+LOOKBACK_DAYS = 730        # swings older than this do not make levels
+INCREMENTAL_CALENDAR_DAYS = 60
+
+
+def _last_date(symbols):
+    return StockPrices.objects.filter(symbol__in=symbols).aggregate(last=Max('business_date'))['last']
+
+
+def _as_date(day):
+    return (pd.Timestamp(0) + pd.Timedelta(days=int(day))).date()
+
+
+def swing_points(packed, window=SWING_WINDOW):
+    """
+    (swing_high, swing_low) boolean matrices over packed (bars x symbols):
+    the bar's high (low) is the extreme of the 2 * window + 1 bars centred
+    on it. A swing is only known `window` bars after it.
+    """
+    span = 2 * window + 1
+    high, low = packed['high'], packed['low']
+    swing_high = high.eq(high.rolling(span, center=True, min_periods=span).max())
+    swing_low = low.eq(low.rolling(span, center=True, min_periods=span).min())
+    return swing_high.to_numpy(), swing_low.to_numpy()
+
+
+def cluster_levels(prices, tolerance=LEVEL_TOLERANCE):
+    """
+    Groups swing prices into levels. prices are sorted and split wherever
+    the gap to the previous price exceeds tolerance. Returns the mean price
+    of each cluster.
+    """
+    sorted_prices = np.sort(prices)
+    if not len(sorted_prices):
+        return sorted_prices
+    breaks = np.flatnonzero(sorted_prices[1:] > sorted_prices[:-1] * (1 + tolerance)) + 1
+    starts = np.concatenate([[0], breaks])
+    counts = np.diff(np.concatenate([starts, [len(sorted_prices)]]))
+    return np.add.reduceat(sorted_prices, starts) / counts
+
+
+class SupportResistanceService:
+    """
+    Support and resistance levels from swing highs and lows. Swings are
+    rolling-window extrema over the packed (bars x symbols) price matrices.
+    Swing lows cluster into SUPPORT levels and swing highs into RESISTANCE
+    levels. A level's touches are every swing, high or low, inside its
+    tolerance band, counted with searchsorted over the sorted swing prices.
+    A level is broken by the first close through its band after its last
+    touch.
+    """
+
+    @staticmethod
+    def levels_for(symbol, high, low, close, day, swing_high, swing_low, tolerance=LEVEL_TOLERANCE, min_touches=MIN_TOUCHES):
+        """Unsaved SupportResistanceLevel rows for one symbol's column of the packed arrays."""
+        bars = ~np.isnan(close)
+        if not bars.any():
+            return []
+        start_day = np.nanmax(day) - LOOKBACK_DAYS
+        recent = bars & (day >= start_day)
+        highs = swing_high & recent
+        lows = swing_low & recent
+
+        # Every swing, sorted by price: the touch index
+        swing_prices = np.concatenate([high[highs], low[lows]])
+        swing_days = np.concatenate([day[highs], day[lows]])
+        order = np.argsort(swing_prices, kind='stable')
+        swing_prices, swing_days = swing_prices[order], swing_days[order]
+
+        levels = []
+        for level_type, prices in (('RESISTANCE', high[highs]), ('SUPPORT', low[lows])):
+            for level in cluster_levels(prices, tolerance):
+                lo = np.searchsorted(swing_prices, level * (1 - tolerance), side='left')
+                hi = np.searchsorted(swing_prices, level * (1 + tolerance), side='right')
+                touches = hi - lo
+                if touches < min_touches:
+                    continue
+                first_day, last_day = swing_days[lo:hi].min(), swing_days[lo:hi].max()
+                levels.append((level_type, level, touches, first_day, last_day))
+        if not levels:
+            return []
+
+        # Broken: the first close through the band after the last touch (levels x bars)
+        types = np.array([t for t, *_ in levels])
+        prices = np.array([p for _, p, *_ in levels])
+        last_days = np.array([l for *_, l in levels])
+        valid_close = np.where(bars, close, np.nan)
+        with np.errstate(invalid='ignore'):
+            through = np.where(
+                (types == 'SUPPORT')[:, None],
+                valid_close[None, :] < (prices * (1 - tolerance))[:, None],
+                valid_close[None, :] > (prices * (1 + tolerance))[:, None],
+            ) & (day[None, :] > last_days[:, None])
+        broken = through.any(axis=1)
+        broken_days = day[np.argmax(through, axis=1)]
+
+        rows = []
+        for (level_type, price, touches, first_day, last_day), is_broken, broken_day in zip(levels, broken, broken_days):
+            rows.append(SupportResistanceLevel(
+                symbol=symbol,
+                level_type=level_type,
+                price_level=Decimal(repr(float(price))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+                strength=int(min(10, 2 * touches - 1)),
+                first_touched=_as_date(first_day),
+                last_touched=_as_date(last_day),
+                touch_count=int(touches),
+                is_active=not is_broken,
+                broken_date=_as_date(broken_day) if is_broken else None,
+            ))
+        return rows
+
+    @staticmethod
+    def rebuild(symbols, end_date=None, window=SWING_WINDOW):
+        """Recomputes every level of symbols from their recent history and replaces the stored rows."""
+        symbols = sorted(set(symbols))
+        if not symbols:
+            return 0
+        # Swings need `window` bars before the lookback starts
+        start_date = None
+        end = end_date or _last_date(symbols)
+        if end is not None:
+            start_date = end - timedelta(days=LOOKBACK_DAYS + 4 * window)
+        frames = BatchIndicatorService.load_universe(symbols, end_date, start_date=start_date)
+        frames['day'] = day_numbers(frames['close'])
+        packed, _ = align_right(frames)
+        swing_high, swing_low = swing_points(packed, window)
+        high, low, close, day = (packed[f].to_numpy() for f in ('high', 'low', 'close', 'day'))
+
+        rows = []
+        for col, symbol in enumerate(packed['close'].columns):
+            rows.extend(SupportResistanceService.levels_for(
+                symbol, high[:, col], low[:, col], close[:, col], day[:, col], swing_high[:, col], swing_low[:, col]
+            ))
+        SupportResistanceLevel.objects.filter(symbol__in=symbols).delete()
+        SupportResistanceLevel.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+    @staticmethod
+    def affected_symbols(symbols, end_date=None, bars=1, window=SWING_WINDOW):
+        """
+        Symbols whose levels the newest `bars` bars change: a swing confirmed
+        by one of them, a close through an active level's band, or a touch
+        falling out of the look-back window.
+        """
+        symbols = sorted(set(symbols))
+        end = end_date or _last_date(symbols)
+        if end is None:
+            return []
+        frames = BatchIndicatorService.load_universe(
+            symbols, end_date, start_date=end - timedelta(days=INCREMENTAL_CALENDAR_DAYS)
+        )
+        packed, _ = align_right(frames)
+        if not len(packed['close']):
+            return []
+        swing_high, swing_low = swing_points(packed, window)
+        n = len(packed['close'])
+
+        # Swings at rows [n - bars - window, n - window) are confirmed by the newest bars
+        confirmed = slice(max(n - bars - window, 0), max(n - window, 0))
+        new_swing = (swing_high[confirmed] | swing_low[confirmed]).any(axis=0)
+
+        newest = packed['close'].iloc[max(n - bars, 0):]
+        lowest, highest = newest.min(), newest.max()
+        active = pd.DataFrame(list(
+            SupportResistanceLevel.objects.filter(symbol__in=symbols, is_active=True)
+            .values_list('symbol', 'level_type', 'price_level')
+        ), columns=['symbol', 'level_type', 'price_level'])
+        breaking = set()
+        if not active.empty:
+            price = active['price_level'].astype(float)
+            broken = np.where(
+                active['level_type'] == 'SUPPORT',
+                active['symbol'].map(lowest) < price * (1 - LEVEL_TOLERANCE),
+                active['symbol'].map(highest) > price * (1 + LEVEL_TOLERANCE),
+            )
+            breaking = set(active['symbol'][broken])
+
+        # Levels whose first touch has left the look-back window lose it
+        aged = set(
+            SupportResistanceLevel.objects.filter(
+                symbol__in=symbols, first_touched__lt=end - timedelta(days=LOOKBACK_DAYS)
+            ).values_list('symbol', flat=True)
+        )
+
+        columns = packed['close'].columns
+        return sorted(set(columns[new_swing]) | breaking | aged)
+
+    @staticmethod
+    def update(symbols, end_date=None, bars=1, full=False):
+        """Daily run: rebuilds the levels of the symbols the newest bars affect (all of them when full)."""
+        affected = sorted(set(symbols)) if full else SupportResistanceService.affected_symbols(symbols, end_date, bars)
+        stored = SupportResistanceService.rebuild(affected, end_date) if affected else 0
+        print(f"Support/resistance: {len(affected)} of {len(set(symbols))} symbols rebuilt, {stored} levels.")
+        return affected, stored
@@ -0,0 +1,41 @@
+# technical_analysis/tasks.py
+import pandas as pd
+from celery import shared_task
+
+from .models import TradingStrategy
+from .services.backtest_service import BacktestService
+from .services.data_service import MarketDataService
+
+
+@shared_task(bind=True)
+def run_backtest_job(self, strategy_id, years=10):
+    """
+    Background task for the backtest page: backtests a TradingStrategy over
+    the active symbols, stores its trades (replacing the strategy's previous
+    backtest) and returns the summary and equity curve.
+    """
+    job_id = self.request.id
+    try:
+        strategy = TradingStrategy.objects.get(pk=strategy_id)
+        self.update_state(state='PROGRESS', meta={"message": f"Backtesting {strategy.name}..."})
+        symbols = MarketDataService.get_active_symbols()
+        if not symbols:
+            return {"status": "error", "message": "No symbols with recent prices to backtest."}
+        result = BacktestService.run(strategy, symbols, years=years)
+        days = pd.to_datetime(result['portfolio'].index.astype('int64'), unit='D')
+        return {
+            "status": "success",
+            "message": f"Backtest of {strategy.name} finished: {result['summary']['trades']} trades.",
+            "summary": result['summary'],
+            "equity_curve": [
+                {'date': day.date().isoformat(), 'equity': round(float(value), 4)}
+                for day, value in zip(days, result['portfolio'])
+            ],
+        }
+
+    except (TradingStrategy.DoesNotExist, ValueError, NotImplementedError) as e:
+        return {"status": "error", "message": str(e)}
+    except Exception as e:
+        error_msg = f"Critical error: {str(e)}"
+        print(f"!!! --- CRITICAL ERROR in backtest job {job_id}: {error_msg} --- !!!")
+        return {"status": "error", "message": error_msg}
@@ -1,3 +1,457 @@
-from django.test import TestCase
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from nepse_data.models import StockPrices
+from technical_analysis import indicators as ta
+from technical_analysis.models import ScreenerSnapshot, TradingStrategy
+from technical_analysis.services.alert_service import AlertIndex, AlertService
+from technical_analysis.services.backtest_service import BacktestService
+from technical_analysis.services.batch_indicator_service import BatchIndicatorService, align_right, day_numbers
+from technical_analysis.services.batch_signal_service import BatchSignalService
+from technical_analysis.services.data_service import MarketDataService
+from technical_analysis.services.indicator_service import IndicatorService
+from technical_analysis.services.indicator_state import IndicatorStateService
+from technical_analysis.services.pattern_service import CandlestickPatternService
+from technical_analysis.services import screener_service
+from technical_analysis.services.screener_service import FILTER_FIELDS, ScreenerService
+from technical_analysis.services.support_resistance_service import (
+    SupportResistanceService, cluster_levels, swing_points,
+)
+
+SYMBOLS = ['A', 'B', 'C', 'D']
+
+
+def price_frames(n=300, seed=0, holes=True):
+    """{field: dates x symbols DataFrame} of a random walk, with the gaps real symbols have."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2020-01-01', periods=n, freq='D', name='business_date')
+    close = pd.DataFrame(100 + rng.standard_normal((n, len(SYMBOLS))).cumsum(axis=0), index=dates, columns=SYMBOLS)
+    volume = pd.DataFrame(rng.integers(1, 1000, (n, len(SYMBOLS))).astype(float), index=dates, columns=SYMBOLS)
+    if holes:
+        close.iloc[:50, 1] = np.nan      # listed late
+        close.iloc[100:120, 2] = np.nan  # suspended
+        close.iloc[250:, 3] = np.nan     # delisted
+        close.iloc[::7, 0] = np.nan      # missing days
+    volume = volume.where(close.notna())
+    return {'open': close, 'high': close, 'low': close, 'close': close, 'volume': volume}
+
+
+class BatchIndicatorParityTests(SimpleTestCase):
+    """The batch engine against the per-symbol functions in technical_analysis.indicators."""
+
+    CASES = [
+        ('SMA', {'window': 20}, lambda c, v: ta.calculate_sma(c, 20)),
+        ('EMA', {'window': 20}, lambda c, v: ta.calculate_ema(c, 20)),
+        ('RSI', {'window': 14}, lambda c, v: ta.calculate_rsi(c, 14)),
+        ('MACD', {}, lambda c, v: ta.calculate_macd(c)),
+        ('Bollinger_Bands', {}, lambda c, v: ta.calculate_bollinger_bands(c)),
+        ('OBV', {}, lambda c, v: ta.calculate_obv(c, v)),
+    ]
+
+    def test_every_bar_matches_per_symbol_calculation(self):
+        frames = price_frames()
+        packed, _ = align_right(frames)
+        for name, params, per_symbol in self.CASES:
+            result = BatchIndicatorService.calculate(name, params, packed)
+            for symbol in SYMBOLS:
+                close = frames['close'][symbol].dropna()
+                expected = per_symbol(close, frames['volume'][symbol].dropna())
+                expected = expected if isinstance(expected, pd.DataFrame) else expected.to_frame('value')
+                batch = result if isinstance(result, dict) else {'value': result}
+                for key in expected.columns:
+                    # A symbol's bars are the bottom len(close) rows of its packed column
+                    got = batch[key][symbol].to_numpy()[-len(close):]
+                    np.testing.assert_allclose(
+                        got, expected[key].to_numpy(), rtol=1e-9, equal_nan=True, err_msg=f"{name} {key} {symbol}"
+                    )
+
+    def test_last_dates(self):
+        frames = price_frames()
+        _, last_dates = align_right(frames)
+        self.assertEqual(last_dates['D'], date(2020, 1, 1) + timedelta(days=249))
+        self.assertEqual(last_dates['B'], date(2020, 1, 1) + timedelta(days=299))
+
+
+class IndicatorStateSteppingTests(SimpleTestCase):
+    """Stepping a stored state bar by bar against a full recompute at every bar."""
+
+    CASES = [('ema', 'EMA', {'window': 20}), ('rsi', 'RSI', {'window': 14}), ('macd', 'MACD', {}), ('obv', 'OBV', {})]
+
+    def assert_same(self, got, expected, message):
+        if isinstance(expected, dict):
+            for key, value in expected.items():
+                self.assert_same(got and got[key], value, f"{message} {key}")
+        elif pd.isna(expected):
+            self.assertIsNone(got, message)
+        else:
+            self.assertAlmostEqual(got, expected, delta=1e-9 * max(1.0, abs(expected)), msg=message)
+
+    def test_daily_steps_match_full_recompute(self):
+        frames = price_frames(n=120, seed=1, holes=False)
+        full, _ = align_right(frames)
+        close, volume = frames['close']['A'].tolist(), frames['volume']['A'].tolist()
+        for kind, name, params in self.CASES:
+            result = BatchIndicatorService.calculate(name, params, full)
+            for cut in (1, 5, 30):
+                history, _ = align_right({field: frame.iloc[:cut] for field, frame in frames.items()})
+                state = IndicatorStateService.states_from_history(kind, params, history)['A']
+                for t in range(cut, len(close)):
+                    state = IndicatorStateService.advance(kind, params, state, [(close[t], volume[t])], close[t - 1], t)
+                    got = IndicatorStateService.output(kind, params, state, t + 1)
+                    if isinstance(result, dict):
+                        expected = {key: result[key]['A'].iloc[t] for key in ('macd', 'signal', 'histogram')}
+                    else:
+                        expected = result['A'].iloc[t]
+                    self.assert_same(got, expected, f"{kind} from bar {cut}, bar {t}")
+
+
+def per_symbol_signal(strategy, ohlcv):
+    """(signal_type, reason) the SignalService.generate_*_signals rules give one symbol's bars, or None."""
+    config = strategy.config
+    if strategy.strategy_type == 'RSI_OVERSOLD':
+        overbought, oversold = config.get('overbought', 70), config.get('oversold', 30)
+        rsi = IndicatorService.get_indicator_data('X', 'rsi', config.get('rsi_params', {'window': 14}), ohlcv_df=ohlcv)
+        if rsi.empty or len(rsi) < 2:
+            return None
+        today, yesterday = rsi.iloc[-1], rsi.iloc[-2]
+        if yesterday >= overbought and today < overbought:
+            return 'SELL', f"RSI crossed below Overbought level ({overbought}) from {yesterday:.2f} to {today:.2f}."
+        if yesterday <= oversold and today > oversold:
+            return 'BUY', f"RSI crossed above Oversold level ({oversold}) from {yesterday:.2f} to {today:.2f}."
+        return None
+
+    short_window, long_window = config.get('short_window', 50), config.get('long_window', 200)
+    short = IndicatorService.get_indicator_data('X', 'sma', {'window': short_window}, ohlcv_df=ohlcv)
+    long = IndicatorService.get_indicator_data('X', 'sma', {'window': long_window}, ohlcv_df=ohlcv)
+    both = pd.DataFrame({'short': short, 'long': long}).dropna()
+    if len(both) < 2:
+        return None
+    today, yesterday = both.iloc[-1], both.iloc[-2]
+    if yesterday['short'] <= yesterday['long'] and today['short'] > today['long']:
+        return 'BUY', f"Golden Cross: SMA({short_window}) crossed above SMA({long_window})."
+    if yesterday['short'] >= yesterday['long'] and today['short'] < today['long']:
+        return 'SELL', f"Death Cross: SMA({short_window}) crossed below SMA({long_window})."
+    return None
+
+
+class BatchSignalParityTests(SimpleTestCase):
+    """BatchSignalService's last-bar masks against the per-symbol SignalService rules, bar by bar."""
+
+    STRATEGIES = [
+        TradingStrategy(name='RSI', strategy_type='RSI_OVERSOLD',
+                        config={'rsi_params': {'window': 5}, 'overbought': 60, 'oversold': 40}),
+        TradingStrategy(name='MA', strategy_type='MA_CROSSOVER', config={'short_window': 3, 'long_window': 8}),
+    ]
+
+    def test_every_bar_matches_per_symbol_rules(self):
+        frames = price_frames(seed=1)
+        signals = 0
+        for end in range(2, len(frames['close']) + 1):
+            history = {field: frame.iloc[:end] for field, frame in frames.items()}
+            packed, _ = align_right(history)
+            for strategy in self.STRATEGIES:
+                evaluator = getattr(BatchSignalService, BatchSignalService.EVALUATORS[strategy.strategy_type])
+                got = {symbol: (kwargs['signal_type'], kwargs['reason']) for symbol, kwargs in evaluator(strategy, packed)}
+                expected = {}
+                for symbol in SYMBOLS:
+                    ohlcv = history['close'][symbol].dropna().to_frame('close')
+                    found = per_symbol_signal(strategy, ohlcv) if len(ohlcv) else None
+                    if found:
+                        expected[symbol] = found
+                self.assertEqual(got, expected, f"{strategy.name} at bar {end}")
+                signals += len(expected)
+        self.assertGreater(signals, 100)
+
+
+class BacktestTradeTests(SimpleTestCase):
+
+    def test_hand_checked_ma_crossover_trade(self):
+        # SMA(2) / SMA(3) of A's closes:
+        #   bar 3: SMA2 10 -> 11 crosses SMA3 10 -> 10.67   entry at 12
+        #   bar 6: SMA2 13.5 -> 11 falls below SMA3 13 -> 12 exit at 9
+        # B is the same series listed two days later.
+        closes = [10, 10, 10, 12, 14, 13, 9, 8, 8]
+        dates = pd.date_range('2024-01-01', periods=len(closes) + 2, freq='D', name='business_date')
+        close = pd.DataFrame({'A': closes + [np.nan, np.nan], 'B': [np.nan, np.nan] + closes}, index=dates, dtype=float)
+        frames = {'open': close, 'high': close, 'low': close, 'close': close, 'volume': close * 0 + 1}
+        frames['day'] = day_numbers(close)
+        packed, _ = align_right(frames)
+
+        result = BacktestService.simulate('MA_CROSSOVER', {'short_window': 2, 'long_window': 3}, packed)
+        trades = result['trades'].sort_values('col')
+        self.assertEqual(len(trades), 2)
+        for (_, trade), first_day in zip(trades.iterrows(), (date(2024, 1, 1), date(2024, 1, 3))):
+            self.assertEqual(trade['entry_price'], 12.0)
+            self.assertEqual(trade['exit_price'], 9.0)
+            self.assertAlmostEqual(trade['return_pct'], -25.0)
+            self.assertAlmostEqual(trade['max_drawdown_pct'], (1 - 9 / 14) * 100)
+            self.assertEqual(date(1970, 1, 1) + timedelta(days=int(trade['entry_day'])), first_day + timedelta(days=3))
+            self.assertEqual(trade['exit_day'] - trade['entry_day'], 3)
+        np.testing.assert_allclose(result['equity'].iloc[-1], [0.75, 0.75])
+        self.assertEqual(result['summary']['closed_trades'], 2)
+        self.assertEqual(result['summary']['winners'], 0)
+        self.assertEqual(result['summary']['avg_return_pct'], -25.0)
+
+
+def alert_fires(alert_type, value, row):
+    """One alert checked on its own, as the AlertService docstring defines each type."""
+    if alert_type in ('PRICE_ABOVE', 'RSI_OVERBOUGHT', 'VOLUME_SPIKE', 'PRICE_BELOW', 'RSI_OVERSOLD'):
+        observed = row[{'PRICE_ABOVE': 'close', 'PRICE_BELOW': 'close', 'VOLUME_SPIKE': 'volume_ratio'}.get(alert_type, 'rsi')]
+        if pd.isna(observed):
+            return False
+        return observed >= value if alert_type in ('PRICE_ABOVE', 'RSI_OVERBOUGHT', 'VOLUME_SPIKE') else observed <= value
+    if alert_type == 'CHANGE_PERCENT':
+        change = row['change_percent']
+        return not pd.isna(change) and (change >= value if value >= 0 else change <= value)
+    if alert_type == 'MACD_CROSSOVER':
+        direction = row['macd_cross']
+        return (direction > 0 and value >= 0) or (direction < 0 and value <= 0)
+    if alert_type == 'MA_CROSSOVER':
+        return row.get(f'ma_cross_{int(value)}', 0) != 0
+    return False
+
+
+class AlertTriggerTests(SimpleTestCase):
+    """AlertService.triggered's bisects against each alert checked on its own."""
+
+    SNAPSHOT = pd.DataFrame({
+        'close': [100.0, 50.0, 20.0, np.nan],
+        'change_percent': [5.0, -5.0, 0.0, np.nan],
+        'volume_ratio': [3.0, 0.5, np.nan, 1.0],
+        'rsi': [75.0, 25.0, 50.0, np.nan],
+        'macd_cross': [1, -1, 0, 0],
+        'ma_cross_5': [1, 0, -1, 0],
+        'ma_cross_20': [0, -1, 0, 0],
+    }, index=pd.Index(['UP', 'DOWN', 'FLAT', 'NAN'], name='symbol'))
+
+    def test_hand_checked_alerts(self):
+        rows = [
+            (1, 'PRICE_ABOVE', 'UP', 100), (2, 'PRICE_ABOVE', 'UP', 100.01), (3, 'PRICE_BELOW', 'DOWN', 50),
+            (4, 'CHANGE_PERCENT', 'UP', 5), (5, 'CHANGE_PERCENT', 'UP', -3), (6, 'CHANGE_PERCENT', 'DOWN', -3),
+            (7, 'CHANGE_PERCENT', 'DOWN', 3), (8, 'CHANGE_PERCENT', 'FLAT', 0), (9, 'CHANGE_PERCENT', 'FLAT', -0.5),
+            (10, 'MACD_CROSSOVER', 'UP', 1), (11, 'MACD_CROSSOVER', 'UP', -1), (12, 'MACD_CROSSOVER', 'UP', 0),
+            (13, 'MACD_CROSSOVER', 'DOWN', 0), (14, 'MACD_CROSSOVER', 'FLAT', 0),
+            (15, 'MA_CROSSOVER', 'FLAT', 5), (16, 'MA_CROSSOVER', 'FLAT', 20), (17, 'RSI_OVERSOLD', 'NAN', 30),
+            (18, 'PRICE_ABOVE', 'MISSING', 1),
+        ]
+        fired = AlertService.triggered(AlertIndex(rows), self.SNAPSHOT)
+        self.assertEqual(sorted(alert_id for alert_id, _ in fired), [1, 3, 4, 6, 8, 10, 12, 13, 15])
+
+    def test_random_alerts_match_one_by_one(self):
+        rng = np.random.default_rng(4)
+        types = ['PRICE_ABOVE', 'PRICE_BELOW', 'CHANGE_PERCENT', 'VOLUME_SPIKE', 'RSI_OVERBOUGHT', 'RSI_OVERSOLD',
+                 'MACD_CROSSOVER', 'MA_CROSSOVER']
+        ranges = {'PRICE_ABOVE': (0, 150), 'PRICE_BELOW': (0, 150), 'CHANGE_PERCENT': (-8, 8), 'VOLUME_SPIKE': (0, 4),
+                  'RSI_OVERBOUGHT': (0, 100), 'RSI_OVERSOLD': (0, 100), 'MACD_CROSSOVER': (-1, 1)}
+        rows = []
+        for alert_id in range(1, 2001):
+            alert_type = types[rng.integers(len(types))]
+            symbol = self.SNAPSHOT.index[rng.integers(len(self.SNAPSHOT))]
+            if alert_type == 'MA_CROSSOVER':
+                value = float(rng.choice([5, 20, 50]))
+            else:
+                value = float(np.round(rng.uniform(*ranges[alert_type]) * 2) / 2)  # ties with the snapshot values
+            rows.append((alert_id, alert_type, symbol, value))
+
+        fired = AlertService.triggered(AlertIndex(rows), self.SNAPSHOT)
+        expected = [
+            (alert_id, symbol) for alert_id, alert_type, symbol, value in rows
+            if alert_fires(alert_type, value, self.SNAPSHOT.loc[symbol])
+        ]
+        self.assertEqual(sorted(fired), expected)
+        self.assertEqual(len(set(fired)), len(fired))
+
+
+def candle_patterns(o, h, l, c):
+    """{pattern_type: bar indexes} of one symbol's bars, each rule checked bar by bar."""
+    found = defaultdict(list)
+    for t in range(len(c)):
+        body, rng = abs(c[t] - o[t]), h[t] - l[t]
+        upper, lower = h[t] - max(o[t], c[t]), min(o[t], c[t]) - l[t]
+        if rng > 0 and body <= 0.1 * rng:
+            found['DOJI'].append(t)
+        if t >= 6 and body > 0:
+            if lower >= 2 * body and upper <= 0.5 * body and c[t - 1] < c[t - 6]:
+                found['HAMMER'].append(t)
+            if upper >= 2 * body and lower <= 0.5 * body and c[t - 1] > c[t - 6]:
+                found['SHOOTING_STAR'].append(t)
+        if t >= 1:
+            body1 = abs(c[t - 1] - o[t - 1])
+            if c[t - 1] < o[t - 1] and c[t] > o[t] and o[t] <= c[t - 1] and c[t] >= o[t - 1] and body > body1:
+                found['ENGULFING_BULL'].append(t)
+            if c[t - 1] > o[t - 1] and c[t] < o[t] and o[t] >= c[t - 1] and c[t] <= o[t - 1] and body > body1:
+                found['ENGULFING_BEAR'].append(t)
+        if t >= 2:
+            body2, middle = abs(c[t - 2] - o[t - 2]), (o[t - 2] + c[t - 2]) / 2
+            star = body2 >= 0.6 * (h[t - 2] - l[t - 2]) and body1 <= 0.3 * body2
+            if star and c[t - 2] < o[t - 2] and max(o[t - 1], c[t - 1]) <= c[t - 2] and c[t] > o[t] and c[t] > middle:
+                found['MORNING_STAR'].append(t)
+            if star and c[t - 2] > o[t - 2] and min(o[t - 1], c[t - 1]) >= c[t - 2] and c[t] < o[t] and c[t] < middle:
+                found['EVENING_STAR'].append(t)
+    return found
+
+
+class CandlestickPatternTests(SimpleTestCase):
+
+    def test_matrices_match_bar_by_bar_rules(self):
+        # Whole-number candles so bodies, shadows and stars tie and repeat often
+        rng = np.random.default_rng(6)
+        frames = price_frames(n=400, seed=6)
+        close = frames['close'].round()
+        open_ = close.shift(1).fillna(close) + rng.integers(-2, 3, close.shape)
+        high = np.maximum(open_, close) + rng.integers(0, 4, close.shape)
+        low = np.minimum(open_, close) - rng.integers(0, 4, close.shape)
+        packed, _ = align_right({'open': open_.where(close.notna()), 'high': high, 'low': low, 'close': close})
+
+        matrices = CandlestickPatternService.detect(packed)
+        hits = 0
+        for col, symbol in enumerate(SYMBOLS):
+            bars = close[symbol].notna()
+            o, h, l, c = (frame[symbol][bars].to_numpy() for frame in (open_, high, low, close))
+            expected = candle_patterns(o, h, l, c)
+            offset = len(packed['close']) - len(c)
+            for pattern_type, matrix in matrices.items():
+                self.assertFalse(matrix[:offset, col].any())
+                got = list(np.flatnonzero(matrix[offset:, col]))
+                self.assertEqual(got, expected[pattern_type], f"{pattern_type} {symbol}")
+                hits += len(got)
+        self.assertGreater(hits, 100)
+
+    def test_engulfing_confirmed_by_the_next_bar(self):
+        # E: bearish bar, bullish engulfing, then a close above the engulfing high.
+        # F: the same two bars, no next bar yet.
+        dates = pd.date_range('2024-01-01', periods=3, freq='D', name='business_date')
+        bars = {'open': [10.0, 9.4, 10.5], 'high': [10.2, 10.6, 11.2], 'low': [9.4, 9.3, 10.4], 'close': [9.5, 10.5, 11.0]}
+        frames = {
+            field: pd.DataFrame({'E': values, 'F': values[:2] + [np.nan]}, index=dates)
+            for field, values in bars.items()
+        }
+        frames['volume'] = frames['close'] * 0 + 1
+        frames['day'] = day_numbers(frames['close'])
+        packed, _ = align_right(frames)
+
+        found = {row.symbol: row for row in CandlestickPatternService.patterns(packed)}
+        self.assertEqual(sorted(found), ['E', 'F'])
+        for row in found.values():
+            self.assertEqual((row.pattern_type, row.sentiment), ('ENGULFING_BULL', 'BULLISH'))
+            self.assertEqual((row.start_date, row.detected_date), (date(2024, 1, 1), date(2024, 1, 2)))
+            self.assertEqual(row.confidence, 65)
+        self.assertTrue(found['E'].is_completed and found['E'].breakout_confirmed)
+        self.assertEqual(found['E'].breakout_date, date(2024, 1, 3))
+        self.assertFalse(found['F'].is_completed or found['F'].breakout_confirmed)
+
+
+class SupportResistanceTests(SimpleTestCase):
+
+    def test_swing_points_match_a_window_scan(self):
+        frames = price_frames(seed=7)
+        packed, _ = align_right(frames)
+        window = 3
+        swing_high, swing_low = swing_points(packed, window)
+        for col, symbol in enumerate(SYMBOLS):
+            close = frames['close'][symbol].dropna().to_numpy()
+            offset = len(packed['close']) - len(close)
+            for swings, extreme in ((swing_high, np.max), (swing_low, np.min)):
+                expected = [
+                    t for t in range(window, len(close) - window)
+                    if close[t] == extreme(close[t - window:t + window + 1])
+                ]
+                self.assertEqual(list(np.flatnonzero(swings[:, col]) - offset), expected, symbol)
+
+    def test_cluster_levels(self):
+        # 101.5 is within 1.5% of 101, which is within 1.5% of 100; 110 is not
+        np.testing.assert_allclose(cluster_levels(np.array([111, 100, 101.5, 110, 101])), [302.5 / 3, 110.5])
+        self.assertEqual(len(cluster_levels(np.array([]))), 0)
+
+    def test_hand_checked_levels(self):
+        # With a one-bar window: swing highs 110, 110.5, 109.8 and lows 100, 100.5, 101;
+        # the last close breaks the resistance band (110.1 + 1.5%), nothing breaks the support
+        close = np.array([100, 110, 100, 110.5, 100.5, 109.8, 101, 120], dtype=float)
+        day = np.arange(len(close), dtype=float) + 19723  # 2024-01-01
+        packed = {'high': pd.DataFrame({'A': close}), 'low': pd.DataFrame({'A': close})}
+        swing_high, swing_low = swing_points(packed, window=1)
+        rows = SupportResistanceService.levels_for('A', close, close, close, day, swing_high[:, 0], swing_low[:, 0])
+
+        levels = {row.level_type: row for row in rows}
+        self.assertEqual(sorted(levels), ['RESISTANCE', 'SUPPORT'])
+        resistance, support = levels['RESISTANCE'], levels['SUPPORT']
+        self.assertEqual((resistance.price_level, resistance.touch_count, resistance.strength), (Decimal('110.10'), 3, 5))
+        self.assertEqual((resistance.first_touched, resistance.last_touched), (date(2024, 1, 2), date(2024, 1, 6)))
+        self.assertEqual((resistance.is_active, resistance.broken_date), (False, date(2024, 1, 8)))
+        self.assertEqual((support.price_level, support.touch_count), (Decimal('100.50'), 3))
+        self.assertEqual((support.first_touched, support.last_touched), (date(2024, 1, 3), date(2024, 1, 7)))
+        self.assertEqual((support.is_active, support.broken_date), (True, None))
+
+        # Three touches are not enough when four are required
+        self.assertEqual(SupportResistanceService.levels_for(
+            'A', close, close, close, day, swing_high[:, 0], swing_low[:, 0], min_touches=4
+        ), [])
+
+
+@override_settings(PRICE_PANEL_ENABLED=False)
+class DuplicatePriceRowTests(TestCase):
+    """A symbol whose security_id changed has two stock_prices rows on that date; the newest one counts."""
+
+    def setUp(self):
+        day = date(2024, 1, 1)
+        for i, (security_id, close) in enumerate([('1', '100.00'), ('1', '101.00'), ('2', '105.00')]):
+            StockPrices.objects.create(
+                business_date=day + timedelta(days=min(i, 1)), security_id=security_id, symbol='A',
+                security_name='A', open_price=Decimal(close), high_price=Decimal(close), low_price=Decimal(close),
+                close_price=Decimal(close), total_traded_quantity=10 * (i + 1),
+            )
+
+    def test_load_universe(self):
+        frames = BatchIndicatorService.load_universe(['A'])
+        self.assertEqual(list(frames['close']['A']), [100.0, 105.0])
+        self.assertEqual(list(frames['volume']['A']), [10.0, 30.0])
+
+    def test_get_ohlcv(self):
+        frame = MarketDataService.get_ohlcv('A')
+        self.assertTrue(frame.index.is_unique)
+        self.assertEqual([float(close) for close in frame['close']], [100.0, 105.0])
+        self.assertEqual(float(frame.loc['2024-01-02', 'close']), 105.0)
+        self.assertEqual(list(frame['volume']), [10, 30])
+
+
+class ScreenerEngineParityTests(TestCase):
+    """ScreenerService.to_q (SQL) and to_mask (NumPy) must pick and order the same rows, NULLs included."""
+
+    CRITERIA = [
+        {},
+        {'rsi_14__lt': 48},
+        {'rsi_14__lte': '50', 'volume_ratio__gte': 1.5},
+        {'close__gt': 'sma_50'},
+        {'close__gte': 'sma_50', 'macd__lt': 'macd_signal'},
+        {'change_percent__eq': 0},
+        {'pct_from_52w_high__gt': -5, 'symbols': ['S03', 'S07', 'S11', 'S19', 'S23']},
+    ]
+
+    def setUp(self):
+        screener_service._SNAPSHOT_FRAME.clear()
+        rng = np.random.default_rng(5)
+        rows = []
+        for i in range(40):
+            # Half-unit steps: plenty of ties, all exact as floats
+            values = {field: Decimal(int(rng.integers(-10, 11))) / 2 + 50 for field in FILTER_FIELDS}
+            values['change_percent'] = Decimal(int(rng.integers(-2, 3)))
+            values['pct_from_52w_high'] -= 50
+            values['volume'] = int(rng.integers(0, 5))
+            for field in rng.choice(list(FILTER_FIELDS)[1:], size=3, replace=False):
+                values[field] = None
+            rows.append(ScreenerSnapshot(symbol=f"S{39 - i:02d}", business_date=date(2024, 1, 1), **values))
+        ScreenerSnapshot.objects.bulk_create(rows)
+
+    def test_sql_and_numpy_agree(self):
+        for criteria in self.CRITERIA:
+            for order_by in ('symbol', '-symbol', 'rsi_14', '-volume_ratio'):
+                sql = ScreenerService.screen(criteria, order_by=order_by, engine='sql')
+                numpy = ScreenerService.screen(criteria, order_by=order_by, engine='numpy')
+                self.assertEqual(numpy, sql, f"{criteria} by {order_by}")
+        self.assertEqual(len(ScreenerService.screen({'rsi_14__lt': 'rsi_14'})), 0)
 
-# Create your tests here.
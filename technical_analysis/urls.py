@@ -37,4 +37,6 @@ urlpatterns = [
     path('api/get-ohlcv/<str:symbol>/', views.get_ohlcv_api, name='api_get_ohlcv'),
     path('api/screener-results/', views.screener_results_api, name='api_screener_results'),
     path('api/signals-data/', views.signals_data_api, name='api_signals_data'),
+    path('api/backtest-status/<str:job_id>/', views.backtest_status_api, name='api_backtest_status'),
+    path('api/indicator-cache-stats/', views.indicator_cache_stats_api, name='api_indicator_cache_stats'),
 ]
\ No newline at end of file
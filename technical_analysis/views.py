@@ -1,12 +1,22 @@
-from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, JsonResponse
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.db.models import Count, Q
 from datetime import datetime, timedelta
+import pandas as pd
+from celery.result import AsyncResult
 
-from .models import Signal, IndicatorValue, ChartPattern, SupportResistanceLevel
+from .models import (
+    Signal, SignalPerformance, TradingStrategy, IndicatorType, IndicatorValue, ChartPattern, SupportResistanceLevel,
+    TechnicalScan,
+)
 from .services.data_service import MarketDataService
 from .services.indicator_service import IndicatorService
+from .services.indicator_cache import IndicatorCacheService, frame_records
+from .services.backtest_service import BacktestService, BACKTEST_SOURCE
+from .services.screener_service import ScreenerService, FILTER_FIELDS
+from .tasks import run_backtest_job
 from adjustments_stock_price.models import StockPricesAdj
 
 
@@ -62,10 +72,16 @@ def stock_chart(request, symbol):
         business_date__gte=start_date
     ).select_related('indicator_type').order_by('indicator_type', '-business_date')
     
+    # Full indicator series for the chart, from the indicator cache
+    indicator_series = IndicatorCacheService.get_many(
+        symbol, IndicatorType.objects.filter(is_active=True), start_date, end_date
+    )
+    
     context = {
         'symbol': symbol,
         'ohlcv_data': ohlcv_data.to_dict('records') if not ohlcv_data.empty else [],
         'indicators': recent_indicators,
+        'indicator_series': {name: frame_records(frame) for name, frame in indicator_series.items()},
     }
     
     return render(request, 'technical_analysis/stock_chart.html', context)
@@ -77,6 +93,7 @@ def stock_screener(request):
     
     context = {
         'title': 'Stock Screener',
+        'fields': list(FILTER_FIELDS),
     }
     
     return render(request, 'technical_analysis/stock_screener.html', context)
@@ -187,12 +204,52 @@ def sr_levels(request, symbol):
 
 # Backtesting
 def backtest_strategy(request):
-    """Strategy backtesting interface"""
+    """
+    Strategy backtesting interface. POST queues a backtest (tasks.run_backtest_job)
+    and redirects back with ?job_id= for the page to poll; GET shows the stored one.
+    """
+    
+    strategies = TradingStrategy.objects.order_by('name')
+    strategy_id = request.POST.get('strategy') or request.GET.get('strategy')
+    if strategy_id and not strategy_id.isdigit():
+        raise Http404("Unknown strategy.")
+    strategy = get_object_or_404(TradingStrategy, pk=strategy_id) if strategy_id else None
     
     context = {
         'title': 'Strategy Backtesting',
+        'strategies': strategies,
+        'strategy': strategy,
     }
     
+    if strategy is not None:
+        if request.method == 'POST':
+            try:
+                years = float(request.POST.get('years', 10))
+                if not years > 0:
+                    raise ValueError("Years must be a positive number.")
+            except ValueError as e:
+                context['error'] = str(e)
+            else:
+                task = run_backtest_job.delay(strategy.pk, years)
+                return redirect(f"{reverse('technical_analysis:backtest')}?strategy={strategy.pk}&job_id={task.id}")
+
+        job_id = request.GET.get('job_id')
+        if job_id:
+            task_result = AsyncResult(job_id)
+            result = task_result.result if task_result.successful() else None
+            if isinstance(result, dict) and result.get('status') == 'success':
+                context['equity_curve'] = result['equity_curve']
+            elif isinstance(result, dict):
+                context['error'] = result.get('message')
+            else:
+                context['job_id'] = job_id
+        
+        context['summary'] = BacktestService.stored_summary(strategy)
+        context['trades'] = SignalPerformance.objects.filter(
+            signal__strategy=strategy,
+            signal__technical_summary__source=BACKTEST_SOURCE,
+        ).select_related('signal').order_by('-entry_date')[:100]
+    
     return render(request, 'technical_analysis/backtest.html', context)
 
 
@@ -271,10 +328,22 @@ def indicator_symbol(request, indicator_name, symbol):
         business_date__gte=start_date
     ).order_by('business_date')
     
+    # The full series (not just the stored daily values), from the indicator cache
+    series = []
+    try:
+        indicator_type = IndicatorCacheService.indicator_type_for(indicator_name)
+    except NotImplementedError:
+        indicator_type = None
+    if indicator_type is not None:
+        frame = IndicatorCacheService.get_many(symbol, [indicator_type], start_date, end_date).get(indicator_type.name)
+        if frame is not None:
+            series = frame_records(frame)
+    
     context = {
         'indicator_name': indicator_name,
         'symbol': symbol,
         'values': values,
+        'series': series,
     }
     
     return render(request, 'technical_analysis/indicator_symbol.html', context)
@@ -319,6 +388,7 @@ def alert_center(request):
     
     context = {
         'alerts': alerts,
+        'triggered_alerts': alerts.filter(is_triggered=True),
     }
     
     return render(request, 'technical_analysis/alert_center.html', context)
@@ -372,24 +442,70 @@ def calculate_indicator_api(request):
     
     symbol = request.GET.get('symbol')
     indicator = request.GET.get('indicator')
-    period = int(request.GET.get('period', 14))
+    period = request.GET.get('period')
     
     if not symbol or not indicator:
         return JsonResponse({'error': 'Missing parameters'}, status=400)
     
     try:
-        # Get data and calculate
-        data = MarketDataService.get_ohlcv(symbol)
-        result = IndicatorService.calculate(indicator, data, period=period)
+        indicator_type = IndicatorCacheService.indicator_type_for(indicator)
+        if indicator_type is None:
+            return JsonResponse({'error': f"Unknown indicator '{indicator}'"}, status=400)
+        
+        # Read through the indicator cache; recomputed only when the symbol's prices changed
+        params = IndicatorCacheService.params_for(indicator_type, period)
+        result = IndicatorCacheService.get_series(symbol.upper(), indicator_type, params)
         
         return JsonResponse({
             'success': True,
-            'data': result
+            'indicator': indicator_type.name,
+            'parameters': params,
+            'data': frame_records(result)
         })
+    except NotImplementedError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def backtest_status_api(request, job_id):
+    """ API endpoint for the backtest page to POLL a run_backtest_job (same shape as recalc_status_view). """
+    task_result = AsyncResult(job_id)
+    status = task_result.status
+
+    if status == 'SUCCESS':
+        result = task_result.result or {}
+        job_status = result.get("status", "success")
+        return JsonResponse({
+            "status": {"success": "complete"}.get(job_status, job_status),
+            "message": result.get("message", "Complete!"),
+            "summary": result.get("summary"),
+            "equity_curve": result.get("equity_curve", []),
+        })
+    elif status == 'FAILURE':
+        return JsonResponse({
+            "status": "error",
+            "message": str(task_result.info) if task_result.info else "Task failed",
+        })
+    elif status == 'PROGRESS':
+        result = task_result.info or {}
+        return JsonResponse({
+            "status": "running",
+            "message": result.get("message", "Running..."),
+        })
+    else:
+        return JsonResponse({
+            "status": "pending",
+            "message": "Job is queued...",
+        })
+
+
+def indicator_cache_stats_api(request):
+    """API for the indicator cache hit / miss counters"""
+    
+    return JsonResponse(IndicatorCacheService.stats())
+
+
 def get_ohlcv_api(request, symbol):
     """API to get OHLCV data"""
     
@@ -412,16 +528,49 @@ def get_ohlcv_api(request, symbol):
 def screener_results_api(request):
     """API for screener results"""
     
+    # Saved scan: cached in TechnicalScan.last_results until the snapshot changes
+    scan_id = request.GET.get('scan')
+    if scan_id:
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Login required'}, status=403)
+        scan = get_object_or_404(TechnicalScan, pk=scan_id, user=request.user)
+        try:
+            results = ScreenerService.run_scan(scan)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({'success': True, 'scan': scan.name, 'count': len(results), 'results': results})
+    
     # Get filter parameters from request
     rsi_min = request.GET.get('rsi_min')
     rsi_max = request.GET.get('rsi_max')
     price_above_ma = request.GET.get('price_above_ma')
     
-    # TODO: Implement screener logic
+    criteria = {key: value for key, value in request.GET.items() if '__' in key}
+    if rsi_min:
+        criteria['rsi_14__gte'] = rsi_min
+    if rsi_max:
+        criteria['rsi_14__lte'] = rsi_max
+    if price_above_ma:
+        # "50" means the 50-day SMA; a column name (e.g. "ema_20") is used as is
+        criteria['close__gt'] = price_above_ma if not price_above_ma.isdigit() else f"sma_{price_above_ma}"
+    if request.GET.get('symbols'):
+        criteria['symbols'] = request.GET['symbols'].split(',')
+    
+    try:
+        limit = int(request.GET.get('limit', 100))
+        results = ScreenerService.screen(
+            criteria,
+            order_by=request.GET.get('order_by', 'symbol'),
+            limit=limit,
+            engine=request.GET.get('engine', 'numpy'),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
     return JsonResponse({
         'success': True,
-        'results': []
+        'count': len(results),
+        'results': results
     })
 
 